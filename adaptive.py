@@ -0,0 +1,154 @@
+#Description: Adaptive semantic reranking, only hybrid queries with an ambiguous result list are reranked semantically.
+#usage: python adaptive.py decisions.jsonl --min-margin 0.01 --min-agreement 0.5
+import json
+import time
+import logging
+import argparse
+import threading
+import searchquery
+
+#Reciprocal Rank Fusion constant of the service (and of localsearch.LocalSearchIndex)
+rrf_k = 60
+
+#decides from the scores of a hybrid result list (best first) if the top k are uncertain enough for semantic reranking
+class EscalationPolicy:
+    def __init__(self, k=2, min_margin=0.01, min_agreement=0.5, rrf_k=rrf_k):
+        self.k = k
+        self.min_margin = min_margin
+        self.min_agreement = min_agreement
+        self.rrf_k = rrf_k
+
+    #margin: relative gap between the k-th and the next score, 1.0 if no other result competes for the top k.
+    #agreement: share of the top k that both the text and the vector ranking found.
+    def signals(self, scores):
+        top = scores[:self.k]
+        if not top:
+            return {"results": 0, "margin": 1.0, "agreement": 1.0}
+        margin = (top[-1] - scores[self.k]) / top[-1] if len(scores) > self.k and top[-1] > 0 else 1.0
+        #small tolerance, the scores come back rounded from the service
+        single_leg_score = 1 / (self.rrf_k + 1) * (1 + 1e-6)
+        agreement = sum(1 for score in top if score > single_leg_score) / len(top)
+        return {"results": len(scores), "margin": margin, "agreement": agreement}
+
+    def decide(self, scores):
+        signals = self.signals(scores)
+        escalate = signals["results"] > 0 and (signals["margin"] < self.min_margin or signals["agreement"] < self.min_agreement)
+        return escalate, signals
+
+#runs queries adaptively and keeps the escalation rate and latencies. With record_file every decision is appended as JSON
+#line with the scores, the signals and, for escalated queries, whether the reranking changed the top k Ids.
+class AdaptiveSearch:
+    def __init__(self, policy=None, candidates=50, record_file=None):
+        self.policy = policy or EscalationPolicy()
+        self.candidates = candidates
+        self.record_file = record_file
+        self.stats = {"queries": 0, "escalated": 0, "changed": 0, "hybrid_seconds": 0.0, "semantic_seconds": 0.0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    #same arguments as searchquery.search, the response has the additional key "escalated"
+    def search(self, search_client, search_input, index_name, k=2, vector=None, collapse=False, filter=None, filter_mode="pre", **query_options):
+        start = time.perf_counter()
+        #the semantic ranker reranks at most 50 results, more hybrid candidates would not be reranked
+        fetch = max(self.candidates, k)
+        response = searchquery.search(search_client, "hybrid", search_input, index_name, fetch, vector=vector, filter=filter,
+                                      filter_mode=filter_mode, **query_options)
+        candidates = response["results"]
+        hybrid_seconds = time.perf_counter() - start
+        escalate, signals = self.policy.decide([result["@search.score"] for result in candidates])
+
+        changed = None
+        top = searchquery.collapse_parents(candidates, k) if collapse else candidates[:k]
+        if escalate:
+            ids = ",".join(result["Id"] for result in candidates)
+            candidate_filter = f"search.in(Id, '{ids}', ',')"
+            semantic = searchquery.search(search_client, "semantic", search_input, index_name, len(candidates) if collapse else k, vector=vector,
+                                          filter=f"({filter}) and {candidate_filter}" if filter else candidate_filter, filter_mode="pre",
+                                          **query_options)
+            reranked = searchquery.collapse_parents(semantic["results"], k) if collapse else semantic["results"][:k]
+            changed = [result["Id"] for result in reranked] != [result["Id"] for result in top]
+            response = {"answers": semantic["answers"], "results": reranked}
+        else:
+            response = {"answers": [], "results": top}
+        seconds = time.perf_counter() - start
+        response["escalated"] = escalate
+
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["hybrid_seconds"] += hybrid_seconds
+            self.stats["seconds"] += seconds
+            if escalate:
+                self.stats["escalated"] += 1
+                self.stats["changed"] += changed
+                self.stats["semantic_seconds"] += seconds - hybrid_seconds
+        logging.info(f"Adaptive search {search_input!r}: margin {signals['margin']:.4f}, agreement {signals['agreement']:.2f}, "
+                     f"{'escalated' if escalate else 'answered by hybrid'} in {seconds * 1000:.1f} ms")
+        if self.record_file:
+            self.record(search_input, [result["@search.score"] for result in candidates], signals, escalate, changed, hybrid_seconds,
+                        seconds - hybrid_seconds if escalate else None)
+        return response
+
+    #semantic_seconds is the extra latency of the escalation, None for queries answered by hybrid
+    def record(self, search_input, scores, signals, escalated, changed, hybrid_seconds=None, semantic_seconds=None):
+        entry = {"query": search_input, "scores": scores, "signals": signals, "escalated": escalated, "changed": changed,
+                 "hybrid_ms": hybrid_seconds * 1000 if hybrid_seconds is not None else None,
+                 "semantic_ms": semantic_seconds * 1000 if semantic_seconds is not None else None}
+        with self._lock, open(self.record_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    #escalation rate and the latency saved against sending every query as semantic query. The latency of a semantic
+    #query is estimated by the semantic requests of the escalated queries.
+    def report(self):
+        stats = dict(self.stats)
+        queries, escalated = stats["queries"], stats["escalated"]
+        semantic_seconds = stats["semantic_seconds"] / escalated if escalated else None
+        stats["escalation_rate"] = escalated / queries if queries else 0.0
+        stats["changed_rate"] = stats["changed"] / escalated if escalated else None
+        stats["mean_ms"] = stats["seconds"] / queries * 1000 if queries else None
+        stats["saved_ms"] = (semantic_seconds * queries - stats["seconds"]) * 1000 if semantic_seconds is not None else None
+        return stats
+
+    def format_report(self):
+        stats = self.report()
+        saved = f"{stats['saved_ms']:.0f} ms saved against semantic only" if stats["saved_ms"] is not None else "no escalation to estimate the saving"
+        changed = f", reranking changed the top k of {stats['changed_rate']:.0%}" if stats["changed_rate"] is not None else ""
+        mean = f"{stats['mean_ms']:.1f}" if stats["mean_ms"] is not None else "-"
+        return (f"Adaptive search: {stats['escalated']} of {stats['queries']} queries escalated ({stats['escalation_rate']:.0%}){changed}, "
+                f"mean {mean} ms, {saved}")
+
+#replays recorded decisions (AdaptiveSearch.record_file) with a policy. Recorded queries with a known outcome (changed)
+#show how many of the queries whose answer the reranker changes the policy escalates.
+def replay(entries, policy):
+    result = {"queries": 0, "escalated": 0, "labeled": 0, "changed": 0, "changed_escalated": 0}
+    for entry in entries:
+        escalate, _ = policy.decide(entry["scores"])
+        result["queries"] += 1
+        result["escalated"] += escalate
+        if entry.get("changed") is not None:
+            result["labeled"] += 1
+            result["changed"] += entry["changed"]
+            result["changed_escalated"] += entry["changed"] and escalate
+    return result
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays recorded adaptive search decisions with other thresholds")
+    parser.add_argument("records", help="JSON lines of AdaptiveSearch.record_file (record with --min-margin 1 to label every query)")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--min-margin", type=float, nargs="+", default=[0.0, 0.01, 0.02, 0.05, 0.1])
+    parser.add_argument("--min-agreement", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    args = parser.parse_args(argv)
+
+    entries = read_records(args.records)
+    print(f"{len(entries)} recorded queries, {sum(1 for entry in entries if entry.get('changed') is not None)} with known reranking outcome")
+    print(f"{'min margin':>10} {'agreement':>10} {'escalated':>10} {'changes caught':>15}")
+    for min_margin in args.min_margin:
+        for min_agreement in args.min_agreement:
+            result = replay(entries, EscalationPolicy(args.k, min_margin, min_agreement))
+            caught = f"{result['changed_escalated']}/{result['changed']}" if result["labeled"] else "-"
+            print(f"{min_margin:>10.3f} {min_agreement:>10.2f} {result['escalated'] / max(result['queries'], 1):>10.0%} {caught:>15}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 # Description: This file creates a new Azure SQL database and loads data from a CSV file into the database. 
 # Afterwards it connects to Azure AI Search as a data source.
+import os
 import logging
-import pyodbc
+import queue
+import threading
+import hashlib
+import functools
 import pandas
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes import SearchIndexerClient
 from azure.search.documents.indexes.models import (
-    SearchIndexerDataContainer, SearchIndexerDataSourceConnection)
+    SearchIndexerDataContainer, SearchIndexerDataSourceConnection, HighWaterMarkChangeDetectionPolicy,
+    SoftDeleteColumnDeletionDetectionPolicy)
+import tracing
 
 #to run this code indipendently, uncomment the following lines and make sure to set your environment variables
 #
@@ -23,74 +29,361 @@ from azure.search.documents.indexes.models import (
 # password = os.environ.get("SQL_PASSWORD")
 # sql_driver = os.environ.get("SQL_DRIVER")
 
-def create_db_and_aisearch_connection(aisearch_key, service_endpoint, sql_server, database_name, username, password, sql_driver):
-    logging.info("Creating a Azure SQL DB Table and importing data from CSV file")
-    #Azure SQL Connection string
-    connection_string = f"DRIVER={sql_driver};SERVER=tcp:{sql_server};DATABASE={database_name};UID={username};PWD={password}"
-    logging.info(f"Connection String for Azuer SQL DB: {connection_string}")
-    #TODO: add error handling
-    co = pyodbc.connect(connection_string)
-    cursor = co.cursor()
-
-
-    table_name = "nobelprizewinners"
-    logging.info(f"Creating table {table_name}")
-    #drop if table exists
-    cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-
-    #Create table
-    cursor.execute(f"""
-                CREATE TABLE {table_name}
-                (ID INT IDENTITY(1,1) NOT NULL PRIMARY KEY, 
-                Year int,
-                Discipline text,
-                Winner text,
-                Description text);
-                """)
+#fixed dtypes for the CSV columns, so every streamed chunk is parsed the same way and no type inference runs per chunk
+csv_dtypes = {"year": "int64", "discipline": "object", "winner": "object", "desc": "object"}
 
-    logging.info(f"Finished creating new table {table_name}") 
+insert_statement = """
+                    INSERT INTO {table_name} (Year, Discipline, Winner, Description)
+                    VALUES (?,?,?,?)
+                    """
 
+#streams the CSV in chunks of batch_size rows, only one chunk is held in memory at a time
+def read_csv_batches(csv_file_path, batch_size):
+    chunks = pandas.read_csv(csv_file_path, chunksize=batch_size, dtype=csv_dtypes)
+    while True:
+        #parsing and converting a batch is traced apart from inserting it
+        with tracing.span("azuresql.read_csv_batch") as span:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            years = chunk["year"].tolist()
+            disciplines = chunk["discipline"].where(chunk["discipline"].notna(), None).tolist()
+            winners = chunk["winner"].where(chunk["winner"].notna(), None).tolist()
+            #same conversion as the row by row loader (str(row.desc))
+            descriptions = chunk["desc"].map(str).tolist()
+            span.add(rows=len(chunk))
+        yield list(zip(years, disciplines, winners, descriptions))
 
-    #Load data into the Azure SQL Database table
-    csv_file_path = "./data/nobel-prize-winners.csv"
-    logging.info(f"Loading data from {csv_file_path} into {table_name}")
+#original loader: one INSERT and therefore one network round trip per row. Kept as baseline for the benchmark.
+@tracing.traced("azuresql.load_csv_row_by_row")
+def load_csv_row_by_row(co, csv_file_path, table_name):
+    cursor = co.cursor()
     data  = pandas.read_csv(csv_file_path)
     df = pandas.DataFrame(data)
 
+    rows = 0
     for row in df.itertuples():
         yearentry = row.year
         disciplineentry = row.discipline
         winnerentry = row.winner
         descentry = str(row.desc)
             
-        cursor.execute("""
-                    INSERT INTO nobelprizewinners (Year, Discipline, Winner, Description)
-                    VALUES (?,?,?,?)
-                    """,
+        cursor.execute(insert_statement.format(table_name=table_name),
                     yearentry,
                     disciplineentry,
                     winnerentry,
                     descentry
                     )
+        rows += 1
     co.commit()
+    tracing.add(rows=rows)
+    return rows
+
+#sets the pyodbc parameter types ("int", "text" or "key") of the next executemany calls, text is unbounded like the
+#columns of the table. Other drivers (SQLite) need no types.
+def set_input_sizes(cursor, types):
+    if hasattr(cursor, "fast_executemany"):
+        import pyodbc
+        sizes = {"int": (pyodbc.SQL_INTEGER, 0, 0), "text": (pyodbc.SQL_WLONGVARCHAR, 0, 0), "key": (pyodbc.SQL_CHAR, 64, 0)}
+        cursor.setinputsizes([sizes[parameter_type] for parameter_type in types])
+
+#inserts the batches through one connection and commits every commit_interval rows
+@tracing.traced("azuresql.insert_batches")
+def insert_batches(co, batches, table_name, commit_interval):
+    cursor = co.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        #pyodbc sends the whole parameter array of a batch in one round trip instead of one per row
+        cursor.fast_executemany = True
+    set_input_sizes(cursor, ("int", "text", "text", "text"))
+    statement = insert_statement.format(table_name=table_name)
+
+    rows = 0
+    uncommitted = 0
+    for batch in batches:
+        with tracing.span("azuresql.executemany", rows=len(batch)):
+            cursor.executemany(statement, batch)
+        rows += len(batch)
+        uncommitted += len(batch)
+        if uncommitted >= commit_interval:
+            with tracing.span("azuresql.commit"):
+                co.commit()
+            uncommitted = 0
+    co.commit()
+    tracing.add(rows=rows)
+    return rows
+
+#bulk loader: streams the CSV in batches and inserts every batch with a single executemany call.
+#connect returns a new DB-API connection, with parallel_connections > 1 the batches are spread over several connections.
+@tracing.traced("azuresql.load_csv_bulk")
+def load_csv_bulk(connect, csv_file_path, table_name, batch_size=1000, commit_interval=10000, parallel_connections=1):
+    batches = read_csv_batches(csv_file_path, batch_size)
+    if parallel_connections <= 1:
+        co = connect()
+        try:
+            return insert_batches(co, batches, table_name, commit_interval)
+        finally:
+            co.close()
+
+    work = queue.Queue(maxsize=parallel_connections * 2)
+    counts = []
+    errors = []
+    #the writers trace their inserts below the span of the load
+    parent = tracing.current()
+
+    def writer():
+        try:
+            co = connect()
+            try:
+                with tracing.span("azuresql.writer", parent=parent):
+                    counts.append(insert_batches(co, iter(work.get, None), table_name, commit_interval))
+            finally:
+                co.close()
+        except Exception as e:
+            errors.append(e)
+            #keep consuming until the end marker, so the reader is never blocked by a failed writer
+            while work.get() is not None:
+                pass
+
+    writers = [threading.Thread(target=writer, daemon=True) for _ in range(parallel_connections)]
+    for w in writers:
+        w.start()
+    for batch in batches:
+        if errors:
+            break
+        work.put(batch)
+    for _ in writers:
+        work.put(None)
+    for w in writers:
+        w.join()
+
+    if errors:
+        raise errors[0]
+    return sum(counts)
+
+#table layout for incremental enrollment. RowVer is the high water mark of the indexer, IsDeleted its soft delete marker.
+incremental_table_ddl = """
+                CREATE TABLE {table_name}
+                (ID INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+                Year int,
+                Discipline text,
+                Winner text,
+                Description text,
+                RowKey char(64) NOT NULL UNIQUE,
+                RowHash char(64) NOT NULL,
+                IsDeleted int NOT NULL DEFAULT 0,
+                RowVer rowversion);
+                """
+high_water_mark_column = "RowVer"
+soft_delete_column = "IsDeleted"
+soft_delete_marker = "1"
+
+#stable business key of a row
+def row_key(year, discipline, winner):
+    return hashlib.sha256(f"{year}|{discipline}|{winner}".encode("utf-8")).hexdigest()
+
+#content hash of a row, changes whenever one of the indexed columns changes
+def row_hash(year, discipline, winner, description):
+    return hashlib.sha256(f"{year}|{discipline}|{winner}|{description}".encode("utf-8")).hexdigest()
+
+#keys per lookup, SQL Server allows at most 2100 parameters per statement
+lookup_batch_size = 500
+
+#values of the first column of the rows of statement (with a "{keys}" placeholder) for the keys, queried in lookup batches
+def lookup_keys(cursor, statement, keys):
+    rows = []
+    for i in range(0, len(keys), lookup_batch_size):
+        batch = keys[i:i + lookup_batch_size]
+        cursor.execute(statement.format(keys=", ".join("?" * len(batch))), batch)
+        rows.extend(cursor.fetchall())
+    return rows
+
+#incremental loader: only writes the rows whose content hash changed and soft deletes the rows missing from the CSV.
+#Every batch is diffed against the rows of its keys, the keys seen are kept in the staging table <table>_synckeys.
+@tracing.traced("azuresql.sync_csv_incremental")
+def sync_csv_incremental(co, csv_file_path, table_name, batch_size=1000):
+    staging_table = f"{table_name}_synckeys"
+    cursor = co.cursor()
+    #lookups run on a cursor of their own, the parameter types of the writes stay set on the other
+    lookup = co.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    #a staging table left by a failed run is dropped
+    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+    cursor.execute(f"CREATE TABLE {staging_table} (RowKey char(64) NOT NULL PRIMARY KEY)")
+
+    select_rows = f"SELECT RowKey, RowHash, IsDeleted FROM {table_name} WHERE RowKey IN ({{keys}})"
+    select_seen = f"SELECT RowKey FROM {staging_table} WHERE RowKey IN ({{keys}})"
+    stage = f"INSERT INTO {staging_table} (RowKey) VALUES (?)"
+    insert = f"INSERT INTO {table_name} (Year, Discipline, Winner, Description, RowKey, RowHash) VALUES (?,?,?,?,?,?)"
+    update = f"UPDATE {table_name} SET Year = ?, Discipline = ?, Winner = ?, Description = ?, RowHash = ?, {soft_delete_column} = 0 WHERE RowKey = ?"
+
+    stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    for batch in read_csv_batches(csv_file_path, batch_size):
+        rows = {}
+        for year, discipline, winner, description in batch:
+            key = row_key(year, discipline, winner)
+            if key in rows:
+                logging.warning(f"Skipping duplicate row {year} {discipline} {winner}")
+                continue
+            rows[key] = (year, discipline, winner, description)
+        #keys of earlier batches
+        for (key,) in lookup_keys(lookup, select_seen, list(rows)):
+            year, discipline, winner, _ = rows.pop(key.strip())
+            logging.warning(f"Skipping duplicate row {year} {discipline} {winner}")
+        existing = {key.strip(): (content_hash.strip(), bool(is_deleted)) for key, content_hash, is_deleted in lookup_keys(lookup, select_rows, list(rows))}
+
+        new_rows = []
+        changed_rows = []
+        for key, (year, discipline, winner, description) in rows.items():
+            content_hash = row_hash(year, discipline, winner, description)
+            current = existing.get(key)
+            if current is None:
+                new_rows.append((year, discipline, winner, description, key, content_hash))
+            elif current != (content_hash, False):
+                changed_rows.append((year, discipline, winner, description, content_hash, key))
+            else:
+                stats["unchanged"] += 1
+        if rows:
+            set_input_sizes(cursor, ("key",))
+            cursor.executemany(stage, [(key,) for key in rows])
+        if new_rows:
+            set_input_sizes(cursor, ("int", "text", "text", "text", "key", "key"))
+            cursor.executemany(insert, new_rows)
+            stats["inserted"] += len(new_rows)
+        if changed_rows:
+            set_input_sizes(cursor, ("int", "text", "text", "text", "key", "key"))
+            cursor.executemany(update, changed_rows)
+            stats["updated"] += len(changed_rows)
+
+    cursor.execute(f"UPDATE {table_name} SET {soft_delete_column} = {soft_delete_marker} "
+                   f"WHERE {soft_delete_column} = 0 AND RowKey NOT IN (SELECT RowKey FROM {staging_table})")
+    stats["deleted"] = cursor.rowcount
+    cursor.execute(f"DROP TABLE {staging_table}")
+    co.commit()
+    tracing.add(**stats)
+    return stats
+
+def sql_connection_string(sql_server, database_name, username, password, sql_driver):
+    return f"DRIVER={sql_driver};SERVER=tcp:{sql_server};DATABASE={database_name};UID={username};PWD={password}"
+
+#pyodbc is imported on the first connection, the offline parts of this module (SQLite, definitions) work without the ODBC driver
+def connect(sql_server, database_name, username, password, sql_driver):
+    import pyodbc
+    return pyodbc.connect(sql_connection_string(sql_server, database_name, username, password, sql_driver))
+
+#creates the table and loads the CSV into it (or synchronizes it with incremental), returns the table name. With tracing
+#the CSV parsing of the calling thread is profiled as azuresql.load_csv (see tracing.profile).
+@tracing.traced("azuresql.load_table")
+def load_table(sql_server, database_name, username, password, sql_driver, bulk_load=True, batch_size=1000, commit_interval=10000,
+               parallel_connections=1, csv_file_path="./data/nobel-prize-winners.csv", incremental=False, table_name="nobelprizewinners"):
+    logging.info("Creating a Azure SQL DB Table and importing data from CSV file")
+    #Azure SQL Connection string
+    connection_string = sql_connection_string(sql_server, database_name, username, password, sql_driver)
+    logging.info(f"Connection String for Azuer SQL DB: {connection_string}")
+    if tracing.enabled():
+        tracing.add(csv_bytes=os.path.getsize(csv_file_path))
+    #TODO: add error handling
+    with tracing.span("azuresql.connect"):
+        co = connect(sql_server, database_name, username, password, sql_driver)
+    cursor = co.cursor()
+
+    if incremental:
+        #keep the table and only write the rows that changed since the last run
+        cursor.execute(f"SELECT COL_LENGTH('{table_name}', 'RowKey')")
+        if cursor.fetchone()[0] is None:
+            logging.info(f"Table {table_name} does not exist or was created without change tracking columns, recreating it")
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+            cursor.execute(incremental_table_ddl.format(table_name=table_name))
+            co.commit()
+        logging.info(f"Synchronizing {csv_file_path} with {table_name}")
+        with tracing.profile("azuresql.load_csv"):
+            stats = sync_csv_incremental(co, csv_file_path, table_name, batch_size=batch_size)
+        co.close()
+        logging.info(f"Synchronized {table_name}: {stats['inserted']} inserted, {stats['updated']} updated, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
+        return table_name
+
+    logging.info(f"Creating table {table_name}")
+    with tracing.span("azuresql.create_table"):
+        #drop if table exists
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+        #Create table
+        cursor.execute(f"""
+                    CREATE TABLE {table_name}
+                    (ID INT IDENTITY(1,1) NOT NULL PRIMARY KEY, 
+                    Year int,
+                    Discipline text,
+                    Winner text,
+                    Description text);
+                    """)
+        #commit the schema change, otherwise the loader connections wait on the schema lock of this transaction
+        co.commit()
+
+    logging.info(f"Finished creating new table {table_name}") 
+
+
+    #Load data into the Azure SQL Database table
+    logging.info(f"Loading data from {csv_file_path} into {table_name}")
+    with tracing.profile("azuresql.load_csv"):
+        if bulk_load:
+            logging.info(f"Bulk loading with batch size {batch_size}, commit interval {commit_interval} and {parallel_connections} connection(s)")
+            rows = load_csv_bulk(functools.partial(connect, sql_server, database_name, username, password, sql_driver), csv_file_path, table_name,
+                                 batch_size=batch_size, commit_interval=commit_interval, parallel_connections=parallel_connections)
+        else:
+            rows = load_csv_row_by_row(co, csv_file_path, table_name)
+    co.close()
+    tracing.add(rows=rows)
         
-    logging.info(f"Data loaded into {table_name} successfully")
+    logging.info(f"{rows} rows loaded into {table_name} successfully")
+    return table_name
+
+#number of rows of the table, None if it does not exist
+def count_rows(co, table_name="nobelprizewinners"):
+    cursor = co.cursor()
+    cursor.execute(f"SELECT OBJECT_ID('{table_name}', 'U')")
+    if cursor.fetchone()[0] is None:
+        return None
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
 
+def create_db_and_aisearch_connection(aisearch_key, service_endpoint, sql_server, database_name, username, password, sql_driver,
+                                      bulk_load=True, batch_size=1000, commit_interval=10000, parallel_connections=1,
+                                      csv_file_path="./data/nobel-prize-winners.csv", incremental=False):
+    table_name = load_table(sql_server, database_name, username, password, sql_driver, bulk_load, batch_size, commit_interval,
+                            parallel_connections, csv_file_path, incremental)
+    create_data_source_connection(aisearch_key, service_endpoint, sql_server, database_name, username, password, table_name, incremental=incremental)
+
+#name of the data source connection of a table or view, the indexers refer to it
+def data_source_name(table_name):
+    return f"{table_name}-azuresqlcon"
+
+#returns the data source definition without creating it (used by orchestrator.py). table_name may also be a view, e.g.
+#one key range partition of a table (see partitions.py), name overrides the name of the data source.
+def build_data_source_connection(sql_server, database_name, username, password, table_name, incremental=False, name=None):
     #Azure SQL TCP connection string for Azure AI Search integration
     #creates a connection between Azure SQL and Azure AI Search
     sqltcpcon = f'Encrypt=True;TrustServerCertificate=False;Connection Timeout=30;Server=tcp:{sql_server};Database={database_name};User ID={username};Password={password};'
     logging.info(f"SQL TCP Connection String for Azure AI Search: {sqltcpcon}")
-    
-    logging.info("Creating a data source connection for Azure AI Search")
-    aisearch = SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key))
     search_container = SearchIndexerDataContainer(name=table_name)
 
     data_source_connection = SearchIndexerDataSourceConnection(
-        name=f"{table_name}-azuresqlcon",
+        name=name or data_source_name(table_name),
         type="azuresql",
         connection_string=sqltcpcon,
         container=search_container
     )
+    if incremental:
+        #the indexer only picks up rows with a higher rowversion than in its last run and removes soft deleted rows
+        data_source_connection.data_change_detection_policy = HighWaterMarkChangeDetectionPolicy(high_water_mark_column_name=high_water_mark_column)
+        data_source_connection.data_deletion_detection_policy = SoftDeleteColumnDeletionDetectionPolicy(
+            soft_delete_column_name=soft_delete_column, soft_delete_marker_value=soft_delete_marker)
+        logging.info(f"Using high water mark column {high_water_mark_column} and soft delete column {soft_delete_column}")
+    return data_source_connection
 
+@tracing.traced("azuresql.create_data_source_connection")
+def create_data_source_connection(aisearch_key, service_endpoint, sql_server, database_name, username, password, table_name, incremental=False):
+    logging.info("Creating a data source connection for Azure AI Search")
+    data_source_connection = build_data_source_connection(sql_server, database_name, username, password, table_name, incremental)
+    aisearch = tracing.instrument(SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key)))
     datacon = aisearch.create_or_update_data_source_connection(data_source_connection)
     logging.info(f"Data source connection {datacon.name} created")
\ No newline at end of file
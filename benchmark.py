@@ -0,0 +1,1056 @@
+#Description: Benchmarks for the building blocks of this repo against local stand-ins, without Azure resources.
+#usage: python benchmark.py sqlload --rows 20000 --latency-ms 1
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import subprocess
+import logging
+import argparse
+import asyncio
+import tempfile
+import functools
+import random
+import numpy
+import azuresql
+import indexer
+import chunking
+import embeddings
+import estimator
+import mockserver
+import loadgen
+import pushpipeline
+import embeddingstore
+import orchestrator
+import partitions
+import index
+import skillset
+import localsearch
+import searchengine
+import searchquery
+import tracing
+import queryplanner
+import adaptive
+import queryservice
+import typeahead
+import aiohttp
+from azure.search.documents.models import VectorizedQuery
+from fakes import (sample_csv_file_path, sqlite_incremental_table_ddl, FakeIndexClient, FakeIndexerClient,
+                   FakePartitionedIndexerClient, LatencyEmbeddingClient, FakeUploadClient, connect_sqlite, write_csv, write_changed_csv,
+                   create_sqlite_table, count_rows, wait_for_port)
+
+#modules main.py imported at startup before it had subcommands, whatever it was started for
+legacy_main_imports = ("azuresql", "openai", "index", "skillset", "indexer", "consoleapp", "searchquery", "searchengine", "querycache",
+                       "embeddings", "chunking", "localsearch", "pushpipeline", "estimator", "orchestrator")
+#modules "python main.py query" must not import. The search SDK itself loads azure.search.documents.indexes (its buffered
+#sender depends on it), so the index management models can not be left out.
+heavy_query_modules = ("pandas", "pyodbc", "openai", "numpy", "aiohttp")
+
+def report(name, rows, seconds):
+    print(f"{name:<40} {rows:>10} rows {seconds:>9.2f} s {rows / seconds:>12.0f} rows/sec")
+
+def bench_sqlload(args):
+    table_name = "nobelprizewinners"
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_file_path = os.path.join(workdir, "data.csv")
+        db_path = os.path.join(workdir, "bench.db")
+        write_csv(csv_file_path, args.rows)
+        connect = functools.partial(connect_sqlite, db_path, args.latency_ms)
+        print(f"Loading {args.rows} rows, simulated round trip latency {args.latency_ms} ms")
+
+        if not args.skip_row_by_row:
+            create_sqlite_table(db_path, table_name)
+            co = connect()
+            start = time.perf_counter()
+            azuresql.load_csv_row_by_row(co, csv_file_path, table_name)
+            seconds = time.perf_counter() - start
+            co.close()
+            report("row by row", count_rows(db_path, table_name), seconds)
+
+        for parallel_connections in args.parallel_connections:
+            create_sqlite_table(db_path, table_name)
+            start = time.perf_counter()
+            azuresql.load_csv_bulk(connect, csv_file_path, table_name, batch_size=args.batch_size,
+                                   commit_interval=args.commit_interval, parallel_connections=parallel_connections)
+            seconds = time.perf_counter() - start
+            report(f"bulk batch={args.batch_size} connections={parallel_connections}", count_rows(db_path, table_name), seconds)
+    finally:
+        shutil.rmtree(workdir)
+
+#full reload vs. incremental synchronization after a small change of the source data.
+#The rows written are the rows the indexer has to re-chunk and re-embed afterwards.
+def bench_incremental(args):
+    table_name = "nobelprizewinners"
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_file_path = os.path.join(workdir, "data.csv")
+        changed_csv_file_path = os.path.join(workdir, "changed.csv")
+        db_path = os.path.join(workdir, "bench.db")
+        write_csv(csv_file_path, args.rows)
+        write_changed_csv(csv_file_path, changed_csv_file_path, round(100 / args.change_percent))
+        connect = functools.partial(connect_sqlite, db_path, args.latency_ms)
+
+        create_sqlite_table(db_path, table_name, ddl=sqlite_incremental_table_ddl)
+        co = connect()
+        start = time.perf_counter()
+        stats = azuresql.sync_csv_incremental(co, csv_file_path, table_name, batch_size=args.batch_size)
+        full_seconds = time.perf_counter() - start
+        full_rows = stats["inserted"] + stats["updated"] + stats["deleted"]
+        print(f"{'initial run':<20} {full_rows:>10} rows written {full_seconds:>9.2f} s  {stats}")
+
+        start = time.perf_counter()
+        stats = azuresql.sync_csv_incremental(co, changed_csv_file_path, table_name, batch_size=args.batch_size)
+        seconds = time.perf_counter() - start
+        changed_rows = stats["inserted"] + stats["updated"] + stats["deleted"]
+        co.close()
+        print(f"{'incremental run':<20} {changed_rows:>10} rows written {seconds:>9.2f} s  {stats}")
+        print(f"rows to re-index: {100 * changed_rows / full_rows:.2f}% of a full run")
+    finally:
+        shutil.rmtree(workdir)
+
+#throughput of the async search engine against the local mock search server for different concurrency limits
+async def run_engine(args):
+    service = mockserver.MockSearchService(mockserver.load_documents(), latency_ms=args.latency_ms, throttle_rate=args.throttle_rate)
+    runner = await mockserver.start(service, port=args.port)
+    try:
+        queries = [f"query {i}" for i in range(args.queries)]
+        for concurrency in args.concurrency:
+            service.max_in_flight = 0
+            async with searchengine.SearchEngine(f"http://127.0.0.1:{args.port}", "benchmark", "key", max_concurrency=concurrency,
+                                                 backoff_base=0.01, backoff_max=0.2) as engine:
+                start = time.perf_counter()
+                errors = 0
+                async for entry in engine.search_many(queries, args.mode):
+                    errors += "error" in entry
+                seconds = time.perf_counter() - start
+                print(f"concurrency={concurrency:<5} {args.queries / seconds:>9.1f} queries/sec  errors={errors} "
+                      f"throttled={engine.stats['throttled']} max in flight={service.max_in_flight} final limit={engine.concurrency_limit}")
+    finally:
+        await runner.cleanup()
+
+def bench_engine(args):
+    print(f"{args.queries} {args.mode} queries, mock latency {args.latency_ms} ms, throttle rate {args.throttle_rate}")
+    asyncio.run(run_engine(args))
+
+#closed and open loop load of the mixed search modes against the mock search server with per-mode latency
+async def run_load(args):
+    mode_latency_ms = {"vector": args.vector_latency_ms, "hybrid": args.hybrid_latency_ms, "semantic": args.semantic_latency_ms}
+    service = mockserver.MockSearchService(mockserver.load_documents(), throttle_rate=args.throttle_rate, mode_latency_ms=mode_latency_ms,
+                                           jitter=args.jitter)
+    runner = await mockserver.start(service, port=args.port)
+    try:
+        corpus = loadgen.sample_corpus(size=1000)
+        runs = {}
+        for concurrency in args.concurrency:
+            runs[f"closed concurrency={concurrency}"] = await loadgen.run_load(f"http://127.0.0.1:{args.port}", "benchmark", "key", corpus,
+                                                                               loadgen.parse_mix(args.mix), concurrency=concurrency,
+                                                                               duration=args.duration, max_retries=args.max_retries)
+        for qps in args.qps:
+            runs[f"open qps={qps:g}"] = await loadgen.run_load(f"http://127.0.0.1:{args.port}", "benchmark", "key", corpus, loadgen.parse_mix(args.mix),
+                                                               qps=qps, duration=args.duration, arrivals="poisson", max_retries=args.max_retries)
+        return runs
+    finally:
+        await runner.cleanup()
+
+def bench_load(args):
+    print(f"mix {args.mix}, mock latency vector {args.vector_latency_ms} ms, hybrid {args.hybrid_latency_ms} ms, semantic {args.semantic_latency_ms} ms, "
+          f"jitter {args.jitter}, throttle rate {args.throttle_rate}")
+    runs = asyncio.run(run_load(args))
+    for name, summary in runs.items():
+        print(f"\n{name}")
+        print(loadgen.format_report(summary))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"time": time.time(), "config": vars(args) | {"func": None}, "runs": runs}, f, indent=2)
+
+#indexer runs with different batch sizes against the fake indexer client. Every batch size runs twice, the second run
+#gets its ETA from the execution history of the first one.
+def bench_indexer(args):
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+    print(f"{args.items} items, batch overhead {args.batch_overhead_ms} ms, {args.item_ms} ms per item, failure rate {args.failure_rate}")
+    for batch_size in args.batch_size:
+        client = FakeIndexerClient(args.items, args.batch_overhead_ms, args.item_ms, args.failure_rate)
+        for run in range(2):
+            client.polls = 0
+            start = time.perf_counter()
+            result = indexer.create_indexer(None, "benchmark", None, batch_size=batch_size, max_failed_items=args.max_failed_items, wait=True,
+                                            poll_interval=args.poll_interval, max_poll_interval=args.max_poll_interval, indexer_c=client)
+            seconds = time.perf_counter() - start
+            polls = client.polls
+            progress = indexer.indexer_progress(client.get_indexer_status("benchmark-indexer"))
+            print(f"batch={batch_size:<6} run {run + 1}  {result.status:<17} {result.item_count:>8} items {result.failed_item_count:>6} failed "
+                  f"{seconds:>7.2f} s {progress['docs_per_second']:>10.0f} docs/sec  {polls} status polls")
+
+#push ingestion from a SQLite table with fake embedding and upload clients, per embedding batch size and concurrency
+def bench_push(args):
+    table_name = "nobelprizewinners"
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_file_path = os.path.join(workdir, "data.csv")
+        db_path = os.path.join(workdir, "bench.db")
+        write_csv(csv_file_path, args.rows)
+        create_sqlite_table(db_path, table_name)
+        azuresql.load_csv_bulk(functools.partial(connect_sqlite, db_path, 0), csv_file_path, table_name)
+        print(f"{args.rows} rows, embedding latency {args.embed_request_ms} ms per request + {args.embed_text_ms} ms per text, "
+              f"upload latency {args.upload_request_ms} ms per request + {args.upload_document_ms} ms per document")
+
+        for embed_batch_size in args.embed_batch_size:
+            for concurrency in args.concurrency:
+                embedding_client = LatencyEmbeddingClient(args.dimensions, args.embed_request_ms, args.embed_text_ms)
+                upload_client = FakeUploadClient(args.dimensions, args.upload_request_ms, args.upload_document_ms)
+                co = sqlite3.connect(db_path)
+                stats = pushpipeline.push_rows(chunking.read_sql_rows(co, table_name), embedding_client, upload_client,
+                                               embed_batch_size=embed_batch_size, embed_concurrency=concurrency,
+                                               upload_batch_size=args.upload_batch_size, upload_concurrency=concurrency)
+                co.close()
+                if len(upload_client.keys) != stats["chunks"]:
+                    raise ValueError(f"{stats['chunks']} chunks but {len(upload_client.keys)} distinct documents uploaded")
+                print(f"batch={embed_batch_size:<5} concurrency={concurrency:<3} {stats['uploaded']:>8} docs {stats['embedding_requests']:>6} embedding requests "
+                      f"{upload_client.requests:>5} uploads {stats['seconds']:>7.2f} s {stats['uploaded'] / stats['seconds']:>9.0f} docs/sec")
+    finally:
+        shutil.rmtree(workdir)
+
+#push ingestion with the embedding store in SQLite: without store, the first run (empty store), a full rebuild without
+#changes and a rebuild after every n-th description changed. Only the chunks missing from the store are embedded.
+def bench_embedstore(args):
+    table_name = "nobelprizewinners"
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_file_path = os.path.join(workdir, "data.csv")
+        changed_csv_file_path = os.path.join(workdir, "changed.csv")
+        db_path = os.path.join(workdir, "bench.db")
+        write_csv(csv_file_path, args.rows)
+        write_changed_csv(csv_file_path, changed_csv_file_path, args.change_every)
+        #the store is written while the rows are read, in the default journal mode the reader would block the writers
+        co = sqlite3.connect(db_path)
+        co.execute("PRAGMA journal_mode=WAL")
+        co.close()
+        print(f"{args.rows} rows, embedding latency {args.embed_request_ms} ms per request + {args.embed_text_ms} ms per text, "
+              f"SQL latency {args.sql_latency_ms} ms per round trip")
+
+        store = None
+        for name, source, use_store in [("no store", csv_file_path, False), ("first run", csv_file_path, True),
+                                        ("rebuild", csv_file_path, True), (f"rebuild, 1/{args.change_every} changed", changed_csv_file_path, True)]:
+            create_sqlite_table(db_path, table_name)
+            azuresql.load_csv_bulk(functools.partial(connect_sqlite, db_path, 0), source, table_name)
+            embedding_client = LatencyEmbeddingClient(args.dimensions, args.embed_request_ms, args.embed_text_ms)
+            if use_store and store is None:
+                store = embeddingstore.EmbeddingStore(functools.partial(connect_sqlite, db_path, args.sql_latency_ms), embedding_client.deployment,
+                                                      args.dimensions, vector_type=args.vector_type, ddl=embeddingstore.sqlite_store_table_ddl)
+            upload_client = FakeUploadClient(args.dimensions, 0, 0)
+            co = sqlite3.connect(db_path)
+            stats = pushpipeline.push_rows(chunking.read_sql_rows(co, table_name), embedding_client, upload_client,
+                                           embed_batch_size=args.embed_batch_size, embed_concurrency=args.concurrency,
+                                           upload_concurrency=args.concurrency, embedding_store=store if use_store else None)
+            co.close()
+            print(f"{name:<26} {stats['uploaded']:>8} docs {stats['embedded']:>8} embedded {embedding_client.calls:>6} embedding requests "
+                  f"{stats['seconds']:>7.2f} s {stats['uploaded'] / stats['seconds']:>9.0f} docs/sec")
+        print(f"store: {store.count()} vectors, {os.path.getsize(db_path) / 2 ** 20:.1f} MiB database")
+        store.close()
+    finally:
+        shutil.rmtree(workdir)
+
+#enrollment with the orchestrator against fake clients and a SQLite table: a cold run, a warm run without changes, a run
+#after the CSV changed and a run after the index definition changed
+def bench_enroll(args):
+    table_name = "nobelprizewinners"
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_file_path = os.path.join(workdir, "data.csv")
+        db_path = os.path.join(workdir, "bench.db")
+        state_file = os.path.join(workdir, "enroll-state.json")
+        write_csv(csv_file_path, args.rows)
+        index_c = FakeIndexClient(args.call_ms)
+        indexer_c = FakeIndexerClient(args.rows, call_ms=args.call_ms)
+
+        def load_table():
+            create_sqlite_table(db_path, table_name)
+            azuresql.load_csv_bulk(functools.partial(connect_sqlite, db_path, args.latency_ms), csv_file_path, table_name)
+
+        def count_table_rows():
+            return count_rows(db_path, table_name) if os.path.exists(db_path) else None
+
+        def run(name, hnsw_m=4):
+            steps = orchestrator.enrollment_steps(
+                index_c, indexer_c,
+                index.build_index("benchmark", args.dimensions, "key", "https://openai", "deployment", hnsw_m=hnsw_m),
+                azuresql.build_data_source_connection("server", "database", "user", "password", table_name),
+                skillset.build_skillset("https://openai", "deployment", "key", "benchmark"),
+                indexer.build_indexer("benchmark"),
+                load_table=load_table, count_rows=count_table_rows, source_file=csv_file_path, wait=True, poll_interval=0.05, max_poll_interval=0.5)
+            calls = index_c.calls + indexer_c.calls + indexer_c.polls
+            results = orchestrator.run_steps(steps, state_file)
+            print(f"{name}: {index_c.calls + indexer_c.calls + indexer_c.polls - calls} calls to the service")
+            print(orchestrator.format_report(results))
+            print()
+
+        print(f"{args.rows} rows, simulated SQL round trip {args.latency_ms} ms, {args.call_ms} ms per call to the service\n")
+        run("cold enrollment")
+        run("warm enrollment without changes")
+        write_changed_csv(csv_file_path, os.path.join(workdir, "changed.csv"), 100)
+        os.replace(os.path.join(workdir, "changed.csv"), csv_file_path)
+        run("enrollment after 1% of the CSV changed")
+        run("enrollment after the HNSW parameters changed", hnsw_m=8)
+    finally:
+        shutil.rmtree(workdir)
+
+#cost of a span with tracing disabled and enabled, and the overhead of tracing an enrollment against fake clients
+def bench_tracing(args):
+    def span_seconds(count):
+        start = time.perf_counter()
+        for _ in range(count):
+            with tracing.span("benchmark.span") as span:
+                span.add(rows=1)
+        return (time.perf_counter() - start) / count
+
+    def call_seconds(count):
+        function = tracing.traced("benchmark.call")(lambda: None)
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        return (time.perf_counter() - start) / count
+
+    disabled = (span_seconds(args.spans), call_seconds(args.spans))
+    tracing.start("benchmark")
+    enabled = (span_seconds(args.spans), call_seconds(args.spans))
+    tracing.stop()
+    print(f"{args.spans} spans: disabled {disabled[0] * 1e9:.0f} ns per span and {disabled[1] * 1e9:.0f} ns per traced call, "
+          f"enabled {enabled[0] * 1e6:.1f} us per span and {enabled[1] * 1e6:.1f} us per traced call\n")
+
+    table_name = "nobelprizewinners"
+
+    def enroll(trace):
+        workdir = tempfile.mkdtemp()
+        try:
+            csv_file_path = os.path.join(workdir, "data.csv")
+            db_path = os.path.join(workdir, "bench.db")
+            write_csv(csv_file_path, args.rows)
+            tracer = tracing.start("enroll", profile=args.profile_cpu) if trace else None
+            index_c = tracing.instrument(FakeIndexClient(args.call_ms))
+            indexer_c = tracing.instrument(FakeIndexerClient(args.rows, call_ms=args.call_ms))
+
+            def load_table():
+                create_sqlite_table(db_path, table_name)
+                with tracing.profile("azuresql.load_csv"):
+                    azuresql.load_csv_bulk(functools.partial(connect_sqlite, db_path, args.latency_ms), csv_file_path, table_name)
+
+            steps = orchestrator.enrollment_steps(
+                index_c, indexer_c,
+                index.build_index("benchmark", args.dimensions, "key", "https://openai", "deployment"),
+                azuresql.build_data_source_connection("server", "database", "user", "password", table_name),
+                skillset.build_skillset("https://openai", "deployment", "key", "benchmark"),
+                indexer.build_indexer("benchmark"),
+                load_table=load_table, source_file=csv_file_path, wait=True, poll_interval=0.05, max_poll_interval=0.5)
+            start = time.perf_counter()
+            try:
+                results = orchestrator.run_steps(steps, os.path.join(workdir, "enroll-state.json"))
+            finally:
+                tracing.stop()
+            failed = [result["step"] for result in results if result["status"] != "applied"]
+            if failed:
+                print(f"Steps not applied: {', '.join(failed)}")
+                sys.exit(1)
+            return time.perf_counter() - start, tracer
+        finally:
+            shutil.rmtree(workdir)
+
+    untraced, _ = enroll(False)
+    traced, baseline = enroll(True)
+    baseline.write(args.report)
+    retraced, current = enroll(True)
+    report = baseline.report()
+    spans = sum(total["count"] for total in report["totals"].values())
+    calls = sum(total["count"] for name, total in report["totals"].items() if name.startswith("sdk "))
+    print(f"{args.rows} rows, simulated SQL round trip {args.latency_ms} ms, {args.call_ms} ms per call to the service")
+    print(f"cold enrollment untraced {untraced:.2f} s, traced {traced:.2f} s ({traced / untraced - 1:+.1%}) with {spans} spans, "
+          f"{calls} of them calls to the service")
+    if args.profile_cpu:
+        for name, profile in report["profiles"].items():
+            print(f"profile {name}: {profile['calls']} calls in {profile['seconds']:.3f} s, top {profile['functions'][0]['function']}")
+    print(f"trace written to {args.report}\n")
+    rows = tracing.compare(report, current.report(), args.max_regression)
+    print(tracing.format_comparison(rows, report, current.report()))
+
+#enrollment of a table split into key range partitions (partitions.py) against fake clients
+def bench_partitions(args):
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+    print(f"{args.rows} rows, batch overhead {args.batch_overhead_ms} ms, {args.item_ms} ms per item")
+    for count in args.partitions:
+        workdir = tempfile.mkdtemp()
+        try:
+            config = partitions.read_table_config(partitions=count)
+            plan = partitions.plan_partitions(config, partitions.even_boundaries(1, args.rows, count))
+            resources = partitions.build_partition_resources(config, plan, "benchmark", "server", "database", "user", "password",
+                                                             batch_size=args.batch_size)
+            #rows of the key range of every data source, the keys are 1..rows
+            items = {resource["data_source"].name: min(resource["partition"]["upper"] or args.rows + 1, args.rows + 1) - (resource["partition"]["lower"] or 1)
+                     for resource in resources}
+            index_c = FakeIndexClient(args.call_ms)
+            indexer_c = FakePartitionedIndexerClient(items.get, args.batch_overhead_ms, args.item_ms, args.call_ms)
+            views = []
+            steps = orchestrator.enrollment_steps(
+                index_c, indexer_c,
+                index.build_index("benchmark", args.dimensions, "key", "https://openai", "deployment"),
+                None,
+                skillset.build_skillset("https://openai", "deployment", "key", "benchmark"),
+                wait=True, poll_interval=0.05, max_poll_interval=0.5, partition_resources=resources, create_view=views.append)
+            start = time.perf_counter()
+            results = orchestrator.run_steps(steps, os.path.join(workdir, "enroll-state.json"), max_workers=args.max_workers)
+            seconds = time.perf_counter() - start
+            failed = [result["step"] for result in results if result["status"] in ("failed", "blocked")]
+            indexed = sum(indexer_c.get_indexer_status(resource["indexer"].name).last_result.item_count for resource in resources)
+            print(f"{count:>3} partitions: {indexed} items in {seconds:6.2f} s, {indexed / seconds:8.0f} docs/sec, {len(views)} views, "
+                  f"{indexer_c.polls} status polls{', failed ' + ', '.join(failed) if failed else ''}")
+        finally:
+            shutil.rmtree(workdir)
+
+def percentiles(seconds):
+    milliseconds = numpy.asarray(seconds) * 1000
+    return f"p50 {numpy.percentile(milliseconds, 50):7.3f} ms  p95 {numpy.percentile(milliseconds, 95):7.3f} ms"
+
+#builds a local index with fake embeddings from a CSV with the given number of rows
+def build_local_index(rows, dimensions, workdir):
+    csv_file_path = os.path.join(workdir, "data.csv")
+    write_csv(csv_file_path, rows)
+    embedder = embeddings.QueryEmbedder(embeddings.FakeEmbeddingClient(dimensions))
+    return localsearch.LocalSearchIndex.from_rows(chunking.read_csv_rows(csv_file_path), embedder), embedder
+
+#query latency of the local search backend for text, vector and hybrid queries
+def bench_localsearch(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        index, embedder = build_local_index(args.rows, args.dimensions, workdir)
+        print(f"Built local index with {len(index)} chunks of {args.dimensions} dimensions in {time.perf_counter() - start:.2f} s")
+    finally:
+        shutil.rmtree(workdir)
+
+    queries = [document["chunk"][:40] for document in index.documents[::max(1, len(index) // args.queries)]][:args.queries]
+    vectors = embedder.embed_many(queries)
+    for name, run in [
+        ("bm25", lambda query, vector: index.search(search_text=query, top=args.top)),
+        ("vector", lambda query, vector: index.search(vector_queries=[VectorizedQuery(vector=vector, k_nearest_neighbors=args.top, fields="vector")], top=args.top)),
+        ("hybrid", lambda query, vector: index.search(search_text=query, vector_queries=[VectorizedQuery(vector=vector, k_nearest_neighbors=args.top, fields="vector")], top=args.top))
+    ]:
+        seconds = []
+        for query, vector in zip(queries, vectors):
+            start = time.perf_counter()
+            run(query, vector)
+            seconds.append(time.perf_counter() - start)
+        print(f"{name:<8} {percentiles(seconds)}")
+
+    start = time.perf_counter()
+    index.knn_batch(vectors, args.top)
+    seconds = time.perf_counter() - start
+    print(f"{'knn batch':<8} {len(vectors)} queries in {seconds * 1000:.1f} ms ({seconds * 1000 / len(vectors):.3f} ms per query)")
+
+#sweeps the HNSW parameters on the local HNSW stand-in and reports recall@k against exact kNN and the latency
+def bench_vectorprofiles(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        index, embedder = build_local_index(args.rows, args.dimensions, workdir)
+    finally:
+        shutil.rmtree(workdir)
+    matrix = index._matrix
+    queries = [document["chunk"][:60] for document in index.documents[::max(1, len(index) // args.queries)]][:args.queries]
+    vectors = numpy.asarray(embedder.embed_many(queries), dtype=numpy.float32)
+    print(f"{len(index)} chunks of {args.dimensions} dimensions, {len(queries)} queries, recall@{args.top} against exact kNN")
+
+    exact = []
+    seconds = []
+    for vector in vectors:
+        start = time.perf_counter()
+        _, similarities = index.knn(vector, args.top)
+        seconds.append(time.perf_counter() - start)
+        exact.append(similarities.tolist())
+    print(f"{'exhaustive':<40} recall 1.000  {percentiles(seconds)}")
+
+    results = [{"profile": "exhaustiveknn-profile", "recall": 1.0, "p50_ms": numpy.percentile(seconds, 50) * 1000, "p95_ms": numpy.percentile(seconds, 95) * 1000}]
+    for m in args.m:
+        for ef_construction in args.ef_construction:
+            start = time.perf_counter()
+            hnsw = localsearch.HnswIndex(matrix, m=m, ef_construction=ef_construction)
+            build_seconds = time.perf_counter() - start
+            for ef_search in args.ef_search:
+                seconds = []
+                recalls = []
+                for vector, expected in zip(vectors, exact):
+                    start = time.perf_counter()
+                    _, similarities = hnsw.search(vector, args.top, ef_search)
+                    seconds.append(time.perf_counter() - start)
+                    recalls.append(localsearch.recall_at_k_with_ties(expected, similarities.tolist(), args.top))
+                name = f"hnsw m={m} ef_construction={ef_construction} ef_search={ef_search}"
+                print(f"{name:<40} recall {numpy.mean(recalls):.3f}  {percentiles(seconds)}  build {build_seconds:.1f} s")
+                results.append({"profile": "vectorsearch-profile", "m": m, "ef_construction": ef_construction, "ef_search": ef_search,
+                                "recall": float(numpy.mean(recalls)), "p50_ms": numpy.percentile(seconds, 50) * 1000,
+                                "p95_ms": numpy.percentile(seconds, 95) * 1000, "build_seconds": build_seconds})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+#local stand-in for the scalar quantization of the vector index: every dimension is mapped linearly from its range over
+#all vectors to int8. Returns the codes and the scale and offset to score queries against the codes without decoding them.
+def scalar_quantize(matrix):
+    low = matrix.min(axis=0)
+    scale = numpy.maximum(matrix.max(axis=0) - low, 1e-12) / 255
+    codes = numpy.round((matrix - low) / scale - 128).astype(numpy.int8)
+    return codes, scale.astype(numpy.float32), (low + 128 * scale).astype(numpy.float32)
+
+#size, recall@k and local kNN latency of the default and the compact index schemas
+def bench_compact(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        local_index, embedder = build_local_index(args.rows, args.dimensions, workdir)
+        estimates = estimator.compare_schemas(estimator.estimate_rows(chunking.read_csv_rows(os.path.join(workdir, "data.csv"))),
+                                              dimensions=args.dimensions)
+    finally:
+        shutil.rmtree(workdir)
+    for name, schema in estimator.schemas.items():
+        index.build_index("benchmark", args.dimensions, "key", "https://openai", "deployment", default_oversampling=max(args.oversampling),
+                          **schema)
+    print(f"Validated the index definitions of the schemas {', '.join(estimator.schemas)}")
+    print(estimator.format_schema_comparison(estimates))
+
+    matrix = local_index._matrix
+    queries = [document["chunk"][:60] for document in local_index.documents[::max(1, len(local_index) // args.queries)]][:args.queries]
+    vectors = numpy.asarray(embedder.embed_many(queries), dtype=numpy.float32)
+    print(f"{len(local_index)} chunks of {args.dimensions} dimensions, {len(queries)} queries, recall@{args.top} against float32 exact kNN")
+    half = matrix.astype(numpy.float16)
+    codes, scale, offset = scalar_quantize(half.astype(numpy.float32))
+
+    def exact(vector):
+        return localsearch.top_k(matrix @ vector, args.top)
+
+    def half_precision(vector):
+        return localsearch.top_k((half @ vector.astype(numpy.float16)).astype(numpy.float32), args.top)
+
+    def quantized(oversampling):
+        def search(vector):
+            candidates = localsearch.top_k(codes @ (vector * scale) + float(offset @ vector), args.top * oversampling)
+            #rescoring of the candidates with the original (float16) vectors, like rerank_with_original_vectors
+            return candidates[localsearch.top_k((half[candidates] @ vector.astype(numpy.float16)).astype(numpy.float32), args.top)]
+        return search
+
+    variants = [("float32 exact", matrix.nbytes, exact), ("float16", half.nbytes, half_precision)]
+    variants += [(f"int8 oversampling={oversampling}", codes.nbytes, quantized(oversampling)) for oversampling in args.oversampling]
+    results = []
+    for name, vector_bytes, search in variants:
+        seconds = []
+        recalls = []
+        for vector in vectors:
+            expected = (matrix[exact(vector)] @ vector).tolist()
+            start = time.perf_counter()
+            ids = search(vector)
+            seconds.append(time.perf_counter() - start)
+            recalls.append(localsearch.recall_at_k_with_ties(expected, (matrix[ids] @ vector).tolist(), args.top))
+        print(f"{name:<24} vectors {estimator.format_size(vector_bytes):>9}  recall {numpy.mean(recalls):.3f}  {percentiles(seconds)}")
+        results.append({"variant": name, "vector_bytes": int(vector_bytes), "recall": float(numpy.mean(recalls)),
+                        "p50_ms": numpy.percentile(seconds, 50) * 1000, "p95_ms": numpy.percentile(seconds, 95) * 1000})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"schemas": estimates, "variants": results}, f, indent=2)
+
+#first dimensions of the rows, normalized again, like the dimensions parameter of the text-embedding-3 models
+def shorten(matrix, dimensions):
+    shortened = matrix[:, :dimensions]
+    norms = numpy.linalg.norm(shortened, axis=-1, keepdims=True)
+    return (shortened / numpy.where(norms == 0, 1, norms)).astype(numpy.float32)
+
+#size and kNN latency of shortened embeddings, the recall only with real embeddings from --vectors (a .npy matrix)
+def bench_dimensions(args):
+    estimates = None
+    if args.vectors:
+        vectors = numpy.load(args.vectors).astype(numpy.float32)
+        order = numpy.random.default_rng(args.seed).permutation(len(vectors))
+        queries, matrix = vectors[order[:args.queries]], vectors[order[args.queries:]]
+        source = f"{len(matrix)} vectors of {args.vectors}, {len(queries)} held-out queries"
+    else:
+        workdir = tempfile.mkdtemp()
+        try:
+            local_index, embedder = build_local_index(args.rows, args.full_dimensions, workdir)
+            stats = estimator.estimate_rows(chunking.read_csv_rows(os.path.join(workdir, "data.csv")))
+        finally:
+            shutil.rmtree(workdir)
+        matrix = local_index._matrix
+        texts = [document["chunk"][:60] for document in local_index.documents[::max(1, len(local_index) // args.queries)]][:args.queries]
+        queries = numpy.asarray(embedder.embed_many(texts), dtype=numpy.float32)
+        estimates = {dimensions: estimator.complete_estimate(dict(stats), dimensions=dimensions) for dimensions in args.dimensions + [args.full_dimensions]}
+        source = f"synthetic: {len(matrix)} chunks with fake embeddings, {len(queries)} chunk prefix queries"
+    full_dimensions = matrix.shape[1]
+    if args.vectors:
+        print(f"{source}, recall@{args.top} against exact kNN with {full_dimensions} dimensions")
+    else:
+        print(f"{source}, size and latency only (recall needs real embeddings, --vectors)")
+    matrix, full_queries = shorten(matrix, full_dimensions), shorten(queries, full_dimensions)
+    results = []
+    for dimensions in sorted(set(args.dimensions) | {full_dimensions}, reverse=True):
+        if dimensions > full_dimensions:
+            continue
+        shortened, shortened_queries = shorten(matrix, dimensions), shorten(queries, dimensions)
+        seconds = []
+        recalls = []
+        for query, full_query in zip(shortened_queries, full_queries):
+            start = time.perf_counter()
+            ids = localsearch.top_k(shortened @ query, args.top)
+            seconds.append(time.perf_counter() - start)
+            if args.vectors:
+                expected = (matrix[localsearch.top_k(matrix @ full_query, args.top)] @ full_query).tolist()
+                recalls.append(localsearch.recall_at_k_with_ties(expected, (matrix[ids] @ full_query).tolist(), args.top))
+        index_bytes = estimates[dimensions]["vector_index_bytes"] if estimates and dimensions in estimates else None
+        index_size = estimator.format_size(index_bytes) if index_bytes is not None else "-"
+        recall = float(numpy.mean(recalls)) if recalls else None
+        recall_text = f"recall {recall:.3f}  " if recall is not None else ""
+        print(f"{dimensions:>5} dimensions  vectors {estimator.format_size(shortened.nbytes):>9}  index {index_size:>9}  "
+              f"{recall_text}{percentiles(seconds)}")
+        results.append({"dimensions": dimensions, "synthetic": not args.vectors, "vector_bytes": int(shortened.nbytes),
+                        "vector_index_bytes": index_bytes, "recall": recall, "p50_ms": numpy.percentile(seconds, 50) * 1000,
+                        "p95_ms": numpy.percentile(seconds, 95) * 1000})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+#modules and their cumulative import time in seconds from the -X importtime output of a python process
+def parse_import_times(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+def run_timed(command):
+    start = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed: {completed.stderr[-2000:]}")
+    return seconds, parse_import_times(completed.stderr)
+
+#selective queries on the local search backend: unfiltered vs. the planned filter applied before and after the vector search
+def bench_planner(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        index, embedder = build_local_index(args.rows, args.dimensions, workdir)
+    finally:
+        shutil.rmtree(workdir)
+    if not args.exhaustive:
+        index.build_hnsw()
+
+    queries = []
+    for document in index.documents[::max(1, len(index) // args.queries)][:args.queries]:
+        decade = int(document["db_table_year"]) // 10 * 10
+        words = " ".join(document["chunk"].split()[:3])
+        queries.append(f"{document['db_table_discipline']} {decade}s {words}")
+    planners = {"none": None, "pre": queryplanner.QueryPlanner(filter_mode="pre"), "post": queryplanner.QueryPlanner(filter_mode="post")}
+    results = {}
+    print(f"{len(queries)} {args.mode} queries on {len(index)} chunks, top {args.top}")
+    for name, planner in planners.items():
+        seconds = []
+        counts = []
+        matching = 0
+        for query in queries:
+            plan = queryplanner.extract(query)
+            predicate = queryplanner.compile_predicate(queryplanner.compile_filter(plan))
+            text, options = planner.apply(query) if planner is not None else (query, {})
+            start = time.perf_counter()
+            vector = embedder.embed(text)
+            response = list(index.search(**searchquery.build_search_kwargs(args.mode, text, "bench", args.top, vector=vector, **options)))
+            seconds.append(time.perf_counter() - start)
+            counts.append(len(response))
+            matching += sum(1 for result in response if predicate(result))
+        results[name] = {"p50_ms": float(numpy.percentile(seconds, 50) * 1000), "p95_ms": float(numpy.percentile(seconds, 95) * 1000),
+                         "results": float(numpy.mean(counts)), "matching": matching / max(sum(counts), 1)}
+        print(f"{name:<5} {percentiles(seconds)}  {results[name]['results']:5.2f} results per query, {results[name]['matching']:6.1%} match the constraints")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"queries": len(queries), "chunks": len(index), "top": args.top, "mode": args.mode, "results": results}, f, indent=2)
+
+#local index with the latency of the service per request: semantic_ms for semantic queries (reranking), hybrid_ms otherwise
+class LatencySearchClient:
+    def __init__(self, index, hybrid_ms, semantic_ms):
+        self.index = index
+        self.hybrid_latency = hybrid_ms / 1000
+        self.semantic_latency = semantic_ms / 1000
+        self.requests = {"hybrid": 0, "semantic": 0}
+
+    def search(self, **kwargs):
+        mode = "semantic" if kwargs.get("query_type") else "hybrid"
+        self.requests[mode] += 1
+        time.sleep(self.semantic_latency if mode == "semantic" else self.hybrid_latency)
+        return self.index.search(**kwargs)
+
+#adaptive semantic reranking against hybrid only and semantic only on the local index with simulated service latencies.
+#The local index has no semantic ranker, the benchmark shows the escalation rate and the latency, not the relevance.
+def bench_adaptive(args):
+    workdir = tempfile.mkdtemp()
+    try:
+        index, embedder = build_local_index(args.rows, args.dimensions, workdir)
+    finally:
+        shutil.rmtree(workdir)
+    queries = loadgen.sample_corpus(size=args.queries, seed=args.seed)
+    vectors = embedder.embed_many(queries)
+    print(f"{len(queries)} queries on {len(index)} chunks, hybrid {args.hybrid_ms} ms, semantic {args.semantic_ms} ms per request")
+    for min_margin in args.min_margin:
+        client = LatencySearchClient(index, args.hybrid_ms, args.semantic_ms)
+        adaptive_search = adaptive.AdaptiveSearch(adaptive.EscalationPolicy(min_margin=min_margin, min_agreement=args.min_agreement))
+        for query, vector in zip(queries, vectors):
+            adaptive_search.search(client, query, "bench", vector=vector)
+        stats = adaptive_search.report()
+        print(f"adaptive min margin {min_margin:<6} {stats['escalation_rate']:>5.0%} escalated  mean {stats['mean_ms']:7.1f} ms  "
+              f"{client.requests['semantic']:>5} semantic requests  {stats['saved_ms'] or 0:9.0f} ms saved")
+    for mode in ("hybrid", "semantic"):
+        client = LatencySearchClient(index, args.hybrid_ms, args.semantic_ms)
+        seconds = []
+        for query, vector in zip(queries, vectors):
+            start = time.perf_counter()
+            searchquery.search(client, mode, query, "bench", vector=vector)
+            seconds.append(time.perf_counter() - start)
+        print(f"{mode + ' only':<26} {'':>15}  mean {numpy.mean(seconds) * 1000:7.1f} ms  {client.requests['semantic']:>5} semantic requests")
+
+#import-time regression test of "python main.py query" against the mock search server, exits with 1 on a regression
+async def service_request(session, url, text, scheduled):
+    try:
+        async with session.get(url, params={"q": text}) as response:
+            await response.read()
+            status = response.status
+    except aiohttp.ClientError:
+        status = None
+    return status, time.perf_counter() - scheduled
+
+#open loop load against the HTTP query service in front of the mock search server
+async def run_service(args):
+    mock = mockserver.MockSearchService(mockserver.load_documents(), latency_ms=args.latency_ms, jitter=args.jitter)
+    mock_runner = await mockserver.start(mock, port=args.mock_port)
+    corpus = loadgen.sample_corpus(size=1000)
+    url = f"http://127.0.0.1:{args.port}/search/{args.mode}"
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            for max_pending in args.max_pending:
+                engine_factory = functools.partial(searchengine.SearchEngine, f"http://127.0.0.1:{args.mock_port}", "benchmark", "key",
+                                                   max_concurrency=args.concurrency, backoff_base=0.01, backoff_max=0.2)
+                service = queryservice.QueryService(engine_factory, max_pending=max_pending, timeout=args.deadline_ms / 1000)
+                runner = await queryservice.start(service, port=args.port)
+                try:
+                    for qps in args.qps:
+                        tasks = []
+                        start = time.perf_counter()
+                        for i in range(int(qps * args.duration)):
+                            scheduled = start + i / qps
+                            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                            tasks.append(asyncio.create_task(service_request(session, url, corpus[i % len(corpus)], scheduled)))
+                        results = await asyncio.gather(*tasks)
+                        seconds = time.perf_counter() - start
+                        ok = [latency for status, latency in results if status == 200]
+                        shed = sum(1 for status, _ in results if status == 503)
+                        missed = sum(1 for status, _ in results if status == 504)
+                        latency = f"p50 {numpy.percentile(ok, 50) * 1000:7.1f} ms  p99 {numpy.percentile(ok, 99) * 1000:7.1f} ms" if ok else "no answers"
+                        print(f"max pending {max_pending:<6} offered {qps:>6.0f} qps  answered {len(ok) / seconds:>7.1f} qps  {latency}  "
+                              f"shed {shed / len(results):6.1%}  deadline missed {missed / len(results):6.1%}  "
+                              f"errors {len(results) - len(ok) - shed - missed}")
+                finally:
+                    await runner.cleanup()
+    finally:
+        await mock_runner.cleanup()
+
+def bench_service(args):
+    print(f"{args.mode} queries for {args.duration} s per rate, mock latency {args.latency_ms} ms, {args.concurrency} requests in flight, "
+          f"deadline {args.deadline_ms} ms")
+    asyncio.run(run_service(args))
+
+#suggest requests of the service answered by a scan of the prefix index suggestions after a fixed latency
+class LatencySuggestClient:
+    def __init__(self, prefix_index, latency_ms):
+        self.prefix_index = prefix_index
+        self.latency = latency_ms / 1000
+        self.requests = 0
+
+    def suggest(self, search_text, suggester_name, top=5, select=None, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        return [{"@search.text": suggestion["text"], suggestion["field"]: suggestion["text"]}
+                for suggestion in scan_suggestions(self.prefix_index, search_text, top)]
+
+#suggestions of a prefix by scanning all suggestions of the prefix index in rank order, the answers of the simulated suggester
+def scan_suggestions(prefix_index, prefix, top):
+    prefix = " ".join(typeahead.tokenize(prefix))
+    if not prefix:
+        return []
+    ranks = [rank for rank, ((value, _), _) in enumerate(prefix_index.suggestions)
+             if any(key.startswith(prefix) for key in typeahead.suffix_keys(value))]
+    return [prefix_index.suggestion(rank) for rank in ranks[:top]]
+
+#keystroke by keystroke typeahead of winners, disciplines and query terms, local lookups vs. the (simulated) suggester
+def bench_typeahead(args):
+    start = time.perf_counter()
+    prefix_index = typeahead.PrefixIndex.from_csv(sample_csv_file_path)
+    print(f"prefix index: {len(prefix_index)} suggestions, {len(prefix_index.keys)} keys, built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(args.seed)
+    texts = [value for (value, _), _ in prefix_index.suggestions] + loadgen.sample_corpus(size=args.queries, seed=args.seed)
+    typed = []
+    for text in rng.sample(texts, min(args.queries, len(texts))):
+        if rng.random() < args.typo_rate and len(text) > 3:
+            i = rng.randrange(1, len(text) - 1)
+            text = text[:i] + rng.choice("qxzj") + text[i + 1:]
+        typed.extend(text[:length] for length in range(1, len(text) + 1))
+    print(f"{len(typed)} keystrokes of {args.queries} texts, {args.typo_rate:.0%} with a typo")
+
+    seconds = []
+    for prefix in typed:
+        lookup_start = time.perf_counter()
+        prefix_index.lookup(prefix, args.top)
+        seconds.append(time.perf_counter() - lookup_start)
+    microseconds = numpy.asarray(seconds) * 1e6
+    print(f"{'local lookup':<24} p50 {numpy.percentile(microseconds, 50):8.1f} us  p95 {numpy.percentile(microseconds, 95):8.1f} us")
+
+    client = LatencySuggestClient(prefix_index, args.service_ms)
+    suggester = typeahead.Typeahead(prefix_index, client)
+    start = time.perf_counter()
+    for prefix in typed:
+        suggester.suggest(prefix, args.top)
+    seconds = time.perf_counter() - start
+    print(f"{'local with fallback':<24} mean {seconds / len(typed) * 1000:8.3f} ms  {client.requests} service requests")
+    print(suggester.report())
+    print(f"{'service only (estimate)':<24} mean {args.service_ms:8.3f} ms  {len(typed)} service requests")
+
+def bench_startup(args):
+    server = subprocess.Popen([sys.executable, "mockserver.py", "--port", str(args.port), "--latency-ms", "0"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        query_command = [sys.executable, "-X", "importtime", "main.py", "query", "--endpoint", f"http://127.0.0.1:{args.port}", "--index-name", "benchmark",
+                         "--key", "benchmark", "--json", "--no-stderr-logs", "Einstein"]
+        baseline_command = [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(legacy_main_imports)]
+        query_seconds, baseline_seconds = [], []
+        for _ in range(args.repeat):
+            seconds, query_modules = run_timed(query_command)
+            query_seconds.append(seconds)
+            seconds, baseline_modules = run_timed(baseline_command)
+            baseline_seconds.append(seconds)
+    finally:
+        server.terminate()
+        server.wait()
+
+    query_median, baseline_median = numpy.median(query_seconds), numpy.median(baseline_seconds)
+    ratio = query_median / baseline_median
+    print(f"{'old main.py imports':<32} {baseline_median * 1000:>8.0f} ms  {len(baseline_modules):>5} modules")
+    print(f"{'main.py query incl. request':<32} {query_median * 1000:>8.0f} ms  {len(query_modules):>5} modules  ({ratio:.2f} of the old startup)")
+    for name, seconds in sorted(baseline_modules.items(), key=lambda item: -item[1]):
+        if name in legacy_main_imports or name.split(".")[0] in heavy_query_modules and "." not in name:
+            print(f"  {name:<30} {seconds * 1000:>8.0f} ms {'imported by query' if name in query_modules else ''}")
+    heavy = [name for name in heavy_query_modules if name in query_modules]
+    if heavy:
+        print(f"FAIL: the query path imports {', '.join(heavy)}")
+    if ratio > args.max_ratio:
+        print(f"FAIL: the query path takes {ratio:.2f} of the old startup, at most {args.max_ratio} allowed")
+    if heavy or ratio > args.max_ratio:
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks against local stand-ins")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    sqlload = subparsers.add_parser("sqlload", help="row by row CSV load vs. bulk CSV load into SQLite")
+    sqlload.add_argument("--rows", type=int, default=20000)
+    sqlload.add_argument("--latency-ms", type=float, default=1.0)
+    sqlload.add_argument("--batch-size", type=int, default=1000)
+    sqlload.add_argument("--commit-interval", type=int, default=10000)
+    sqlload.add_argument("--parallel-connections", type=int, nargs="+", default=[1, 4])
+    sqlload.add_argument("--skip-row-by-row", action="store_true")
+    sqlload.set_defaults(func=bench_sqlload)
+
+    incremental = subparsers.add_parser("incremental", help="full load vs. incremental synchronization after a change")
+    incremental.add_argument("--rows", type=int, default=20000)
+    incremental.add_argument("--change-percent", type=float, default=1.0)
+    incremental.add_argument("--latency-ms", type=float, default=1.0)
+    incremental.add_argument("--batch-size", type=int, default=1000)
+    incremental.set_defaults(func=bench_incremental)
+
+    engine = subparsers.add_parser("engine", help="async search engine throughput against the mock search server")
+    engine.add_argument("--queries", type=int, default=500)
+    engine.add_argument("--mode", choices=["vector", "hybrid", "semantic"], default="hybrid")
+    engine.add_argument("--latency-ms", type=float, default=20.0)
+    engine.add_argument("--throttle-rate", type=float, default=0.0)
+    engine.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    engine.add_argument("--port", type=int, default=8765)
+    engine.set_defaults(func=bench_engine)
+
+    load = subparsers.add_parser("load", help="closed and open loop load of the mixed search modes against the mock search server")
+    load.add_argument("--mix", default="vector=1,hybrid=2,semantic=1")
+    load.add_argument("--duration", type=float, default=5.0)
+    load.add_argument("--concurrency", type=int, nargs="+", default=[4, 32])
+    load.add_argument("--qps", type=float, nargs="+", default=[100, 400])
+    load.add_argument("--vector-latency-ms", type=float, default=10.0)
+    load.add_argument("--hybrid-latency-ms", type=float, default=20.0)
+    load.add_argument("--semantic-latency-ms", type=float, default=80.0)
+    load.add_argument("--jitter", type=float, default=0.3)
+    load.add_argument("--throttle-rate", type=float, default=0.0)
+    load.add_argument("--max-retries", type=int, default=5)
+    load.add_argument("--port", type=int, default=8767)
+    load.add_argument("--output", help="writes the results as JSON")
+    load.set_defaults(func=bench_load)
+
+    indexer_run = subparsers.add_parser("indexer", help="indexer batch sizes and run monitoring against a fake indexer client")
+    indexer_run.add_argument("--items", type=int, default=5000)
+    indexer_run.add_argument("--batch-size", type=int, nargs="+", default=[100, 500, 1000])
+    indexer_run.add_argument("--batch-overhead-ms", type=float, default=50.0)
+    indexer_run.add_argument("--item-ms", type=float, default=0.2)
+    indexer_run.add_argument("--failure-rate", type=float, default=0.0)
+    indexer_run.add_argument("--max-failed-items", type=int, default=None)
+    indexer_run.add_argument("--poll-interval", type=float, default=0.05)
+    indexer_run.add_argument("--max-poll-interval", type=float, default=0.5)
+    indexer_run.add_argument("--verbose", action="store_true", help="logs the progress of every status poll")
+    indexer_run.set_defaults(func=bench_indexer)
+
+    push = subparsers.add_parser("push", help="push ingestion throughput with fake embedding and upload clients")
+    push.add_argument("--rows", type=int, default=5000)
+    push.add_argument("--dimensions", type=int, default=1536)
+    push.add_argument("--embed-batch-size", type=int, nargs="+", default=[1, 128])
+    push.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    push.add_argument("--upload-batch-size", type=int, default=500)
+    push.add_argument("--embed-request-ms", type=float, default=20.0)
+    push.add_argument("--embed-text-ms", type=float, default=0.1)
+    push.add_argument("--upload-request-ms", type=float, default=50.0)
+    push.add_argument("--upload-document-ms", type=float, default=0.05)
+    push.set_defaults(func=bench_push)
+
+    embedstore = subparsers.add_parser("embedstore", help="push ingestion with the embedding store: first run, rebuild and rebuild after changes")
+    embedstore.add_argument("--rows", type=int, default=5000)
+    embedstore.add_argument("--dimensions", type=int, default=1536)
+    embedstore.add_argument("--embed-batch-size", type=int, default=128)
+    embedstore.add_argument("--concurrency", type=int, default=4)
+    embedstore.add_argument("--embed-request-ms", type=float, default=200.0)
+    embedstore.add_argument("--embed-text-ms", type=float, default=2.0)
+    embedstore.add_argument("--sql-latency-ms", type=float, default=1.0)
+    embedstore.add_argument("--change-every", type=int, default=100, help="changes the description of every n-th row")
+    embedstore.add_argument("--vector-type", choices=["single", "half"], default="single")
+    embedstore.set_defaults(func=bench_embedstore)
+
+    enroll = subparsers.add_parser("enroll", help="cold and warm enrollment with the orchestrator against fake clients")
+    enroll.add_argument("--rows", type=int, default=20000)
+    enroll.add_argument("--dimensions", type=int, default=1536)
+    enroll.add_argument("--latency-ms", type=float, default=1.0)
+    enroll.add_argument("--call-ms", type=float, default=200.0)
+    enroll.set_defaults(func=bench_enroll)
+
+    partitioned = subparsers.add_parser("partitions", help="enrollment of a table split into key range partitions against fake clients")
+    partitioned.add_argument("--rows", type=int, default=20000)
+    partitioned.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8])
+    partitioned.add_argument("--dimensions", type=int, default=1536)
+    partitioned.add_argument("--batch-size", type=int, default=1000)
+    partitioned.add_argument("--batch-overhead-ms", type=float, default=50.0)
+    partitioned.add_argument("--item-ms", type=float, default=0.2)
+    partitioned.add_argument("--call-ms", type=float, default=20.0)
+    partitioned.add_argument("--max-workers", type=int, default=8, help="enrollment steps run at the same time")
+    partitioned.add_argument("--verbose", action="store_true", help="logs the aggregated progress")
+    partitioned.set_defaults(func=bench_partitions)
+
+    local = subparsers.add_parser("localsearch", help="query latency of the in-process search backend")
+    local.add_argument("--rows", type=int, default=20000)
+    local.add_argument("--dimensions", type=int, default=1536)
+    local.add_argument("--queries", type=int, default=200)
+    local.add_argument("--top", type=int, default=10)
+    local.set_defaults(func=bench_localsearch)
+
+    profiles = subparsers.add_parser("vectorprofiles", help="recall and latency of HNSW parameters against exhaustive kNN")
+    profiles.add_argument("--rows", type=int, default=3000)
+    profiles.add_argument("--dimensions", type=int, default=1536)
+    profiles.add_argument("--queries", type=int, default=100)
+    profiles.add_argument("--top", type=int, default=10)
+    profiles.add_argument("--m", type=int, nargs="+", default=[4, 8])
+    profiles.add_argument("--ef-construction", type=int, nargs="+", default=[100, 400])
+    profiles.add_argument("--ef-search", type=int, nargs="+", default=[50, 100, 500])
+    profiles.add_argument("--output", help="writes the results as JSON")
+    profiles.set_defaults(func=bench_vectorprofiles)
+
+    compact = subparsers.add_parser("compact", help="size, recall and latency of the default and the compact index schemas")
+    compact.add_argument("--rows", type=int, default=3000)
+    compact.add_argument("--dimensions", type=int, default=1536)
+    compact.add_argument("--queries", type=int, default=100)
+    compact.add_argument("--top", type=int, default=10)
+    compact.add_argument("--oversampling", type=int, nargs="+", default=[1, 2, 4])
+    compact.add_argument("--output", help="writes the estimates and results as JSON")
+    compact.set_defaults(func=bench_compact)
+
+    planner = subparsers.add_parser("planner", help="selective queries without filter and with pre and post vector filtering")
+    planner.add_argument("--rows", type=int, default=20000)
+    planner.add_argument("--dimensions", type=int, default=1536)
+    planner.add_argument("--queries", type=int, default=200)
+    planner.add_argument("--top", type=int, default=10)
+    planner.add_argument("--mode", choices=["vector", "hybrid"], default="vector")
+    planner.add_argument("--exhaustive", action=argparse.BooleanOptionalAction, default=True, help="exact kNN instead of the HNSW stand-in")
+    planner.add_argument("--output", help="writes the results as JSON")
+    planner.set_defaults(func=bench_planner)
+
+    adaptive_run = subparsers.add_parser("adaptive", help="adaptive semantic reranking against hybrid and semantic only with simulated latencies")
+    adaptive_run.add_argument("--rows", type=int, default=5000)
+    adaptive_run.add_argument("--dimensions", type=int, default=256)
+    adaptive_run.add_argument("--queries", type=int, default=200)
+    adaptive_run.add_argument("--hybrid-ms", type=float, default=30.0)
+    adaptive_run.add_argument("--semantic-ms", type=float, default=150.0)
+    adaptive_run.add_argument("--min-margin", type=float, nargs="+", default=[0.005, 0.01, 0.02])
+    adaptive_run.add_argument("--min-agreement", type=float, default=0.5)
+    adaptive_run.add_argument("--seed", type=int, default=0)
+    adaptive_run.set_defaults(func=bench_adaptive)
+
+    service = subparsers.add_parser("service", help="open loop load against the HTTP query service with and without load shedding")
+    service.add_argument("--mode", choices=["vector", "hybrid", "semantic"], default="hybrid")
+    service.add_argument("--qps", type=float, nargs="+", default=[100, 400])
+    service.add_argument("--duration", type=float, default=3.0)
+    service.add_argument("--latency-ms", type=float, default=20.0)
+    service.add_argument("--jitter", type=float, default=0.3)
+    service.add_argument("--concurrency", type=int, default=4)
+    service.add_argument("--max-pending", type=int, nargs="+", default=[8, 100000])
+    service.add_argument("--deadline-ms", type=float, default=500.0)
+    service.add_argument("--port", type=int, default=8768)
+    service.add_argument("--mock-port", type=int, default=8769)
+    service.set_defaults(func=bench_service)
+
+    typeahead_run = subparsers.add_parser("typeahead", help="local prefix index against the suggester with a simulated latency")
+    typeahead_run.add_argument("--queries", type=int, default=500, help="texts typed keystroke by keystroke")
+    typeahead_run.add_argument("--typo-rate", type=float, default=0.05)
+    typeahead_run.add_argument("--top", type=int, default=5)
+    typeahead_run.add_argument("--service-ms", type=float, default=30.0)
+    typeahead_run.add_argument("--seed", type=int, default=0)
+    typeahead_run.set_defaults(func=bench_typeahead)
+
+    dimensions = subparsers.add_parser("dimensions", help="size and latency of shortened embeddings, with --vectors also their recall against the full dimensions")
+    dimensions.add_argument("--rows", type=int, default=5000)
+    dimensions.add_argument("--full-dimensions", type=int, default=1536, help="dimensions of the fake embeddings")
+    dimensions.add_argument("--dimensions", type=int, nargs="+", default=[1024, 512, 256, 128])
+    dimensions.add_argument("--vectors", help=".npy matrix of real embeddings, one chunk per row, needed for the recall")
+    dimensions.add_argument("--queries", type=int, default=200)
+    dimensions.add_argument("--top", type=int, default=10)
+    dimensions.add_argument("--seed", type=int, default=0)
+    dimensions.add_argument("--output", help="writes the results as JSON")
+    dimensions.set_defaults(func=bench_dimensions)
+
+    traced = subparsers.add_parser("tracing", help="cost of disabled and enabled tracing and a traced enrollment against fake clients")
+    traced.add_argument("--spans", type=int, default=100000)
+    traced.add_argument("--rows", type=int, default=20000)
+    traced.add_argument("--dimensions", type=int, default=1536)
+    traced.add_argument("--latency-ms", type=float, default=1.0)
+    traced.add_argument("--call-ms", type=float, default=50.0)
+    traced.add_argument("--profile-cpu", action=argparse.BooleanOptionalAction, default=True)
+    traced.add_argument("--max-regression", type=float, default=0.2)
+    traced.add_argument("--report", default="enroll-trace.json")
+    traced.set_defaults(func=bench_tracing)
+
+    startup = subparsers.add_parser("startup", help="import-time regression test of \"python main.py query\"")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--max-ratio", type=float, default=0.5, help="fails above this share of the old startup time")
+    startup.add_argument("--port", type=int, default=8766)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
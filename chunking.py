@@ -0,0 +1,81 @@
+#Description: Local version of the SplitSkill and the index projections of skillset.py.
+import re
+import csv
+
+#SplitSkill settings of skillset.py
+maximum_page_length = 300
+page_overlap_length = 20
+
+#index fields of a row and the table columns they are read from, in the order of the arguments of project_row
+table_columns = {"db_table_id": "ID", "db_table_year": "Year", "db_table_discipline": "Discipline", "db_table_winner": "Winner",
+                 "db_table_description": "Description"}
+
+sentence_end = re.compile(r"[.!?](?=\s)")
+
+#splits a text into pages of at most maximum_page_length characters like the SplitSkill in "pages" mode
+def split_text(text, maximum_page_length=maximum_page_length, page_overlap_length=page_overlap_length):
+    text = text.strip() if text else ""
+    if len(text) <= maximum_page_length:
+        return [text] if text else []
+
+    pages = []
+    start = 0
+    while start < len(text):
+        end = start + maximum_page_length
+        if end >= len(text):
+            pages.append(text[start:].strip())
+            break
+        window = text[start:end]
+        sentence_ends = [match.end() for match in sentence_end.finditer(window)]
+        if sentence_ends and sentence_ends[-1] > maximum_page_length // 2:
+            cut = start + sentence_ends[-1]
+        elif " " in window[1:]:
+            cut = start + window.rindex(" ")
+        else:
+            cut = end
+        pages.append(text[start:cut].strip())
+
+        next_start = max(cut - page_overlap_length, start + 1)
+        #start the overlap at a word boundary
+        while 0 < next_start < cut and not text[next_start - 1].isspace():
+            next_start += 1
+        start = next_start if next_start < cut else cut
+        while start < len(text) and text[start].isspace():
+            start += 1
+    return [page for page in pages if page]
+
+#maps the chunks of one table row to index documents like the SearchIndexerIndexProjections of skillset.py
+def project_row(row_id, year, discipline, winner, description, maximum_page_length=maximum_page_length, page_overlap_length=page_overlap_length):
+    return [
+        {
+            "Id": f"{row_id}_pages_{i}",
+            "chunk": chunk,
+            "db_table_id": str(row_id),
+            "db_table_year": str(year),
+            "db_table_discipline": discipline,
+            "db_table_winner": winner,
+            "db_table_description": description
+        }
+        for i, chunk in enumerate(split_text(description, maximum_page_length, page_overlap_length))
+    ]
+
+#yields (ID, Year, Discipline, Winner, Description) rows of the CSV the way azuresql.py loads them: IDs are numbered in file
+#order like the IDENTITY column and empty descriptions become "nan" like str(row.desc) in the loader
+def read_csv_rows(csv_file_path="./data/nobel-prize-winners.csv"):
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        for row_id, row in enumerate(csv.DictReader(f), start=1):
+            yield row_id, int(row["year"]), row["discipline"], row["winner"], row["desc"] or "nan"
+
+#yields (ID, Year, Discipline, Winner, Description) rows of the table, fetched in batches. where is an optional SQL
+#condition, columns maps the index fields to the columns of the table.
+def read_sql_rows(co, table_name="nobelprizewinners", batch_size=1000, where=None, columns=None):
+    columns = columns or table_columns
+    cursor = co.cursor()
+    condition = f" WHERE {where}" if where else ""
+    cursor.execute(f"SELECT {', '.join(columns[field] for field in table_columns)} FROM {table_name}{condition} ORDER BY {columns['db_table_id']}")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield tuple(row)
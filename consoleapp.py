@@ -1,94 +1,63 @@
-from azure.search.documents import SearchClient  
-from azure.core.credentials import AzureKeyCredential 
-from azure.search.documents.models import VectorizableTextQuery 
-from azure.search.documents.models import (
-    QueryType,QueryAnswerType
-)
+from azure.search.documents import SearchClient
+from azure.core.credentials import AzureKeyCredential
+import searchquery
+import adaptive
+
+#reads search commands from the console until the user enters quit and prints the results of the given search mode.
+#"suggest <prefix>" lists the suggestions of the typeahead instead of searching.
+def run_console(mode, service_endpoint, index_name, aisearch_key, cache=None, embedder=None, search_client=None, query_options=None, metrics=None,
+                planner=None, adaptive_search=None, typeahead=None, suggest_top=5):
+    query_options = query_options or {}
+    if mode == "adaptive" and adaptive_search is None:
+        adaptive_search = adaptive.AdaptiveSearch()
+    if search_client is None:
+        search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
+    if metrics is not None:
+        search_client = metrics.instrument(search_client)
+        embedder = metrics.instrument_embedder(embedder)
 
-# ... (your existing code to set up the connection)
-def vectorsearch(service_endpoint, index_name, aisearch_key):
-    search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-    
     while True:
         search_input = input("Enter your search command: ")
         if search_input.lower() == 'quit':
             break
-
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-        
-        results = search_client.search(
-            search_text=None,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            top=2
-        )
-
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-
+        if typeahead is not None and search_input.lower().startswith("suggest "):
+            suggestions, source = typeahead.suggest(search_input[len("suggest "):], suggest_top)
+            for suggestion in suggestions:
+                print(f"{suggestion['text']} ({suggestion['field']})")
+            print(f"{len(suggestions)} suggestions ({source})")
+            continue
+
+        options = query_options
+        if planner is not None:
+            search_input, options = planner.apply(search_input, query_options)
+        if mode == "adaptive":
+            vector = embedder.embed(search_input) if embedder is not None else None
+            response = adaptive_search.search(search_client, search_input, index_name, vector=vector, **options)
+        elif cache is not None:
+            response = cache.search(search_client, mode, search_input, index_name, embedder=embedder, **options)
+        else:
+            vector = embedder.embed(search_input) if embedder is not None else None
+            response = searchquery.search(search_client, mode, search_input, index_name, vector=vector, **options)
+        searchquery.print_results(response)
+
+    if cache is not None:
+        print(cache.report())
+    if typeahead is not None:
+        print(typeahead.report())
+    if mode == "adaptive":
+        print(adaptive_search.format_report())
+    if metrics is not None:
+        print(metrics.report())
     print("Exiting the application.")
 
-def hybridsearch(service_endpoint, index_name, aisearch_key):
-    search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-
-    while True:
-        search_input = input("Enter your search command: ")
-        if search_input.lower() == 'quit':
-            break
-
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-
-        results = search_client.search(
-            search_text=search_input,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            top=2
-        )
-
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-
-        print("Exiting the application.")
-
-def vectorsemanticsearch(service_endpoint, index_name, aisearch_key):
-    search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-    while True:
-        search_input = input("Enter your search command: ")
-        if search_input.lower() == 'quit':
-            break    
-
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-
-        results = search_client.search(
-            search_text=search_input,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            query_type=QueryType.SEMANTIC,
-            semantic_configuration_name=f"{index_name}-semantic",
-            query_caption=QueryAnswerType.EXTRACTIVE,
-            query_answer=QueryAnswerType.EXTRACTIVE,
-            top=2
-        )
+def vectorsearch(service_endpoint, index_name, aisearch_key, cache=None, embedder=None, search_client=None, query_options=None):
+    run_console("vector", service_endpoint, index_name, aisearch_key, cache, embedder, search_client, query_options)
 
-        semantic_results = results.get_answers()
-        if semantic_results:
-            for result in semantic_results:
-                if result.highlights:
-                    print(f"Semantic search result (highlight): {result.highlights}")
-                else:
-                    print(f"Semantic search result: {result.text}")
-                
-                print(f"Semantic results score:  {result.score}")
-                
+def hybridsearch(service_endpoint, index_name, aisearch_key, cache=None, embedder=None, search_client=None, query_options=None):
+    run_console("hybrid", service_endpoint, index_name, aisearch_key, cache, embedder, search_client, query_options)
 
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-            captions = result["@search.captions"]
-            if captions:
-                caption = captions[0]
-                if caption.highlights:
-                    print(f"Caption: {caption.highlights}")
-                else:
-                    print(f"Caption: {caption.text}")
+def vectorsemanticsearch(service_endpoint, index_name, aisearch_key, cache=None, embedder=None, search_client=None, query_options=None):
+    run_console("semantic", service_endpoint, index_name, aisearch_key, cache, embedder, search_client, query_options)
 
-        print("Exiting the application.")
+def adaptivesearch(service_endpoint, index_name, aisearch_key, cache=None, embedder=None, search_client=None, query_options=None):
+    run_console("adaptive", service_endpoint, index_name, aisearch_key, cache, embedder, search_client, query_options)
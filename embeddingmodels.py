@@ -0,0 +1,21 @@
+#Description: Dimensions of the Azure OpenAI embedding models, without dependencies, so the dry run can check them.
+#native dimensions, only the text-embedding-3 models return shortened embeddings
+embedding_models = {"text-embedding-ada-002": 1536, "text-embedding-3-small": 1536, "text-embedding-3-large": 3072}
+shortening_models = ("text-embedding-3-small", "text-embedding-3-large")
+#AI Search API version with the dimensions and modelName properties of the embedding skill and the vectorizer
+dimensions_api_version = "2024-05-01-preview"
+
+#dimensions parameter of the embedding requests for model (the model of the deployment), None for its native dimensions
+#or an unknown model (None). Raises ValueError if the model can not return the dimensions.
+def requested_dimensions(model, dimensions):
+    if model is None:
+        return None
+    if model not in embedding_models:
+        raise ValueError(f"Unknown embedding model {model}, use one of {', '.join(embedding_models)}")
+    native = embedding_models[model]
+    if dimensions == native:
+        return None
+    if model not in shortening_models or not 1 <= dimensions < native:
+        raise ValueError(f"Embedding model {model} returns {native} dimensions and can not return {dimensions}"
+                         + (f", use {', '.join(shortening_models)} for shortened embeddings" if model not in shortening_models else ""))
+    return dimensions
@@ -0,0 +1,216 @@
+#Description: Client-side embedding of search queries with a persistent embedding cache.
+import os
+import re
+import time
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+import numpy
+import openai
+from embeddingmodels import requested_dimensions
+
+#Azure OpenAI embedding deployment. With the model of the deployment shortened embeddings are requested (see
+#requested_dimensions), otherwise the deployment must return dimensions on its own.
+class AzureOpenAIEmbeddingClient:
+    def __init__(self, openai_uri, openai_key, openai_deployment, dimensions=1536, api_version="2024-02-01", model=None):
+        self.deployment = openai_deployment
+        self.dimensions = dimensions
+        self.model = model
+        self.request_dimensions = requested_dimensions(model, dimensions)
+        self._client = openai.AzureOpenAI(azure_endpoint=openai_uri, api_key=openai_key, api_version=api_version)
+
+    def embed(self, texts):
+        #the pinned openai package has no dimensions argument yet, it is passed in the body
+        extra_body = {"dimensions": self.request_dimensions} if self.request_dimensions is not None else None
+        response = self._client.embeddings.create(input=texts, model=self.deployment, extra_body=extra_body)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+#deterministic local stand-in for an embedding deployment. Words are hashed into the vector (feature hashing), so texts
+#sharing words get similar vectors, which is enough to exercise vector and hybrid search without Azure OpenAI.
+class FakeEmbeddingClient:
+    def __init__(self, dimensions=1536, deployment="fake-embedding"):
+        self.deployment = deployment
+        self.dimensions = dimensions
+        self.calls = 0
+        self.texts = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self.vector(text) for text in texts]
+
+    def vector(self, text):
+        vector = numpy.zeros(self.dimensions, dtype=numpy.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.sha256(token.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0 if digest[4] & 1 else -1.0
+        norm = numpy.linalg.norm(vector)
+        if norm == 0:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+            vector = numpy.random.default_rng(seed).standard_normal(self.dimensions).astype(numpy.float32)
+            norm = numpy.linalg.norm(vector)
+        return (vector / norm).tolist()
+
+#persistent embedding cache of one deployment and dimension, rows of a memory-mapped float32 matrix. Only one process
+#at a time should write to it.
+class EmbeddingCache:
+    def __init__(self, cache_dir, deployment, dimensions, initial_capacity=1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.deployment = deployment
+        self.dimensions = dimensions
+        base = os.path.join(cache_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', deployment)}-{dimensions}")
+        self._matrix_path = base + ".f32"
+        self._index_path = base + ".idx"
+        self._lock = threading.Lock()
+
+        self._index = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    #skips a line that was only partially written
+                    if len(parts) == 2 and parts[1].isdigit():
+                        self._index[parts[0]] = int(parts[1])
+
+        row_bytes = dimensions * 4
+        existing_rows = os.path.getsize(self._matrix_path) // row_bytes if os.path.exists(self._matrix_path) else 0
+        self._capacity = max(initial_capacity, existing_rows)
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(self._capacity * row_bytes)
+        self._matrix = numpy.memmap(self._matrix_path, dtype=numpy.float32, mode="r+", shape=(self._capacity, dimensions))
+        self._index_file = open(self._index_path, "a", encoding="utf-8")
+
+    def __len__(self):
+        return len(self._index)
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.deployment}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        row = self._index.get(self.key(text))
+        if row is None:
+            return None
+        return numpy.array(self._matrix[row])
+
+    #doubles the matrix file when it is full. Readers keep using the old mapping until the new one is swapped in,
+    #it stays valid for all rows written so far.
+    def _grow(self, rows):
+        capacity = self._capacity
+        while capacity < rows:
+            capacity *= 2
+        self._matrix.flush()
+        with open(self._matrix_path, "r+b") as f:
+            f.truncate(capacity * self.dimensions * 4)
+        self._matrix = numpy.memmap(self._matrix_path, dtype=numpy.float32, mode="r+", shape=(capacity, self.dimensions))
+        self._capacity = capacity
+
+    def put_many(self, texts, vectors):
+        with self._lock:
+            entries = []
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self._index:
+                    continue
+                row = len(self._index) + len(entries)
+                if row >= self._capacity:
+                    self._grow(row + 1)
+                self._matrix[row] = vector
+                entries.append((key, row))
+            if not entries:
+                return
+            self._matrix.flush()
+            self._index_file.write("".join(f"{key} {row}\n" for key, row in entries))
+            self._index_file.flush()
+            self._index.update(entries)
+
+    def close(self):
+        self._matrix.flush()
+        self._index_file.close()
+
+#embeds query texts through the cache. Misses of concurrent callers are collected for up to max_wait_ms and sent as one
+#request of up to batch_size texts; callers waiting for the same text share one request.
+class QueryEmbedder:
+    def __init__(self, client, cache=None, batch_size=16, max_wait_ms=5):
+        if cache is not None and (cache.dimensions != client.dimensions or cache.deployment != client.deployment):
+            raise ValueError(f"Embedding cache for {cache.deployment} with {cache.dimensions} dimensions does not match "
+                             f"deployment {client.deployment} with {client.dimensions} dimensions")
+        self.client = client
+        self.cache = cache
+        self.dimensions = client.dimensions
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        #shared counts misses that waited for the request of another caller embedding the same text
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "requests": 0}
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def embed(self, text):
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts):
+        vectors = [None] * len(texts)
+        futures = []
+        for i, text in enumerate(texts):
+            vector = self.cache.get(text) if self.cache is not None else None
+            if vector is not None:
+                self.stats["hits"] += 1
+                vectors[i] = vector.tolist()
+            else:
+                futures.append((i, self._submit(text)))
+        for i, future in futures:
+            vectors[i] = future.result()
+        return vectors
+
+    def _submit(self, text):
+        with self._lock:
+            future = self._pending.get(text)
+            if future is None:
+                future = Future()
+                self._pending[text] = future
+                self._queue.put(text)
+                self.stats["misses"] += 1
+            else:
+                self.stats["shared"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch):
+        try:
+            self.stats["requests"] += 1
+            vectors = self.client.embed(batch)
+            for vector in vectors:
+                if len(vector) != self.dimensions:
+                    raise ValueError(f"Deployment {self.client.deployment} returned {len(vector)} dimensions, expected {self.dimensions}")
+            if self.cache is not None:
+                self.cache.put_many(batch, vectors)
+        except Exception as e:
+            logging.error(f"Error embedding {len(batch)} queries: {e}")
+            for text in batch:
+                self._pending[text].set_exception(e)
+        else:
+            for text, vector in zip(batch, vectors):
+                self._pending[text].set_result(numpy.asarray(vector, dtype=numpy.float32).tolist())
+        finally:
+            with self._lock:
+                for text in batch:
+                    del self._pending[text]
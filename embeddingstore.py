@@ -0,0 +1,154 @@
+#Description: Store of the chunk embeddings in the SQL database, so push ingestion only embeds new and changed chunks.
+import sys
+import hashlib
+import logging
+import threading
+import numpy
+
+store_table_name = "chunkembeddings"
+
+store_table_ddl = """
+                IF OBJECT_ID('{table_name}', 'U') IS NULL
+                CREATE TABLE {table_name}
+                (ContentHash binary(32) NOT NULL,
+                Deployment nvarchar(128) NOT NULL,
+                Dimensions int NOT NULL,
+                Vector varbinary(max) NOT NULL,
+                PRIMARY KEY (ContentHash, Deployment, Dimensions));
+                """
+
+#SQLite version of store_table_ddl, for local runs and the benchmark
+sqlite_store_table_ddl = """
+                CREATE TABLE IF NOT EXISTS {table_name}
+                (ContentHash blob NOT NULL,
+                Deployment text NOT NULL,
+                Dimensions int NOT NULL,
+                Vector blob NOT NULL,
+                PRIMARY KEY (ContentHash, Deployment, Dimensions));
+                """
+
+#byte order and precision of the stored vectors
+vector_dtypes = {"single": numpy.dtype("<f4"), "half": numpy.dtype("<f2")}
+
+#hashes per lookup, SQL Server allows at most 2100 parameters per statement
+lookup_batch_size = 500
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+#IntegrityError of the DB-API driver of a connection, raised for duplicate keys. Connections of sqlite3 have it as attribute
+#(optional in DB-API), for the others (pyodbc) it is taken from the module of the connection class.
+def integrity_error(co):
+    error = getattr(co, "IntegrityError", None)
+    if error is None:
+        error = sys.modules[type(co).__module__.split(".")[0]].IntegrityError
+    return error
+
+def create_store_table(co, table_name=store_table_name, ddl=store_table_ddl):
+    cursor = co.cursor()
+    cursor.execute(ddl.format(table_name=table_name))
+    co.commit()
+
+#embeddings of one deployment and dimension in the table table_name. connect returns a new DB-API connection, every
+#thread that uses the store gets its own (pyodbc connections must not be shared between threads).
+class EmbeddingStore:
+    def __init__(self, connect, deployment, dimensions, table_name=store_table_name, vector_type="single", ddl=store_table_ddl):
+        if vector_type not in vector_dtypes:
+            raise ValueError(f"Unknown vector type {vector_type}, use one of {', '.join(vector_dtypes)}")
+        self.deployment = deployment
+        self.dimensions = dimensions
+        self.table_name = table_name
+        self.dtype = vector_dtypes[vector_type]
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._connect = connect
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        create_store_table(self._connection(), table_name, ddl)
+
+    def _connection(self):
+        co = getattr(self._local, "co", None)
+        if co is None:
+            co = self._local.co = self._connect()
+            with self._lock:
+                self._connections.append(co)
+        return co
+
+    def encode(self, vector):
+        return numpy.asarray(vector, dtype=self.dtype).tobytes()
+
+    def decode(self, data):
+        return numpy.frombuffer(data, dtype=self.dtype).astype(numpy.float32).tolist()
+
+    #stored vectors of the texts, None for the texts without vector
+    def get_many(self, texts):
+        hashes = [content_hash(text) for text in texts]
+        found = {}
+        cursor = self._connection().cursor()
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), lookup_batch_size):
+            batch = unique[i:i + lookup_batch_size]
+            cursor.execute(f"SELECT ContentHash, Vector FROM {self.table_name} WHERE Deployment = ? AND Dimensions = ? "
+                           f"AND ContentHash IN ({', '.join('?' * len(batch))})", [self.deployment, self.dimensions] + batch)
+            for key, data in cursor.fetchall():
+                found[bytes(key)] = self.decode(data)
+        vectors = [found.get(key) for key in hashes]
+        with self._lock:
+            self.stats["hits"] += sum(1 for vector in vectors if vector is not None)
+            self.stats["misses"] += sum(1 for vector in vectors if vector is None)
+        return vectors
+
+    def put_many(self, texts, vectors):
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            if len(vector) != self.dimensions:
+                raise ValueError(f"Vector with {len(vector)} dimensions can not be stored with {self.dimensions} dimensions")
+            key = content_hash(text)
+            rows[key] = (key, self.deployment, self.dimensions, self.encode(vector))
+        if not rows:
+            return
+        co = self._connection()
+        cursor = co.cursor()
+        insert = f"INSERT INTO {self.table_name} (ContentHash, Deployment, Dimensions, Vector) VALUES (?,?,?,?)"
+        duplicate_key = integrity_error(co)
+        stored = len(rows)
+        try:
+            cursor.executemany(insert, list(rows.values()))
+            co.commit()
+        except duplicate_key as e:
+            #another thread or process stored some of the vectors in the meantime, the others are inserted one by one
+            logging.info(f"Storing {len(rows)} embeddings as batch failed ({e}), storing them one by one")
+            co.rollback()
+            stored = 0
+            for row in rows.values():
+                try:
+                    cursor.executemany(insert, [row])
+                    co.commit()
+                    stored += 1
+                except duplicate_key:
+                    co.rollback()
+        with self._lock:
+            self.stats["stored"] += stored
+
+    #vectors of the texts from the store, the distinct missing texts are embedded with embedding_client in one request and
+    #stored. Returns the vectors and the number of embedded texts.
+    def embed(self, embedding_client, texts):
+        vectors = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            embedded = dict(zip(missing, embedding_client.embed(missing)))
+            self.put_many(missing, list(embedded.values()))
+            vectors = [embedded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors, len(missing)
+
+    def count(self):
+        cursor = self._connection().cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {self.table_name} WHERE Deployment = ? AND Dimensions = ?", [self.deployment, self.dimensions])
+        return cursor.fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            for co in self._connections:
+                co.close()
+            self._connections = []
+        self._local = threading.local()
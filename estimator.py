@@ -0,0 +1,165 @@
+#Description: Dry run of the enrollment, estimates chunks, embedding tokens, index size and embedding time.
+#usage: python estimator.py ./data/nobel-prize-winners.csv --dimensions 1536
+import json
+import math
+import argparse
+import chunking
+
+#columns of the rows yielded by chunking.read_csv_rows and chunking.read_sql_rows
+columns = ("ID", "Year", "Discipline", "Winner", "Description")
+
+#index fields of a chunk that are copied from the table row (see the index projections of skillset.py)
+projected_columns = {"ID": "db_table_id", "Year": "db_table_year", "Discipline": "db_table_discipline", "Winner": "db_table_winner",
+                     "Description": "db_table_description"}
+
+#fields of the documents with filter, sort or facet attributes: all projected fields in the default schema, the filtered
+#and faceted fields of index.compact_filterable_fields in the compact schema (index.py is not imported for a dry run)
+attribute_fields = {"default": ("db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"),
+                    "compact": ("db_table_id", "db_table_year", "db_table_discipline", "db_table_winner")}
+
+#bytes per vector dimension of the vector field types of index.vector_types and of the scalar quantized (int8) vector index
+vector_element_bytes = {"single": 4, "half": 2}
+quantized_element_bytes = 1
+
+#schemas compared by compare_schemas: compact, vector_type and vector_compression of index.build_index
+schemas = {
+    "default": {"compact": False, "vector_type": "single", "vector_compression": None},
+    "compact": {"compact": True, "vector_type": "single", "vector_compression": None},
+    "compact half": {"compact": True, "vector_type": "half", "vector_compression": None},
+    "compact half scalar": {"compact": True, "vector_type": "half", "vector_compression": "scalar"}
+}
+
+#rule of thumb of OpenAI for English text, a tokenizer would need a download of its encoding
+characters_per_token = 4
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / characters_per_token)
+
+#collects the statistics of one table and its columns from its rows, the rows are chunked like the SplitSkill
+def estimate_rows(rows, table_name="nobelprizewinners", maximum_page_length=chunking.maximum_page_length,
+                  page_overlap_length=chunking.page_overlap_length):
+    stats = {"table": table_name, "rows": 0, "chunks": 0, "max_chunks_per_row": 0, "empty_rows": 0, "chunk_characters": 0,
+             "chunk_tokens": 0, "max_chunk_tokens": 0, "document_bytes": 0, "field_bytes": {},
+             "columns": {column: {"values": 0, "characters": 0, "max_characters": 0, "bytes": 0, "tokens": 0} for column in columns}}
+    for row in rows:
+        stats["rows"] += 1
+        for column, value in zip(columns, row):
+            text = "" if value is None else str(value)
+            column_stats = stats["columns"][column]
+            column_stats["values"] += bool(text)
+            column_stats["characters"] += len(text)
+            column_stats["max_characters"] = max(column_stats["max_characters"], len(text))
+            column_stats["bytes"] += len(text.encode("utf-8"))
+            column_stats["tokens"] += estimate_tokens(text)
+
+        documents = chunking.project_row(*row, maximum_page_length=maximum_page_length, page_overlap_length=page_overlap_length)
+        stats["chunks"] += len(documents)
+        stats["max_chunks_per_row"] = max(stats["max_chunks_per_row"], len(documents))
+        stats["empty_rows"] += not documents
+        for document in documents:
+            tokens = estimate_tokens(document["chunk"])
+            stats["chunk_characters"] += len(document["chunk"])
+            stats["chunk_tokens"] += tokens
+            stats["max_chunk_tokens"] = max(stats["max_chunk_tokens"], tokens)
+            #every chunk carries the projected columns of its row, including the full description
+            for field, value in document.items():
+                size = len(value.encode("utf-8"))
+                stats["document_bytes"] += size
+                stats["field_bytes"][field] = stats["field_bytes"].get(field, 0) + size
+    return stats
+
+#adds the embedding requests, the index size and the embedding time to the statistics of estimate_rows
+def complete_estimate(stats, dimensions=1536, embedding_batch_size=128, hnsw_m=4, vector_profile="vectorsearch-profile",
+                      tokens_per_minute=240000, requests_per_minute=1440, compact=False, vector_type="single", vector_compression=None):
+    chunks = stats["chunks"]
+    stats["dimensions"] = dimensions
+    stats["schema"] = {"compact": compact, "vector_type": vector_type, "vector_compression": vector_compression}
+    stats["embedding_tokens"] = stats["chunk_tokens"]
+    stats["embedding_requests_indexer"] = chunks
+    stats["embedding_requests_push"] = math.ceil(chunks / embedding_batch_size)
+    stats["vector_bytes"] = chunks * dimensions * vector_element_bytes[vector_type]
+    stats["graph_bytes"] = chunks * 2 * hnsw_m * 4 if vector_profile == "vectorsearch-profile" else 0
+    #the vector index counts against the vector quota of the tier, the stored vectors and documents against the storage
+    quantized = vector_compression == "scalar"
+    stats["vector_index_bytes"] = (chunks * dimensions * quantized_element_bytes if quantized else stats["vector_bytes"]) + stats["graph_bytes"]
+    stats["stored_vector_bytes"] = 0 if compact else stats["vector_bytes"]
+    stats["rescoring_vector_bytes"] = stats["vector_bytes"] if quantized else 0
+    stats["attribute_bytes"] = sum(stats["field_bytes"].get(field, 0) for field in attribute_fields["compact" if compact else "default"])
+    stats["storage_bytes"] = stats["vector_index_bytes"] + stats["stored_vector_bytes"] + stats["rescoring_vector_bytes"] + \
+        stats["document_bytes"] + stats["attribute_bytes"]
+    token_minutes = stats["embedding_tokens"] / tokens_per_minute
+    stats["embedding_minutes_indexer"] = max(token_minutes, stats["embedding_requests_indexer"] / requests_per_minute)
+    stats["embedding_minutes_push"] = max(token_minutes, stats["embedding_requests_push"] / requests_per_minute)
+    return stats
+
+def estimate_csv(csv_file_path="./data/nobel-prize-winners.csv", table_name="nobelprizewinners", **options):
+    return complete_estimate(estimate_rows(chunking.read_csv_rows(csv_file_path), table_name), **options)
+
+#estimates of the same rows (statistics of estimate_rows) for every schema of schemas
+def compare_schemas(stats, **options):
+    return {name: complete_estimate(dict(stats), **dict(options, **schema)) for name, schema in schemas.items()}
+
+#estimates an existing table, the rows are fetched in batches (see chunking.read_sql_rows)
+def estimate_table(co, table_name="nobelprizewinners", where=None, **options):
+    return complete_estimate(estimate_rows(chunking.read_sql_rows(co, table_name, where=where), table_name), **options)
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+def format_report(stats):
+    rows = stats["rows"]
+    lines = [
+        f"Table {stats['table']}: {rows} rows, {stats['chunks']} chunks ({stats['chunks'] / max(rows, 1):.2f} per row, at most "
+        f"{stats['max_chunks_per_row']}), {stats['empty_rows']} rows without chunks",
+        f"  embedding: {stats['embedding_tokens']} tokens (at most {stats['max_chunk_tokens']} per chunk), "
+        f"{stats['embedding_requests_indexer']} requests with the indexer, {stats['embedding_requests_push']} with push ingestion",
+        f"  embedding time: {stats['embedding_minutes_indexer']:.1f} minutes with the indexer, {stats['embedding_minutes_push']:.1f} minutes with push ingestion",
+        f"  index: {format_size(stats['vector_index_bytes'])} vector index ({stats['dimensions']} dimensions), "
+        f"{format_size(stats['storage_bytes'])} storage including {format_size(stats['document_bytes'])} of document fields",
+        f"  {'column':<12} {'field':<21} {'values':>8} {'characters':>12} {'max':>7} {'tokens':>10} {'size':>10}"
+    ]
+    for column, column_stats in stats["columns"].items():
+        lines.append(f"  {column:<12} {projected_columns[column]:<21} {column_stats['values']:>8} {column_stats['characters']:>12} "
+                     f"{column_stats['max_characters']:>7} {column_stats['tokens']:>10} {format_size(column_stats['bytes']):>10}")
+    return "\n".join(lines)
+
+def format_schema_comparison(estimates):
+    lines = [f"{'schema':<20} {'vector index':>13} {'stored vectors':>15} {'rescoring':>11} {'attributes':>11} {'storage':>11} {'change':>7}"]
+    baseline = None
+    for name, stats in estimates.items():
+        baseline = baseline or stats["storage_bytes"]
+        lines.append(f"{name:<20} {format_size(stats['vector_index_bytes']):>13} {format_size(stats['stored_vector_bytes']):>15} "
+                     f"{format_size(stats['rescoring_vector_bytes']):>11} {format_size(stats['attribute_bytes']):>11} "
+                     f"{format_size(stats['storage_bytes']):>11} {stats['storage_bytes'] / baseline - 1:>+7.0%}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate chunks, embedding tokens, index size and embedding time without enrolling")
+    parser.add_argument("csv_file_path", nargs="?", default="./data/nobel-prize-winners.csv")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--embedding-batch-size", type=int, default=128)
+    parser.add_argument("--hnsw-m", type=int, default=4)
+    parser.add_argument("--vector-profile", default="vectorsearch-profile")
+    parser.add_argument("--tokens-per-minute", type=int, default=240000)
+    parser.add_argument("--requests-per-minute", type=int, default=1440)
+    parser.add_argument("--compact", action="store_true", help="compact schema, see index.build_index")
+    parser.add_argument("--vector-type", choices=list(vector_element_bytes), default="single")
+    parser.add_argument("--vector-compression", choices=["scalar"])
+    parser.add_argument("--compare-schemas", action="store_true", help="compares the size of the default and the compact schemas")
+    parser.add_argument("--json", action="store_true", help="prints the estimate as JSON")
+    args = parser.parse_args(argv)
+
+    options = {"dimensions": args.dimensions, "embedding_batch_size": args.embedding_batch_size, "hnsw_m": args.hnsw_m,
+               "vector_profile": args.vector_profile, "tokens_per_minute": args.tokens_per_minute, "requests_per_minute": args.requests_per_minute}
+    if args.compare_schemas:
+        estimates = compare_schemas(estimate_rows(chunking.read_csv_rows(args.csv_file_path)), **options)
+        print(json.dumps(estimates, indent=2) if args.json else format_schema_comparison(estimates))
+        return
+    stats = estimate_csv(args.csv_file_path, compact=args.compact, vector_type=args.vector_type, vector_compression=args.vector_compression, **options)
+    print(json.dumps(stats, indent=2) if args.json else format_report(stats))
+
+if __name__ == "__main__":
+    main()
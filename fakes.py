@@ -0,0 +1,307 @@
+#Description: Local stand-ins for Azure SQL (SQLite), the Search service and Azure OpenAI, shared by the tests and benchmark.py.
+import os
+import csv
+import time
+import types
+import uuid
+import socket
+import sqlite3
+import datetime
+import threading
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+import embeddings
+import pushpipeline
+
+sample_csv_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nobel-prize-winners.csv")
+
+#SQLite version of the nobelprizewinners table created in azuresql.py
+sqlite_table_ddl = """
+                CREATE TABLE {table_name}
+                (ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                Year int,
+                Discipline text,
+                Winner text,
+                Description text);
+                """
+
+#SQLite version of azuresql.incremental_table_ddl, SQLite has no rowversion column
+sqlite_incremental_table_ddl = """
+                CREATE TABLE {table_name}
+                (ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                Year int,
+                Discipline text,
+                Winner text,
+                Description text,
+                RowKey text NOT NULL UNIQUE,
+                RowHash text NOT NULL,
+                IsDeleted int NOT NULL DEFAULT 0);
+                """
+
+#SQLite stand-in for a remote database, every execute, executemany and commit is one simulated round trip of latency_ms
+class LatencyCursor:
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    #parameters as arguments or as one sequence, like pyodbc
+    def execute(self, statement, *params):
+        time.sleep(self._latency)
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        return self._cursor.execute(statement, params)
+
+    def executemany(self, statement, seq_of_params):
+        time.sleep(self._latency)
+        return self._cursor.executemany(statement, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class LatencyConnection:
+    def __init__(self, connection, latency):
+        self._connection = connection
+        self._latency = latency
+        self.IntegrityError = connection.IntegrityError
+
+    def cursor(self):
+        return LatencyCursor(self._connection.cursor(), self._latency)
+
+    def commit(self):
+        time.sleep(self._latency)
+        self._connection.commit()
+
+    def rollback(self):
+        time.sleep(self._latency)
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+#live resources of a fake client of the service. Every call takes call_ms, like a round trip to the service, and
+#a created or updated resource gets a new ETag.
+class FakeResources:
+    def __init__(self, call_ms=0.0):
+        self.latency = call_ms / 1000
+        self.calls = 0
+        self._e_tags = {}
+
+    def _put(self, kind, resource):
+        time.sleep(self.latency)
+        self.calls += 1
+        self._e_tags[(kind, resource.name)] = uuid.uuid4().hex
+        return types.SimpleNamespace(name=resource.name, e_tag=self._e_tags[(kind, resource.name)])
+
+    def _get(self, kind, name):
+        time.sleep(self.latency)
+        self.calls += 1
+        if (kind, name) not in self._e_tags:
+            raise ResourceNotFoundError(f"{kind} {name} not found")
+        return types.SimpleNamespace(name=name, e_tag=self._e_tags[(kind, name)])
+
+#SearchIndexClient stand-in for orchestrator.py
+class FakeIndexClient(FakeResources):
+    def create_or_update_index(self, index):
+        return self._put("index", index)
+
+    def get_index(self, name):
+        return self._get("index", name)
+
+#stand-in for the SearchIndexerClient of indexer.py, every batch of a run costs batch_overhead_ms plus item_ms per item
+class FakeIndexerClient(FakeResources):
+    def __init__(self, items, batch_overhead_ms=50.0, item_ms=0.2, failure_rate=0.0, call_ms=0.0):
+        super().__init__(call_ms)
+        self.items = items
+        self.batch_overhead = batch_overhead_ms / 1000
+        self.item_seconds = item_ms / 1000
+        self.failure_rate = failure_rate
+        self.polls = 0
+        self._indexer = None
+        self._runs = []
+
+    def create_or_update_indexer(self, indexer):
+        created = self._indexer is None
+        self._indexer = indexer
+        if created:
+            self._start()
+        return self._put("indexer", indexer)
+
+    def get_indexer(self, name):
+        return self._get("indexer", name)
+
+    def create_or_update_skillset(self, skillset):
+        return self._put("skillset", skillset)
+
+    def get_skillset(self, name):
+        return self._get("skillset", name)
+
+    def create_or_update_data_source_connection(self, data_source_connection):
+        return self._put("data source", data_source_connection)
+
+    def get_data_source_connection(self, name):
+        return self._get("data source", name)
+
+    def run_indexer(self, name):
+        if self._runs and self._result(self._runs[0]).status == "inProgress":
+            raise ResourceExistsError("Another indexer invocation is currently in progress")
+        self._start()
+
+    def _start(self):
+        parameters = self._indexer.parameters
+        self._runs.insert(0, {"start": datetime.datetime.now(datetime.timezone.utc),
+                              "batch_size": (parameters.batch_size if parameters else None) or 1000,
+                              "max_failed_items": (parameters.max_failed_items if parameters else None) or 0})
+
+    def _result(self, run):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        batch_size = run["batch_size"]
+        batch_seconds = self.batch_overhead + batch_size * self.item_seconds
+        batches = int((now - run["start"]).total_seconds() / batch_seconds)
+        done = min(batches * batch_size, self.items)
+        failed = int(done * self.failure_rate)
+        status = "inProgress"
+        end_time = None
+        if done == self.items or (run["max_failed_items"] != -1 and failed > run["max_failed_items"]):
+            status = "success" if failed <= run["max_failed_items"] or run["max_failed_items"] == -1 else "transientFailure"
+            end_time = run["start"] + datetime.timedelta(seconds=batches * batch_seconds)
+        errors = [types.SimpleNamespace(key=str(i), error_message="Could not execute skill") for i in range(failed)]
+        return types.SimpleNamespace(status=status, start_time=run["start"], end_time=end_time, item_count=done - failed,
+                                     failed_item_count=failed, errors=errors, warnings=[], error_message=None)
+
+    def get_indexer_status(self, name):
+        if self._indexer is None:
+            raise ResourceNotFoundError(f"Indexer {name} not found")
+        self.polls += 1
+        history = [self._result(run) for run in self._runs]
+        return types.SimpleNamespace(status="running", last_result=history[0], execution_history=history)
+
+#stand-in for the SearchIndexerClient with several indexers, e.g. of the partitions of partitions.py. Every indexer runs
+#like the one of FakeIndexerClient over items(data_source_name) items, all of them at the same time.
+class FakePartitionedIndexerClient(FakeResources):
+    def __init__(self, items, batch_overhead_ms=50.0, item_ms=0.2, call_ms=0.0):
+        super().__init__(call_ms)
+        self.items = items
+        self.batch_overhead_ms = batch_overhead_ms
+        self.item_ms = item_ms
+        self.indexers = {}
+
+    @property
+    def polls(self):
+        return sum(client.polls for client in self.indexers.values())
+
+    def _indexer(self, name):
+        if name not in self.indexers:
+            raise ResourceNotFoundError(f"Indexer {name} not found")
+        return self.indexers[name]
+
+    def create_or_update_indexer(self, indexer):
+        if indexer.name not in self.indexers:
+            self.indexers[indexer.name] = FakeIndexerClient(self.items(indexer.data_source_name), self.batch_overhead_ms, self.item_ms)
+        self.indexers[indexer.name].create_or_update_indexer(indexer)
+        return self._put("indexer", indexer)
+
+    def get_indexer(self, name):
+        return self._get("indexer", name)
+
+    def run_indexer(self, name):
+        self._indexer(name).run_indexer(name)
+
+    def get_indexer_status(self, name):
+        return self._indexer(name).get_indexer_status(name)
+
+    def create_or_update_skillset(self, skillset):
+        return self._put("skillset", skillset)
+
+    def get_skillset(self, name):
+        return self._get("skillset", name)
+
+    def create_or_update_data_source_connection(self, data_source_connection):
+        return self._put("data source", data_source_connection)
+
+    def get_data_source_connection(self, name):
+        return self._get("data source", name)
+
+#embedding deployment stand-in with a simulated latency of request_ms per request plus text_ms per text
+class LatencyEmbeddingClient(embeddings.FakeEmbeddingClient):
+    def __init__(self, dimensions, request_ms, text_ms):
+        super().__init__(dimensions)
+        self.latency = request_ms / 1000
+        self.text_latency = text_ms / 1000
+
+    def embed(self, texts):
+        time.sleep(self.latency + self.text_latency * len(texts))
+        return super().embed(texts)
+
+#SearchClient stand-in for pushpipeline.py with a simulated latency per upload request and per document. It checks that
+#every document has exactly the fields of the index projections.
+class FakeUploadClient:
+    def __init__(self, dimensions, request_ms, document_ms):
+        self.dimensions = dimensions
+        self.latency = request_ms / 1000
+        self.document_latency = document_ms / 1000
+        self.requests = 0
+        self.keys = set()
+        self._lock = threading.Lock()
+
+    def upload_documents(self, documents):
+        time.sleep(self.latency + self.document_latency * len(documents))
+        for document in documents:
+            if set(document) != set(pushpipeline.document_fields) or len(document["vector"]) != self.dimensions:
+                raise ValueError(f"Document {document.get('Id')} does not match the index schema")
+        with self._lock:
+            self.requests += 1
+            self.keys.update(document["Id"] for document in documents)
+        return [types.SimpleNamespace(key=document["Id"], succeeded=True, error_message=None) for document in documents]
+
+def connect_sqlite(db_path, latency_ms):
+    return LatencyConnection(sqlite3.connect(db_path, timeout=60, check_same_thread=False), latency_ms / 1000)
+
+#writes a CSV with the given number of rows by repeating the sample data.
+#Repeated winners get a suffix, so the business key (year, discipline, winner) stays unique.
+def write_csv(path, rows, source=sample_csv_file_path):
+    with open(source, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        sample = list(reader)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            year, discipline, winner, desc = sample[i % len(sample)]
+            repetition = i // len(sample)
+            writer.writerow([year, discipline, f"{winner} ({repetition})" if repetition else winner, desc])
+
+#changes the description of every n-th row, e.g. n=100 changes 1% of the rows
+def write_changed_csv(source, path, every_nth_row):
+    with open(source, newline="", encoding="utf-8") as f_in, open(path, "w", newline="", encoding="utf-8") as f_out:
+        reader = csv.reader(f_in)
+        writer = csv.writer(f_out)
+        writer.writerow(next(reader))
+        for i, row in enumerate(reader):
+            if i % every_nth_row == 0:
+                row[3] = f"{row[3]} (updated)"
+            writer.writerow(row)
+
+def create_sqlite_table(db_path, table_name, ddl=sqlite_table_ddl):
+    co = sqlite3.connect(db_path)
+    co.execute(f"DROP TABLE IF EXISTS {table_name}")
+    co.execute(ddl.format(table_name=table_name))
+    co.commit()
+    co.close()
+
+def count_rows(db_path, table_name):
+    co = sqlite3.connect(db_path)
+    rows = co.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    co.close()
+    return rows
+
+#waits until a local server (e.g. mockserver.py) accepts connections
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
@@ -2,13 +2,20 @@
 #
 import logging
 import openai 
+import querycache
+import schema
+import tracing
+import embeddingmodels
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchField, SearchFieldDataType, 
     VectorSearch, HnswAlgorithmConfiguration, VectorSearchProfile, AzureOpenAIVectorizer, 
     AzureOpenAIParameters, SearchIndex, HnswParameters, VectorSearchAlgorithmMetric, SemanticConfiguration, SemanticPrioritizedFields, 
-    SemanticField, SemanticSearch, ExhaustiveKnnAlgorithmConfiguration, ExhaustiveKnnParameters)
+    SemanticField, SemanticSearch, ExhaustiveKnnAlgorithmConfiguration, ExhaustiveKnnParameters, SearchSuggester)
+#compression models and the stored property of fields are only in the private generated models of azure-search-documents
+#11.6.0b2 (they are public from 11.6.0), requirements.txt pins that version exactly
+from azure.search.documents.indexes._generated.models import ScalarQuantizationCompressionConfiguration, ScalarQuantizationParameters
 
 
 #to run this code indipendently, uncomment the following lines and make sure to set your environment variables
@@ -25,6 +32,39 @@ from azure.search.documents.indexes.models import (
 # openai_uri = os.environ.get("OPENAI_URI")
 # openai_deployment = os.environ.get("OPENAI_DEPLOYMENT")
 
+vector_profiles = ("vectorsearch-profile", "exhaustiveknn-profile")
+
+#element types of the vector field and compressions of the vector index. Binary quantization needs a newer API version.
+vector_types = {"single": SearchFieldDataType.Single, "half": "Edm.Half"}
+vector_compressions = (None, "scalar")
+
+#fields of the compact schema that are filtered (e.g. by the query planner or to collapse results) or faceted, all other
+#fields get no filter, sort or facet attributes. db_table_year is an Int32 in the compact schema.
+compact_filterable_fields = ("db_table_id", "db_table_year", "db_table_discipline", "db_table_winner")
+compact_facetable_fields = ("db_table_year", "db_table_discipline")
+compact_int32_fields = ("db_table_year",)
+
+#AzureOpenAIParameters of the vectorizer with the modelName property, azure-search-documents 11.6.0b2 does not know it
+#yet. With the model the vectorizer requests the dimensions of the vector field (embeddingmodels.dimensions_api_version).
+class ModelAzureOpenAIParameters(AzureOpenAIParameters):
+    _attribute_map = dict(AzureOpenAIParameters._attribute_map, model_name={"key": "modelName", "type": "str"})
+
+    def __init__(self, model_name=None, **kwargs):
+        super().__init__(**kwargs)
+        self.model_name = model_name
+
+#SearchField with the stored property. stored=False keeps no copy of the field for retrieval, only the vector index,
+#which requires the field to be hidden (not retrievable).
+class StoredSearchField(SearchField):
+    def __init__(self, stored=None, **kwargs):
+        super().__init__(**kwargs)
+        self.stored = stored
+
+    def _to_generated(self):
+        field = super()._to_generated()
+        field.stored = self.stored
+        return field
+
 #create indexer with vector search configuration
 #1. create fiels
 #2. create indexer
@@ -34,22 +74,56 @@ from azure.search.documents.indexes.models import (
 #parameters of chunks
 #db_table_id, db_table_year, db_table_discipline, db_table_winner, db_table_description 
 #parameters of Azure SQL DB table
-def create_index(aisearch_key, service_endpoint, index_name, embedding_length, openai_key, openai_type, openai_uri, openai_deployment):
-    logging.info(f"Start creating index {index_name}")
-    
-    openai.api_key =  openai_key
-    openai.api_type = openai_type
+#build_index returns the index definition without creating it (used by orchestrator.py), create_index creates it
+@tracing.traced("index.build_index")
+def build_index(index_name, embedding_length, openai_key, openai_uri, openai_deployment, vector_profile="vectorsearch-profile",
+                hnsw_m=4, hnsw_ef_construction=400, hnsw_ef_search=500, compact=False, vector_type="single", vector_compression=None,
+                default_oversampling=None, suggester=False, embedding_model=None):
+    if vector_profile not in vector_profiles:
+        raise ValueError(f"Unknown vector profile {vector_profile}, use one of {', '.join(vector_profiles)}")
+    if vector_type not in vector_types:
+        raise ValueError(f"Unknown vector type {vector_type}, use one of {', '.join(vector_types)}")
+    if vector_compression not in vector_compressions:
+        raise ValueError(f"Unknown vector compression {vector_compression}, use scalar or None")
+    shortened = embeddingmodels.requested_dimensions(embedding_model, embedding_length) is not None
+
     #Defines the index fields.
-    fields = [
-    SearchField(name="Id", type=SearchFieldDataType.String, key=True, analyzer_name="keyword"),
-    SearchField(name="chunk", type=SearchFieldDataType.String, sortable=False, filterable=False, facetable=False),
-    SearchField(name="vector", type=SearchFieldDataType.Collection(SearchFieldDataType.Single), vector_search_dimensions=embedding_length, vector_search_profile_name="vectorsearch-profile"),
-    SearchField(name="db_table_id", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
-    SearchField(name="db_table_year", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
-    SearchField(name="db_table_discipline", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
-    SearchField(name="db_table_winner", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
-    SearchField(name="db_table_description", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True)
-    ]
+    vector_field_type = SearchFieldDataType.Collection(vector_types[vector_type])
+    if compact:
+        fields = [
+        SearchField(name="Id", type=SearchFieldDataType.String, key=True, analyzer_name="keyword"),
+        SearchField(name="chunk", type=SearchFieldDataType.String, searchable=True, sortable=False, filterable=False, facetable=False),
+        StoredSearchField(name="vector", type=vector_field_type, searchable=True, hidden=True, stored=False, vector_search_dimensions=embedding_length,
+                          vector_search_profile_name=vector_profile)
+        ]
+        for name, field_type, searchable in (("db_table_id", SearchFieldDataType.String, False), ("db_table_year", SearchFieldDataType.Int32, False),
+                                             ("db_table_discipline", SearchFieldDataType.String, True), ("db_table_winner", SearchFieldDataType.String, True),
+                                             ("db_table_description", SearchFieldDataType.String, False)):
+            fields.append(SearchField(name=name, type=field_type, searchable=searchable, sortable=False, filterable=name in compact_filterable_fields,
+                                      facetable=name in compact_facetable_fields))
+    else:
+        fields = [
+        SearchField(name="Id", type=SearchFieldDataType.String, key=True, analyzer_name="keyword"),
+        SearchField(name="chunk", type=SearchFieldDataType.String, sortable=False, filterable=False, facetable=False),
+        SearchField(name="vector", type=vector_field_type, vector_search_dimensions=embedding_length, vector_search_profile_name=vector_profile),
+        SearchField(name="db_table_id", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
+        SearchField(name="db_table_year", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
+        SearchField(name="db_table_discipline", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
+        SearchField(name="db_table_winner", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True),
+        SearchField(name="db_table_description", type=SearchFieldDataType.String, sortable=True, filterable=True, facetable=True)
+        ]
+
+    compressions = None
+    if vector_compression == "scalar":
+        compressions = [
+            ScalarQuantizationCompressionConfiguration(
+                name="scalar-quantization",
+                rerank_with_original_vectors=True,
+                default_oversampling=default_oversampling,
+                parameters=ScalarQuantizationParameters(quantized_data_type="int8")
+            )
+        ]
+    compression_name = compressions[0].name if compressions else None
 
     vector_search_config = VectorSearch(
     
@@ -57,21 +131,23 @@ def create_index(aisearch_key, service_endpoint, index_name, embedding_length, o
         VectorSearchProfile(
             name="vectorsearch-profile",
             algorithm_configuration_name="hnsw-config",
-            vectorizer="openai-ada" 
+            vectorizer="openai-ada",
+            compression_configuration_name=compression_name
         ),
         VectorSearchProfile(
             name="exhaustiveknn-profile",
             algorithm_configuration_name="exhaustiveknn-config",
-            vectorizer="openai-ada"
+            vectorizer="openai-ada",
+            compression_configuration_name=compression_name
         )
     ], #at least azure-search-documents 11.6.0b1 (preview in March 26, 2024). See https://pypi.org/project/azure-search-documents/#history
     algorithms=[
         HnswAlgorithmConfiguration(
             name="hnsw-config",
             parameters=HnswParameters(  
-                m=4,  
-                ef_construction=400,  
-                ef_search=500,  
+                m=hnsw_m,  
+                ef_construction=hnsw_ef_construction,  
+                ef_search=hnsw_ef_search,  
                 metric=VectorSearchAlgorithmMetric.COSINE,  
             ),  
         ),
@@ -87,16 +163,18 @@ def create_index(aisearch_key, service_endpoint, index_name, embedding_length, o
         AzureOpenAIVectorizer(
             name="openai-ada",
             kind="azureOpenAI",
-            azure_open_ai_parameters=AzureOpenAIParameters(
+            azure_open_ai_parameters=(ModelAzureOpenAIParameters if shortened else AzureOpenAIParameters)(
                 resource_uri=openai_uri,
                 deployment_id=openai_deployment,
-                api_key=openai.api_key,
+                api_key=openai_key,
+                **({"model_name": embedding_model} if shortened else {})
             )
 
         )
-    ]
+    ],
+    compressions=compressions
     )
-    logging.info(f"Succesfully created vector search configuration. Vector search profile: {vector_search_config.profiles[0].name} and vectorizer: {vector_search_config.vectorizers[0].name}. Algorithms: {vector_search_config.algorithms[0].name}")
+    logging.info(f"Succesfully created vector search configuration. Vector search profile: {vector_profile} and vectorizer: {vector_search_config.vectorizers[0].name}. Algorithms: {vector_search_config.algorithms[0].name}")
     #define semantic configuration
     semantic_search_config = SemanticConfiguration(
         name=f"{index_name}-semantic",
@@ -108,12 +186,78 @@ def create_index(aisearch_key, service_endpoint, index_name, embedding_length, o
     logging.info(f"Succesfully created semantic search configuration. Semantic search profile: {semantic_search_config.name}")
     #add semantic serach to the index
     semantic_search = SemanticSearch(configurations=[semantic_search_config]) 
-    
-    aisearch_client = SearchIndexClient(service_endpoint, AzureKeyCredential(aisearch_key))
+    suggesters = [SearchSuggester(name=schema.suggester_name, source_fields=list(schema.suggester_fields))] if suggester else None
+    search_index = SearchIndex(name=index_name, fields=fields, vector_search=vector_search_config, semantic_search=semantic_search, suggesters=suggesters)
+    validate_index(search_index)
+    return search_index
+
+#offline checks of an index definition, raises ValueError with all problems found
+def validate_index(search_index):
+    problems = []
+    fields = {field.name: field for field in search_index.fields}
+    keys = [field.name for field in search_index.fields if field.key]
+    if len(keys) != 1:
+        problems.append(f"expected one key field, found {keys}")
+    vector_search = search_index.vector_search
+    profiles = {profile.name: profile for profile in vector_search.profiles} if vector_search else {}
+    algorithms = {algorithm.name for algorithm in vector_search.algorithms or []} if vector_search else set()
+    compressions = {compression.name for compression in vector_search.compressions or []} if vector_search else set()
+    vectorizers = {vectorizer.name for vectorizer in vector_search.vectorizers or []} if vector_search else set()
+    for profile in profiles.values():
+        if profile.algorithm_configuration_name not in algorithms:
+            problems.append(f"profile {profile.name} uses unknown algorithm {profile.algorithm_configuration_name}")
+        if profile.vectorizer and profile.vectorizer not in vectorizers:
+            problems.append(f"profile {profile.name} uses unknown vectorizer {profile.vectorizer}")
+        if profile.compression_configuration_name and profile.compression_configuration_name not in compressions:
+            problems.append(f"profile {profile.name} uses unknown compression {profile.compression_configuration_name}")
+    for field in search_index.fields:
+        is_vector = str(field.type).startswith("Collection(Edm.Single") or str(field.type).startswith("Collection(Edm.Half")
+        if is_vector:
+            if not field.vector_search_dimensions or not 2 <= field.vector_search_dimensions <= 3072:
+                problems.append(f"vector field {field.name} has invalid dimensions {field.vector_search_dimensions}")
+            if field.vector_search_profile_name not in profiles:
+                problems.append(f"vector field {field.name} uses unknown profile {field.vector_search_profile_name}")
+            if field.filterable or field.sortable or field.facetable:
+                problems.append(f"vector field {field.name} can not be filterable, sortable or facetable")
+        if getattr(field, "stored", None) is False and not field.hidden:
+            problems.append(f"field {field.name} is not stored and must be hidden")
+        if field.type == SearchFieldDataType.Int32 and field.searchable:
+            problems.append(f"Int32 field {field.name} can not be searchable")
+    if search_index.semantic_search:
+        for configuration in search_index.semantic_search.configurations:
+            for semantic_field in configuration.prioritized_fields.content_fields or []:
+                if semantic_field.field_name not in fields:
+                    problems.append(f"semantic configuration {configuration.name} uses unknown field {semantic_field.field_name}")
+    for suggester in search_index.suggesters or []:
+        for name in suggester.source_fields:
+            field = fields.get(name)
+            if field is None:
+                problems.append(f"suggester {suggester.name} uses unknown field {name}")
+            elif field.type != SearchFieldDataType.String or field.searchable is False:
+                problems.append(f"suggester {suggester.name} field {name} must be a searchable string")
+    if problems:
+        raise ValueError(f"Invalid index definition {search_index.name}: {'; '.join(problems)}")
+    return search_index
+
+@tracing.traced("index.create_index")
+def create_index(aisearch_key, service_endpoint, index_name, embedding_length, openai_key, openai_type, openai_uri, openai_deployment,
+                 vector_profile="vectorsearch-profile", hnsw_m=4, hnsw_ef_construction=400, hnsw_ef_search=500, compact=False,
+                 vector_type="single", vector_compression=None, default_oversampling=None, suggester=False, embedding_model=None):
+    logging.info(f"Start creating index {index_name}")
+    openai.api_key =  openai_key
+    openai.api_type = openai_type
+    search_index = build_index(index_name, embedding_length, openai_key, openai_uri, openai_deployment, vector_profile,
+                               hnsw_m, hnsw_ef_construction, hnsw_ef_search, compact, vector_type, vector_compression, default_oversampling,
+                               suggester, embedding_model)
+
+    api_options = {"api_version": embeddingmodels.dimensions_api_version} if isinstance(search_index.vector_search.vectorizers[0].azure_open_ai_parameters,
+                                                                                    ModelAzureOpenAIParameters) else {}
+    aisearch_client = tracing.instrument(SearchIndexClient(service_endpoint, AzureKeyCredential(aisearch_key), **api_options))
     #Create search index with vector search configuration
     try:
-        search_index = SearchIndex(name=index_name, fields=fields, vector_search=vector_search_config, semantic_search=semantic_search)
         search_index_response = aisearch_client.create_or_update_index(search_index)
         logging.info(f"Index {search_index_response.name} created successfully with vector search configuration")
+        #cached query results may not match the new index definition
+        querycache.invalidate()
     except Exception as e:
-        logging.ERROR(f"Error creating index {index_name} with vector search configuration: {e}")
\ No newline at end of file
+        logging.error(f"Error creating index {index_name} with vector search configuration: {e}")
\ No newline at end of file
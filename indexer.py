@@ -1,9 +1,14 @@
 #Description: Create an indexer to index data from Azure SQL DB, skillset and index.
 #Afterwards it runs the indexer.
+import time
 import logging
-from azure.search.documents.indexes.models import SearchIndexer
+import datetime
+from azure.search.documents.indexes.models import SearchIndexer, IndexingParameters, IndexingParametersConfiguration
 from azure.search.documents.indexes import SearchIndexerClient
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+import querycache
+import tracing
 
 #to run this code indipendently, uncomment the following lines and make sure to set your environment variables
 #
@@ -11,24 +16,147 @@ from azure.core.credentials import AzureKeyCredential
 # index_name = os.environ.get("AZURE_SEARCH_INDEX_NAME")
 # aisearch_key = os.environ.get("AZURE_SEARCH_KEY")
 
-def create_indexer(service_endpoint, index_name, aisearch_key):
-    indexer_name = f"{index_name}-indexer"
-    logging.info(f"Start creating indexer {indexer_name}")
-    indexer = SearchIndexer(
-        name=indexer_name,
+#IndexingParameters of the indexer. None keeps the default of the service (batch size 1000 for Azure SQL, no failed items
+#allowed). configuration takes IndexingParametersConfiguration settings, e.g. {"query_timeout": "00:10:00"} for big tables.
+def build_indexing_parameters(batch_size=None, max_failed_items=None, max_failed_items_per_batch=None, configuration=None):
+    if batch_size is None and max_failed_items is None and max_failed_items_per_batch is None and not configuration:
+        return None
+    return IndexingParameters(
+        batch_size=batch_size,
+        max_failed_items=max_failed_items,
+        max_failed_items_per_batch=max_failed_items_per_batch,
+        configuration=IndexingParametersConfiguration(**configuration) if configuration else None
+    )
+
+#progress of the current run of an indexer status: items processed, failed items, docs/sec and the ETA
+def indexer_progress(status, expected_items=None, now=None):
+    result = status.last_result
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    end = result.end_time or now
+    elapsed = (end - result.start_time).total_seconds() if result.start_time else 0.0
+    progress = {"status": result.status, "items": result.item_count, "failed": result.failed_item_count, "seconds": elapsed,
+                "docs_per_second": result.item_count / elapsed if elapsed > 0 else 0.0, "expected_items": expected_items, "eta_seconds": None}
+
+    previous = next((run for run in status.execution_history or [] if run.start_time != result.start_time and run.status == "success"
+                     and run.end_time and run.item_count), None)
+    rate = progress["docs_per_second"]
+    if previous is not None:
+        if progress["expected_items"] is None:
+            progress["expected_items"] = previous.item_count
+        if not rate:
+            rate = previous.item_count / max((previous.end_time - previous.start_time).total_seconds(), 1e-3)
+    if result.status == "inProgress" and rate and progress["expected_items"] is not None:
+        progress["eta_seconds"] = max(progress["expected_items"] - result.item_count - result.failed_item_count, 0) / rate
+    return progress
+
+def format_progress(progress):
+    text = (f"{progress['items']} items processed, {progress['failed']} failed, {progress['seconds']:.0f} s, "
+            f"{progress['docs_per_second']:.1f} docs/sec")
+    if progress["eta_seconds"] is not None:
+        text += f", ETA {progress['eta_seconds']:.0f} s for {progress['expected_items']} items"
+    return text
+
+#polls the indexer status with a doubling interval until the run started after previous_start_time has finished
+@tracing.traced("indexer.wait_for_indexer")
+def wait_for_indexer(indexer_c, indexer_name, previous_start_time=None, poll_interval=5.0, max_poll_interval=60.0, timeout=None,
+                     expected_items=None, sleep=time.sleep):
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    interval = poll_interval
+    result = None
+    while True:
+        status = indexer_c.get_indexer_status(indexer_name)
+        tracing.add(polls=1)
+        if status.status == "error":
+            logging.error(f"Indexer {indexer_name} is in error state and cannot run")
+            return status.last_result
+        if status.last_result is None or status.last_result.start_time == previous_start_time:
+            logging.info(f"Indexer {indexer_name} run is queued")
+        else:
+            result = status.last_result
+            progress = indexer_progress(status, expected_items)
+            if result.status == "inProgress":
+                logging.info(f"Indexer {indexer_name} is running: {format_progress(progress)}")
+            else:
+                log = logging.info if result.status == "success" else logging.error
+                log(f"Indexer {indexer_name} run finished with status {result.status}: {format_progress(progress)}, "
+                    f"{len(result.errors or [])} errors, {len(result.warnings or [])} warnings")
+                tracing.add(items=result.item_count, failed_items=result.failed_item_count)
+                if result.error_message:
+                    logging.error(f"Indexer {indexer_name}: {result.error_message}")
+                for error in (result.errors or [])[:5]:
+                    logging.error(f"Indexer {indexer_name} failed item {error.key}: {error.error_message}")
+                return result
+
+        if deadline is not None and time.monotonic() + interval > deadline:
+            logging.warning(f"Stopped waiting for indexer {indexer_name} after {timeout} seconds, the run continues on the service")
+            return result
+        sleep(interval)
+        interval = min(interval * 2, max_poll_interval)
+
+#returns the indexer definition without creating it (used by orchestrator.py). name defaults to <index>-indexer, the
+#indexers of key range partitions get their own names (see partitions.py).
+def build_indexer(index_name, batch_size=None, max_failed_items=None, max_failed_items_per_batch=None, configuration=None,
+                  data_source_name="nobelprizewinners-azuresqlcon", name=None):
+    return SearchIndexer(
+        name=name or f"{index_name}-indexer",
         description="Indexer to index data from Azure SQL DB, chunk text and vectorize it",
         skillset_name=index_name + "-skillset",
         target_index_name=index_name,
-        data_source_name="nobelprizewinners-azuresqlcon" #TODO make it smarter
+        data_source_name=data_source_name,
+        parameters=build_indexing_parameters(batch_size, max_failed_items, max_failed_items_per_batch, configuration)
     )
+
+#start time of the last run of an existing indexer, so waiting does not mistake it for a new run
+def last_start_time(indexer_c, indexer_name):
+    try:
+        last_result = indexer_c.get_indexer_status(indexer_name).last_result
+    except ResourceNotFoundError:
+        return None
+    return last_result.start_time if last_result else None
+
+#runs the indexer and, with wait, waits for the run. A run in progress is waited for instead of queueing a new one.
+@tracing.traced("indexer.start_indexer")
+def start_indexer(indexer_c, indexer_name, previous_start_time=None, wait=False, poll_interval=5.0, max_poll_interval=60.0, timeout=None,
+                  expected_items=None):
+    logging.info(f"Start running indexer {indexer_name}")
+
+    try:
+        indexer_c.run_indexer(indexer_name)
+    except ResourceExistsError:
+        #a new indexer starts running when it is created. An earlier run may also still be in progress, its start time
+        #can be previous_start_time, which would make waiting for a new run wait forever.
+        logging.info(f"Indexer {indexer_name} is already running, waiting for the running run")
+        previous_start_time = None
+    if not wait:
+        #cached query results expire after their TTL, the end of the run is not known here
+        logging.info(f"Run of indexer {indexer_name} is queued, it continues on the service")
+        return None
+
+    result = wait_for_indexer(indexer_c, indexer_name, previous_start_time, poll_interval, max_poll_interval, timeout, expected_items)
+    #the finished run changed the indexed documents, cached query results are outdated. Results cached while the run
+    #is still writing (after a timeout) expire after their TTL.
+    if result is not None and result.status != "inProgress":
+        querycache.invalidate()
+    return result
+
+#indexer_c replaces the SearchIndexerClient of the service, e.g. with a fake client in benchmarks
+@tracing.traced("indexer.create_indexer")
+def create_indexer(service_endpoint, index_name, aisearch_key, batch_size=None, max_failed_items=None, max_failed_items_per_batch=None,
+                   configuration=None, wait=False, poll_interval=5.0, max_poll_interval=60.0, timeout=None, expected_items=None, indexer_c=None,
+                   data_source_name="nobelprizewinners-azuresqlcon"):
+    indexer_name = f"{index_name}-indexer"
+    logging.info(f"Start creating indexer {indexer_name}")
+    indexer = build_indexer(index_name, batch_size, max_failed_items, max_failed_items_per_batch, configuration, data_source_name)
     logging.info(f"created indexer configuration for {indexer_name}. Skillset: {indexer.skillset_name}, Target Index: {indexer.target_index_name}, Data Source: {indexer.data_source_name}")
-    
-    indexer_c = SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key))
+    if indexer.parameters is not None:
+        logging.info(f"Indexing parameters of {indexer_name}: {indexer.parameters.serialize()}")
+
+    if indexer_c is None:
+        indexer_c = tracing.instrument(SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key)))
+
+    previous_start_time = last_start_time(indexer_c, indexer_name) if wait else None
     indexer_result = indexer_c.create_or_update_indexer(indexer)
 
     logging.info(f"Indexer {indexer_result.name} created")
-    
-    logging.info(f"Start running indexer {indexer_name}")
-    
-    indexer_c.run_indexer(indexer_name) #add waiting time for bigger dbs, insert status check
-    logging.info(f"Running indexer {indexer_name} is finished")
\ No newline at end of file
+
+    return start_indexer(indexer_c, indexer_name, previous_start_time, wait, poll_interval, max_poll_interval, timeout, expected_items)
@@ -0,0 +1,206 @@
+#Description: Load generator for the vector, hybrid and semantic search modes.
+#usage: python loadgen.py --concurrency 16 --duration 30 --mix vector=1,hybrid=2,semantic=1 --output run.json
+import os
+import csv
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from azure.core.exceptions import HttpResponseError
+import metrics
+import searchengine
+import searchquery
+
+#terms of the sampled corpus: winners, "<discipline> <year>" and short phrases of the descriptions
+def sample_corpus(csv_file_path="./data/nobel-prize-winners.csv", size=1000, seed=0):
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        row = rng.choice(rows)
+        kind = rng.random()
+        if kind < 0.3:
+            corpus.append(row["winner"])
+        elif kind < 0.5:
+            corpus.append(f"{row['discipline']} {row['year']}")
+        else:
+            words = row["desc"].split()
+            length = rng.randint(2, 5)
+            start = rng.randint(0, max(len(words) - length, 0))
+            corpus.append(" ".join(words[start:start + length]) or row["winner"])
+    return corpus
+
+#parses "vector=1,hybrid=2,semantic=1" into weights per search mode
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        mode, _, weight = part.partition("=")
+        mode = mode.strip()
+        if mode not in searchquery.modes:
+            raise ValueError(f"Unknown search mode {mode} in the mix, use {', '.join(searchquery.modes)}")
+        weights[mode] = float(weight) if weight else 1.0
+    return weights
+
+#endless stream of (mode, search text). Queries of the corpus with their own mode (see searchengine.read_queries) keep it,
+#all others get a mode drawn from the weights.
+def query_stream(corpus, weights, seed=0):
+    rng = random.Random(seed)
+    modes, mode_weights = list(weights), list(weights.values())
+    while True:
+        for query in corpus:
+            if isinstance(query, tuple):
+                yield query
+            else:
+                yield rng.choices(modes, mode_weights)[0], query
+
+class LoadGenerator:
+    def __init__(self, engine, queries, timeout=10.0):
+        self.engine = engine
+        self.queries = queries
+        self.timeout = timeout
+        self.samples = []
+
+    #runs one query, the latency counts from start (the scheduled time in open loop runs)
+    async def _run(self, mode, search_input, start):
+        error = None
+        try:
+            await self.engine.search(search_input, mode, self.timeout)
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except HttpResponseError as e:
+            error = "throttled" if e.status_code in searchengine.throttling_status_codes else f"http {e.status_code}"
+        except Exception as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+        self.samples.append({"mode": mode, "start": start, "seconds": end - start, "error": error})
+
+    #closed loop: concurrency clients send their next query as soon as the previous one is answered
+    async def run_closed(self, concurrency, duration):
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                mode, search_input = next(self.queries)
+                await self._run(mode, search_input, time.perf_counter())
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    #open loop: queries start at qps per second (uniform or poisson arrivals) regardless of the answers
+    async def run_open(self, qps, duration, arrivals="uniform", seed=0):
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        scheduled = start
+        tasks = set()
+        while scheduled < start + duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            mode, search_input = next(self.queries)
+            task = asyncio.ensure_future(self._run(mode, search_input, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            scheduled += rng.expovariate(qps) if arrivals == "poisson" else 1 / qps
+        if tasks:
+            await asyncio.wait(tasks)
+
+#throughput, latency percentiles and error rates of the samples, per mode and for all modes ("all"). Samples that
+#started before warmup seconds after the first sample are left out.
+def summarize(samples, duration, throttled_attempts=0, warmup=0.0):
+    if samples:
+        first = min(sample["start"] for sample in samples)
+        samples = [sample for sample in samples if sample["start"] >= first + warmup]
+    summary = {}
+    for mode in ["all"] + sorted({sample["mode"] for sample in samples}):
+        selected = [sample for sample in samples if mode == "all" or sample["mode"] == mode]
+        histogram = metrics.Histogram()
+        errors = {}
+        for sample in selected:
+            histogram.record(sample["seconds"] * 1e6)
+            if sample["error"]:
+                errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+        latency = histogram.summary(1e-6)
+        count = len(selected)
+        summary[mode] = {"queries": count, "qps": count / max(duration - warmup, 1e-9),
+                         "p50_ms": latency.get("p50", 0) * 1000, "p95_ms": latency.get("p95", 0) * 1000, "p99_ms": latency.get("p99", 0) * 1000,
+                         "max_ms": latency.get("max", 0) * 1000, "error_rate": sum(errors.values()) / max(count, 1),
+                         "timeout_rate": errors.get("timeout", 0) / max(count, 1), "errors": errors}
+    #the engine retries throttled requests, the throttle rate counts every throttled attempt including the failed ones
+    if summary:
+        total = summary["all"]
+        total["throttle_rate"] = (throttled_attempts + total["errors"].get("throttled", 0)) / max(total["queries"] + throttled_attempts, 1)
+    return summary
+
+async def run_load(service_endpoint, index_name, aisearch_key, corpus, weights, concurrency=16, qps=None, duration=30.0, arrivals="uniform",
+                   timeout=10.0, max_retries=5, warmup=0.0, seed=0):
+    #open loop runs are not limited by the engine, only by the arrival rate
+    max_concurrency = max(concurrency, int(qps * timeout) + 1) if qps else concurrency
+    async with searchengine.SearchEngine(service_endpoint, index_name, aisearch_key, max_concurrency=max_concurrency, timeout=timeout,
+                                         max_retries=max_retries) as engine:
+        generator = LoadGenerator(engine, query_stream(corpus, weights, seed), timeout)
+        start = time.perf_counter()
+        if qps:
+            await generator.run_open(qps, duration, arrivals, seed)
+        else:
+            await generator.run_closed(concurrency, duration)
+        seconds = time.perf_counter() - start
+        return summarize(generator.samples, seconds, engine.stats["throttled"], warmup)
+
+def format_report(summary):
+    lines = [f"{'mode':<9} {'queries':>8} {'qps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'errors':>7} {'timeouts':>8}"]
+    for mode, values in summary.items():
+        lines.append(f"{mode:<9} {values['queries']:>8} {values['qps']:>8.1f} {values['p50_ms']:>7.1f}ms {values['p95_ms']:>7.1f}ms "
+                     f"{values['p99_ms']:>7.1f}ms {values['max_ms']:>7.1f}ms {values['error_rate']:>7.1%} {values['timeout_rate']:>8.1%}")
+    if "all" in summary:
+        lines.append(f"throttled attempts: {summary['all']['throttle_rate']:.1%}")
+    return "\n".join(lines)
+
+#compares the summary with the one of a saved run (relative change of throughput and latency per mode)
+def format_comparison(summary, baseline):
+    lines = [f"{'mode':<9} {'qps':>16} {'p50':>18} {'p99':>18} {'errors':>16}"]
+    for mode, values in summary.items():
+        before = baseline.get(mode)
+        if before is None:
+            continue
+        cells = []
+        for key, unit in (("qps", ""), ("p50_ms", "ms"), ("p99_ms", "ms")):
+            change = (values[key] - before[key]) / before[key] if before[key] else 0.0
+            cells.append(f"{before[key]:.1f}->{values[key]:.1f}{unit} {change:+.0%}")
+        lines.append(f"{mode:<9} {cells[0]:>16} {cells[1]:>18} {cells[2]:>18} {before['error_rate']:>6.1%}->{values['error_rate']:.1%}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the search modes")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients of a closed loop run")
+    parser.add_argument("--qps", type=float, help="arrival rate of an open loop run")
+    parser.add_argument("--arrivals", choices=["uniform", "poisson"], default="uniform")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=0.0, help="seconds at the start that are not counted")
+    parser.add_argument("--mix", default="vector=1,hybrid=1,semantic=1")
+    parser.add_argument("--queries-file", help="replays this file (see searchengine.read_queries) instead of the sampled corpus")
+    parser.add_argument("--corpus-size", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--max-retries", type=int, default=5, help="retries of throttled requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="saves the configuration and the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    corpus = list(searchengine.read_queries(args.queries_file)) if args.queries_file else sample_corpus(size=args.corpus_size, seed=args.seed)
+    summary = asyncio.run(run_load(os.environ.get("AZURE_SEARCH_ENDPOINT"), os.environ.get("AZURE_SEARCH_INDEX_NAME"), os.environ.get("AZURE_SEARCH_KEY"),
+                                   corpus, parse_mix(args.mix), args.concurrency, args.qps, args.duration, args.arrivals, args.timeout,
+                                   args.max_retries, args.warmup, args.seed))
+    print(format_report(summary))
+    if args.compare:
+        with open(args.compare) as f:
+            print(format_comparison(summary, json.load(f)["results"]))
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        with open(args.output, "w") as f:
+            json.dump({"time": time.time(), "config": config, "results": summary}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
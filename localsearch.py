@@ -0,0 +1,324 @@
+#Description: Offline, in-process search backend with the fields and search modes of the index.
+import re
+import math
+import heapq
+import random
+from collections import defaultdict
+import numpy
+import chunking
+import queryplanner
+
+token_pattern = re.compile(r"\w+")
+
+def tokenize(text):
+    return token_pattern.findall(text.lower()) if text else []
+
+#returns the indices of the top largest scores in descending order, argpartition avoids sorting all scores
+def top_k(scores, top):
+    top = min(top, scores.shape[-1])
+    if top <= 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    candidates = numpy.argpartition(-scores, top - 1)[:top]
+    return candidates[numpy.argsort(-scores[candidates], kind="stable")]
+
+#share of the expected (exact) top k ids found in the top k ids of another search
+def recall_at_k(expected_ids, actual_ids, k):
+    expected = set(list(expected_ids)[:k])
+    if not expected:
+        return 1.0
+    return len(expected & set(list(actual_ids)[:k])) / len(expected)
+
+#recall@k that counts ties: a result is correct if its similarity reaches the k-th exact similarity. Duplicate chunks
+#have identical vectors, matching ids alone would count an equally similar duplicate as a miss.
+def recall_at_k_with_ties(exact_similarities, similarities, k, tolerance=1e-6):
+    exact_similarities = list(exact_similarities)[:k]
+    if not exact_similarities:
+        return 1.0
+    threshold = exact_similarities[-1] - tolerance
+    return min(1.0, sum(1 for similarity in list(similarities)[:k] if similarity >= threshold) / len(exact_similarities))
+
+#local stand-in for the hnsw-config algorithm of the index, m, ef_construction and ef_search like HnswParameters
+class HnswIndex:
+    def __init__(self, matrix, m=4, ef_construction=400, seed=0):
+        self.matrix = matrix
+        self.m = m
+        self.ef_construction = ef_construction
+        self._level_factor = 1 / math.log(max(m, 2))
+        self._random = random.Random(seed)
+        self._layers = []
+        self._entry_point = None
+        self._top_level = -1
+        for node in range(matrix.shape[0]):
+            self._insert(node)
+
+    def _search_layer(self, query, entry_points, ef, layer):
+        graph = self._layers[layer]
+        visited = set(entry_points)
+        similarities = (self.matrix[entry_points] @ query).tolist()
+        candidates = [(-similarity, node) for similarity, node in zip(similarities, entry_points)]
+        heapq.heapify(candidates)
+        results = [(similarity, node) for similarity, node in zip(similarities, entry_points)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative_similarity, node = heapq.heappop(candidates)
+            if -negative_similarity < results[0][0] and len(results) >= ef:
+                break
+            neighbors = [neighbor for neighbor in graph.get(node, ()) if neighbor not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for neighbor, similarity in zip(neighbors, (self.matrix[neighbors] @ query).tolist()):
+                if len(results) < ef or similarity > results[0][0]:
+                    heapq.heappush(candidates, (-similarity, neighbor))
+                    heapq.heappush(results, (similarity, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _insert(self, node):
+        level = int(-math.log(1 - self._random.random()) * self._level_factor)
+        while len(self._layers) <= level:
+            self._layers.append({})
+        if self._entry_point is None:
+            for layer in range(level + 1):
+                self._layers[layer][node] = []
+            self._entry_point = node
+            self._top_level = level
+            return
+
+        query = self.matrix[node]
+        entry_points = [self._entry_point]
+        top_level = self._top_level
+        for layer in range(top_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        for layer in range(min(level, top_level), -1, -1):
+            found = self._search_layer(query, entry_points, self.ef_construction, layer)
+            max_links = 2 * self.m if layer == 0 else self.m
+            neighbors = [neighbor for _, neighbor in found[:self.m]]
+            graph = self._layers[layer]
+            graph[node] = neighbors
+            for neighbor in neighbors:
+                links = graph.setdefault(neighbor, [])
+                links.append(node)
+                if len(links) > max_links:
+                    #keep the most similar links of the neighbor
+                    similarities = self.matrix[links] @ self.matrix[neighbor]
+                    graph[neighbor] = [links[i] for i in numpy.argsort(-similarities)[:max_links]]
+            entry_points = [neighbor for _, neighbor in found]
+        for layer in range(top_level + 1, level + 1):
+            self._layers[layer][node] = []
+        if level > top_level:
+            self._entry_point = node
+            self._top_level = level
+
+    def search(self, query, k, ef_search=500):
+        query = numpy.asarray(query, dtype=numpy.float32)
+        if self._entry_point is None or k <= 0:
+            return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float32)
+        query = query / (numpy.linalg.norm(query) or 1)
+        entry_points = [self._entry_point]
+        for layer in range(self._top_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        found = self._search_layer(query, entry_points, max(ef_search, k), 0)[:k]
+        return numpy.array([node for _, node in found], dtype=numpy.int64), numpy.array([similarity for similarity, _ in found], dtype=numpy.float32)
+
+#result of LocalSearchIndex.search, iterates like SearchItemPaged. There is no semantic ranker, so there are no answers.
+class LocalSearchResults:
+    def __init__(self, results):
+        self._results = results
+
+    def __iter__(self):
+        return iter(self._results)
+
+    def __len__(self):
+        return len(self._results)
+
+    def get_answers(self):
+        return None
+
+    def get_count(self):
+        return len(self._results)
+
+class LocalSearchIndex:
+    def __init__(self, embedder=None, k1=1.2, b=0.75, rrf_k=60):
+        self.embedder = embedder
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.documents = []
+        self._vectors = []
+        self._matrix = None
+        self._postings = {}
+        self._idf = {}
+        self._length_norm = None
+        self._hnsw = None
+        self.ef_search = 500
+        self._filter_cache = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    #builds the index from the CSV (or any rows of chunking.read_csv_rows / read_sql_rows). The chunks are embedded with the
+    #embedder in batches of batch_size.
+    @classmethod
+    def from_rows(cls, rows, embedder, batch_size=256, **kwargs):
+        index = cls(embedder, **kwargs)
+        documents = []
+        for row in rows:
+            documents.extend(chunking.project_row(*row))
+            if len(documents) >= batch_size:
+                index.add_documents(documents, embedder.embed_many([document["chunk"] for document in documents]))
+                documents = []
+        if documents:
+            index.add_documents(documents, embedder.embed_many([document["chunk"] for document in documents]))
+        index.build()
+        return index
+
+    def add_documents(self, documents, vectors):
+        self.documents.extend(documents)
+        self._vectors.extend(vectors)
+
+    #creates the normalized vector matrix and the inverted index of chunk
+    def build(self):
+        matrix = numpy.ascontiguousarray(numpy.asarray(self._vectors, dtype=numpy.float32))
+        if matrix.size:
+            norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= numpy.where(norms == 0, 1, norms)
+        self._matrix = matrix
+        self._vectors = []
+        self._filter_cache = {}
+
+        term_frequencies = defaultdict(lambda: defaultdict(int))
+        lengths = numpy.zeros(len(self.documents), dtype=numpy.float32)
+        for doc_id, document in enumerate(self.documents):
+            tokens = tokenize(document["chunk"])
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                term_frequencies[token][doc_id] += 1
+
+        count = len(self.documents)
+        self._postings = {}
+        self._idf = {}
+        for token, frequencies in term_frequencies.items():
+            self._postings[token] = (numpy.fromiter(frequencies.keys(), dtype=numpy.int64, count=len(frequencies)),
+                                     numpy.fromiter(frequencies.values(), dtype=numpy.float32, count=len(frequencies)))
+            self._idf[token] = math.log(1 + (count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+        average_length = lengths.mean() if count else 0.0
+        self._length_norm = self.k1 * (1 - self.b + self.b * lengths / (average_length or 1.0))
+
+    #BM25 scores of all chunks for the query text
+    def bm25_scores(self, search_text):
+        scores = numpy.zeros(len(self.documents), dtype=numpy.float32)
+        for token in tokenize(search_text):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            doc_ids, frequencies = posting
+            scores[doc_ids] += self._idf[token] * frequencies * (self.k1 + 1) / (frequencies + self._length_norm[doc_ids])
+        return scores
+
+    def bm25(self, search_text, top):
+        scores = self.bm25_scores(search_text)
+        matched = numpy.count_nonzero(scores)
+        ids = top_k(scores, min(top, matched))
+        return ids, scores[ids]
+
+    #exact cosine kNN for a batch of query vectors with one matrix multiply. Returns the ids and cosine similarities,
+    #one row per query.
+    def knn_batch(self, query_vectors, top):
+        queries = numpy.atleast_2d(numpy.asarray(query_vectors, dtype=numpy.float32))
+        top = min(top, len(self.documents))
+        if top <= 0:
+            return numpy.empty((len(queries), 0), dtype=numpy.int64), numpy.empty((len(queries), 0), dtype=numpy.float32)
+        #a zero query vector is similar to nothing instead of NaN
+        norms = numpy.linalg.norm(queries, axis=1, keepdims=True)
+        similarities = (queries / numpy.where(norms == 0, 1, norms)) @ self._matrix.T
+        ids = numpy.argpartition(-similarities, top - 1, axis=1)[:, :top]
+        order = numpy.argsort(-numpy.take_along_axis(similarities, ids, axis=1), axis=1, kind="stable")
+        ids = numpy.take_along_axis(ids, order, axis=1)
+        return ids, numpy.take_along_axis(similarities, ids, axis=1)
+
+    def knn(self, query_vector, top):
+        ids, similarities = self.knn_batch([query_vector], top)
+        return ids[0], similarities[0]
+
+    #exact cosine kNN over the chunks of candidates (ids) only, like a pre-filtered vector query
+    def knn_candidates(self, query_vector, top, candidates):
+        query = numpy.asarray(query_vector, dtype=numpy.float32)
+        similarities = self._matrix[candidates] @ (query / (numpy.linalg.norm(query) or 1))
+        order = top_k(similarities, top)
+        return candidates[order], similarities[order]
+
+    #ids of the chunks that match an OData filter (see queryplanner.compile_predicate), cached per filter
+    def filter_ids(self, filter):
+        ids = self._filter_cache.get(filter)
+        if ids is None:
+            predicate = queryplanner.compile_predicate(filter)
+            ids = numpy.fromiter((doc_id for doc_id, document in enumerate(self.documents) if predicate(document)), dtype=numpy.int64)
+            self._filter_cache[filter] = ids
+        return ids
+
+    #builds an HNSW graph over the vectors. Vector queries with exhaustive=False use it afterwards, like the hnsw-config
+    #of the service; exhaustive queries stay exact.
+    def build_hnsw(self, m=4, ef_construction=400, ef_search=500):
+        self._hnsw = HnswIndex(self._matrix, m=m, ef_construction=ef_construction)
+        self.ef_search = ef_search
+
+    def _query_vector(self, vector_query):
+        vector = getattr(vector_query, "vector", None)
+        if vector is not None:
+            return vector
+        if self.embedder is None:
+            raise ValueError("LocalSearchIndex needs an embedder for VectorizableTextQuery")
+        return self.embedder.embed(vector_query.text)
+
+    #same arguments as SearchClient.search, semantic queries are answered like hybrid queries
+    def search(self, search_text=None, vector_queries=None, select=None, top=None, filter=None, vector_filter_mode=None, **kwargs):
+        top = top or 50
+        allowed = self.filter_ids(filter) if filter else None
+        post_filter = allowed is not None and vector_filter_mode == "postFilter"
+
+        ranked_lists = []
+        scores = {}
+        if search_text and search_text != "*":
+            if allowed is None:
+                ids, text_scores = self.bm25(search_text, max(top, 50))
+            else:
+                text_scores = self.bm25_scores(search_text)[allowed]
+                order = top_k(text_scores, min(max(top, 50), numpy.count_nonzero(text_scores)))
+                ids, text_scores = allowed[order], text_scores[order]
+            ranked_lists.append(ids)
+            scores = dict(zip(ids.tolist(), text_scores.tolist()))
+        for vector_query in vector_queries or []:
+            k = vector_query.k_nearest_neighbors or top
+            if allowed is not None and not post_filter:
+                ids, similarities = self.knn_candidates(self._query_vector(vector_query), k, allowed)
+            elif self._hnsw is not None and not vector_query.exhaustive:
+                ids, similarities = self._hnsw.search(self._query_vector(vector_query), k, self.ef_search)
+            else:
+                ids, similarities = self.knn(self._query_vector(vector_query), k)
+            if post_filter:
+                keep = numpy.isin(ids, allowed)
+                ids, similarities = ids[keep], similarities[keep]
+            ranked_lists.append(ids)
+            #cosine similarity as score like the service: 1 / (1 + cosine distance)
+            scores = dict(zip(ids.tolist(), (1 / (2 - similarities)).tolist()))
+
+        if len(ranked_lists) > 1:
+            #Reciprocal Rank Fusion of the text and vector rankings
+            scores = defaultdict(float)
+            for ids in ranked_lists:
+                for rank, doc_id in enumerate(ids.tolist(), start=1):
+                    scores[doc_id] += 1 / (self.rrf_k + rank)
+        ranking = sorted(scores.items(), key=lambda item: -item[1])[:top]
+
+        results = []
+        for doc_id, score in ranking:
+            document = self.documents[doc_id]
+            result = {field: document.get(field) for field in select} if select else dict(document)
+            result["@search.score"] = score
+            results.append(result)
+        return LocalSearchResults(results)
@@ -3,23 +3,14 @@
 # create an Azure AI Search index with vector search configuration,
 # create a skillset for Azure AI Search with Azure OpenAi Embedding and TextSplit,
 # and create an indexer with index, data source, and skillset.
+# usage: python main.py [enroll|query|console|serve|suggest|bench] ...
 
 
 import os
+import sys
 import time
 import logging
-import azuresql
-import openai 
-import index
-import skillset
-import indexer
-import consoleapp
-from azure.search.documents import SearchClient  
-from azure.core.credentials import AzureKeyCredential 
-from azure.search.documents.models import VectorizableTextQuery 
-from azure.search.documents.models import (
-    QueryType,QueryAnswerType
-)
+import argparse
 
 #Debug mode
 #set stderr_logs to True if you want to see logs in the console
@@ -34,156 +25,621 @@ hyrbidsearchsample = True
 #enables the hybrid search with semantic reranking sample request below
 vectorsemanticsearchsample = False
 
+#enables the adaptive search sample request below: hybrid search, semantic reranking only for ambiguous queries
+adaptivesearchsample = False
+
 #allows you to continuously enter search commands in the console
 app = True
 
 #specifies if the user wants (or needs) to create the AI Search configuration for Azure SQL integrated vectorization.
 enroll = True
 
+#everything else is configured by the flags of the subcommands below (python main.py <subcommand> --help)
 
-if stderr_logs:
-    logging_handlers = [
-        logging.FileHandler("debug.log"),
-        logging.StreamHandler()
-    ]
-else:
-    logging_handlers = [
-        logging.FileHandler("debug.log")
-    ]
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=logging_handlers
-)
-
-logging.info("Starting the main script")
-start_time = time.time()
-
-# #OpenAI vars
-openai.api_key = os.environ.get("OPENAI_API_KEY")
-openai.api_type = os.environ.get("OPENAI_API_TYPE")
-openai_uri = os.environ.get("OPENAI_URI")
-openai_deployment = os.environ.get("OPENAI_DEPLOYMENT")
-
-# #AI Search vars
-aisearch_key = os.environ.get("AZURE_SEARCH_KEY")
-service_endpoint = os.environ.get("AZURE_SEARCH_ENDPOINT")
-index_name = os.environ.get("AZURE_SEARCH_INDEX_NAME")
-embedding_length = 1536
-
-# #Azure SQL vars
-sql_server = os.environ.get("SQL_SERVER_NAME")
-database_name = os.environ.get("SQL_DATABASE_NAME")
-username = os.environ.get("SQL_USERNAME")
-password = os.environ.get("SQL_PASSWORD")
-sql_driver = os.environ.get("SQL_DRIVER")
 
 #search input defines the term that should be searched in the index
 search_input = "Einstein"
+#dimensions of the embedding deployment, e.g. 256 for shortened text-embedding-3 embeddings
+embedding_length = 1536
+csv_file_path = "./data/nobel-prize-winners.csv"
+
+
+def configure_logging(stderr):
+    if stderr:
+        logging_handlers = [
+            logging.FileHandler("debug.log"),
+            logging.StreamHandler()
+        ]
+    else:
+        logging_handlers = [
+            logging.FileHandler("debug.log")
+        ]
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=logging_handlers
+    )
+
+#search modes of the enabled sample requests
+def sample_modes():
+    return [mode for mode, enabled in (("vector", vectorsearchsample), ("hybrid", hyrbidsearchsample), ("semantic", vectorsemanticsearchsample),
+                                       ("adaptive", adaptivesearchsample))
+            if enabled]
+
+#flags of the AI Search service and the Azure OpenAI deployment, the defaults come from the environment variables
+def add_service_arguments(parser):
+    parser.add_argument("--endpoint", default=os.environ.get("AZURE_SEARCH_ENDPOINT"), help="AI Search endpoint (AZURE_SEARCH_ENDPOINT)")
+    parser.add_argument("--index-name", default=os.environ.get("AZURE_SEARCH_INDEX_NAME"), help="index name (AZURE_SEARCH_INDEX_NAME)")
+    parser.add_argument("--key", default=os.environ.get("AZURE_SEARCH_KEY"), help="AI Search key (AZURE_SEARCH_KEY)")
+    parser.add_argument("--openai-uri", default=os.environ.get("OPENAI_URI"), help="Azure OpenAI endpoint (OPENAI_URI)")
+    parser.add_argument("--openai-key", default=os.environ.get("OPENAI_API_KEY"), help="Azure OpenAI key (OPENAI_API_KEY)")
+    parser.add_argument("--openai-deployment", default=os.environ.get("OPENAI_DEPLOYMENT"), help="embedding deployment (OPENAI_DEPLOYMENT)")
+    parser.add_argument("--embedding-length", type=int, default=embedding_length, help="dimensions of the embeddings")
+    parser.add_argument("--embedding-model", default="text-embedding-ada-002", help="model of the embedding deployment, text-embedding-3-* can shorten")
+    parser.add_argument("--no-stderr-logs", dest="stderr_logs", action="store_false", default=stderr_logs, help="logs only to debug.log")
+
+#flags of the Azure SQL database, the defaults come from the environment variables
+def add_sql_arguments(parser):
+    parser.add_argument("--sql-server", default=os.environ.get("SQL_SERVER_NAME"), help="(SQL_SERVER_NAME)")
+    parser.add_argument("--database-name", default=os.environ.get("SQL_DATABASE_NAME"), help="(SQL_DATABASE_NAME)")
+    parser.add_argument("--sql-username", default=os.environ.get("SQL_USERNAME"), help="(SQL_USERNAME)")
+    parser.add_argument("--sql-password", default=os.environ.get("SQL_PASSWORD"), help="(SQL_PASSWORD)")
+    parser.add_argument("--sql-driver", default=os.environ.get("SQL_DRIVER"), help="(SQL_DRIVER)")
+
+#flags of every search request, of the query, console and serve subcommands
+def add_request_arguments(parser):
+    parser.add_argument("--exhaustive", action=argparse.BooleanOptionalAction, default=True,
+                        help="exact kNN instead of the HNSW graph of the vector profile")
+    #the queries are embedded on the client and sent as vector, the adaptive mode does so by default
+    parser.add_argument("--client-embedding", action=argparse.BooleanOptionalAction, default=None,
+                        help="embeds the queries on the client (default only in the adaptive mode)")
+    parser.add_argument("--embedding-cache-dir", default=".embeddingcache")
+    #more chunks are fetched until k rows are found. Every chunk repeats the description of its row, see
+    #searchquery.projection_profiles for the fields of the profiles.
+    parser.add_argument("--collapse", action=argparse.BooleanOptionalAction, default=False,
+                        help="returns the best chunk of k distinct rows")
+    parser.add_argument("--profile", default="full", help="returned fields: full, display, chunk or ids")
+    parser.add_argument("--oversampling", type=float, default=None, help="oversampling of a compressed vector index")
+    #years, disciplines and winner names of the queries become an OData filter (see queryplanner.py), applied before
+    #("pre") or after ("post") the vector search
+    parser.add_argument("--plan", action=argparse.BooleanOptionalAction, default=False,
+                        help="moves years, disciplines and winners of the queries into a filter")
+    parser.add_argument("--filter-mode", choices=["pre", "post"], default="pre", help="filters before or after the vector search")
+    parser.add_argument("--year", action="append", default=[], help="year or range (1920-1929) of every query, repeatable")
+    parser.add_argument("--discipline", action="append", default=[], help="discipline of every query, repeatable")
+    parser.add_argument("--winner", action="append", default=[], help="winner of every query, repeatable")
+    parser.add_argument("--int-year", action=argparse.BooleanOptionalAction, default=False,
+                        help="db_table_year is an Int32 (compact schema)")
+
+#flags of the query and console subcommands
+def add_query_arguments(parser, mode):
+    parser.add_argument("--mode", choices=["vector", "hybrid", "semantic", "adaptive"], default=mode)
+    add_request_arguments(parser)
+    #chunks and queries are embedded with the deployment, or with a local fake embedding
+    parser.add_argument("--local", action=argparse.BooleanOptionalAction, default=False,
+                        help="answers from an in-process index built from the CSV")
+    parser.add_argument("--local-fake-embedding", action=argparse.BooleanOptionalAction, default=False)
+    add_hnsw_arguments(parser)
+    #adaptive mode: a hybrid query is only sent again with semantic reranking if its result is ambiguous (see adaptive.py).
+    #"python adaptive.py <record file>" replays the recorded decisions with other thresholds.
+    parser.add_argument("--min-margin", type=float, default=0.01, help="adaptive mode: escalates below this score margin")
+    parser.add_argument("--min-agreement", type=float, default=0.5,
+                        help="adaptive mode: escalates below this share of results found by text and vector search")
+    parser.add_argument("--candidates", type=int, default=50, help="adaptive mode: hybrid results reranked on escalation")
+    parser.add_argument("--record-file", default=None, help="adaptive mode: appends every decision as JSON line")
+    #latency, time to first result, server elapsed time, result count and response size per search mode, reported as
+    #p50/p95/p99 at the end. Queries of at least --slow-query-ms are logged with probability --slow-query-sample-rate.
+    parser.add_argument("--metrics", action=argparse.BooleanOptionalAction, default=False, help="measures every search request")
+    parser.add_argument("--metrics-file", default=None, help="writes the metrics, Prometheus text for .prom, otherwise JSON")
+    parser.add_argument("--slow-query-ms", type=float, default=None)
+    parser.add_argument("--slow-query-sample-rate", type=float, default=1.0)
+    parser.add_argument("--slow-query-log", default=None, help="appends the slow queries as JSON lines to this file")
+
+#HNSW parameters of the vector profile of the index and of the local index, see "python benchmark.py vectorprofiles"
+def add_hnsw_arguments(parser):
+    parser.add_argument("--hnsw-m", type=int, default=4)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=400)
+    parser.add_argument("--hnsw-ef-search", type=int, default=500)
+
+#flags of the typeahead of the console and suggest subcommands. Only prefixes without a local suggestion are sent to the
+#suggester of the index.
+def add_typeahead_arguments(parser):
+    parser.add_argument("--typeahead-table", default=None, help="builds the prefix index from this table of the database instead of the CSV")
+    add_sql_arguments(parser)
+    parser.add_argument("--suggester", action=argparse.BooleanOptionalAction, default=False,
+                        help="sends prefixes without local suggestion to the suggester of the index")
+    parser.add_argument("--suggest-top", type=int, default=5)
+
+#flags of the enroll subcommand
+def add_enroll_arguments(parser):
+    #estimates chunks, embedding requests and tokens, index size and embedding time from the CSV, nothing is sent to Azure
+    parser.add_argument("--dry-run", action=argparse.BooleanOptionalAction, default=False, help="estimates the enrollment without enrolling")
+    #steps whose definition did not change since the last enrollment (kept in the state file) and whose resource is
+    #unchanged on the service are skipped
+    parser.add_argument("--force", action=argparse.BooleanOptionalAction, default=False, help="applies all steps")
+    parser.add_argument("--state-file", default=".enroll-state.json")
+    parser.add_argument("--trace", default=None, help="writes a JSON trace of the enrollment to this file")
+    parser.add_argument("--profile-cpu", action=argparse.BooleanOptionalAction, default=False,
+                        help="adds a cProfile of the CSV parsing to the trace")
+    #keeps the table between runs and only writes changed rows. The data source gets a high water mark and soft delete
+    #policy, so the indexer only processes the changed rows.
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--push", action=argparse.BooleanOptionalAction, default=False,
+                        help="pushes the table into the index instead of the skillset and the indexer")
+    parser.add_argument("--wait", action=argparse.BooleanOptionalAction, default=False, help="waits until the indexer run is finished")
+    parser.add_argument("--table-config", default=None, help="table config (JSON), see partitions.py")
+    parser.add_argument("--partitions", type=int, default=1, help="key range partitions indexed in parallel")
+    parser.add_argument("--vector-profile", choices=["vectorsearch-profile", "exhaustiveknn-profile"], default="vectorsearch-profile")
+    add_hnsw_arguments(parser)
+    #see "python benchmark.py compact" and "python estimator.py --compare-schemas"
+    parser.add_argument("--compact-schema", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--suggester", action=argparse.BooleanOptionalAction, default=False,
+                        help="adds a suggester over the winners and disciplines, only when the index is created")
+    parser.add_argument("--vector-type", choices=["single", "half"], default="single")
+    parser.add_argument("--vector-compression", choices=["scalar"], default=None)
+    parser.add_argument("--vector-oversampling", type=float, default=None, help="default oversampling of the compression")
+    add_sql_arguments(parser)
+    parser.add_argument("--bulk-load", action=argparse.BooleanOptionalAction, default=True, help="loads the CSV with batched inserts")
+    parser.add_argument("--sql-batch-size", type=int, default=1000)
+    parser.add_argument("--sql-commit-interval", type=int, default=10000)
+    parser.add_argument("--sql-parallel-connections", type=int, default=1)
+    #IndexingParameters of the indexer, None keeps the service defaults (batch size 1000 for Azure SQL, no failed items
+    #allowed), see "python benchmark.py indexer"
+    parser.add_argument("--indexer-batch-size", type=int, default=None)
+    parser.add_argument("--indexer-max-failed-items", type=int, default=None)
+    parser.add_argument("--indexer-max-failed-items-per-batch", type=int, default=None)
+    #the status is polled with exponential backoff, the timeout stops waiting (None waits until the run is finished)
+    parser.add_argument("--indexer-poll-interval", type=float, default=5)
+    parser.add_argument("--indexer-max-poll-interval", type=float, default=60)
+    parser.add_argument("--indexer-timeout", type=float, default=None)
+    #see "python benchmark.py push"
+    parser.add_argument("--push-embed-batch-size", type=int, default=128)
+    parser.add_argument("--push-embed-concurrency", type=int, default=4)
+    parser.add_argument("--push-upload-batch-size", type=int, default=500)
+    parser.add_argument("--push-upload-concurrency", type=int, default=4)
+    parser.add_argument("--push-buffered-sender", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--embedding-store", action=argparse.BooleanOptionalAction, default=False,
+                        help="reuses the embeddings of unchanged chunks from a table of the database (with --push)")
+    parser.add_argument("--embedding-store-table", default="chunkembeddings")
+    #quota of the embedding deployment for the time estimate of the dry run
+    parser.add_argument("--embedding-tokens-per-minute", type=int, default=240000)
+    parser.add_argument("--embedding-requests-per-minute", type=int, default=1440)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Azure SQL integrated vectorization with Azure AI Search")
+    subparsers = parser.add_subparsers(dest="command")
+
+    enroll_parser = subparsers.add_parser("enroll", help="creates the table, data source, index, skillset and indexer")
+    add_service_arguments(enroll_parser)
+    add_enroll_arguments(enroll_parser)
+    enroll_parser.set_defaults(func=run_enroll)
+
+    query_parser = subparsers.add_parser("query", help="runs search requests and prints the results")
+    add_service_arguments(query_parser)
+    add_query_arguments(query_parser, "hybrid")
+    query_parser.add_argument("text", nargs="*", default=[search_input])
+    #the search mode of a line can be given as "<mode><TAB><query>"
+    query_parser.add_argument("--file", default=None,
+                              help="runs the queries of this file (one per line, - for stdin) concurrently with the async search engine")
+    query_parser.add_argument("--concurrency", type=int, default=16)
+    query_parser.add_argument("--json", action="store_true", help="prints the results as JSON lines")
+    query_parser.add_argument("--stream", type=int, metavar="TOP",
+                              help="streams up to TOP results page by page as JSON lines instead of the best 2")
+    query_parser.set_defaults(func=run_query)
+
+    console_parser = subparsers.add_parser("console", help="reads search commands from the console until quit is entered")
+    add_service_arguments(console_parser)
+    add_query_arguments(console_parser, "hybrid")
+    #the cache is invalidated whenever the index is created or the indexer runs
+    console_parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False, help="answers repeated queries from a cache")
+    console_parser.add_argument("--cache-disk", action=argparse.BooleanOptionalAction, default=False)
+    console_parser.add_argument("--typeahead", action=argparse.BooleanOptionalAction, default=False, help="answers \"suggest <prefix>\"")
+    add_typeahead_arguments(console_parser)
+    console_parser.set_defaults(func=run_console)
+
+    serve_parser = subparsers.add_parser("serve", help="serves the search modes over HTTP until it is stopped")
+    add_service_arguments(serve_parser)
+    add_request_arguments(serve_parser)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the port")
+    serve_parser.add_argument("--concurrency", type=int, default=16, help="search requests in flight per worker")
+    serve_parser.add_argument("--max-pending", type=int, default=128, help="requests per worker above this are shed with 503")
+    serve_parser.add_argument("--timeout", type=float, default=10.0, help="deadline of requests without an X-Deadline-Ms header in seconds")
+    serve_parser.add_argument("--max-timeout", type=float, default=30.0, help="longest deadline a client can ask for in seconds")
+    #the service embeds with the deployment, not with the local index
+    serve_parser.set_defaults(func=run_serve, local=False, local_fake_embedding=False)
+
+    suggest_parser = subparsers.add_parser("suggest", help="suggests winners and disciplines for prefixes")
+    add_service_arguments(suggest_parser)
+    add_typeahead_arguments(suggest_parser)
+    suggest_parser.add_argument("prefixes", nargs="+")
+    suggest_parser.set_defaults(func=run_suggest, typeahead=True, local=False)
+
+    #only listed in the help, main passes everything after bench to benchmark.py, e.g. "python main.py bench startup"
+    subparsers.add_parser("bench", help="runs a benchmark of benchmark.py, see \"python main.py bench --help\"")
+    return parser
+
+#query embedder for client-side embedding and the local index, None lets the vectorizer of the index embed the queries
+def build_embedder(args):
+    client_embedding = args.client_embedding if args.client_embedding is not None else getattr(args, "mode", None) == "adaptive"
+    if not client_embedding and not args.local:
+        return None
+    import embeddings
+    if args.local and args.local_fake_embedding:
+        return embeddings.QueryEmbedder(embeddings.FakeEmbeddingClient(args.embedding_length))
+    #the cache and the embedding client use embedding_length, a deployment returning other dimensions is rejected
+    embedding_client = embeddings.AzureOpenAIEmbeddingClient(args.openai_uri, args.openai_key, args.openai_deployment, dimensions=args.embedding_length,
+                                                             model=args.embedding_model)
+    return embeddings.QueryEmbedder(embedding_client, embeddings.EmbeddingCache(args.embedding_cache_dir, args.openai_deployment, args.embedding_length))
+
+#client for the search requests, the local index if enabled or the SearchClient of the service
+def build_search_client(args, embedder):
+    if args.local:
+        import chunking
+        import localsearch
+        logging.info("Local search enabled. Building the local index from the CSV file")
+        local_index = localsearch.LocalSearchIndex.from_rows(chunking.read_csv_rows(), embedder)
+        if not args.exhaustive:
+            local_index.build_hnsw(m=args.hnsw_m, ef_construction=args.hnsw_ef_construction, ef_search=args.hnsw_ef_search)
+        logging.info(f"Local index with {len(local_index)} chunks built")
+        return local_index
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+    return SearchClient(args.endpoint, args.index_name, credential=AzureKeyCredential(args.key))
+
+#metrics.QueryMetrics if the search requests are measured, otherwise None
+def build_metrics(args):
+    if not args.metrics and not args.metrics_file and args.slow_query_ms is None:
+        return None
+    import metrics
+    return metrics.QueryMetrics(slow_query_ms=args.slow_query_ms, slow_query_sample_rate=args.slow_query_sample_rate, slow_query_log=args.slow_query_log)
+
+def finish_metrics(args, metrics, log_report=True):
+    if metrics is None:
+        return
+    if log_report:
+        logging.info(f"Query metrics:\n{metrics.report()}")
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+
+#runs the enrollment with a tracer if --trace is set, the trace is also written when the enrollment fails
+def run_enroll(args):
+    if not args.trace:
+        if args.profile_cpu:
+            logging.warning("--profile-cpu needs --trace, the enrollment is not profiled")
+        run_enrollment(args)
+        return
+    import tracing
+    tracer = tracing.start("enroll", profile=args.profile_cpu)
+    tracer.root.set(index=args.index_name, dry_run=args.dry_run, incremental=args.incremental, push=args.push, partitions=args.partitions)
+    try:
+        run_enrollment(args)
+    finally:
+        tracing.stop()
+        tracer.write(args.trace)
+
+def run_enrollment(args):
+    import embeddingmodels
+    #raises before anything is estimated or created if the model can not return embedding_length dimensions
+    shortened = embeddingmodels.requested_dimensions(args.embedding_model, args.embedding_length) is not None
+    if args.dry_run:
+        import estimator
+        logging.info("Dry run: estimating the enrollment without sending anything to Azure")
+        estimate = estimator.estimate_csv(csv_file_path, dimensions=args.embedding_length, embedding_batch_size=args.push_embed_batch_size,
+                                          hnsw_m=args.hnsw_m, vector_profile=args.vector_profile, tokens_per_minute=args.embedding_tokens_per_minute,
+                                          requests_per_minute=args.embedding_requests_per_minute, compact=args.compact_schema,
+                                          vector_type=args.vector_type, vector_compression=args.vector_compression)
+        print(estimator.format_report(estimate))
+        return
+
+    import azuresql
+    import index
+    import skillset
+    import indexer
+    import orchestrator
+    import partitions
+    import tracing
+    from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
+    from azure.core.credentials import AzureKeyCredential
 
-if enroll:
     logging.info("Enroll mode: Enrolling Azure AI Search with Azure SQL integrated vectorization")
-    
-    #create a new Azure SQL table and loads data from a CSV file into the table. 
-    azuresql.create_db_and_aisearch_connection(aisearch_key, service_endpoint, sql_server, database_name, username, password, sql_driver)
-
-    #create index with vector search configuration
-    index.create_index(aisearch_key, service_endpoint, index_name, embedding_length, openai.api_key, openai.api_type, openai_uri, openai_deployment)
-
-    #create a skillset for Azure AI Search with Azure OpenAi Embedding and TextSplit
-    skillset.createSkillset(openai_uri, openai_deployment, openai.api_key, index_name, service_endpoint, aisearch_key)
-
-    #create indexer with index, data source and skillset
-    indexer.create_indexer(service_endpoint, index_name, aisearch_key)
-
-if app == False:
-    #vector search
-    #This is a sample request for a vector search. It takes a text input and returns the most similar vector from the index.
-    #
-    if vectorsearchsample:
-        
-        logging.info(f"Vector search enabled. Running vector search sample request with search input {search_input}")
-
-        search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-
-        results = search_client.search(
-            search_text=None,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            top=2
-        )
-
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-            
-
-    #hybrid search
-    #This is a sample request for a hybrid search. Additionally to the vector search, it also searches for the text input in the index.
-    if hyrbidsearchsample:
-        
-        logging.info(f"Hybrid search enabled. Running hybrid search sample request with search input {search_input}")
-        
-        search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-
-        results = search_client.search(
-            search_text=search_input,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            top=2
-        )
-
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-
-    #hybrid search with semantic reranking
-    #This is a sample request for a hybrid search with semantic reranking.
-    if vectorsemanticsearchsample:
-        logging.info(f"Hybrid semantic search enabled. Running hybrid search in combination with semantic search with sample request with search input {search_input}")
-        
-        search_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
-        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=2, fields="vector", exhaustive=True)
-
-        results = search_client.search(
-            search_text=search_input,
-            vector_queries=[vector_query],
-            select=["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"],
-            query_type=QueryType.SEMANTIC,
-            semantic_configuration_name=f"{index_name}-semantic",
-            query_caption=QueryAnswerType.EXTRACTIVE,
-            query_answer=QueryAnswerType.EXTRACTIVE,
-            top=2
-        )
-
-        semantic_results = results.get_answers()
-        if semantic_results:
-            for result in semantic_results:
-                if result.highlights:
-                    print(f"Semantic search result (highlight): {result.highlights}")
-                else:
-                    print(f"Semantic search result: {result.text}")
-                
-                print(f"Semantic results score:  {result.score}")
-                
-
-        for result in results:
-            print(f"Nobel price result: {result['db_table_year']} {result['db_table_winner']} description: {result['db_table_description']}")
-            captions = result["@search.captions"]
-            if captions:
-                caption = captions[0]
-                if caption.highlights:
-                    print(f"Caption: {caption.highlights}")
-                else:
-                    print(f"Caption: {caption.text}")
-
-if app:
-    if vectorsearchsample:
-        consoleapp.vectorsearch(service_endpoint, index_name, aisearch_key)
-    if hyrbidsearchsample:
-        consoleapp.hybridsearch(service_endpoint, index_name, aisearch_key)
-    if vectorsemanticsearchsample:
-        consoleapp.vectorsemanticsearch(service_endpoint, index_name, aisearch_key)
-                
-logging.info(f"Finished execution in {time.time() - start_time} seconds")
\ No newline at end of file
+    sql_args = (args.sql_server, args.database_name, args.sql_username, args.sql_password, args.sql_driver)
+    #the dimensions of shortened embeddings are only known to a newer API version
+    api_options = {"api_version": embeddingmodels.dimensions_api_version} if shortened else {}
+    #with tracing every call to the service is a span of its own
+    index_c = tracing.instrument(SearchIndexClient(args.endpoint, AzureKeyCredential(args.key), **api_options))
+    indexer_c = tracing.instrument(SearchIndexerClient(args.endpoint, AzureKeyCredential(args.key), **api_options))
+    table_config = partitions.read_table_config(args.table_config, args.partitions)
+    table = table_config["table"]
+
+    #create a new Azure SQL table and loads data from a CSV file into the table
+    def load_table():
+        azuresql.load_table(*sql_args, bulk_load=args.bulk_load, batch_size=args.sql_batch_size, commit_interval=args.sql_commit_interval,
+                            parallel_connections=args.sql_parallel_connections, csv_file_path=table_config["csv_file_path"],
+                            incremental=args.incremental, table_name=table)
+
+    def count_rows():
+        co = azuresql.connect(*sql_args)
+        try:
+            return azuresql.count_rows(co, table)
+        finally:
+            co.close()
+
+    #tables without CSV exist already and are not loaded
+    if not table_config["csv_file_path"]:
+        load_table = count_rows = None
+
+    indexing_options = {"batch_size": args.indexer_batch_size, "max_failed_items": args.indexer_max_failed_items,
+                        "max_failed_items_per_batch": args.indexer_max_failed_items_per_batch}
+    partition_resources = None
+    create_view = None
+    #push ingestion reads the whole table, partitions only split the indexer
+    if table_config["partitions"] > 1 and not args.push:
+        co = azuresql.connect(*sql_args)
+        try:
+            plan = partitions.plan_table(co, table_config)
+        finally:
+            co.close()
+        logging.info(partitions.format_plan(table_config, plan))
+        partition_resources = partitions.build_partition_resources(table_config, plan, args.index_name, args.sql_server, args.database_name,
+                                                                   args.sql_username, args.sql_password, args.incremental, **indexing_options)
+
+        def create_view(ddl):
+            co = azuresql.connect(*sql_args)
+            try:
+                partitions.create_view(co, ddl)
+            finally:
+                co.close()
+
+    push_table = None
+    if args.embedding_store and not args.push:
+        logging.warning("The embedding store is only used by push ingestion, the embedding skill of the indexer embeds every chunk")
+    if args.push:
+        import functools
+        import embeddings
+        import pushpipeline
+
+        #chunk, embed and upload the rows from here instead of the skillset and the indexer
+        def push_table():
+            co = azuresql.connect(*sql_args)
+            embedding_client = embeddings.AzureOpenAIEmbeddingClient(args.openai_uri, args.openai_key, args.openai_deployment,
+                                                                     dimensions=args.embedding_length, model=args.embedding_model)
+            store = None
+            if args.embedding_store:
+                import embeddingstore
+                store = embeddingstore.EmbeddingStore(functools.partial(azuresql.connect, *sql_args), args.openai_deployment, args.embedding_length,
+                                                      table_name=args.embedding_store_table)
+            try:
+                pushpipeline.push_table(co, table, args.endpoint, args.index_name, args.key, embedding_client,
+                                        embed_batch_size=args.push_embed_batch_size, embed_concurrency=args.push_embed_concurrency,
+                                        upload_batch_size=args.push_upload_batch_size, upload_concurrency=args.push_upload_concurrency,
+                                        buffered_sender=args.push_buffered_sender, where=f"{azuresql.soft_delete_column} = 0" if args.incremental else None,
+                                        deleted_where=f"{azuresql.soft_delete_column} = {azuresql.soft_delete_marker}" if args.incremental else None,
+                                        int_fields=index.compact_int32_fields if args.compact_schema else (), columns=table_config["columns"],
+                                        embedding_store=store)
+            finally:
+                co.close()
+                if store is not None:
+                    logging.info(f"Embedding store: {store.stats['hits']} chunks reused, {store.stats['stored']} embeddings stored")
+                    store.close()
+
+    #index with vector search configuration
+    index_definition = index.build_index(args.index_name, args.embedding_length, args.openai_key, args.openai_uri, args.openai_deployment,
+                                         vector_profile=args.vector_profile, hnsw_m=args.hnsw_m, hnsw_ef_construction=args.hnsw_ef_construction,
+                                         hnsw_ef_search=args.hnsw_ef_search, compact=args.compact_schema, vector_type=args.vector_type,
+                                         vector_compression=args.vector_compression, default_oversampling=args.vector_oversampling,
+                                         suggester=args.suggester, embedding_model=args.embedding_model)
+    #skillset with Azure OpenAi Embedding and TextSplit
+    skillset_definition = skillset.build_skillset(args.openai_uri, args.openai_deployment, args.openai_key, args.index_name, table_config["columns"],
+                                                  dimensions=args.embedding_length, model=args.embedding_model)
+    skillset.check_dimensions(index_definition, skillset_definition, args.embedding_model)
+
+    #the enrollment runs as a dependency graph: the index and the skillset are created while the table is loaded, and
+    #steps whose definition and live resource did not change since the last enrollment are skipped
+    steps = orchestrator.enrollment_steps(
+        index_c, indexer_c,
+        index_definition,
+        azuresql.build_data_source_connection(args.sql_server, args.database_name, args.sql_username, args.sql_password, table,
+                                              incremental=args.incremental),
+        skillset_definition,
+        #indexer with index, data source and skillset
+        indexer.build_indexer(args.index_name, data_source_name=azuresql.data_source_name(table), **indexing_options),
+        load_table=load_table, count_rows=count_rows, source_file=table_config["csv_file_path"],
+        load_definition={"table": table, "incremental": args.incremental},
+        push_table=push_table, push_definition={"deployment": args.openai_deployment, "dimensions": args.embedding_length, "compact": args.compact_schema},
+        wait=args.wait, poll_interval=args.indexer_poll_interval, max_poll_interval=args.indexer_max_poll_interval, timeout=args.indexer_timeout,
+        partition_resources=partition_resources, create_view=create_view)
+    results = orchestrator.run_steps(steps, args.state_file, force=args.force)
+    print(orchestrator.format_report(results))
+    for result in results:
+        if result["status"] in ("failed", "blocked"):
+            logging.error(f"Enrollment step {result['step']} {result['status']} {result['error'] or ''}")
+
+#options of every search request, see searchquery.search
+def build_query_options(args):
+    options = {"exhaustive": args.exhaustive, "profile": args.profile, "collapse": args.collapse}
+    if args.oversampling is not None:
+        options["oversampling"] = args.oversampling
+    return options
+
+#queryplanner.QueryPlanner of the queries, None without planning and without --year, --discipline or --winner
+def build_planner(args):
+    if not args.plan and not (args.year or args.discipline or args.winner):
+        return None
+    import queryplanner
+    winner_names = queryplanner.WinnerNames.from_csv(csv_file_path) if args.plan else None
+    return queryplanner.QueryPlanner(winner_names, filter_mode=args.filter_mode, int_year=args.int_year, extract_constraints=args.plan,
+                                     years=args.year, disciplines=args.discipline, winners=args.winner)
+
+#adaptive.AdaptiveSearch of the adaptive mode, None for the other modes
+def build_adaptive(args):
+    if args.mode != "adaptive":
+        return None
+    import adaptive
+    return adaptive.AdaptiveSearch(adaptive.EscalationPolicy(min_margin=args.min_margin, min_agreement=args.min_agreement),
+                                   candidates=args.candidates, record_file=args.record_file)
+
+#metrics is passed when several runs share one metrics.QueryMetrics, its owner reports and writes it
+def run_query(args, metrics=None):
+    embedder = build_embedder(args)
+    query_options = build_query_options(args)
+    planner = build_planner(args)
+    adaptive_search = build_adaptive(args)
+    if adaptive_search is not None and (args.file or args.stream):
+        raise ValueError("The adaptive mode answers query texts and the console app, not --file or --stream")
+    if args.file:
+        import asyncio
+        import searchengine
+        logging.info(f"Running the queries of {args.file} with the async search engine, mode {args.mode}")
+        asyncio.run(searchengine.run_file(args.file, args.endpoint, args.index_name, args.key, mode=args.mode, max_concurrency=args.concurrency,
+                                          embedder=embedder, query_options=query_options, planner=planner))
+        return
+
+    import json
+    import searchquery
+    shared_metrics = metrics is not None
+    metrics = metrics if shared_metrics else build_metrics(args)
+    search_client = build_search_client(args, embedder)
+    if metrics is not None:
+        search_client = metrics.instrument(search_client)
+        embedder = metrics.instrument_embedder(embedder)
+    for text in args.text:
+        options = query_options
+        if planner is not None:
+            text, options = planner.apply(text, query_options)
+            logging.info(f"Planned search input {text} with filter {options.get('filter')}")
+        logging.info(f"Running {args.mode} search request with search input {text}")
+        vector = embedder.embed(text) if embedder is not None else None
+        if args.stream:
+            stream = searchquery.ResultStream(search_client, args.mode, text, args.index_name, args.stream, vector=vector, **options)
+            for document in stream:
+                print(json.dumps(document, default=str))
+            logging.info(f"Streamed {stream.returned} results")
+            continue
+        if adaptive_search is not None:
+            response = adaptive_search.search(search_client, text, args.index_name, vector=vector, **options)
+        else:
+            response = searchquery.search(search_client, args.mode, text, args.index_name, vector=vector, **options)
+        if args.json:
+            print(json.dumps(response, default=str))
+        else:
+            searchquery.print_results(response)
+    if adaptive_search is not None:
+        logging.info(adaptive_search.format_report())
+    if not shared_metrics:
+        finish_metrics(args, metrics)
+
+#typeahead.Typeahead of the console app and the suggest subcommand, None without typeahead
+def build_typeahead(args):
+    if not args.typeahead:
+        return None
+    import typeahead
+    if args.typeahead_table:
+        import azuresql
+        co = azuresql.connect(args.sql_server, args.database_name, args.sql_username, args.sql_password, args.sql_driver)
+        try:
+            prefix_index = typeahead.PrefixIndex.from_sql(co, args.typeahead_table)
+        finally:
+            co.close()
+    else:
+        prefix_index = typeahead.PrefixIndex.from_csv(csv_file_path)
+    logging.info(f"Prefix index with {len(prefix_index)} suggestions built")
+    search_client = None
+    if args.suggester and not args.local:
+        from azure.search.documents import SearchClient
+        from azure.core.credentials import AzureKeyCredential
+        search_client = SearchClient(args.endpoint, args.index_name, credential=AzureKeyCredential(args.key))
+    return typeahead.Typeahead(prefix_index, search_client)
+
+def run_suggest(args):
+    typeahead = build_typeahead(args)
+    for prefix in args.prefixes:
+        suggestions, source = typeahead.suggest(prefix, args.suggest_top)
+        print(f"{prefix} ({source}): {', '.join(suggestion['text'] for suggestion in suggestions) or 'no suggestions'}")
+    logging.info(typeahead.report())
+
+def run_console(args, metrics=None):
+    import consoleapp
+    embedder = build_embedder(args)
+    cache = None
+    if args.cache:
+        import querycache
+        #results of other indexes, endpoints, the local backend or other embeddings are kept apart
+        backend = f"local:{os.path.abspath(csv_file_path)}:{'fake' if args.local_fake_embedding else 'openai'}" if args.local else args.endpoint
+        cache = querycache.QueryCache(disk=args.cache_disk, scope={"backend": backend, "deployment": args.openai_deployment,
+                                                                   "embedding_model": args.embedding_model, "dimensions": args.embedding_length})
+    shared_metrics = metrics is not None
+    metrics = metrics if shared_metrics else build_metrics(args)
+    #the console app prints the report when it exits
+    consoleapp.run_console(args.mode, args.endpoint, args.index_name, args.key, cache, embedder, build_search_client(args, embedder) if args.local else None,
+                           build_query_options(args), metrics, build_planner(args), build_adaptive(args), build_typeahead(args), args.suggest_top)
+    if not shared_metrics:
+        finish_metrics(args, metrics, log_report=False)
+
+#search engine of a query service worker, every worker process builds its own
+def build_engine(args):
+    import searchengine
+    return searchengine.SearchEngine(args.endpoint, args.index_name, args.key, max_concurrency=args.concurrency, timeout=args.max_timeout,
+                                     embedder=build_embedder(args), query_options=build_query_options(args), planner=build_planner(args))
+
+def run_serve(args):
+    import functools
+    import queryservice
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    queryservice.serve(functools.partial(build_engine, args), args.host, args.port, args.workers, max_pending=args.max_pending,
+                       timeout=args.timeout, max_timeout=args.max_timeout)
+
+def run_bench(argv):
+    import benchmark
+    benchmark.main(argv)
+
+#runs what the settings at the top of this file enable, like before the subcommands existed (used by the deployment scripts)
+def run_configured(parser):
+    enroll_args = parser.parse_args(["enroll"])
+    if enroll or enroll_args.dry_run:
+        run_enroll(enroll_args)
+
+    if enroll_args.dry_run:
+        logging.info("Dry run: no search requests are sent")
+
+    elif parser.parse_args(["query"]).file:
+        mode = (sample_modes() or ["hybrid"])[0]
+        run_query(parser.parse_args(["query", "--mode", mode]))
+
+    elif app == False:
+        #vector search, hybrid search and hybrid search with semantic reranking sample requests, measured together
+        args = parser.parse_args(["query", search_input])
+        metrics = build_metrics(args)
+        for mode in sample_modes():
+            run_query(parser.parse_args(["query", "--mode", mode, search_input]), metrics)
+        finish_metrics(args, metrics)
+
+    elif app:
+        args = parser.parse_args(["console"])
+        metrics = build_metrics(args)
+        for mode in sample_modes():
+            run_console(parser.parse_args(["console", "--mode", mode]), metrics)
+        finish_metrics(args, metrics, log_report=False)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["bench"]:
+        #the benchmarks have their own flags and logging
+        run_bench(argv[1:])
+        return
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    configure_logging(args.stderr_logs if args.command else stderr_logs)
+
+    logging.info("Starting the main script")
+    start_time = time.time()
+    if args.command is None:
+        run_configured(parser)
+    else:
+        args.func(args)
+    logging.info(f"Finished execution in {time.time() - start_time} seconds")
+
+if __name__ == "__main__":
+    main()
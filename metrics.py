@@ -0,0 +1,256 @@
+#Description: Latency metrics of the search requests, exported as JSON or Prometheus histograms.
+import json
+import time
+import random
+import logging
+import threading
+
+#the search service returns its processing time in milliseconds in this response header
+elapsed_time_header = "elapsed-time"
+
+#exported metrics: name, unit scale of the recorded integers, help text. Times are recorded in microseconds.
+metric_definitions = {
+    "latency_seconds": (1e-6, "Client-side latency of search requests until the last result was read"),
+    "first_result_seconds": (1e-6, "Client-side time until the first result of a search request"),
+    "server_elapsed_seconds": (1e-6, "Processing time reported by the search service in the elapsed-time header"),
+    "embedding_seconds": (1e-6, "Client-side query embedding time"),
+    "results": (1, "Results returned per search request"),
+    "response_bytes": (1, "Size of the search responses")
+}
+
+#upper bounds (le) of the buckets of the Prometheus histograms, in the exported unit
+seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+prometheus_buckets = {
+    "latency_seconds": seconds_buckets,
+    "first_result_seconds": seconds_buckets,
+    "server_elapsed_seconds": seconds_buckets,
+    "embedding_seconds": seconds_buckets,
+    "results": (0, 1, 2, 5, 10, 20, 50, 100),
+    "response_bytes": (1024, 4096, 16384, 65536, 262144, 1048576)
+}
+
+#HDR-style histogram of non-negative integers with a relative error below 2 ** (1 - sub_bucket_bits)
+class Histogram:
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+        bucket = (value >> shift) << shift
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    #highest value of the bucket that contains the given percentile (0-100) of the recorded values
+    def percentile(self, percentile):
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * percentile // 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                shift = max(bucket.bit_length() - self.sub_bucket_bits, 0)
+                return min(bucket + (1 << shift) - 1, self.max)
+        return self.max
+
+    #number of recorded values up to value, with the relative error of the buckets
+    def count_at_most(self, value):
+        return sum(count for bucket, count in self.counts.items() if bucket <= value)
+
+    def summary(self, scale=1):
+        if not self.count:
+            return {"count": 0}
+        values = {"sum": self.total, "mean": self.total / self.count, "min": self.min, "max": self.max, "p50": self.percentile(50),
+                  "p95": self.percentile(95), "p99": self.percentile(99)}
+        #rounded to the microsecond resolution of the times
+        return dict({"count": self.count}, **{key: round(value * scale, 6) for key, value in values.items()})
+
+#search results that record the timings when they are read. Everything else (get_answers, get_count, ...) is passed to
+#the results of the wrapped client.
+class InstrumentedResults:
+    def __init__(self, results, metrics, mode, search_input, start, response_info):
+        self._results = results
+        self._metrics = metrics
+        self._mode = mode
+        self._search_input = search_input
+        self._start = start
+        self._response_info = response_info
+
+    def __iter__(self):
+        first_result = None
+        count = 0
+        for result in self._results:
+            if first_result is None:
+                first_result = time.perf_counter() - self._start
+            count += 1
+            yield result
+        seconds = time.perf_counter() - self._start
+        self._metrics.record(self._mode, self._search_input, seconds, first_result if first_result is not None else seconds,
+                             self._response_info.get("server_seconds"), count, self._response_info.get("bytes"))
+
+    def __getattr__(self, name):
+        return getattr(self._results, name)
+
+#search client that measures every search call, see QueryMetrics.instrument
+class InstrumentedSearchClient:
+    def __init__(self, search_client, metrics):
+        self._search_client = search_client
+        self._metrics = metrics
+
+    def search(self, search_text=None, **kwargs):
+        response_info = {}
+
+        def on_response(response):
+            #called by the pipeline of the SDK for every response, the local index never calls it
+            http_response = response.http_response
+            elapsed = http_response.headers.get(elapsed_time_header)
+            if elapsed is not None:
+                response_info["server_seconds"] = float(elapsed) / 1000
+            length = http_response.headers.get("Content-Length")
+            response_info["bytes"] = int(length) if length is not None else len(http_response.body() or b"")
+
+        start = time.perf_counter()
+        results = self._search_client.search(search_text=search_text, raw_response_hook=on_response, **kwargs)
+        return InstrumentedResults(results, self._metrics, search_mode(search_text, kwargs), search_text, start, response_info)
+
+    def __getattr__(self, name):
+        return getattr(self._search_client, name)
+
+#query embedder that measures the embedding time of every query
+class InstrumentedEmbedder:
+    def __init__(self, embedder, metrics):
+        self._embedder = embedder
+        self._metrics = metrics
+
+    def embed(self, text):
+        start = time.perf_counter()
+        vector = self._embedder.embed(text)
+        self._metrics.observe("embedding_seconds", None, (time.perf_counter() - start) * 1e6)
+        return vector
+
+    def __getattr__(self, name):
+        return getattr(self._embedder, name)
+
+#search mode of a search call from its arguments (see searchquery.build_search_kwargs)
+def search_mode(search_text, search_kwargs):
+    if str(search_kwargs.get("query_type", "")).lower().endswith("semantic"):
+        return "semantic"
+    if search_text is None:
+        return "vector"
+    return "hybrid" if search_kwargs.get("vector_queries") else "text"
+
+#collects the metrics of the search calls of instrumented clients. Queries with a latency of at least slow_query_ms are
+#logged as warnings with probability slow_query_sample_rate and, with slow_query_log, appended to that file as JSON lines.
+class QueryMetrics:
+    def __init__(self, slow_query_ms=None, slow_query_sample_rate=1.0, slow_query_log=None, prefix="search"):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_sample_rate = slow_query_sample_rate
+        self.slow_query_log = slow_query_log
+        self.prefix = prefix
+        self.histograms = {}
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def instrument(self, search_client):
+        return InstrumentedSearchClient(search_client, self)
+
+    def instrument_embedder(self, embedder):
+        return InstrumentedEmbedder(embedder, self) if embedder is not None else None
+
+    #records one value of a metric of metric_definitions, mode None for metrics without mode
+    def observe(self, name, mode, value):
+        with self._lock:
+            histogram = self.histograms.get((name, mode))
+            if histogram is None:
+                histogram = self.histograms[(name, mode)] = Histogram()
+            histogram.record(value)
+
+    def record(self, mode, search_input, seconds, first_result_seconds, server_seconds=None, results=None, response_bytes=None):
+        self.observe("latency_seconds", mode, seconds * 1e6)
+        self.observe("first_result_seconds", mode, first_result_seconds * 1e6)
+        if server_seconds is not None:
+            self.observe("server_elapsed_seconds", mode, server_seconds * 1e6)
+        if results is not None:
+            self.observe("results", mode, results)
+        if response_bytes is not None:
+            self.observe("response_bytes", mode, response_bytes)
+        if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries += 1
+            if random.random() < self.slow_query_sample_rate:
+                self.log_slow_query(mode, search_input, seconds, first_result_seconds, server_seconds, results, response_bytes)
+
+    def log_slow_query(self, mode, search_input, seconds, first_result_seconds, server_seconds, results, response_bytes):
+        entry = {"time": time.time(), "mode": mode, "search_input": search_input, "latency_ms": seconds * 1000,
+                 "first_result_ms": first_result_seconds * 1000, "server_elapsed_ms": server_seconds * 1000 if server_seconds is not None else None,
+                 "results": results, "response_bytes": response_bytes}
+        logging.warning(f"Slow {mode} query {search_input!r}: {entry['latency_ms']:.1f} ms, server {entry['server_elapsed_ms']} ms")
+        if self.slow_query_log:
+            with self._lock, open(self.slow_query_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    #metric -> mode ("all" for metrics without mode) -> count, sum, mean, min, max, p50, p95 and p99
+    def summary(self):
+        with self._lock:
+            histograms = dict(self.histograms)
+        summary = {}
+        for (name, mode), histogram in sorted(histograms.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+            summary.setdefault(name, {})[mode or "all"] = histogram.summary(metric_definitions[name][0])
+        return summary
+
+    def to_json(self):
+        return json.dumps({"metrics": self.summary(), "slow_queries": self.slow_queries}, indent=2)
+
+    #Prometheus text exposition format, every metric as a histogram with the cumulative counts of prometheus_buckets, so
+    #the quantiles can be aggregated over workers with histogram_quantile
+    def to_prometheus(self):
+        with self._lock:
+            histograms = dict(self.histograms)
+        lines = []
+        names = sorted({name for name, _ in histograms})
+        for name in names:
+            metric = f"{self.prefix}_{name}"
+            scale = metric_definitions[name][0]
+            lines.append(f"# HELP {metric} {metric_definitions[name][1]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_name, mode), histogram in sorted(histograms.items(), key=lambda item: item[0][1] or ""):
+                if histogram_name != name:
+                    continue
+                labels = f'mode="{mode}",' if mode is not None else ""
+                for le in prometheus_buckets[name]:
+                    lines.append(f'{metric}_bucket{{{labels}le="{le}"}} {histogram.count_at_most(le / scale)}')
+                lines.append(f'{metric}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+                series = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{metric}_sum{series} {round(histogram.total * scale, 6)}")
+                lines.append(f"{metric}_count{series} {histogram.count}")
+        lines.append(f"# HELP {self.prefix}_slow_queries_total Search requests above the slow query threshold")
+        lines.append(f"# TYPE {self.prefix}_slow_queries_total counter")
+        lines.append(f"{self.prefix}_slow_queries_total {self.slow_queries}")
+        return "\n".join(lines) + "\n"
+
+    #writes the metrics as Prometheus text if the file ends with .prom, otherwise as JSON
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+    def report(self):
+        lines = [f"{'metric':<24} {'mode':<9} {'count':>6} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+        for name, modes in self.summary().items():
+            scale, unit = (1000, "ms") if name.endswith("_seconds") else (1, "")
+            for mode, values in modes.items():
+                if values["count"]:
+                    lines.append(f"{name:<24} {mode:<9} {values['count']:>6} " +
+                                 " ".join(f"{values[key] * scale:>8.1f}{unit:<2}" for key in ("p50", "p95", "p99", "max")))
+        lines.append(f"{self.slow_queries} slow queries")
+        return "\n".join(lines)
+
+def instrument(search_client, metrics):
+    return search_client if metrics is None else metrics.instrument(search_client)
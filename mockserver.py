@@ -0,0 +1,132 @@
+#Description: Local mock of the Azure AI Search query endpoint for throughput tests without a search service.
+#usage: python mockserver.py --port 8765 --latency-ms 20 --semantic-latency-ms 80 --jitter 0.3 --throttle-rate 0.05
+import csv
+import math
+import random
+import asyncio
+import logging
+import argparse
+from aiohttp import web
+
+def load_documents(csv_file_path="./data/nobel-prize-winners.csv"):
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        return [
+            {
+                "Id": f"{i}_pages_0",
+                "chunk": row["desc"],
+                "db_table_id": str(i),
+                "db_table_year": row["year"],
+                "db_table_discipline": row["discipline"],
+                "db_table_winner": row["winner"],
+                "db_table_description": row["desc"]
+            }
+            for i, row in enumerate(csv.DictReader(f), start=1)
+        ]
+
+#search mode of a request body, see searchquery.build_search_kwargs
+def request_mode(query):
+    if query.get("queryType") == "semantic":
+        return "semantic"
+    return "hybrid" if query.get("search") else "vector"
+
+#mode_latency_ms overrides latency_ms per search mode, e.g. {"semantic": 80}. jitter is the sigma of a log-normal factor
+#applied to every latency (0 answers every request after exactly its latency).
+class MockSearchService:
+    def __init__(self, documents, latency_ms=0.0, throttle_rate=0.0, mode_latency_ms=None, jitter=0.0):
+        self.documents = documents
+        self.latency = latency_ms / 1000
+        self.mode_latency = {mode: latency / 1000 for mode, latency in (mode_latency_ms or {}).items()}
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    #documents skip to skip + count of a ranking that only depends on the search text, so pages of one query fit together.
+    #The ranking steps through the documents with a stride coprime to their number.
+    def ranking(self, search_text, skip, count):
+        total = len(self.documents)
+        rng = random.Random(search_text)
+        offset, stride = rng.randrange(total), rng.randrange(1, total) if total > 1 else 1
+        while math.gcd(stride, total) != 1:
+            stride += 1
+        return [self.documents[(offset + position * stride) % total] for position in range(skip, min(skip + count, total))]
+
+    async def search(self, request):
+        self.requests += 1
+        if random.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response({"error": {"code": "", "message": "Too many requests"}}, status=429, headers={"Retry-After": "1"})
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            query = await request.json()
+            latency = self.mode_latency.get(request_mode(query), self.latency)
+            if self.jitter:
+                latency *= random.lognormvariate(0, self.jitter)
+            await asyncio.sleep(latency)
+        finally:
+            self.in_flight -= 1
+
+        #without top the service returns pages of 50 results with the parameters of the next page
+        top = query.get("top")
+        skip = query.get("skip") or 0
+        page_size = top if top is not None else 50
+        select = query.get("select")
+        fields = select.split(",") if select else None
+        documents = self.ranking(query.get("search") or "", skip, page_size)
+        value = []
+        for rank, document in enumerate(documents):
+            result = {field: document.get(field) for field in fields} if fields else dict(document)
+            result["@search.score"] = 1.0 / (rank + 1)
+            if query.get("queryType") == "semantic":
+                result["@search.rerankerScore"] = 4.0 - rank * 0.1
+                result["@search.captions"] = [{"text": document["chunk"], "highlights": None}]
+            value.append(result)
+        body = {"value": value}
+        if top is None and skip + page_size < len(self.documents):
+            body["@search.nextPageParameters"] = dict(query, skip=skip + page_size)
+            body["@odata.nextLink"] = str(request.url)
+        if query.get("answers"):
+            body["@search.answers"] = [{"key": value[0].get("Id"), "text": documents[0]["chunk"], "highlights": None, "score": 0.9}] if value else []
+        #like the service, the processing time is returned in milliseconds in the elapsed-time header
+        return web.json_response(body, headers={"elapsed-time": str(int(latency * 1000))})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/indexes('{index_name}')/docs/search.post.search", self.search)
+        return app
+
+#starts the mock server in the running event loop and returns the runner, call runner.cleanup() to stop it
+async def start(service, host="127.0.0.1", port=8765):
+    runner = web.AppRunner(service.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+#latencies of the --<mode>-latency-ms flags that are set
+def mode_latencies(args):
+    latencies = {"vector": args.vector_latency_ms, "hybrid": args.hybrid_latency_ms, "semantic": args.semantic_latency_ms}
+    return {mode: latency for mode, latency in latencies.items() if latency is not None}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Azure AI Search query endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--vector-latency-ms", type=float, help="latency of vector queries, default --latency-ms")
+    parser.add_argument("--hybrid-latency-ms", type=float, help="latency of hybrid queries, default --latency-ms")
+    parser.add_argument("--semantic-latency-ms", type=float, help="latency of semantic queries, default --latency-ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="sigma of the log-normal latency factor")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    service = MockSearchService(load_documents(), latency_ms=args.latency_ms, throttle_rate=args.throttle_rate,
+                                mode_latency_ms=mode_latencies(args), jitter=args.jitter)
+    web.run_app(service.app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
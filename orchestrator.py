@@ -0,0 +1,249 @@
+#Description: Runs the enrollment as a dependency graph and skips the steps that are unchanged since the last run.
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from azure.core.exceptions import ResourceNotFoundError
+import indexer
+import partitions
+import querycache
+import tracing
+
+default_state_file = ".enroll-state.json"
+
+#one step of the enrollment. apply creates or updates the resource, fetch returns the version of the live resource.
+class Step:
+    def __init__(self, name, apply, depends_on=(), definition=None, fetch=None, run_after_changes=False):
+        self.name = name
+        self.apply = apply
+        self.depends_on = tuple(depends_on)
+        self.definition = definition
+        self.fetch = fetch
+        self.run_after_changes = run_after_changes
+
+def definition_hash(definition):
+    if hasattr(definition, "serialize"):
+        definition = definition.serialize()
+    return hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def read_state(state_file=default_state_file):
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_state(state, state_file=default_state_file):
+    #written to a temporary file first, so an interrupted enrollment never leaves a broken state file
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_file + ".tmp", state_file)
+
+#runs one step: compares the definition hash and the live version with the state and applies the step if anything changed
+def run_step(step, state, changed_dependencies, force):
+    desired = definition_hash(step.definition) if step.definition is not None else None
+    previous = state.get(step.name)
+    if not force and desired is not None and previous is not None and previous["hash"] == desired \
+            and not (step.run_after_changes and changed_dependencies):
+        #without fetch the state is trusted, e.g. for documents pushed into the index
+        if step.fetch is None or step.fetch() == previous["version"]:
+            return "unchanged", previous
+    version = step.apply()
+    return "applied", {"hash": desired, "version": version}
+
+#runs the steps in dependency order, up to max_workers at the same time, and returns one result per step
+@tracing.traced("orchestrator.run_steps")
+def run_steps(steps, state_file=default_state_file, force=False, max_workers=4):
+    steps = {step.name: step for step in steps}
+    for step in steps.values():
+        for dependency in step.depends_on:
+            if dependency not in steps:
+                raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+    state = read_state(state_file)
+    lock = threading.Lock()
+    results = {}
+    start = time.perf_counter()
+    #the steps run in the threads of the executor, their spans are children of the span of run_steps
+    parent = tracing.current()
+
+    def execute(step, changed_dependencies):
+        step_start = time.perf_counter() - start
+        logging.info(f"Enrollment step {step.name} started")
+        with tracing.span(f"step {step.name}", parent=parent) as span:
+            try:
+                status, entry = run_step(step, state, changed_dependencies, force)
+                error = None
+            except Exception as e:
+                logging.error(f"Enrollment step {step.name} failed: {e}")
+                status, entry, error = "failed", None, e
+            span.set(status=status)
+        #changed marks steps that were applied or depend on an applied step
+        result = {"step": step.name, "status": status, "depends_on": list(step.depends_on), "start": step_start,
+                  "end": time.perf_counter() - start, "error": str(error) if error else None,
+                  "changed": status == "applied" or bool(changed_dependencies)}
+        logging.info(f"Enrollment step {step.name} {status} in {result['end'] - step_start:.2f} seconds")
+        if status == "applied":
+            with lock:
+                state[step.name] = entry
+                write_state(state, state_file)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        pending = dict(steps)
+        while pending or running:
+            for name, step in list(pending.items()):
+                dependencies = [results.get(dependency) for dependency in step.depends_on]
+                if any(result is None for result in dependencies):
+                    continue
+                del pending[name]
+                if any(result["status"] in ("failed", "blocked") for result in dependencies):
+                    now = time.perf_counter() - start
+                    results[name] = {"step": name, "status": "blocked", "depends_on": list(step.depends_on), "start": now, "end": now,
+                                     "error": None, "changed": False}
+                    continue
+                changed_dependencies = [result["step"] for result in dependencies if result["changed"]]
+                running[executor.submit(execute, step, changed_dependencies)] = name
+            if not running:
+                if pending:
+                    raise ValueError(f"Dependency cycle between the steps {', '.join(pending)}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return [results[name] for name in steps]
+
+#chain of steps that determined the duration of the run: starting at the step that finished last, each step is preceded
+#by the dependency that finished last
+def critical_path(results):
+    by_name = {result["step"]: result for result in results}
+    path = []
+    current = max(results, key=lambda result: result["end"]) if results else None
+    while current is not None:
+        path.append(current["step"])
+        dependencies = [by_name[dependency] for dependency in current["depends_on"]]
+        current = max(dependencies, key=lambda result: result["end"]) if dependencies else None
+    return list(reversed(path))
+
+def format_report(results):
+    path = critical_path(results)
+    total = max((result["end"] for result in results), default=0.0)
+    lines = [f"{'step':<16} {'status':<10} {'start':>9} {'duration':>9}"]
+    for result in sorted(results, key=lambda result: result["start"]):
+        marker = "*" if result["step"] in path else ""
+        lines.append(f"{result['step']:<16} {result['status']:<10} {result['start']:>8.2f}s {result['end'] - result['start']:>8.2f}s {marker}")
+    lines.append(f"critical path (*): {' -> '.join(path)}, {total:.2f} seconds in total, "
+                 f"{sum(result['end'] - result['start'] for result in results):.2f} seconds of step time")
+    return "\n".join(lines)
+
+#version of a live resource of the service, its ETag, or None if it does not exist
+def fetch_etag(get, name):
+    try:
+        return get(name).e_tag
+    except ResourceNotFoundError:
+        return None
+
+#steps of the enrollment of main.py: load_table, data_source, index, skillset and indexer, or a push step or the
+#steps of the partitions instead
+def enrollment_steps(index_c, indexer_c, index_definition, data_source_definition, skillset_definition=None, indexer_definition=None,
+                     load_table=None, count_rows=None, source_file=None, load_definition=None, push_table=None, push_definition=None, wait=False,
+                     poll_interval=5.0, max_poll_interval=60.0, timeout=None, partition_resources=None, create_view=None):
+    steps = []
+    if load_table is not None:
+        definition = dict(load_definition or {})
+        if source_file is not None:
+            digest = hashlib.sha256()
+            with open(source_file, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            definition["source_sha256"] = digest.hexdigest()
+
+        def apply_load():
+            load_table()
+            return count_rows() if count_rows is not None else None
+        steps.append(Step("load_table", apply_load, definition=definition, fetch=count_rows))
+
+    table_dependency = ("load_table",) if load_table is not None else ()
+
+    if not partition_resources:
+        def apply_data_source():
+            return indexer_c.create_or_update_data_source_connection(data_source_definition).e_tag
+        steps.append(Step("data_source", apply_data_source, table_dependency, data_source_definition,
+                          lambda: fetch_etag(indexer_c.get_data_source_connection, data_source_definition.name)))
+
+    def apply_index():
+        e_tag = index_c.create_or_update_index(index_definition).e_tag
+        #cached query results may not match the new index definition
+        querycache.invalidate()
+        return e_tag
+    steps.append(Step("index", apply_index, (), index_definition, lambda: fetch_etag(index_c.get_index, index_definition.name)))
+
+    if push_table is not None:
+        def apply_push():
+            push_table()
+            return None
+        definition = dict(push_definition or {}, index=index_definition.name)
+        steps.append(Step("push", apply_push, table_dependency + ("index",), definition, run_after_changes=True))
+        return steps
+
+    def apply_skillset():
+        return indexer_c.create_or_update_skillset(skillset_definition).e_tag
+    steps.append(Step("skillset", apply_skillset, ("index",), skillset_definition,
+                      lambda: fetch_etag(indexer_c.get_skillset, skillset_definition.name)))
+
+    if partition_resources:
+        steps.extend(partition_steps(indexer_c, partition_resources, create_view, table_dependency, wait, poll_interval, max_poll_interval, timeout))
+        return steps
+
+    def apply_indexer():
+        previous_start_time = indexer.last_start_time(indexer_c, indexer_definition.name) if wait else None
+        e_tag = indexer_c.create_or_update_indexer(indexer_definition).e_tag
+        indexer.start_indexer(indexer_c, indexer_definition.name, previous_start_time, wait, poll_interval, max_poll_interval, timeout)
+        return e_tag
+    steps.append(Step("indexer", apply_indexer, ("data_source", "index", "skillset"), indexer_definition,
+                      lambda: fetch_etag(indexer_c.get_indexer, indexer_definition.name), run_after_changes=True))
+    return steps
+
+#view, data source and indexer steps of the partitions of enrollment_steps. The indexer steps only start the runs, so the
+#partitions are indexed in parallel on the service, the wait_partitions step waits for all of them.
+def partition_steps(indexer_c, partition_resources, create_view, table_dependency=(), wait=False, poll_interval=5.0, max_poll_interval=60.0,
+                    timeout=None):
+    steps = []
+    previous_start_times = {}
+    for resource in partition_resources:
+        name = resource["name"]
+        data_source = resource["data_source"]
+        indexer_definition = resource["indexer"]
+
+        def apply_view(ddl=resource["view"]):
+            create_view(ddl)
+            return None
+        steps.append(Step(f"view_{name}", apply_view, table_dependency, {"view": resource["view"]}))
+
+        def apply_data_source(data_source=data_source):
+            return indexer_c.create_or_update_data_source_connection(data_source).e_tag
+        steps.append(Step(f"data_source_{name}", apply_data_source, (f"view_{name}",), data_source,
+                          lambda data_source=data_source: fetch_etag(indexer_c.get_data_source_connection, data_source.name)))
+
+        def apply_indexer(indexer_definition=indexer_definition):
+            previous_start_times[indexer_definition.name] = indexer.last_start_time(indexer_c, indexer_definition.name) if wait else None
+            e_tag = indexer_c.create_or_update_indexer(indexer_definition).e_tag
+            indexer.start_indexer(indexer_c, indexer_definition.name)
+            return e_tag
+        steps.append(Step(f"indexer_{name}", apply_indexer, (f"data_source_{name}", "index", "skillset"), indexer_definition,
+                          lambda indexer_definition=indexer_definition: fetch_etag(indexer_c.get_indexer, indexer_definition.name),
+                          run_after_changes=True))
+
+    if wait:
+        indexer_names = [resource["indexer"].name for resource in partition_resources]
+
+        def apply_wait():
+            partitions.wait_for_partitions(indexer_c, indexer_names, previous_start_times, poll_interval, max_poll_interval, timeout)
+            querycache.invalidate()
+            return None
+        steps.append(Step("wait_partitions", apply_wait, tuple(f"indexer_{resource['name']}" for resource in partition_resources)))
+    return steps
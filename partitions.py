@@ -0,0 +1,229 @@
+#Description: Config-driven enrollment of any table and partitioned indexing of large tables.
+#usage: python partitions.py --config table.json --partitions 8 --min-key 1 --max-key 5000000 --index-name nobelprizes
+import csv
+import json
+import time
+import logging
+import argparse
+import datetime
+import azuresql
+import chunking
+import indexer
+
+#the nobel prize winners table loaded from the CSV by azuresql.load_table
+default_table_config = {
+    "table": "nobelprizewinners",
+    "columns": dict(chunking.table_columns),
+    "csv_file_path": "./data/nobel-prize-winners.csv",
+    "partitions": 1,
+    "boundaries": None
+}
+
+#reads a table config and fills the missing settings with default_table_config. partitions overrides the number of
+#partitions of the file.
+def read_table_config(path=None, partitions=None):
+    config = dict(default_table_config)
+    if path:
+        with open(path) as f:
+            settings = json.load(f)
+        config.update(settings)
+        #a table of its own is not loaded from the CSV of the default table
+        if "csv_file_path" not in settings and config["table"] != default_table_config["table"]:
+            config["csv_file_path"] = None
+    if partitions is not None:
+        config["partitions"] = partitions
+    return validate_table_config(config)
+
+def validate_table_config(config):
+    missing = [field for field in chunking.table_columns if field not in config["columns"]]
+    if missing:
+        raise ValueError(f"Table config of {config['table']} maps no column to the index fields {', '.join(missing)}")
+    unknown = [field for field in config["columns"] if field not in chunking.table_columns]
+    if unknown:
+        raise ValueError(f"Table config of {config['table']} maps columns to unknown index fields {', '.join(unknown)}")
+    if config["partitions"] < 1:
+        raise ValueError(f"Table config of {config['table']} needs at least one partition")
+    if config["boundaries"] is not None and len(config["boundaries"]) != config["partitions"] - 1:
+        raise ValueError(f"Table config of {config['table']} has {len(config['boundaries'])} boundaries for {config['partitions']} partitions")
+    return config
+
+#first keys of the partitions 2..partitions for integer keys spread evenly between min_key and max_key
+def even_boundaries(min_key, max_key, partitions):
+    step = (max_key - min_key + 1) / partitions
+    return [min_key + round(step * i) for i in range(1, partitions)]
+
+#query for the first keys of partitions with the same number of rows, for keys that are not spread evenly
+def boundaries_query(config, partitions):
+    key = config["columns"]["db_table_id"]
+    return (f"SELECT MIN({key}) FROM (SELECT {key}, NTILE({partitions}) OVER (ORDER BY {key}) AS Tile FROM {config['table']}) AS Tiles "
+            f"GROUP BY Tile ORDER BY Tile")
+
+#first keys of the partitions 2..partitions of the table, fewer if the table has fewer rows than partitions
+def query_boundaries(co, config, partitions):
+    cursor = co.cursor()
+    cursor.execute(boundaries_query(config, partitions))
+    return [row[0] for row in cursor.fetchall()][1:]
+
+#key ranges of the table from the configured boundaries, the table or, before the table is loaded, the CSV
+def plan_table(co, config):
+    partitions = config["partitions"]
+    if config["boundaries"] is not None or partitions == 1:
+        return plan_partitions(config, config["boundaries"] or [])
+    if co is not None and azuresql.count_rows(co, config["table"]) is not None:
+        return plan_partitions(config, query_boundaries(co, config, partitions))
+    if config.get("csv_file_path"):
+        with open(config["csv_file_path"], newline="", encoding="utf-8") as f:
+            rows = sum(1 for _ in csv.DictReader(f))
+        return plan_partitions(config, even_boundaries(1, rows, partitions))
+    raise ValueError(f"Table {config['table']} can not be planned without its rows, set boundaries or the smallest and largest key")
+
+#partitions of the key ranges between the boundaries. The first partition has no lower and the last no upper bound, so
+#rows added later outside of the planned range are still indexed.
+def plan_partitions(config, boundaries):
+    boundaries = sorted(set(boundaries))
+    bounds = [None] + boundaries + [None]
+    return [{"number": i, "name": f"{config['table']}_p{i}", "lower": bounds[i], "upper": bounds[i + 1]} for i in range(len(bounds) - 1)]
+
+def sql_literal(value):
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value).replace("'", "''")
+    return f"'{text}'"
+
+#SQL condition of the key range of a partition, None for a partition without bounds
+def partition_condition(config, partition):
+    key = config["columns"]["db_table_id"]
+    conditions = []
+    if partition["lower"] is not None:
+        conditions.append(f"{key} >= {sql_literal(partition['lower'])}")
+    if partition["upper"] is not None:
+        conditions.append(f"{key} < {sql_literal(partition['upper'])}")
+    return " AND ".join(conditions) or None
+
+#view of the rows of a partition with the mapped columns, plus the change tracking columns of an incremental table
+def view_ddl(config, partition, incremental=False):
+    columns = list(dict.fromkeys(config["columns"][field] for field in chunking.table_columns))
+    if incremental:
+        columns += [azuresql.high_water_mark_column, azuresql.soft_delete_column]
+    condition = partition_condition(config, partition)
+    where = f" WHERE {condition}" if condition else ""
+    return f"CREATE OR ALTER VIEW {partition['name']} AS SELECT {', '.join(columns)} FROM {config['table']}{where}"
+
+def create_view(co, ddl):
+    cursor = co.cursor()
+    cursor.execute(ddl)
+    co.commit()
+
+#view, data source and indexer definitions of every partition of the plan. indexing_options are passed to
+#indexer.build_indexer (batch_size, max_failed_items, ...).
+def build_partition_resources(config, plan, index_name, sql_server, database_name, username, password, incremental=False, **indexing_options):
+    resources = []
+    for partition in plan:
+        suffix = f"p{partition['number']}"
+        data_source = azuresql.build_data_source_connection(sql_server, database_name, username, password, partition["name"], incremental,
+                                                            name=f"{config['table'].lower()}-{suffix}-azuresqlcon")
+        resources.append({
+            "name": suffix,
+            "partition": partition,
+            "view": view_ddl(config, partition, incremental),
+            "data_source": data_source,
+            "indexer": indexer.build_indexer(index_name, data_source_name=data_source.name, name=f"{index_name}-indexer-{suffix}", **indexing_options)
+        })
+    return resources
+
+#progress of all partitions from their indexer.indexer_progress (None for a queued run): items, failed items and the rate
+#are summed, the ETA is the one of the slowest running partition since the partitions run in parallel
+def aggregate_progress(progresses):
+    started = [progress for progress in progresses if progress is not None]
+    running = [progress for progress in started if progress["status"] == "inProgress"]
+    if len(started) < len(progresses) or running:
+        status = "inProgress"
+    else:
+        status = next((progress["status"] for progress in started if progress["status"] != "success"), "success")
+    expected = [progress["expected_items"] for progress in started]
+    etas = [progress["eta_seconds"] for progress in running]
+    return {"status": status, "partitions": len(progresses), "running": len(running), "queued": len(progresses) - len(started),
+            "items": sum(progress["items"] for progress in started), "failed": sum(progress["failed"] for progress in started),
+            "seconds": max((progress["seconds"] for progress in started), default=0.0),
+            "docs_per_second": sum(progress["docs_per_second"] for progress in running or started),
+            "expected_items": sum(expected) if started and len(started) == len(progresses) and None not in expected else None,
+            "eta_seconds": max(etas) if etas and None not in etas else None}
+
+def format_aggregate_progress(progress):
+    return (f"{progress['running']} of {progress['partitions']} partitions running, {progress['queued']} queued: "
+            f"{indexer.format_progress(progress)}")
+
+#polls the indexers of all partitions until the runs started after previous_start_times (indexer name -> start time) have
+#finished, with the backoff of indexer.wait_for_indexer, and logs the aggregated progress. Returns the last result per indexer.
+def wait_for_partitions(indexer_c, indexer_names, previous_start_times=None, poll_interval=5.0, max_poll_interval=60.0, timeout=None,
+                        sleep=time.sleep):
+    previous_start_times = previous_start_times or {}
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    interval = poll_interval
+    while True:
+        results = {}
+        progresses = []
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for name in indexer_names:
+            status = indexer_c.get_indexer_status(name)
+            result = status.last_result
+            if status.status == "error":
+                logging.error(f"Indexer {name} is in error state and cannot run")
+                results[name] = result
+                progresses.append({"status": "error", "items": 0, "failed": 0, "seconds": 0.0, "docs_per_second": 0.0,
+                                   "expected_items": None, "eta_seconds": None})
+            elif result is None or result.start_time == previous_start_times.get(name):
+                results[name] = None
+                progresses.append(None)
+            else:
+                results[name] = result
+                progresses.append(indexer.indexer_progress(status, now=now))
+        progress = aggregate_progress(progresses)
+        if progress["status"] != "inProgress":
+            log = logging.info if progress["status"] == "success" else logging.error
+            log(f"Indexers of {len(indexer_names)} partitions finished with status {progress['status']}: {indexer.format_progress(progress)}")
+            for name, result in results.items():
+                if result is not None and result.status != "success":
+                    logging.error(f"Indexer {name} finished with status {result.status}: {result.error_message}")
+            return results
+        logging.info(f"Partitioned indexing: {format_aggregate_progress(progress)}")
+
+        if deadline is not None and time.monotonic() + interval > deadline:
+            logging.warning(f"Stopped waiting for the indexers of {len(indexer_names)} partitions after {timeout} seconds, the runs continue on the service")
+            return results
+        sleep(interval)
+        interval = min(interval * 2, max_poll_interval)
+
+def format_plan(config, plan):
+    lines = [f"Table {config['table']} in {len(plan)} partitions by {config['columns']['db_table_id']}"]
+    for partition in plan:
+        lines.append(f"  {partition['name']:<24} {partition_condition(config, partition) or 'all rows'}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan the key range partitions of a table and print their definitions without enrolling")
+    parser.add_argument("--config", help="table config (JSON), see default_table_config")
+    parser.add_argument("--partitions", type=int)
+    parser.add_argument("--min-key", type=int, help="smallest key of the table, with --max-key the keys are split evenly")
+    parser.add_argument("--max-key", type=int)
+    parser.add_argument("--index-name", default="nobelprizes")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--json", action="store_true", help="prints the view, data source and indexer definitions as JSON")
+    args = parser.parse_args(argv)
+
+    config = read_table_config(args.config, args.partitions)
+    if args.min_key is not None and args.max_key is not None:
+        plan = plan_partitions(config, even_boundaries(args.min_key, args.max_key, config["partitions"]))
+    else:
+        plan = plan_table(None, config)
+    resources = build_partition_resources(config, plan, args.index_name, "<sql server>", "<database>", "<username>", "<password>", args.incremental)
+    if args.json:
+        print(json.dumps([{"name": resource["name"], "view": resource["view"], "data_source": resource["data_source"].serialize(),
+                           "indexer": resource["indexer"].serialize()} for resource in resources], indent=2))
+    else:
+        print(format_plan(config, plan))
+        for resource in resources:
+            print(f"  {resource['view']}\n    data source {resource['data_source'].name}, indexer {resource['indexer'].name}")
+
+if __name__ == "__main__":
+    main()
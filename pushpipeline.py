@@ -0,0 +1,215 @@
+#Description: Push ingestion as an alternative to the pull indexer and skillset.
+import time
+import queue
+import logging
+import threading
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient, SearchIndexingBufferedSender
+import chunking
+import tracing
+import querycache
+
+#fields of the documents written by the index projections of skillset.py, pushed documents have exactly these fields
+document_fields = ("Id", "chunk", "vector", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description")
+
+#upload client based on SearchIndexingBufferedSender. The sender batches, retries and flushes the documents itself, so
+#upload_documents returns no results and failed documents are counted by the on_error callback.
+class BufferedUploadClient:
+    def __init__(self, service_endpoint, index_name, aisearch_key, batch_size=500):
+        self.failed = 0
+        self._sender = SearchIndexingBufferedSender(service_endpoint, index_name, AzureKeyCredential(aisearch_key),
+                                                    initial_batch_action_count=batch_size, on_error=self._on_error)
+
+    def _on_error(self, action):
+        self.failed += 1
+        logging.error(f"Upload of document {(action.additional_properties or {}).get('Id')} failed")
+
+    def upload_documents(self, documents):
+        self._sender.upload_documents(documents=documents)
+
+    def flush(self):
+        self._sender.flush()
+
+    def close(self):
+        self._sender.close()
+
+#deletes the chunks of the index of soft deleted rows and the chunks that are no longer among the chunks of their row
+class StaleChunkCleaner:
+    def __init__(self, search_client, stats, batch_size=500):
+        self.search_client = search_client
+        self.stats = stats
+        self.batch_size = batch_size
+        self._rows = []
+        self._keys = set()
+
+    def add(self, row_id, keys):
+        self._rows.append(str(row_id))
+        self._keys.update(keys)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        #the IDs are integers, search.in needs no quoting with "," as delimiter
+        results = self.search_client.search(search_text="*", filter=f"search.in(db_table_id, '{','.join(self._rows)}', ',')", select=["Id"])
+        stale = [{"Id": result["Id"]} for result in results if result["Id"] not in self._keys]
+        if stale:
+            self.search_client.delete_documents(documents=stale)
+        self.stats["deleted"] += len(stale)
+        self._rows = []
+        self._keys = set()
+
+#yields the chunks of the rows as documents without vector, in lists of batch_size documents
+def chunk_batches(rows, batch_size, stats, int_fields=(), cleaner=None):
+    batch = []
+    for row in rows:
+        stats["rows"] += 1
+        documents = chunking.project_row(*row)
+        if cleaner is not None:
+            cleaner.add(row[0], [document["Id"] for document in documents])
+        for document in documents:
+            for field in int_fields:
+                document[field] = int(document[field])
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+#pushes the chunks of rows ((ID, Year, Discipline, Winner, Description) tuples) into the index and returns the counts
+def push_rows(rows, embedding_client, upload_client, embed_batch_size=128, embed_concurrency=4, upload_batch_size=500, upload_concurrency=4,
+              int_fields=(), embedding_store=None, cleanup_client=None, deleted_rows=()):
+    stats = {"rows": 0, "chunks": 0, "embedding_requests": 0, "embedded": 0, "uploaded": 0, "failed": 0, "deleted": 0, "seconds": 0.0}
+    cleaner = StaleChunkCleaner(cleanup_client, stats) if cleanup_client is not None else None
+    start = time.perf_counter()
+    dimensions = getattr(embedding_client, "dimensions", None)
+    deployment = getattr(embedding_client, "deployment", None)
+    if embedding_store is not None and (embedding_store.dimensions != dimensions or embedding_store.deployment != deployment):
+        raise ValueError(f"Embedding store for {embedding_store.deployment} with {embedding_store.dimensions} dimensions does not match "
+                         f"deployment {deployment} with {dimensions} dimensions")
+    embed_work = queue.Queue(maxsize=embed_concurrency * 2)
+    upload_work = queue.Queue(maxsize=upload_concurrency * 2)
+    lock = threading.Lock()
+    errors = []
+
+    def embedder():
+        for batch in iter(embed_work.get, None):
+            #after an error the batches are only consumed, so the reader is never blocked
+            if errors:
+                continue
+            try:
+                texts = [document["chunk"] for document in batch]
+                if embedding_store is not None:
+                    vectors, embedded = embedding_store.embed(embedding_client, texts)
+                else:
+                    vectors, embedded = embedding_client.embed(texts), len(texts)
+                for document, vector in zip(batch, vectors):
+                    if dimensions is not None and len(vector) != dimensions:
+                        raise ValueError(f"Embedding client returned {len(vector)} dimensions, expected {dimensions}")
+                    document["vector"] = vector
+                with lock:
+                    stats["embedding_requests"] += 1 if embedded else 0
+                    stats["embedded"] += embedded
+                    stats["chunks"] += len(batch)
+                upload_work.put(batch)
+            except Exception as e:
+                logging.error(f"Error embedding {len(batch)} chunks: {e}")
+                errors.append(e)
+
+    def upload(documents):
+        results = upload_client.upload_documents(documents=documents)
+        if results is None:
+            #buffered client, failures are counted when it is flushed
+            uploaded, failed = len(documents), []
+        else:
+            failed = [result for result in results if not result.succeeded]
+            uploaded = len(results) - len(failed)
+        for result in failed[:3]:
+            logging.error(f"Upload of document {result.key} failed: {result.error_message}")
+        with lock:
+            stats["uploaded"] += uploaded
+            stats["failed"] += len(failed)
+
+    def uploader():
+        pending = []
+        for batch in iter(upload_work.get, None):
+            if errors:
+                continue
+            try:
+                pending.extend(batch)
+                while len(pending) >= upload_batch_size:
+                    upload(pending[:upload_batch_size])
+                    pending = pending[upload_batch_size:]
+            except Exception as e:
+                logging.error(f"Error uploading documents: {e}")
+                errors.append(e)
+        try:
+            if pending and not errors:
+                upload(pending)
+        except Exception as e:
+            logging.error(f"Error uploading documents: {e}")
+            errors.append(e)
+
+    embedders = [threading.Thread(target=embedder, daemon=True) for _ in range(embed_concurrency)]
+    uploaders = [threading.Thread(target=uploader, daemon=True) for _ in range(upload_concurrency)]
+    for thread in embedders + uploaders:
+        thread.start()
+    for batch in chunk_batches(rows, embed_batch_size, stats, int_fields, cleaner):
+        if errors:
+            break
+        embed_work.put(batch)
+    if cleaner is not None and not errors:
+        for row in deleted_rows:
+            cleaner.add(row[0], ())
+        cleaner.flush()
+    for _ in embedders:
+        embed_work.put(None)
+    for thread in embedders:
+        thread.join()
+    for _ in uploaders:
+        upload_work.put(None)
+    for thread in uploaders:
+        thread.join()
+
+    if hasattr(upload_client, "flush") and not errors:
+        upload_client.flush()
+        stats["failed"] += upload_client.failed
+        stats["uploaded"] -= upload_client.failed
+    if errors:
+        raise errors[0]
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+#pushes the table into the index instead of running the indexer
+@tracing.traced("pushpipeline.push_table")
+def push_table(co, table_name, service_endpoint, index_name, aisearch_key, embedding_client, embed_batch_size=128, embed_concurrency=4,
+               upload_batch_size=500, upload_concurrency=4, buffered_sender=False, where=None, int_fields=(), columns=None, embedding_store=None,
+               deleted_where=None):
+    logging.info(f"Start pushing table {table_name} into index {index_name}")
+    if buffered_sender:
+        #the buffered sender uploads from the calling thread, one uploader keeps its batches in order
+        upload_client = BufferedUploadClient(service_endpoint, index_name, aisearch_key, batch_size=upload_batch_size)
+        upload_concurrency = 1
+    else:
+        upload_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
+    cleanup_client = None
+    deleted_rows = ()
+    if deleted_where is not None:
+        cleanup_client = SearchClient(service_endpoint, index_name, credential=AzureKeyCredential(aisearch_key))
+        #read after the pushed rows, one result set of the connection at a time
+        deleted_rows = chunking.read_sql_rows(co, table_name, where=deleted_where, columns=columns)
+    try:
+        stats = push_rows(chunking.read_sql_rows(co, table_name, where=where, columns=columns), embedding_client, upload_client, embed_batch_size,
+                          embed_concurrency, upload_batch_size, upload_concurrency, int_fields, embedding_store, cleanup_client, deleted_rows)
+    finally:
+        upload_client.close()
+        if cleanup_client is not None:
+            cleanup_client.close()
+    #the pushed documents change the index, cached query results are outdated
+    querycache.invalidate()
+    tracing.add(**{key: value for key, value in stats.items() if key != "seconds"})
+    logging.info(f"Pushed {stats['rows']} rows as {stats['uploaded']} documents ({stats['failed']} failed, {stats['deleted']} deleted) with {stats['embedding_requests']} "
+                 f"embedding requests for {stats['embedded']} chunks in {stats['seconds']:.1f} seconds, {stats['uploaded'] / max(stats['seconds'], 1e-9):.1f} docs/sec")
+    return stats
@@ -0,0 +1,145 @@
+#Description: Optional cache of the search results, in memory and optionally on disk.
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import searchquery
+
+#next to this file, so queries and enrollments started from other directories share the generation. QUERY_CACHE_DIR
+#overrides it.
+default_cache_dir = os.environ.get("QUERY_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".querycache")
+
+#seconds until a cached result expires. Semantic results are kept shorter, they contain the reranked answers.
+default_ttls = {"vector": 3600, "hybrid": 3600, "semantic": 900}
+
+def generation_file(cache_dir=default_cache_dir):
+    return os.path.join(cache_dir, "generation")
+
+#marks all cached results as outdated. Called by index.create_index and indexer.create_indexer, every QueryCache
+#notices the new generation on its next lookup, also in other processes.
+def invalidate(cache_dir=default_cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(generation_file(cache_dir), "w") as f:
+        f.write(uuid.uuid4().hex)
+    logging.info(f"Invalidated query cache in {cache_dir}")
+
+def read_generation(cache_dir=default_cache_dir):
+    try:
+        with open(generation_file(cache_dir)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+def normalize_query(search_input):
+    return " ".join(search_input.lower().split())
+
+#scope identifies what answers the queries, e.g. the endpoint (or the local backend) and the embedding model and
+#dimensions. It is part of every key, so caches of different backends can share the disk tier.
+class QueryCache:
+    def __init__(self, max_entries=1024, ttls=None, cache_dir=default_cache_dir, disk=False, scope=None):
+        self.max_entries = max_entries
+        self.scope = sorted((scope or {}).items())
+        self.ttls = dict(default_ttls, **(ttls or {}))
+        self.cache_dir = cache_dir
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "semantic_hits": 0, "miss_seconds": 0.0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = read_generation(cache_dir)
+        self._generation_checked = 0.0
+        self._disk = None
+        if disk:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk = sqlite3.connect(os.path.join(cache_dir, "results.db"), check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, generation TEXT, expires REAL, value TEXT)")
+            #drop expired and invalidated entries of earlier runs
+            self._disk.execute("DELETE FROM results WHERE expires < ? OR generation != ?", (time.time(), self._generation))
+            self._disk.commit()
+
+    #cache key of a request: scope, index, normalized query text, mode, k, select list, filter and the other query options
+    def key(self, mode, search_input, search_kwargs, query_options=None, index_name=None):
+        parts = [self.scope, index_name, mode, normalize_query(search_input), search_kwargs.get("top"), search_kwargs.get("select"),
+                 search_kwargs.get("filter"), sorted((query_options or {}).items())]
+        return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+    #drops the memory tier when another process or an enrollment invalidated the cache. The generation file is
+    #checked at most once per second.
+    def _check_generation(self, now):
+        if now - self._generation_checked < 1.0:
+            return
+        self._generation_checked = now
+        generation = read_generation(self.cache_dir)
+        if generation != self._generation:
+            self._generation = generation
+            self._entries.clear()
+
+    def get(self, key, mode):
+        now = time.time()
+        with self._lock:
+            self._check_generation(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["semantic_hits"] += mode == "semantic"
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            if self._disk is not None:
+                row = self._disk.execute("SELECT expires, value FROM results WHERE key = ? AND generation = ?", (key, self._generation)).fetchone()
+                if row is not None and row[0] > now:
+                    value = json.loads(row[1])
+                    self._put_memory(key, row[0], value)
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    self.stats["semantic_hits"] += mode == "semantic"
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def _put_memory(self, key, expires, value):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key, mode, value):
+        expires = time.time() + self.ttls[mode]
+        with self._lock:
+            self._put_memory(key, expires, value)
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, self._generation, expires, json.dumps(value, default=str)))
+                self._disk.commit()
+
+    #runs the search through the cache, the query is only embedded on a cache miss
+    def search(self, search_client, mode, search_input, index_name, k=2, embedder=None, collapse=False, **query_options):
+        search_kwargs = searchquery.build_search_kwargs(mode, search_input, index_name, k, **query_options)
+        key = self.key(mode, search_input, search_kwargs, dict(query_options, collapse=collapse), index_name)
+        response = self.get(key, mode)
+        if response is not None:
+            return response
+
+        start = time.perf_counter()
+        vector = embedder.embed(search_input) if embedder is not None else None
+        response = searchquery.search(search_client, mode, search_input, index_name, k, vector=vector, collapse=collapse, **query_options)
+        self.stats["miss_seconds"] += time.perf_counter() - start
+        self.put(key, mode, response)
+        return response
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        average_miss = self.stats["miss_seconds"] / self.stats["misses"] if self.stats["misses"] else 0.0
+        return (f"Query cache: {self.stats['hits']} hits ({self.stats['disk_hits']} from disk), {self.stats['misses']} misses, "
+                f"hit rate {hit_rate:.1%}, about {self.stats['hits'] * average_miss:.2f} seconds of search latency saved, "
+                f"{self.stats['semantic_hits']} semantic reranks saved")
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,325 @@
+#Description: Extracts year, discipline and winner constraints from the query text and compiles them into an OData filter.
+#usage: python queryplanner.py "physics 1920s Einstein"
+import re
+import csv
+import html
+import json
+import argparse
+import datetime
+import functools
+
+filter_modes = ("pre", "post")
+
+#words of the query text that select a value of db_table_discipline
+discipline_terms = {
+    "physics": "physics", "physicist": "physics", "physicists": "physics",
+    "chemistry": "chemistry", "chemist": "chemistry", "chemists": "chemistry",
+    "medicine": "medicine", "medical": "medicine", "physiology": "medicine",
+    "literature": "literature", "literary": "literature",
+    "peace": "peace",
+    "economics": "economics", "economic": "economics", "economist": "economics", "economists": "economics"
+}
+
+#words left over from the constraints that do not make a query of their own
+filler_words = {"nobel", "prize", "prizes", "winner", "winners", "laureate", "laureates", "in", "of", "the", "for", "and", "or", "from", "to",
+                "between", "year", "years", "award", "awarded", "s"}
+
+#year of the first prizes
+first_prize_year = 1901
+
+#a number without a year cue is only a year if a prize can have been awarded in it, "1000 physicists" is no constraint
+def bare_year(match):
+    year = int(match.group(1))
+    return (year, year) if first_prize_year <= year <= datetime.date.today().year else None
+
+#year constraints of the query text as (pattern, function of the match returning (low, high) or None if the match is no
+#year), tried in this order. None is an open bound.
+year_patterns = [
+    (re.compile(r"\b(\d{2})(?:st|nd|rd|th) century\b", re.IGNORECASE),
+     lambda match: ((int(match.group(1)) - 1) * 100 + 1, int(match.group(1)) * 100)),
+    (re.compile(r"\b(?:between|from) ([12]\d{3}) (?:and|to|until) ([12]\d{3})\b", re.IGNORECASE),
+     lambda match: (int(match.group(1)), int(match.group(2)))),
+    (re.compile(r"\b([12]\d{3}) ?(?:-|–|to) ?([12]\d{3})\b", re.IGNORECASE),
+     lambda match: (int(match.group(1)), int(match.group(2)))),
+    (re.compile(r"\b(?:before|until|prior to) ([12]\d{3})\b", re.IGNORECASE), lambda match: (None, int(match.group(1)) - 1)),
+    (re.compile(r"\bafter ([12]\d{3})\b", re.IGNORECASE), lambda match: (int(match.group(1)) + 1, None)),
+    (re.compile(r"\bsince ([12]\d{3})\b", re.IGNORECASE), lambda match: (int(match.group(1)), None)),
+    (re.compile(r"\b([12]\d{2}0)'?s\b", re.IGNORECASE), lambda match: (int(match.group(1)), int(match.group(1)) + 9)),
+    #"the 20s" and "'20s" are decades of the 20th century, the century of most prizes
+    (re.compile(r"(?:\bthe |')(\d0)'?s\b", re.IGNORECASE), lambda match: (1900 + int(match.group(1)), 1909 + int(match.group(1)))),
+    (re.compile(r"\b([12]\d{3})\b"), bare_year)
+]
+
+word_pattern = re.compile(r"[\w'-]+")
+
+#names of the winners (values of db_table_winner) by their unescaped, lowercased full name and by their surname. The CSV
+#keeps HTML entities in the names, the filter has to use the values as they are stored.
+class WinnerNames:
+    def __init__(self, winners=()):
+        self.full_names = {}
+        self.surnames = {}
+        for winner in winners:
+            name = html.unescape(winner or "").strip()
+            parts = name.split()
+            if len(parts) < 2 or name.lower() == "not awarded":
+                continue
+            self.full_names.setdefault(name.lower(), []).append(winner)
+            surname = parts[-1]
+            #surnames are only matched capitalized, so words like "Cross" in "red cross" do not select a winner
+            if len(surname) >= 4 and surname[0].isupper():
+                self.surnames.setdefault(surname, []).append(winner)
+
+    @classmethod
+    def from_csv(cls, csv_file_path="./data/nobel-prize-winners.csv"):
+        with open(csv_file_path, newline="", encoding="utf-8") as f:
+            return cls(dict.fromkeys(row["winner"] for row in csv.DictReader(f)))
+
+    #winners named in the text: full names anywhere (case-insensitive) and capitalized surnames of the rest of the text,
+    #so "Marie Curie" does not also select Pierre Curie
+    def find(self, text):
+        found = []
+        text = html.unescape(text)
+        for name, winners in self.full_names.items():
+            pattern = re.compile(rf"(?<!\w){re.escape(name)}(?!\w)", re.IGNORECASE)
+            if pattern.search(text):
+                found.extend(winners)
+                text = pattern.sub(" ", text)
+        for word in word_pattern.findall(text):
+            found.extend(self.surnames.get(word, ()))
+        return list(dict.fromkeys(found))
+
+#constraints of one query and the text that is left to search. years are (low, high) ranges, matching any of them.
+class QueryPlan:
+    def __init__(self, text, years=(), disciplines=(), winners=(), original_text=None):
+        self.text = text
+        self.years = list(years)
+        self.disciplines = list(disciplines)
+        self.winners = list(winners)
+        self.original_text = text if original_text is None else original_text
+
+    def to_dict(self):
+        return {"text": self.text, "years": self.years, "disciplines": self.disciplines, "winners": self.winners}
+
+#parses "1921", "1920-1929", "1920-" or "-1950" into a (low, high) range
+def parse_year_range(value):
+    low, separator, high = str(value).partition("-")
+    if not separator:
+        return int(low), int(low)
+    return (int(low) if low.strip() else None), (int(high) if high.strip() else None)
+
+#extracts the constraints of the query text. Year and discipline phrases are removed from the text, winner names stay
+#in it since they also rank the chunks that mention them. If only filler words are left, the original text is searched.
+def extract(search_input, winner_names=None):
+    text = search_input
+    years = []
+    for pattern, year_range in year_patterns:
+        def replace(match):
+            bounds = year_range(match)
+            if bounds is None:
+                return match.group(0)
+            years.append(bounds)
+            return " "
+        text = pattern.sub(replace, text)
+    disciplines = []
+    kept = []
+    for word in text.split():
+        discipline = discipline_terms.get(word.lower().strip(".,;:!?"))
+        if discipline is not None:
+            if discipline not in disciplines:
+                disciplines.append(discipline)
+        else:
+            kept.append(word)
+    winners = winner_names.find(search_input) if winner_names is not None else []
+    remaining = " ".join(kept)
+    if not [word for word in word_pattern.findall(remaining.lower()) if word not in filler_words]:
+        remaining = search_input
+    return QueryPlan(remaining, years, disciplines, winners, search_input)
+
+def odata_string(value):
+    text = str(value).replace("'", "''")
+    return f"'{text}'"
+
+#OData condition of a year range. db_table_year is a string in the default schema (4 digit years compare like numbers)
+#and an Int32 in the compact schema (int_year).
+def year_condition(low, high, int_year=False):
+    literal = str if int_year else lambda year: odata_string(f"{year:04d}")
+    if low is not None and low == high:
+        return f"db_table_year eq {literal(low)}"
+    conditions = []
+    if low is not None:
+        conditions.append(f"db_table_year ge {literal(low)}")
+    if high is not None:
+        conditions.append(f"db_table_year le {literal(high)}")
+    return " and ".join(conditions)
+
+#OData filter of the constraints of a plan, None without constraints. Year ranges are combined with or, the constraints
+#of different fields with and.
+def compile_filter(plan, int_year=False):
+    conditions = []
+    years = [year_condition(low, high, int_year) for low, high in plan.years if low is not None or high is not None]
+    if years:
+        conditions.append(years[0] if len(years) == 1 else "(" + " or ".join(f"({year})" for year in years) + ")")
+    if plan.disciplines:
+        conditions.append(f"search.in(db_table_discipline, {odata_string(','.join(plan.disciplines))}, ',')")
+    if plan.winners:
+        conditions.append(f"search.in(db_table_winner, {odata_string('|'.join(plan.winners))}, '|')")
+    return " and ".join(conditions) or None
+
+#plans the queries of the search paths, apply returns the text to search and the query options with the filter
+class QueryPlanner:
+    def __init__(self, winner_names=None, filter_mode="pre", int_year=False, extract_constraints=True, years=(), disciplines=(), winners=()):
+        if filter_mode not in filter_modes:
+            raise ValueError(f"Unknown filter mode {filter_mode}, use one of {', '.join(filter_modes)}")
+        self.winner_names = winner_names
+        self.filter_mode = filter_mode
+        self.int_year = int_year
+        self.extract_constraints = extract_constraints
+        self.years = [parse_year_range(year) if isinstance(year, str) else tuple(year) for year in years]
+        self.disciplines = [discipline_terms.get(discipline.lower(), discipline.lower()) for discipline in disciplines]
+        self.winners = list(winners)
+
+    def plan(self, search_input):
+        plan = extract(search_input, self.winner_names) if self.extract_constraints else QueryPlan(search_input)
+        plan.years = self.years + [year for year in plan.years if year not in self.years]
+        plan.disciplines = list(dict.fromkeys(self.disciplines + plan.disciplines))
+        plan.winners = list(dict.fromkeys(self.winners + plan.winners))
+        return plan
+
+    def apply(self, search_input, query_options=None):
+        plan = self.plan(search_input)
+        query_options = dict(query_options or {})
+        search_filter = compile_filter(plan, self.int_year)
+        if search_filter:
+            query_options.update(filter=search_filter, filter_mode=self.filter_mode)
+        return plan.text, query_options
+
+#the OData filter subset of compile_filter as a predicate over documents (dicts), for the local search backend:
+#eq, ne, gt, ge, lt, le with string and number literals, search.in, and, or, not and parentheses
+filter_token = re.compile(r"\s*(?:(?P<string>'(?:[^']|'')*')|(?P<number>-?\d+(?:\.\d+)?)|(?P<name>[\w.]+)|(?P<symbol>[(),]))")
+
+def tokenize_filter(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = filter_token.match(text, position)
+        if match is None:
+            raise ValueError(f"Unsupported filter {text!r} at position {position}")
+        position = match.end()
+        if match.group("string") is not None:
+            tokens.append(("value", match.group("string")[1:-1].replace("''", "'")))
+        elif match.group("number") is not None:
+            number = match.group("number")
+            tokens.append(("value", float(number) if "." in number else int(number)))
+        elif match.group("name") is not None:
+            tokens.append(("name", match.group("name")))
+        else:
+            tokens.append(("symbol", match.group("symbol")))
+    return tokens
+
+comparisons = {"eq": lambda a, b: a == b, "ne": lambda a, b: a != b, "gt": lambda a, b: a > b, "ge": lambda a, b: a >= b,
+               "lt": lambda a, b: a < b, "le": lambda a, b: a <= b}
+
+#compares like the service: a number literal against a string field value (db_table_year of the default schema) is
+#compared as number if the value is numeric
+def compare(operator, value, literal):
+    if value is None:
+        return operator == "ne" if literal is not None else operator == "eq"
+    if isinstance(literal, (int, float)) and isinstance(value, str):
+        try:
+            value = type(literal)(value)
+        except ValueError:
+            return False
+    elif isinstance(literal, str) and not isinstance(value, str):
+        value = str(value)
+    return comparisons[operator](value, literal)
+
+class FilterParser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            raise ValueError(f"Unexpected token {token[1]!r} in filter, expected {value or kind}")
+        self.position += 1
+        return token[1]
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.peek()[1]!r} at the end of the filter")
+        return predicate
+
+    def parse_or(self):
+        predicates = [self.parse_and()]
+        while self.peek() == ("name", "or"):
+            self.take()
+            predicates.append(self.parse_and())
+        return predicates[0] if len(predicates) == 1 else lambda document: any(predicate(document) for predicate in predicates)
+
+    def parse_and(self):
+        predicates = [self.parse_not()]
+        while self.peek() == ("name", "and"):
+            self.take()
+            predicates.append(self.parse_not())
+        return predicates[0] if len(predicates) == 1 else lambda document: all(predicate(document) for predicate in predicates)
+
+    def parse_not(self):
+        if self.peek() == ("name", "not"):
+            self.take()
+            predicate = self.parse_not()
+            return lambda document: not predicate(document)
+        return self.parse_term()
+
+    def parse_term(self):
+        if self.peek() == ("symbol", "("):
+            self.take()
+            predicate = self.parse_or()
+            self.take("symbol", ")")
+            return predicate
+        name = self.take("name")
+        if name == "search.in":
+            self.take("symbol", "(")
+            field = self.take("name")
+            self.take("symbol", ",")
+            values = self.take("value")
+            delimiter = " ,"
+            if self.peek() == ("symbol", ","):
+                self.take()
+                delimiter = self.take("value")
+            self.take("symbol", ")")
+            allowed = set(value for value in re.split("|".join(re.escape(character) for character in delimiter), values) if value)
+            return lambda document: document.get(field) in allowed
+        operator = self.take("name")
+        if operator not in comparisons:
+            raise ValueError(f"Unsupported operator {operator} in filter")
+        if self.peek()[0] == "value":
+            literal = self.take("value")
+        else:
+            self.take("name", "null")
+            literal = None
+        return lambda document: compare(operator, document.get(name), literal)
+
+@functools.lru_cache(maxsize=256)
+def compile_predicate(search_filter):
+    return FilterParser(tokenize_filter(search_filter)).parse()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the query plan and OData filter of search queries")
+    parser.add_argument("queries", nargs="+")
+    parser.add_argument("--csv-file-path", default="./data/nobel-prize-winners.csv", help="winner names of the CSV")
+    parser.add_argument("--int-year", action="store_true", help="db_table_year is an Int32 (compact schema)")
+    args = parser.parse_args(argv)
+
+    planner = QueryPlanner(WinnerNames.from_csv(args.csv_file_path), int_year=args.int_year)
+    for query in args.queries:
+        plan = planner.plan(query)
+        print(json.dumps(dict(plan.to_dict(), query=query, filter=compile_filter(plan, args.int_year))))
+
+if __name__ == "__main__":
+    main()
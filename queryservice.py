@@ -0,0 +1,208 @@
+#Description: HTTP query service that serves the vector, hybrid and semantic search modes to many concurrent users.
+#usage: python queryservice.py --port 8080 --workers 4
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import functools
+import multiprocessing
+import aiohttp
+from aiohttp import web
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+import searchengine
+import searchquery
+
+#deadline of a request in milliseconds, also accepted as timeout_ms parameter
+deadline_header = "X-Deadline-Ms"
+
+dumps = functools.partial(json.dumps, default=str)
+
+def error_response(status, message, retry_after=None):
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+#engine_factory returns a new searchengine.SearchEngine, it is entered when the app starts and closed when it stops.
+#timeout is the deadline of requests without their own, max_timeout caps the deadline a client can ask for.
+class QueryService:
+    def __init__(self, engine_factory, max_pending=128, timeout=10.0, max_timeout=30.0, k=2, max_k=100):
+        self.engine_factory = engine_factory
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.k = k
+        self.max_k = max_k
+        self.engine = None
+        self.ready = False
+        self.pending = 0
+        self.stats = {"requests": 0, "shed": 0, "deadline_exceeded": 0, "errors": 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/search/{mode}", self.search)
+        app.router.add_post("/search/{mode}", self.search)
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/readyz", self.readyz)
+        app.router.add_get("/stats", self.stats_handler)
+        app.cleanup_ctx.append(self._engine_context)
+        app.on_shutdown.append(self._drain)
+        return app
+
+    async def _engine_context(self, app):
+        async with self.engine_factory() as engine:
+            self.engine = engine
+            self.ready = True
+            logging.info(f"Query service ready, up to {engine.max_concurrency} search requests in flight and {self.max_pending} pending")
+            yield
+            self.ready = False
+
+    #readiness fails first, so the load balancer stops sending requests while the running ones are finished
+    async def _drain(self, app):
+        self.ready = False
+        logging.info(f"Query service draining {self.pending} pending requests")
+
+    #mode, search text, k, deadline in seconds and streaming of a request. Parameters can be passed in the query string
+    #and, for POST, in a JSON body.
+    async def parse_request(self, request):
+        mode = request.match_info["mode"]
+        if mode not in searchquery.modes:
+            raise ValueError(f"Unknown search mode {mode}, use one of {', '.join(searchquery.modes)}")
+        params = dict(request.query)
+        if request.method == "POST" and request.can_read_body:
+            try:
+                body = await request.json()
+            except json.JSONDecodeError:
+                raise ValueError("The request body is no valid JSON")
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object")
+            params.update(body)
+        search_input = params.get("search", params.get("q"))
+        if not search_input or not isinstance(search_input, str):
+            raise ValueError("The request has no search text (search or q)")
+        try:
+            k = int(params.get("k", self.k))
+            deadline_ms = request.headers.get(deadline_header, params.get("timeout_ms"))
+            timeout = min(float(deadline_ms) / 1000, self.max_timeout) if deadline_ms is not None else self.timeout
+        except (TypeError, ValueError):
+            raise ValueError("k and the deadline must be numbers")
+        if not 1 <= k <= self.max_k:
+            raise ValueError(f"k must be between 1 and {self.max_k}")
+        if timeout <= 0:
+            raise ValueError("The deadline must be positive")
+        stream = str(params.get("stream", "")).lower() in ("1", "true") or "application/x-ndjson" in request.headers.get("Accept", "")
+        return mode, search_input, k, timeout, stream
+
+    async def search(self, request):
+        self.stats["requests"] += 1
+        if not self.ready:
+            return error_response(503, "The query service is not ready", retry_after=1)
+        if self.pending >= self.max_pending:
+            self.stats["shed"] += 1
+            return error_response(503, "The query service is saturated", retry_after=1)
+        self.pending += 1
+        try:
+            try:
+                mode, search_input, k, timeout, stream = await self.parse_request(request)
+            except ValueError as e:
+                return error_response(400, str(e))
+            start = time.perf_counter()
+            try:
+                #the deadline covers waiting for the concurrency limit, retries of throttled requests and the backoff
+                response = await asyncio.wait_for(self.engine.search(search_input, mode, timeout, k), timeout)
+            except asyncio.TimeoutError:
+                self.stats["deadline_exceeded"] += 1
+                return error_response(504, f"Deadline of {timeout * 1000:.0f} ms exceeded")
+            except HttpResponseError as e:
+                self.stats["errors"] += 1
+                if e.status_code in searchengine.throttling_status_codes:
+                    return error_response(503, "The search service is throttling", retry_after=1)
+                return error_response(502, f"Search service error {e.status_code}")
+            except (aiohttp.ClientError, ServiceRequestError, ServiceResponseError) as e:
+                self.stats["errors"] += 1
+                return error_response(502, f"Search service unreachable: {e}")
+        finally:
+            self.pending -= 1
+        header = {"mode": mode, "search": search_input, "seconds": time.perf_counter() - start}
+        if stream:
+            return await self.stream_response(request, header, response)
+        return web.json_response(dict(header, **response), dumps=dumps)
+
+    #JSON lines: the header with the answers first, then one line per result. The service returns the k results in one
+    #response, so the lines are written once the engine has all of them.
+    async def stream_response(self, request, header, response):
+        stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        stream.enable_chunked_encoding()
+        await stream.prepare(request)
+        await stream.write((dumps(dict(header, answers=response["answers"])) + "\n").encode("utf-8"))
+        for document in response["results"]:
+            await stream.write((dumps(document) + "\n").encode("utf-8"))
+        await stream.write_eof()
+        return stream
+
+    async def healthz(self, request):
+        return web.json_response({"status": "ok"})
+
+    #not ready before the engine is started, while draining and while requests would be shed
+    async def readyz(self, request):
+        if not self.ready:
+            return web.json_response({"status": "not ready"}, status=503)
+        if self.pending >= self.max_pending:
+            return web.json_response({"status": "saturated", "pending": self.pending}, status=503)
+        return web.json_response({"status": "ready", "pending": self.pending, "concurrency_limit": self.engine.concurrency_limit})
+
+    async def stats_handler(self, request):
+        engine_stats = dict(self.engine.stats, concurrency_limit=self.engine.concurrency_limit) if self.engine is not None else None
+        return web.json_response({"pid": os.getpid(), "pending": self.pending, "service": self.stats, "engine": engine_stats})
+
+#starts the service in the running event loop and returns the runner, call runner.cleanup() to stop it
+async def start(service, host="127.0.0.1", port=8080):
+    runner = web.AppRunner(service.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def run_worker(engine_factory, host, port, reuse_port, service_options):
+    service = QueryService(engine_factory, **service_options)
+    #no access log, a log line per request costs more than the requests answered from the engine
+    web.run_app(service.app(), host=host, port=port, reuse_port=reuse_port, shutdown_timeout=service.max_timeout, access_log=None, print=None)
+
+#runs the service in workers processes that share the port, every worker with its own engine. engine_factory must be
+#picklable (e.g. a functools.partial of a module level function) for start methods other than fork.
+def serve(engine_factory, host="127.0.0.1", port=8080, workers=1, **service_options):
+    logging.info(f"Starting the query service on {host}:{port} with {workers} worker(s)")
+    if workers == 1:
+        run_worker(engine_factory, host, port, False, service_options)
+        return
+    processes = [multiprocessing.Process(target=run_worker, args=(engine_factory, host, port, True, service_options), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP query service for the vector, hybrid and semantic search modes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the port")
+    parser.add_argument("--concurrency", type=int, default=32, help="search requests in flight per worker")
+    parser.add_argument("--max-pending", type=int, default=128, help="requests per worker above this are shed with 503")
+    parser.add_argument("--timeout", type=float, default=10.0, help="deadline of requests without their own in seconds")
+    parser.add_argument("--max-timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    engine_factory = functools.partial(searchengine.SearchEngine, os.environ.get("AZURE_SEARCH_ENDPOINT"), os.environ.get("AZURE_SEARCH_INDEX_NAME"),
+                                       os.environ.get("AZURE_SEARCH_KEY"), max_concurrency=args.concurrency, timeout=args.max_timeout)
+    serve(engine_factory, args.host, args.port, args.workers, max_pending=args.max_pending, timeout=args.timeout, max_timeout=args.max_timeout)
+
+if __name__ == "__main__":
+    main()
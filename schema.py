@@ -0,0 +1,5 @@
+#Description: Names of the search index schema that index.py creates and the query side uses, without dependencies.
+
+#suggester of the search index and its source fields
+suggester_name = "sg"
+suggester_fields = ("db_table_winner", "db_table_discipline")
@@ -0,0 +1,221 @@
+#Description: Async query engine with a shared HTTP transport and adaptive concurrency.
+#usage: python searchengine.py --mode hybrid --concurrency 32 queries.txt
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.search.documents.aio import SearchClient
+import searchquery
+
+throttling_status_codes = (429, 503)
+
+#AIMD concurrency limit. The limit halves on every throttled request and grows by one after a full window of
+#successful requests, but never above max_concurrency.
+class AdaptiveLimiter:
+    def __init__(self, max_concurrency, min_concurrency=1):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+class SearchEngine:
+    def __init__(self, service_endpoint, index_name, aisearch_key, max_concurrency=16, timeout=10.0, k=2,
+                 max_retries=5, backoff_base=0.2, backoff_max=10.0, embedder=None, query_options=None, planner=None):
+        self.service_endpoint = service_endpoint
+        self.index_name = index_name
+        self.aisearch_key = aisearch_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.k = k
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.embedder = embedder
+        #passed to searchquery.build_search_kwargs, except collapse (see searchquery.search)
+        self.query_options = dict(query_options or {})
+        self.collapse = self.query_options.pop("collapse", False)
+        #queryplanner.QueryPlanner that moves the constraints of the queries into filters
+        self.planner = planner
+        self.stats = {"queries": 0, "errors": 0, "timeouts": 0, "throttled": 0}
+        self._session = None
+        self._client = None
+        self._limiter = None
+
+    async def __aenter__(self):
+        #one connection pool for all queries, sized to the concurrency limit
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+        transport = AioHttpTransport(session=self._session, session_owner=False)
+        #retries of the SDK are disabled, throttling is handled below together with the concurrency limit
+        self._client = SearchClient(self.service_endpoint, self.index_name, AzureKeyCredential(self.aisearch_key),
+                                    transport=transport, retry_total=0)
+        self._limiter = AdaptiveLimiter(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.close()
+        await self._session.close()
+
+    @property
+    def concurrency_limit(self):
+        return self._limiter.limit
+
+    #exponential backoff with full jitter
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _search_once(self, search_input, mode, k=None):
+        k = k or self.k
+        query_options = self.query_options
+        if self.planner is not None:
+            search_input, query_options = self.planner.apply(search_input, query_options)
+        #the embedder blocks, concurrent misses are batched into one embedding request by its own thread
+        vector = await asyncio.to_thread(self.embedder.embed, search_input) if self.embedder is not None else None
+        #like searchquery.search, collapsed results are fetched again with more chunks until k rows are found
+        fetch = searchquery.overfetch_size(k) if self.collapse else k
+        while True:
+            results = await self._client.search(**searchquery.build_search_kwargs(mode, search_input, self.index_name, fetch, vector=vector,
+                                                                                  **query_options))
+            documents = [searchquery.result_to_dict(result) async for result in results]
+            if not self.collapse:
+                break
+            parents = searchquery.collapse_parents(documents, k)
+            fetch = searchquery.overfetch_size(k, fetch, len(documents), len(parents))
+            if fetch is None:
+                documents = parents
+                break
+        answers = await results.get_answers() if mode == "semantic" else None
+        return {
+            "answers": [searchquery.answer_to_dict(answer) for answer in answers or []],
+            "results": documents
+        }
+
+    #runs one query and returns the collected response. Throttled requests are retried up to max_retries times,
+    #every attempt is limited to timeout seconds. k overrides the number of results of the engine.
+    async def search(self, search_input, mode="hybrid", timeout=None, k=None):
+        self.stats["queries"] += 1
+        attempt = 0
+        while True:
+            await self._limiter.acquire()
+            throttled = False
+            try:
+                return await asyncio.wait_for(self._search_once(search_input, mode, k), timeout or self.timeout)
+            except HttpResponseError as e:
+                #the last throttled attempt lowers the limit too
+                throttled = e.status_code in throttling_status_codes
+                if not throttled or attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["throttled"] += 1
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                await self._limiter.release(throttled)
+            attempt += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def _search_entry(self, search_input, mode, timeout):
+        entry = {"query": search_input, "mode": mode}
+        start = time.perf_counter()
+        try:
+            entry.update(await self.search(search_input, mode, timeout))
+        except asyncio.TimeoutError:
+            entry["error"] = "timeout"
+        except Exception as e:
+            entry["error"] = str(e)
+        entry["seconds"] = time.perf_counter() - start
+        return entry
+
+    #runs many queries concurrently and yields one entry per query as soon as it is finished (not in input order)
+    async def search_many(self, queries, mode="hybrid", timeout=None):
+        window = self.max_concurrency * 2
+        pending = set()
+        for query in queries:
+            query_mode, search_input = query if isinstance(query, tuple) else (mode, query)
+            pending.add(asyncio.ensure_future(self._search_entry(search_input, query_mode, timeout)))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+#reads queries from a file or stdin ("-"). A line is either a search text or "<mode><TAB><search text>".
+def read_queries(path):
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            mode, separator, search_input = line.partition("\t")
+            if separator and mode in searchquery.modes:
+                yield (mode, search_input)
+            else:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+async def run_file(path, service_endpoint, index_name, aisearch_key, mode="hybrid", max_concurrency=16, timeout=10.0, out=sys.stdout, embedder=None,
+                   query_options=None, planner=None):
+    start = time.perf_counter()
+    async with SearchEngine(service_endpoint, index_name, aisearch_key, max_concurrency=max_concurrency, timeout=timeout, embedder=embedder,
+                            query_options=query_options, planner=planner) as engine:
+        async for entry in engine.search_many(read_queries(path), mode):
+            out.write(json.dumps(entry, default=str) + "\n")
+        seconds = time.perf_counter() - start
+        logging.info(f"Finished {engine.stats['queries']} queries in {seconds:.2f} seconds ({engine.stats['queries'] / seconds:.1f} queries/sec). "
+                     f"Errors: {engine.stats['errors']}, timeouts: {engine.stats['timeouts']}, throttled: {engine.stats['throttled']}, "
+                     f"final concurrency limit: {engine.concurrency_limit}")
+        return engine.stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many search queries concurrently")
+    parser.add_argument("queries", help="file with one query per line, - for stdin")
+    parser.add_argument("--mode", choices=searchquery.modes, default="hybrid")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    #the SDK logs every request and response on INFO level
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    asyncio.run(run_file(args.queries, os.environ.get("AZURE_SEARCH_ENDPOINT"), os.environ.get("AZURE_SEARCH_INDEX_NAME"),
+                         os.environ.get("AZURE_SEARCH_KEY"), mode=args.mode, max_concurrency=args.concurrency, timeout=args.timeout))
+
+if __name__ == "__main__":
+    main()
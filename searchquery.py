@@ -0,0 +1,170 @@
+#Description: Builds the search requests for the vector, hybrid and semantic search modes and prints their results.
+from azure.search.documents.models import VectorizableTextQuery, VectorizedQuery, VectorFilterMode
+from azure.search.documents.models import (
+    QueryType,QueryAnswerType
+)
+
+modes = ("vector", "hybrid", "semantic")
+
+select_fields = ["Id", "chunk", "db_table_id", "db_table_year", "db_table_discipline", "db_table_winner", "db_table_description"]
+
+#named select lists, a response only needs the fields its consumer reads
+projection_profiles = {
+    "full": select_fields,
+    "display": ["Id", "db_table_id", "db_table_year", "db_table_winner", "db_table_description"],
+    "chunk": ["Id", "chunk", "db_table_id"],
+    "ids": ["Id", "db_table_id"]
+}
+
+#chunks fetched per requested row when the results are collapsed to rows. If k distinct rows are not found the fetch is
+#doubled, up to max_overfetch chunks, until the index has no more results.
+overfetch_factor = 3
+max_overfetch = 1000
+
+#returns the keyword arguments for SearchClient.search (sync and async) for the given mode
+def build_search_kwargs(mode, search_input, index_name, k=2, vector=None, exhaustive=True, profile="full", oversampling=None, filter=None,
+                        filter_mode="pre"):
+    if mode not in modes:
+        raise ValueError(f"Unknown search mode {mode}, use one of {', '.join(modes)}")
+    if profile not in projection_profiles:
+        raise ValueError(f"Unknown projection profile {profile}, use one of {', '.join(projection_profiles)}")
+
+    #oversampling only applies to an index with a compressed vector field (see index.build_index), None keeps the
+    #default_oversampling of its compression
+    vector_options = {"oversampling": oversampling} if oversampling is not None else {}
+    if vector is None:
+        vector_query = VectorizableTextQuery(text=search_input, k_nearest_neighbors=k, fields="vector", exhaustive=exhaustive, **vector_options)
+    else:
+        vector_query = VectorizedQuery(vector=vector, k_nearest_neighbors=k, fields="vector", exhaustive=exhaustive, **vector_options)
+
+    search_kwargs = dict(
+        #vector search sends no search text, hybrid and semantic search also search for the text input in the index
+        search_text=None if mode == "vector" else search_input,
+        vector_queries=[vector_query],
+        select=projection_profiles[profile],
+        top=k
+    )
+    if filter:
+        search_kwargs.update(
+            filter=filter,
+            vector_filter_mode=VectorFilterMode.POST_FILTER if filter_mode == "post" else VectorFilterMode.PRE_FILTER
+        )
+    if mode == "semantic":
+        search_kwargs.update(
+            query_type=QueryType.SEMANTIC,
+            semantic_configuration_name=f"{index_name}-semantic",
+            query_caption=QueryAnswerType.EXTRACTIVE,
+            query_answer=QueryAnswerType.EXTRACTIVE
+        )
+    return search_kwargs
+
+def answer_to_dict(answer):
+    return {"text": answer.text, "highlights": answer.highlights, "score": answer.score}
+
+#converts a search result into a plain dict, captions are returned as objects by the SDK
+def result_to_dict(result):
+    result = dict(result)
+    captions = result.get("@search.captions")
+    if captions:
+        result["@search.captions"] = [{"text": caption.text, "highlights": caption.highlights} for caption in captions]
+    return result
+
+#reads all results of a search call into a plain dict with the semantic answers and the result documents.
+#The results are read before the answers, asking for the answers first makes the SDK send the request twice.
+def collect_results(results, mode):
+    documents = [result_to_dict(result) for result in results]
+    answers = results.get_answers() if mode == "semantic" else None
+    return {
+        "answers": [answer_to_dict(answer) for answer in answers or []],
+        "results": documents
+    }
+
+#keeps the best chunk of every row (db_table_id) until k rows are found
+def collapse_parents(documents, k):
+    parents = {}
+    for document in documents:
+        parents.setdefault(document["db_table_id"], document)
+        if len(parents) >= k:
+            break
+    return list(parents.values())
+
+#number of chunks to fetch for k collapsed rows. Without a previous fetch it is the first fetch size, otherwise the next
+#one, or None if the previous fetch found enough rows or the index has no more results.
+def overfetch_size(k, fetch=None, returned=None, parents=None):
+    if fetch is None:
+        return min(k * overfetch_factor, max_overfetch)
+    if parents >= k or returned < fetch or fetch >= max_overfetch:
+        return None
+    return min(fetch * 2, max_overfetch)
+
+#sends the search and returns the collected response (see collect_results). With collapse the results are the best
+#chunks of k distinct rows instead of the k best chunks, more chunks are fetched until k rows are found.
+def search(search_client, mode, search_input, index_name, k=2, vector=None, collapse=False, **query_options):
+    if not collapse:
+        return collect_results(search_client.search(**build_search_kwargs(mode, search_input, index_name, k, vector=vector, **query_options)), mode)
+    fetch = overfetch_size(k)
+    while True:
+        response = collect_results(search_client.search(**build_search_kwargs(mode, search_input, index_name, fetch, vector=vector, **query_options)), mode)
+        parents = collapse_parents(response["results"], k)
+        fetch = overfetch_size(k, fetch, len(response["results"]), len(parents))
+        if fetch is None:
+            response["results"] = parents
+            return response
+
+#iterates the results of a search page by page, a new ResultStream with continuation continues after the last result read
+class ResultStream:
+    def __init__(self, search_client, mode, search_input, index_name, limit=1000, vector=None, collapse=False, continuation=None, **query_options):
+        self.search_client = search_client
+        self.search_kwargs = build_search_kwargs(mode, search_input, index_name, limit, vector=vector, **query_options)
+        self.search_kwargs["top"] = None
+        self.limit = limit
+        self.collapse = collapse
+        #(continuation token of the current page, results read of it)
+        self.continuation = continuation or (None, 0)
+        self.returned = 0
+
+    def __iter__(self):
+        token, skip = self.continuation
+        results = self.search_client.search(**self.search_kwargs)
+        pages = results.by_page(continuation_token=token) if hasattr(results, "by_page") else iter([results])
+        seen = set()
+        while True:
+            token = getattr(pages, "continuation_token", None)
+            page = next(pages, None)
+            if page is None:
+                return
+            for position, result in enumerate(page):
+                if position < skip:
+                    continue
+                self.continuation = (token, position + 1)
+                document = result_to_dict(result)
+                if self.collapse:
+                    if document["db_table_id"] in seen:
+                        continue
+                    seen.add(document["db_table_id"])
+                yield document
+                self.returned += 1
+                if self.limit is not None and self.returned >= self.limit:
+                    return
+            skip = 0
+
+def print_results(response):
+    for result in response["answers"]:
+        if result["highlights"]:
+            print(f"Semantic search result (highlight): {result['highlights']}")
+        else:
+            print(f"Semantic search result: {result['text']}")
+
+        print(f"Semantic results score:  {result['score']}")
+
+    for result in response["results"]:
+        #fields that are not in the projection profile are missing
+        print(f"Nobel price result: {result.get('db_table_year', '')} {result.get('db_table_winner', '')} "
+              f"description: {result.get('db_table_description', result.get('chunk', ''))}")
+        captions = result.get("@search.captions")
+        if captions:
+            caption = captions[0]
+            if caption["highlights"]:
+                print(f"Caption: {caption['highlights']}")
+            else:
+                print(f"Caption: {caption['text']}")
@@ -8,6 +8,9 @@ SplitSkill, InputFieldMappingEntry, OutputFieldMappingEntry,AzureOpenAIEmbedding
 SearchIndexerSkillset
 )
 from azure.search.documents.indexes import SearchIndexerClient
+import chunking
+import tracing
+import embeddingmodels
 
 #to run this code indipendently, uncomment the following lines and make sure to set your environment variables
 #
@@ -20,12 +23,23 @@ from azure.search.documents.indexes import SearchIndexerClient
 # aisearch_key = os.environ.get("AZURE_SEARCH_KEY")
 
 
-#function to create a skillset.
-def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, service_endpoint, aisearch_key):
-    
-    openai.api_key = openai_api_key
+#AzureOpenAIEmbeddingSkill with the dimensions and modelName properties, azure-search-documents 11.6.0b2 does not know them
+#yet. Only used for shortened embeddings, which need embeddingmodels.dimensions_api_version.
+class ShortenedEmbeddingSkill(AzureOpenAIEmbeddingSkill):
+    _attribute_map = dict(AzureOpenAIEmbeddingSkill._attribute_map, dimensions={"key": "dimensions", "type": "int"},
+                          model_name={"key": "modelName", "type": "str"})
+
+    def __init__(self, dimensions=None, model_name=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dimensions = dimensions
+        self.model_name = model_name
+
+#returns the skillset definition without creating it (used by orchestrator.py)
+@tracing.traced("skillset.build_skillset")
+def build_skillset(openai_uri, openai_deployment, openai_api_key, index_name, columns=None, dimensions=None, model=None):
     skillset_name = index_name + "-skillset"
-    logging.info(f"Start creating skillset {skillset_name}")
+    columns = columns or chunking.table_columns
+    request_dimensions = embeddingmodels.requested_dimensions(model, dimensions) if dimensions is not None else None
     
     #Splitskill to chunk text
     split_skill = SplitSkill(
@@ -35,7 +49,7 @@ def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, se
         maximum_page_length=300,
         page_overlap_length=20,
         inputs=[
-            InputFieldMappingEntry(name="text", source="/document/Description")
+            InputFieldMappingEntry(name="text", source=f"/document/{columns['db_table_description']}")
         ],
         outputs=[
             OutputFieldMappingEntry(name="textItems", target_name="pages")
@@ -44,18 +58,20 @@ def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, se
     logging.info(f"Defined SplitSkill for text chunking. Context: {split_skill.context}")
 
     #Embedding skill to vectorize text
-    embedding_skill = AzureOpenAIEmbeddingSkill(
+    shortened = {"dimensions": request_dimensions, "model_name": model} if request_dimensions is not None else {}
+    embedding_skill = (ShortenedEmbeddingSkill if shortened else AzureOpenAIEmbeddingSkill)(
         description="Skill to generate embeddings via Azure OpenAI",  
         context="/document/pages/*", 
         resource_uri = openai_uri,
         deployment_id=openai_deployment,
-        api_key=openai.api_key,
+        api_key=openai_api_key,
         inputs=[
             InputFieldMappingEntry(name="text", source="/document/pages/*")
         ],
         outputs=[
             OutputFieldMappingEntry(name="embedding", target_name="vector")
-        ]
+        ],
+        **shortened
     )
     logging.info(f"Defined EmbeddingSkill for text vectorization. Context: {embedding_skill.context}")
     #index projections of db rows
@@ -68,12 +84,10 @@ def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, se
                 source_context="/document/pages/*",
                 mappings=[
                     InputFieldMappingEntry(name="chunk", source="/document/pages/*"),
-                    InputFieldMappingEntry(name="vector", source="/document/pages/*/vector"),
-                    InputFieldMappingEntry(name="db_table_year", source="/document/Year"),
-                    InputFieldMappingEntry(name="db_table_discipline", source="/document/Discipline"),
-                    InputFieldMappingEntry(name="db_table_winner", source="/document/Winner"),
-                    InputFieldMappingEntry(name="db_table_description", source="/document/Description")
-                    
+                    InputFieldMappingEntry(name="vector", source="/document/pages/*/vector")
+                ] + [
+                    #db_table_id is the parent key, filled with the document key by the index projections
+                    InputFieldMappingEntry(name=field, source=f"/document/{column}") for field, column in columns.items() if field != "db_table_id"
                 ]
             )
         ]
@@ -88,8 +102,46 @@ def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, se
         ],
         index_projections=index_projections
     )
+    return skillset
+
+#offline check that the embedding skill, the vectorizers and the vector fields use the same deployment and dimensions
+def check_dimensions(search_index, skillset, model=None):
+    problems = []
+    vector_fields = [field for field in search_index.fields if field.vector_search_dimensions]
+    vectorizers = (search_index.vector_search.vectorizers or []) if search_index.vector_search else []
+    for field in vector_fields:
+        try:
+            embeddingmodels.requested_dimensions(model, field.vector_search_dimensions)
+        except ValueError as e:
+            problems.append(f"vector field {field.name}: {e}")
+    for skill in skillset.skills:
+        if not isinstance(skill, AzureOpenAIEmbeddingSkill):
+            continue
+        skill_model = getattr(skill, "model_name", None) or model
+        skill_dimensions = getattr(skill, "dimensions", None) or embeddingmodels.embedding_models.get(skill_model)
+        for field in vector_fields:
+            if skill_dimensions is not None and skill_dimensions != field.vector_search_dimensions:
+                problems.append(f"the embedding skill returns {skill_dimensions} dimensions, vector field {field.name} has {field.vector_search_dimensions}")
+        for vectorizer in vectorizers:
+            parameters = vectorizer.azure_open_ai_parameters
+            if parameters.deployment_id != skill.deployment_id:
+                problems.append(f"vectorizer {vectorizer.name} embeds the queries with deployment {parameters.deployment_id}, "
+                                f"the embedding skill the chunks with {skill.deployment_id}")
+            if (getattr(parameters, "model_name", None) or model) != skill_model:
+                problems.append(f"vectorizer {vectorizer.name} uses model {getattr(parameters, 'model_name', None)}, the embedding skill {skill_model}")
+    if problems:
+        raise ValueError(f"Embedding dimensions of index {search_index.name} and skillset {skillset.name} do not match: {'; '.join(problems)}")
+
+#function to create a skillset.
+@tracing.traced("skillset.create_skillset")
+def createSkillset(openai_uri, openai_deployment, openai_api_key, index_name, service_endpoint, aisearch_key, dimensions=None, model=None):
+    
+    openai.api_key = openai_api_key
+    logging.info(f"Start creating skillset {index_name}-skillset")
+    skillset = build_skillset(openai_uri, openai_deployment, openai_api_key, index_name, dimensions=dimensions, model=model)
     #create Skillset with split and embedding skills
-    c = SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key))  
+    api_options = {"api_version": embeddingmodels.dimensions_api_version} if any(isinstance(skill, ShortenedEmbeddingSkill) for skill in skillset.skills) else {}
+    c = tracing.instrument(SearchIndexerClient(service_endpoint, AzureKeyCredential(aisearch_key), **api_options))
     c.create_or_update_skillset(skillset)  
     
     logging.info(f"{skillset.name} created")
@@ -0,0 +1,5 @@
+#the modules of this repo are imported from the repository root, like "python main.py" does
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
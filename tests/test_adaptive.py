@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+import main
+import adaptive
+import embeddings
+import localsearch
+
+#recorded hybrid scores (best first). 1 / 61 = 0.016393 is the highest score of a chunk found by only one of the text and
+#vector rankings, 2 / 61 = 0.032787 that of a chunk both ranked first.
+records = [
+    {"query": "Einstein photoelectric effect", "scores": [0.032787, 0.032258, 0.029012, 0.028571], "changed": False},
+    {"query": "physics prize", "scores": [0.032787, 0.031010, 0.030900, 0.030800], "changed": True},
+    {"query": "who won for the red cross", "scores": [0.016393, 0.016129, 0.010001], "changed": True},
+    {"query": "Curie radium", "scores": [0.032787, 0.016129, 0.015873], "changed": False},
+    {"query": "no such thing", "scores": [], "changed": None},
+    {"query": "Marie Curie 1911", "scores": [0.032787, 0.032258], "changed": None}
+]
+
+@pytest.mark.parametrize("record, escalate, margin, agreement", [
+    (records[0], False, 0.1006, 1.0),
+    (records[1], True, 0.0035, 1.0),
+    (records[2], True, 0.3799, 0.0),
+    (records[3], True, 0.0159, 0.5),
+    (records[4], False, 1.0, 1.0),
+    (records[5], False, 1.0, 1.0)
+], ids=[record["query"] for record in records])
+def test_decide_on_recorded_scores(record, escalate, margin, agreement):
+    decision, signals = adaptive.EscalationPolicy(k=2, min_margin=0.01, min_agreement=0.6).decide(record["scores"])
+    assert decision == escalate
+    assert signals["results"] == len(record["scores"])
+    assert signals["margin"] == pytest.approx(margin, abs=1e-4)
+    assert signals["agreement"] == agreement
+
+def test_thresholds_and_k():
+    scores = records[3]["scores"]
+    assert adaptive.EscalationPolicy(k=2, min_margin=0.01, min_agreement=0.5).decide(scores)[0] is False
+    assert adaptive.EscalationPolicy(k=2, min_margin=0.05, min_agreement=0.5).decide(scores)[0] is True
+    #the top 1 is found by both rankings and far ahead of the next
+    assert adaptive.EscalationPolicy(k=1, min_margin=0.01, min_agreement=1.0).decide(scores)[0] is False
+    #scores come back rounded, a single leg score at the boundary does not count as agreement
+    assert adaptive.EscalationPolicy(k=1).signals([round(1 / 61, 6), 0.01])["agreement"] == 0.0
+
+def test_replay_recorded_decisions(tmp_path):
+    path = tmp_path / "decisions.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + "\n", encoding="utf-8")
+    entries = adaptive.read_records(str(path))
+    assert len(entries) == len(records)
+
+    result = adaptive.replay(entries, adaptive.EscalationPolicy(k=2, min_margin=0.01, min_agreement=0.6))
+    assert result == {"queries": 6, "escalated": 3, "labeled": 4, "changed": 2, "changed_escalated": 2}
+    #without thresholds nothing is escalated and no change is caught
+    result = adaptive.replay(entries, adaptive.EscalationPolicy(k=2, min_margin=0.0, min_agreement=0.0))
+    assert result["escalated"] == 0 and result["changed_escalated"] == 0
+
+#local index that keeps the arguments of every search call
+class RecordingSearchClient:
+    def __init__(self, search_index):
+        self.search_index = search_index
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.search_index.search(**kwargs)
+
+def test_escalation_reuses_the_vector_and_records_its_latency(tmp_path):
+    embedder = embeddings.QueryEmbedder(embeddings.FakeEmbeddingClient(16))
+    search_index = localsearch.LocalSearchIndex(embedder)
+    search_index.add_documents([{"Id": f"{i}_pages_0", "chunk": text, "db_table_id": str(i)} for i, text in
+                                enumerate(["Albert Einstein physics", "Marie Curie chemistry", "Marie Curie physics", "Niels Bohr physics"])],
+                               embedder.embed_many(["Albert Einstein physics", "Marie Curie chemistry", "Marie Curie physics", "Niels Bohr physics"]))
+    search_index.build()
+    client = RecordingSearchClient(search_index)
+    record_file = tmp_path / "decisions.jsonl"
+    #every query is escalated
+    adaptive_search = adaptive.AdaptiveSearch(adaptive.EscalationPolicy(min_margin=2), candidates=3, record_file=str(record_file))
+    vector = embedder.embed("curie physics")
+    response = adaptive_search.search(client, "curie physics", "test", k=2, vector=vector)
+
+    assert response["escalated"] and len(client.calls) == 2
+    hybrid, semantic = client.calls
+    assert "query_type" not in hybrid and str(semantic["query_type"]).lower().endswith("semantic")
+    #both requests send the precomputed vector, none leaves the embedding to the vectorizer
+    assert [type(call["vector_queries"][0]).__name__ for call in client.calls] == ["VectorizedQuery", "VectorizedQuery"]
+    assert hybrid["vector_queries"][0].vector == semantic["vector_queries"][0].vector == vector
+    assert semantic["filter"].startswith("search.in(Id, ")
+
+    entry = adaptive.read_records(str(record_file))[0]
+    assert entry["escalated"] and entry["hybrid_ms"] > 0 and entry["semantic_ms"] > 0
+    assert entry["hybrid_ms"] + entry["semantic_ms"] == pytest.approx(adaptive_search.stats["seconds"] * 1000)
+    assert entry["semantic_ms"] == pytest.approx(adaptive_search.stats["semantic_seconds"] * 1000)
+
+def test_adaptive_mode_embeds_on_the_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "AzureOpenAIEmbeddingClient", lambda *args, dimensions, model: embeddings.FakeEmbeddingClient(dimensions, args[2]))
+    parser = main.build_parser()
+    args = parser.parse_args(["query", "--mode", "adaptive", "--openai-deployment", "deployment", "--embedding-cache-dir", str(tmp_path)])
+    embedder = main.build_embedder(args)
+    assert embedder.client.deployment == "deployment"
+    embedder.cache.close()
+    assert main.build_embedder(parser.parse_args(["query", "--mode", "adaptive", "--no-client-embedding"])) is None
+    assert main.build_embedder(parser.parse_args(["query", "--mode", "hybrid"])) is None
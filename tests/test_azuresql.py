@@ -0,0 +1,197 @@
+import csv
+import sys
+import types
+import sqlite3
+import functools
+import azuresql
+from fakes import connect_sqlite, write_csv, write_changed_csv, create_sqlite_table, sqlite_incremental_table_ddl
+
+table_name = "nobelprizewinners"
+
+def sync(db_path, csv_file_path):
+    co = sqlite3.connect(db_path)
+    try:
+        return azuresql.sync_csv_incremental(co, csv_file_path, table_name, batch_size=100)
+    finally:
+        co.close()
+
+def table_rows(db_path):
+    co = sqlite3.connect(db_path)
+    try:
+        return {key: (row_id, content_hash, is_deleted)
+                for row_id, key, content_hash, is_deleted in co.execute(f"SELECT ID, RowKey, RowHash, IsDeleted FROM {table_name}")}
+    finally:
+        co.close()
+
+def test_one_percent_change_rewrites_one_percent_of_the_rows(tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    changed_csv_file_path = str(tmp_path / "changed.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 2000)
+    write_changed_csv(csv_file_path, changed_csv_file_path, 100)
+    create_sqlite_table(db_path, table_name, ddl=sqlite_incremental_table_ddl)
+
+    assert sync(db_path, csv_file_path) == {"inserted": 2000, "updated": 0, "deleted": 0, "unchanged": 0}
+    before = table_rows(db_path)
+    assert sync(db_path, csv_file_path) == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 2000}
+
+    stats = sync(db_path, changed_csv_file_path)
+    assert stats == {"inserted": 0, "updated": 20, "deleted": 0, "unchanged": 1980}
+    after = table_rows(db_path)
+    changed = [key for key in before if before[key] != after[key]]
+    assert len(changed) == 20
+    #updated rows keep their ID, so their chunks keep their keys in the index
+    assert all(before[key][0] == after[key][0] for key in changed)
+
+def test_removed_rows_are_soft_deleted_and_restored(tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    reduced_csv_file_path = str(tmp_path / "reduced.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 300)
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    with open(reduced_csv_file_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows[:-3])
+    create_sqlite_table(db_path, table_name, ddl=sqlite_incremental_table_ddl)
+
+    sync(db_path, csv_file_path)
+    assert sync(db_path, reduced_csv_file_path) == {"inserted": 0, "updated": 0, "deleted": 3, "unchanged": 297}
+    assert sum(is_deleted for _, _, is_deleted in table_rows(db_path).values()) == 3
+    #the rows are back in the CSV, they are written again with the soft delete marker cleared
+    assert sync(db_path, csv_file_path) == {"inserted": 0, "updated": 3, "deleted": 0, "unchanged": 297}
+    assert sum(is_deleted for _, _, is_deleted in table_rows(db_path).values()) == 0
+
+def test_duplicate_rows_of_later_batches_are_skipped(tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 250)
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    #the first row again in the third batch, with another description
+    with open(csv_file_path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(rows[1][:-1] + ["changed"])
+    create_sqlite_table(db_path, table_name, ddl=sqlite_incremental_table_ddl)
+    assert sync(db_path, csv_file_path) == {"inserted": 250, "updated": 0, "deleted": 0, "unchanged": 0}
+    assert sync(db_path, csv_file_path) == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 250}
+
+#SQLite cursor with the fast_executemany and setinputsizes of pyodbc, records the statements and their parameter types
+class PyodbcLikeCursor:
+    def __init__(self, cursor, statements):
+        self._cursor = cursor
+        self.statements = statements
+        self.fast_executemany = False
+        self.input_sizes = None
+
+    def setinputsizes(self, sizes):
+        self.input_sizes = sizes
+
+    def execute(self, statement, params=()):
+        self.statements.append((" ".join(statement.split()), None))
+        return self._cursor.execute(statement, params)
+
+    def executemany(self, statement, rows):
+        assert self.fast_executemany
+        self.statements.append((" ".join(statement.split()), self.input_sizes))
+        return self._cursor.executemany(statement, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class PyodbcLikeConnection:
+    def __init__(self, co):
+        self._co = co
+        self.statements = []
+
+    def cursor(self):
+        return PyodbcLikeCursor(self._co.cursor(), self.statements)
+
+    def __getattr__(self, name):
+        return getattr(self._co, name)
+
+pyodbc_constants = types.SimpleNamespace(SQL_CHAR=1, SQL_INTEGER=4, SQL_WLONGVARCHAR=-10)
+
+def test_sync_diffs_batches_by_key_with_unbounded_text(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyodbc", pyodbc_constants)
+    csv_file_path = str(tmp_path / "data.csv")
+    changed_csv_file_path = str(tmp_path / "changed.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 300)
+    write_changed_csv(csv_file_path, changed_csv_file_path, 10)
+    create_sqlite_table(db_path, table_name, ddl=sqlite_incremental_table_ddl)
+    sync(db_path, csv_file_path)
+
+    co = PyodbcLikeConnection(sqlite3.connect(db_path))
+    assert azuresql.sync_csv_incremental(co, changed_csv_file_path, table_name, batch_size=100)["updated"] == 30
+    co.close()
+    #the table is only read by the keys of a batch, never as a whole
+    selects = [statement for statement, _ in co.statements if statement.startswith("SELECT")]
+    assert len(selects) == 6 and all(" WHERE RowKey IN (" in statement for statement in selects)
+    text = (pyodbc_constants.SQL_WLONGVARCHAR, 0, 0)
+    key = (pyodbc_constants.SQL_CHAR, 64, 0)
+    updates = [sizes for statement, sizes in co.statements if statement.startswith(f"UPDATE {table_name} SET Year")]
+    assert updates == [[(pyodbc_constants.SQL_INTEGER, 0, 0), text, text, text, key, key]] * 3
+    assert [sizes for statement, sizes in co.statements if statement.startswith("INSERT INTO nobelprizewinners_synckeys")] == [[key]] * 3
+    #the staging table is dropped again
+    assert sqlite3.connect(db_path).execute("SELECT name FROM sqlite_master WHERE name = 'nobelprizewinners_synckeys'").fetchall() == []
+
+#SQLite connection counting its commits
+class CommitCountingConnection:
+    def __init__(self, co):
+        self._co = co
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        self._co.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._co, name)
+
+def table_content(db_path):
+    co = sqlite3.connect(db_path)
+    try:
+        return sorted(co.execute(f"SELECT Year, Discipline, Winner, Description FROM {table_name}"))
+    finally:
+        co.close()
+
+def test_bulk_load_matches_the_row_by_row_load(tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    write_csv(csv_file_path, 1050)
+    row_by_row_path = str(tmp_path / "row_by_row.db")
+    create_sqlite_table(row_by_row_path, table_name)
+    co = connect_sqlite(row_by_row_path, 0)
+    assert azuresql.load_csv_row_by_row(co, csv_file_path, table_name) == 1050
+    co.close()
+
+    for parallel_connections in (1, 3):
+        bulk_path = str(tmp_path / f"bulk{parallel_connections}.db")
+        create_sqlite_table(bulk_path, table_name)
+        rows = azuresql.load_csv_bulk(functools.partial(connect_sqlite, bulk_path, 0), csv_file_path, table_name, batch_size=100,
+                                      parallel_connections=parallel_connections)
+        assert rows == 1050
+        assert table_content(bulk_path) == table_content(row_by_row_path)
+
+def test_bulk_load_commits_every_commit_interval_rows(tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 1050)
+    create_sqlite_table(db_path, table_name)
+    co = CommitCountingConnection(sqlite3.connect(db_path))
+    azuresql.load_csv_bulk(lambda: co, csv_file_path, table_name, batch_size=100, commit_interval=300)
+    #after 300, 600 and 900 rows, and once at the end
+    assert co.commits == 4
+    assert len(table_content(db_path)) == 1050
+
+def test_bulk_load_sends_unbounded_text(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyodbc", pyodbc_constants)
+    csv_file_path = str(tmp_path / "data.csv")
+    db_path = str(tmp_path / "test.db")
+    long_description = "physics " * 1000
+    with open(csv_file_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([["year", "discipline", "winner", "desc"], [1921, "physics", "Albert Einstein", long_description]])
+    create_sqlite_table(db_path, table_name)
+    co = PyodbcLikeConnection(sqlite3.connect(db_path))
+    azuresql.load_csv_bulk(lambda: co, csv_file_path, table_name)
+    text = (pyodbc_constants.SQL_WLONGVARCHAR, 0, 0)
+    assert [sizes for statement, sizes in co.statements if statement.startswith("INSERT")] == [[(pyodbc_constants.SQL_INTEGER, 0, 0), text, text, text]]
+    assert table_content(db_path) == [(1921, "physics", "Albert Einstein", long_description)]
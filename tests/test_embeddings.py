@@ -0,0 +1,108 @@
+import threading
+
+import numpy
+import pytest
+
+import embeddings
+
+def test_fake_client_is_deterministic():
+    client = embeddings.FakeEmbeddingClient(64)
+    first, second, empty = client.embed(["Albert Einstein physics", "Albert Einstein physics", ""])
+    assert len(first) == 64
+    assert first == second == embeddings.FakeEmbeddingClient(64).vector("Albert Einstein physics")
+    assert numpy.linalg.norm(first) == pytest.approx(1.0) and numpy.linalg.norm(empty) == pytest.approx(1.0)
+    #shared words give similar vectors
+    similar = numpy.dot(first, client.vector("Einstein"))
+    assert similar > numpy.dot(first, client.vector("Marie Curie chemistry"))
+    assert (client.calls, client.texts) == (1, 3)
+
+def test_cache_hits_after_put_many(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path), "deployment", 4)
+    assert cache.get("einstein") is None
+    cache.put_many(["einstein", "curie"], [[1, 2, 3, 4], [5, 6, 7, 8]])
+    assert len(cache) == 2
+    assert cache.get("curie").tolist() == [5, 6, 7, 8]
+    #a text already in the cache keeps its vector
+    cache.put_many(["einstein"], [[0, 0, 0, 0]])
+    assert len(cache) == 2 and cache.get("einstein").tolist() == [1, 2, 3, 4]
+    #the key includes the deployment
+    other = embeddings.EmbeddingCache(str(tmp_path), "other", 4)
+    assert other.get("einstein") is None
+    cache.close()
+    other.close()
+
+def test_cache_survives_a_reopen(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path), "deployment", 4, initial_capacity=2)
+    cache.put_many(["einstein", "curie"], [[1, 2, 3, 4], [5, 6, 7, 8]])
+    cache.close()
+    #a partially written index line is skipped
+    with open(tmp_path / "deployment-4.idx", "a", encoding="utf-8") as f:
+        f.write("abc")
+
+    cache = embeddings.EmbeddingCache(str(tmp_path), "deployment", 4, initial_capacity=2)
+    assert len(cache) == 2
+    assert cache.get("einstein").tolist() == [1, 2, 3, 4]
+    assert cache.get("curie").tolist() == [5, 6, 7, 8]
+    cache.close()
+
+def test_cache_grows_past_its_initial_capacity(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path), "deployment", 3, initial_capacity=2)
+    texts = [f"query {i}" for i in range(9)]
+    cache.put_many(texts[:1], [[0, 0, 0]])
+    cache.put_many(texts[1:], [[i, i, i] for i in range(1, 9)])
+    assert (tmp_path / "deployment-3.f32").stat().st_size == 16 * 3 * 4
+    assert [cache.get(text)[0] for text in texts] == list(range(9))
+    cache.close()
+
+    cache = embeddings.EmbeddingCache(str(tmp_path), "deployment", 3, initial_capacity=2)
+    assert cache.get("query 8").tolist() == [8, 8, 8]
+    cache.close()
+
+def test_embedder_batches_misses_into_one_call(tmp_path):
+    client = embeddings.FakeEmbeddingClient(8)
+    cache = embeddings.EmbeddingCache(str(tmp_path), client.deployment, 8)
+    embedder = embeddings.QueryEmbedder(client, cache, batch_size=16, max_wait_ms=50)
+    texts = [f"query {i}" for i in range(5)]
+    vectors = embedder.embed_many(texts)
+    assert client.calls == 1
+    assert vectors == [pytest.approx(client.vector(text)) for text in texts]
+    assert (embedder.stats["misses"], embedder.stats["requests"]) == (5, 1)
+
+    #the cache answers without another call
+    assert embedder.embed("query 3") == pytest.approx(vectors[3])
+    assert (client.calls, embedder.stats["hits"]) == (1, 1)
+    cache.close()
+
+def test_concurrent_misses_of_the_same_text_share_a_request():
+    client = embeddings.FakeEmbeddingClient(8)
+    #the request only returns after every caller has submitted the text
+    submitted = threading.Barrier(5)
+    embed = client.embed
+    def embed_after_all_submitted(texts):
+        submitted.wait(5)
+        return embed(texts)
+    client.embed = embed_after_all_submitted
+    embedder = embeddings.QueryEmbedder(client, max_wait_ms=0)
+    results = []
+    def query():
+        future = embedder._submit("einstein")
+        submitted.wait(5)
+        results.append(future.result())
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [client.vector("einstein")] * 4
+    assert (client.texts, embedder.stats["misses"], embedder.stats["shared"]) == (1, 1, 3)
+
+def test_mismatched_dimensions_are_rejected(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path), "fake-embedding", 4)
+    with pytest.raises(ValueError, match="does not match"):
+        embeddings.QueryEmbedder(embeddings.FakeEmbeddingClient(8), cache)
+    cache.close()
+
+    client = embeddings.FakeEmbeddingClient(8)
+    client.vector = lambda text: [0.0] * 4
+    with pytest.raises(ValueError, match="returned 4 dimensions, expected 8"):
+        embeddings.QueryEmbedder(client).embed("einstein")
@@ -0,0 +1,99 @@
+import sqlite3
+import functools
+import threading
+
+import pytest
+
+import embeddings
+import embeddingstore
+
+def connect(path):
+    return sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+def open_store(tmp_path, dimensions=4, **kwargs):
+    return embeddingstore.EmbeddingStore(functools.partial(connect, str(tmp_path / "store.db")), "deployment", dimensions,
+                                         ddl=embeddingstore.sqlite_store_table_ddl, **kwargs)
+
+def test_hits_and_misses(tmp_path):
+    store = open_store(tmp_path)
+    assert store.get_many(["einstein", "curie"]) == [None, None]
+    store.put_many(["einstein"], [[1, 2, 3, 4]])
+    assert store.get_many(["einstein", "curie", "einstein"]) == [[1, 2, 3, 4], None, [1, 2, 3, 4]]
+    assert store.stats == {"hits": 2, "misses": 3, "stored": 1}
+    #vectors are kept per deployment and dimensions
+    other = embeddingstore.EmbeddingStore(functools.partial(connect, str(tmp_path / "store.db")), "other", 4, ddl=embeddingstore.sqlite_store_table_ddl)
+    assert other.get_many(["einstein"]) == [None]
+    store.close()
+    other.close()
+
+def test_embed_only_sends_the_missing_texts(tmp_path):
+    store = open_store(tmp_path, dimensions=8)
+    client = embeddings.FakeEmbeddingClient(8)
+    vectors, embedded = store.embed(client, ["einstein", "curie", "einstein"])
+    assert embedded == 2 and client.texts == 2
+    assert vectors[0] == vectors[2] == pytest.approx(client.vector("einstein"))
+    vectors, embedded = store.embed(client, ["curie", "bohr"])
+    assert embedded == 1 and client.texts == 3
+    assert store.count() == 3
+    store.close()
+
+def test_half_vectors_round_trip(tmp_path):
+    store = open_store(tmp_path, vector_type="half")
+    store.put_many(["einstein"], [[0.1, -2.5, 3.0, 65504.0]])
+    vector = store.get_many(["einstein"])[0]
+    assert vector == pytest.approx([0.1, -2.5, 3.0, 65504.0], rel=1e-3)
+    cursor = sqlite3.connect(str(tmp_path / "store.db")).cursor()
+    cursor.execute("SELECT Vector FROM chunkembeddings")
+    assert len(cursor.fetchone()[0]) == 4 * 2
+    store.close()
+
+    with pytest.raises(ValueError, match="Unknown vector type"):
+        open_store(tmp_path, vector_type="double")
+
+def test_mismatched_dimensions_are_rejected(tmp_path):
+    store = open_store(tmp_path)
+    with pytest.raises(ValueError, match="3 dimensions can not be stored with 4 dimensions"):
+        store.put_many(["einstein"], [[1, 2, 3]])
+    assert store.count() == 0
+    store.close()
+
+def test_duplicates_stored_by_another_store_are_skipped(tmp_path):
+    first = open_store(tmp_path)
+    second = open_store(tmp_path)
+    first.put_many(["einstein", "curie"], [[1, 1, 1, 1], [2, 2, 2, 2]])
+    second.put_many(["curie", "bohr"], [[3, 3, 3, 3], [4, 4, 4, 4]])
+    assert second.stats["stored"] == 1
+    #the first stored vector is kept
+    assert second.get_many(["curie", "bohr"]) == [[2, 2, 2, 2], [4, 4, 4, 4]]
+    first.close()
+    second.close()
+
+def test_concurrent_duplicate_inserts(tmp_path):
+    store = open_store(tmp_path)
+    texts = [f"chunk {i}" for i in range(50)]
+    start = threading.Barrier(4)
+    errors = []
+    def put():
+        try:
+            start.wait(5)
+            store.put_many(texts, [[i, i, i, i] for i in range(50)])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=put) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.count() == 50 and store.stats["stored"] == 50
+    store.close()
+
+def test_other_errors_are_raised(tmp_path):
+    store = open_store(tmp_path)
+    co = connect(str(tmp_path / "store.db"))
+    co.execute("DROP TABLE chunkembeddings")
+    co.commit()
+    co.close()
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        store.put_many(["einstein"], [[1, 2, 3, 4]])
+    store.close()
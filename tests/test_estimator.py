@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import chunking
+import estimator
+from fakes import sample_csv_file_path, create_sqlite_table
+
+rows = [(1, 1921, "physics", "Albert Einstein", "for his discovery of the law of the photoelectric effect " * 20),
+        (2, 1911, "chemistry", "Marie Curie", "radium"),
+        (3, 1917, "peace", "Red Cross", "")]
+
+def test_rows_are_chunked_like_the_split_skill():
+    stats = estimator.estimate_rows(rows)
+    chunks = [chunking.project_row(*row) for row in rows]
+    assert stats["rows"] == 3
+    assert stats["chunks"] == sum(len(documents) for documents in chunks) and stats["max_chunks_per_row"] == len(chunks[0]) > 1
+    assert stats["empty_rows"] == 1
+    assert stats["chunk_tokens"] == sum(estimator.estimate_tokens(document["chunk"]) for documents in chunks for document in documents)
+    description = stats["columns"]["Description"]
+    assert (description["values"], description["max_characters"]) == (2, len(rows[0][4]))
+    #every chunk carries the whole description of its row
+    assert stats["field_bytes"]["db_table_description"] == len(rows[0][4]) * len(chunks[0]) + len("radium")
+
+def test_derived_numbers():
+    stats = estimator.complete_estimate({**estimator.estimate_rows(rows), "chunks": 1000, "chunk_tokens": 480000}, dimensions=1536,
+                                        embedding_batch_size=100, hnsw_m=4)
+    assert (stats["embedding_requests_indexer"], stats["embedding_requests_push"]) == (1000, 10)
+    assert stats["vector_bytes"] == 1000 * 1536 * 4
+    assert stats["vector_index_bytes"] == stats["vector_bytes"] + 1000 * 2 * 4 * 4
+    assert stats["stored_vector_bytes"] == stats["vector_bytes"]
+    #bound by the tokens per minute
+    assert stats["embedding_minutes_push"] == stats["embedding_minutes_indexer"] == pytest.approx(2.0)
+    #with few tokens per chunk the indexer is bound by the requests per minute, one per chunk
+    stats = estimator.complete_estimate({**stats, "chunk_tokens": 1000}, embedding_batch_size=100)
+    assert stats["embedding_minutes_indexer"] == pytest.approx(1000 / 1440)
+    assert stats["embedding_minutes_push"] == pytest.approx(10 / 1440)
+
+    exhaustive = estimator.complete_estimate(estimator.estimate_rows(rows), vector_profile="exhaustiveknn-profile")
+    assert exhaustive["graph_bytes"] == 0
+
+def test_schema_comparison():
+    estimates = estimator.compare_schemas(estimator.estimate_rows(chunking.read_csv_rows(sample_csv_file_path)))
+    assert estimates["default"]["storage_bytes"] > estimates["compact"]["storage_bytes"] > estimates["compact half"]["storage_bytes"]
+    compact = estimates["compact half scalar"]
+    assert compact["stored_vector_bytes"] == 0
+    assert compact["vector_index_bytes"] == compact["chunks"] * compact["dimensions"] + compact["graph_bytes"]
+    #the quantized vector index keeps the original vectors for rescoring
+    assert compact["rescoring_vector_bytes"] == compact["vector_bytes"] == compact["chunks"] * compact["dimensions"] * 2
+    assert compact["vector_index_bytes"] < estimates["compact half"]["vector_index_bytes"]
+
+def test_table_and_csv_estimates_agree(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    create_sqlite_table(db_path, "nobelprizewinners")
+    co = sqlite3.connect(db_path)
+    co.executemany("INSERT INTO nobelprizewinners (Year, Discipline, Winner, Description) VALUES (?,?,?,?)",
+                   [row[1:] for row in chunking.read_csv_rows(sample_csv_file_path)])
+    co.commit()
+    from_table = estimator.estimate_table(co)
+    co.close()
+    from_csv = estimator.estimate_csv(sample_csv_file_path)
+    assert from_table == from_csv
+    assert estimator.format_report(from_csv).startswith(f"Table nobelprizewinners: {from_csv['rows']} rows, {from_csv['chunks']} chunks")
@@ -0,0 +1,69 @@
+import os
+from importlib import metadata
+
+import pytest
+from azure.search.documents.indexes.models import SearchField, SearchFieldDataType
+import index
+
+def build(**kwargs):
+    return index.build_index("test", 1536, "key", "https://openai", "deployment", **kwargs)
+
+#the request body of the service, with the properties the models of the SDK do not know yet
+def request_body(search_index):
+    return search_index._to_generated().serialize(keep_readonly=True)
+
+def test_compact_field_attributes():
+    fields = {field["name"]: field for field in request_body(build(compact=True, vector_type="half"))["fields"]}
+    assert fields["vector"]["type"] == "Collection(Edm.Half)"
+    assert fields["vector"]["stored"] is False
+    assert fields["vector"]["retrievable"] is False
+    assert fields["db_table_year"]["type"] == "Edm.Int32"
+    assert fields["db_table_description"]["searchable"] is False
+    for name in ("chunk", "db_table_description"):
+        assert not fields[name]["filterable"] and not fields[name]["sortable"] and not fields[name]["facetable"]
+    assert {name for name, field in fields.items() if field.get("filterable")} == set(index.compact_filterable_fields)
+    assert {name for name, field in fields.items() if field.get("facetable")} == set(index.compact_facetable_fields)
+
+def test_default_schema_is_unchanged():
+    fields = {field["name"]: field for field in request_body(build())["fields"]}
+    assert fields["vector"]["type"] == "Collection(Edm.Single)"
+    assert "stored" not in fields["vector"]
+    assert fields["db_table_year"]["type"] == "Edm.String"
+    assert request_body(build())["vectorSearch"].get("compressions") is None
+
+def test_vector_profile_and_hnsw_parameters():
+    body = request_body(build(vector_profile="exhaustiveknn-profile", hnsw_m=8, hnsw_ef_construction=200, hnsw_ef_search=100))
+    assert next(field for field in body["fields"] if field["name"] == "vector")["vectorSearchProfile"] == "exhaustiveknn-profile"
+    assert {profile["name"] for profile in body["vectorSearch"]["profiles"]} == set(index.vector_profiles)
+    hnsw = next(algorithm for algorithm in body["vectorSearch"]["algorithms"] if algorithm["kind"] == "hnsw")
+    assert hnsw["hnswParameters"] == {"m": 8, "efConstruction": 200, "efSearch": 100, "metric": "cosine"}
+
+def test_scalar_compression_is_referenced_by_every_profile():
+    vector_search = request_body(build(vector_compression="scalar", default_oversampling=10))["vectorSearch"]
+    assert vector_search["compressions"] == [{"name": "scalar-quantization", "kind": "scalarQuantization", "rerankWithOriginalVectors": True,
+                                              "defaultOversampling": 10.0, "scalarQuantizationParameters": {"quantizedDataType": "int8"}}]
+    assert {profile["compression"] for profile in vector_search["profiles"]} == {"scalar-quantization"}
+
+@pytest.mark.parametrize("options", [{"vector_profile": "ivf"}, {"vector_type": "byte"}, {"vector_compression": "binary"}])
+def test_unknown_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        build(**options)
+
+def test_validation_reports_every_problem():
+    search_index = build(compact=True)
+    vector = next(field for field in search_index.fields if field.name == "vector")
+    vector.hidden = False
+    vector.vector_search_profile_name = "missing-profile"
+    search_index.fields.append(SearchField(name="db_table_count", type=SearchFieldDataType.Int32, searchable=True))
+    with pytest.raises(ValueError) as error:
+        index.validate_index(search_index)
+    message = str(error.value)
+    assert "field vector is not stored and must be hidden" in message
+    assert "vector field vector uses unknown profile missing-profile" in message
+    assert "Int32 field db_table_count can not be searchable" in message
+
+#the private models of index.py are only known to work with the pinned version
+def test_installed_sdk_matches_the_pin():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "requirements.txt"), encoding="utf-8") as f:
+        pins = dict(line.strip().split("==") for line in f if "==" in line and not line.startswith("#"))
+    assert metadata.version("azure-search-documents") == pins["azure-search-documents"]
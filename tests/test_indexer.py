@@ -0,0 +1,39 @@
+import pytest
+import indexer
+import querycache
+from fakes import FakeIndexerClient
+
+@pytest.fixture
+def invalidations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(querycache, "invalidate", lambda *args, **kwargs: calls.append(args))
+    return calls
+
+def running_indexer(items, batch_overhead_ms=1.0, item_ms=0.01):
+    indexer_c = FakeIndexerClient(items, batch_overhead_ms=batch_overhead_ms, item_ms=item_ms)
+    #a new indexer starts running when it is created
+    indexer_c.create_or_update_indexer(indexer.build_indexer("test", batch_size=100))
+    return indexer_c
+
+def test_waits_for_run_that_is_already_in_progress(invalidations):
+    indexer_c = running_indexer(1000)
+    previous_start_time = indexer.last_start_time(indexer_c, "test-indexer")
+    assert indexer_c.get_indexer_status("test-indexer").last_result.status == "inProgress"
+
+    result = indexer.start_indexer(indexer_c, "test-indexer", previous_start_time, wait=True, poll_interval=0.01, max_poll_interval=0.05,
+                                   timeout=10)
+    assert result.status == "success"
+    assert result.start_time == previous_start_time
+    assert result.item_count == 1000
+    assert len(invalidations) == 1
+
+def test_queued_run_does_not_invalidate_the_cache(invalidations):
+    indexer_c = running_indexer(1000)
+    assert indexer.start_indexer(indexer_c, "test-indexer", wait=False) is None
+    assert invalidations == []
+
+def test_timeout_while_running_does_not_invalidate_the_cache(invalidations):
+    indexer_c = running_indexer(100000, batch_overhead_ms=50.0)
+    result = indexer.start_indexer(indexer_c, "test-indexer", wait=True, poll_interval=0.01, max_poll_interval=0.01, timeout=0.1)
+    assert result.status == "inProgress"
+    assert invalidations == []
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import loadgen
+import mockserver
+from fakes import sample_csv_file_path
+
+def test_summarize_samples():
+    samples = [{"mode": "vector", "start": i, "seconds": (i + 1) / 1000, "error": None} for i in range(100)]
+    samples += [{"mode": "semantic", "start": 0, "seconds": 0.5, "error": "timeout"},
+                {"mode": "semantic", "start": 1, "seconds": 0.1, "error": "throttled"},
+                {"mode": "semantic", "start": 2, "seconds": 0.2, "error": None}]
+    summary = loadgen.summarize(samples, 10.0, throttled_attempts=7)
+    assert list(summary) == ["all", "semantic", "vector"]
+    vector = summary["vector"]
+    assert (vector["queries"], vector["qps"], vector["error_rate"]) == (100, 10.0, 0.0)
+    assert (vector["p50_ms"], vector["p95_ms"], vector["p99_ms"], vector["max_ms"]) == pytest.approx((50, 95, 99, 100), rel=0.01)
+    semantic = summary["semantic"]
+    assert semantic["errors"] == {"timeout": 1, "throttled": 1}
+    assert (semantic["error_rate"], semantic["timeout_rate"]) == pytest.approx((2 / 3, 1 / 3))
+    assert summary["all"]["queries"] == 103 and summary["all"]["max_ms"] == pytest.approx(500, rel=0.01)
+    #throttled attempts that were retried count as well as the queries that failed throttled
+    assert summary["all"]["throttle_rate"] == pytest.approx((7 + 1) / (103 + 7))
+
+    #samples that started in the warmup are left out
+    assert loadgen.summarize(samples, 10.0, warmup=50)["vector"]["queries"] == 50
+
+def test_parse_mix():
+    assert loadgen.parse_mix("vector=1, hybrid=2,semantic") == {"vector": 1.0, "hybrid": 2.0, "semantic": 1.0}
+    with pytest.raises(ValueError, match="Unknown search mode"):
+        loadgen.parse_mix("fuzzy=1")
+
+def test_closed_loop_against_the_mock_server():
+    service = mockserver.MockSearchService(mockserver.load_documents(sample_csv_file_path), latency_ms=10, throttle_rate=0.2,
+                                           mode_latency_ms={"semantic": 30})
+    corpus = loadgen.sample_corpus(sample_csv_file_path, size=50)
+    async def run():
+        runner = await mockserver.start(service, port=0)
+        try:
+            return await loadgen.run_load(f"http://127.0.0.1:{runner.addresses[0][1]}", "test", "key", corpus, loadgen.parse_mix("vector=1,semantic=1"),
+                                          concurrency=4, duration=1.0, max_retries=0)
+        finally:
+            await runner.cleanup()
+    summary = asyncio.run(run())
+
+    assert set(summary) == {"all", "vector", "semantic"}
+    total = summary["all"]
+    assert total["queries"] == summary["vector"]["queries"] + summary["semantic"]["queries"]
+    #without retries every throttled request is a failed query
+    assert total["queries"] == service.requests
+    assert total["errors"] == {"throttled": service.throttled}
+    assert total["error_rate"] == pytest.approx(service.throttled / service.requests)
+    assert total["throttle_rate"] == pytest.approx(total["error_rate"])
+    for mode in ("vector", "semantic"):
+        values = summary[mode]
+        assert values["p50_ms"] <= values["p95_ms"] <= values["p99_ms"] <= values["max_ms"]
+    #latencies of the answered queries at least those of the mock server
+    assert summary["semantic"]["p99_ms"] >= 30
+
+    report = loadgen.format_report(summary).splitlines()
+    assert report[0].split() == ["mode", "queries", "qps", "p50", "p95", "p99", "max", "errors", "timeouts"]
+    assert report[1].split()[:2] == ["all", str(total["queries"])]
+    assert report[1].split()[7] == f"{total['error_rate']:.1%}"
+    assert report[-1] == f"throttled attempts: {total['throttle_rate']:.1%}"
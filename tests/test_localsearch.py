@@ -0,0 +1,77 @@
+import numpy
+import pytest
+from azure.search.documents.models import VectorizedQuery
+
+import localsearch
+
+texts = ["Albert Einstein physics photoelectric effect",
+         "Marie Curie chemistry radium polonium",
+         "Marie Curie physics radioactivity",
+         "Red Cross peace"]
+vectors = [[1, 0, 0], [0, 1, 0], [0.6, 0.8, 0], [0, 0, 1]]
+
+@pytest.fixture
+def search_index():
+    search_index = localsearch.LocalSearchIndex()
+    search_index.add_documents([{"Id": str(i), "chunk": text, "db_table_year": str(1900 + i)} for i, text in enumerate(texts)], vectors)
+    search_index.build()
+    return search_index
+
+def ids(results):
+    return [result["Id"] for result in results]
+
+def test_bm25_ranks_rare_terms_first(search_index):
+    doc_ids, scores = search_index.bm25("curie radium", 10)
+    assert doc_ids.tolist() == [1, 2]
+    assert scores[0] > scores[1] > 0
+    assert search_index.bm25("nobody", 10)[0].tolist() == []
+    assert sorted(ids(search_index.search("physics"))) == ["0", "2"]
+
+def test_knn_is_exact_cosine(search_index):
+    doc_ids, similarities = search_index.knn([2, 1, 0], 3)
+    assert doc_ids.tolist() == [2, 0, 1]
+    assert similarities == pytest.approx([(1.2 + 0.8) / 5 ** 0.5, 2 / 5 ** 0.5, 1 / 5 ** 0.5], abs=1e-6)
+    doc_ids, _ = search_index.knn_batch([[0, 0, 1], [0, 1, 0]], 1)
+    assert doc_ids.tolist() == [[3], [1]]
+
+def test_knn_of_a_zero_vector_and_an_empty_index(search_index):
+    doc_ids, similarities = search_index.knn([0, 0, 0], 2)
+    assert len(doc_ids) == 2 and similarities.tolist() == [0.0, 0.0]
+    assert search_index.knn([1, 0, 0], 0)[0].tolist() == []
+
+    empty = localsearch.LocalSearchIndex()
+    empty.build()
+    doc_ids, similarities = empty.knn_batch([[1, 0, 0], [0, 1, 0]], 5)
+    assert doc_ids.shape == similarities.shape == (2, 0)
+    assert len(empty.search("einstein", vector_queries=[VectorizedQuery(vector=[1, 0, 0], k_nearest_neighbors=5, fields="vector")])) == 0
+
+def test_hybrid_fuses_the_rankings(search_index):
+    vector_query = VectorizedQuery(vector=[0, 0.1, 1], k_nearest_neighbors=3, fields="vector")
+    results = list(search_index.search("curie radium", vector_queries=[vector_query], top=3))
+    #text ranking 1, 2 and vector ranking 3, 1, 2: chunks found by both rank above the first vector result
+    assert ids(results) == ["1", "2", "3"]
+    assert [result["@search.score"] for result in results] == pytest.approx([1 / 61 + 1 / 62, 1 / 62 + 1 / 63, 1 / 61])
+
+def test_filters_before_and_after_the_vector_search(search_index):
+    vector_query = VectorizedQuery(vector=[1, 0, 0], k_nearest_neighbors=1, fields="vector")
+    assert ids(search_index.search(vector_queries=[vector_query], filter="db_table_year ge '1902'")) == ["2"]
+    assert ids(search_index.search(vector_queries=[vector_query], filter="db_table_year ge '1902'", vector_filter_mode="postFilter")) == []
+
+def test_hnsw_recall_against_exact_knn():
+    rng = numpy.random.default_rng(0)
+    search_index = localsearch.LocalSearchIndex()
+    search_index.add_documents([{"Id": str(i), "chunk": ""} for i in range(500)], rng.standard_normal((500, 16)).tolist())
+    search_index.build()
+    search_index.build_hnsw(m=8, ef_construction=100, ef_search=100)
+    queries = rng.standard_normal((20, 16))
+    exact, _ = search_index.knn_batch(queries, 10)
+    recalls = []
+    for query, expected in zip(queries, exact):
+        found = search_index.search(vector_queries=[VectorizedQuery(vector=query.tolist(), k_nearest_neighbors=10, fields="vector", exhaustive=False)],
+                                    top=10)
+        recalls.append(localsearch.recall_at_k(expected.tolist(), [int(result["Id"]) for result in found], 10))
+        #exhaustive queries stay exact
+        exhaustive = search_index.search(vector_queries=[VectorizedQuery(vector=query.tolist(), k_nearest_neighbors=10, fields="vector", exhaustive=True)],
+                                         top=10)
+        assert [int(result["Id"]) for result in exhaustive] == expected.tolist()
+    assert numpy.mean(recalls) >= 0.9
@@ -0,0 +1,65 @@
+import os
+import sys
+import subprocess
+
+import pytest
+import main
+import azuresql
+import typeahead
+import localsearch
+
+def test_local_index_uses_the_hnsw_flags(monkeypatch):
+    built = []
+    monkeypatch.setattr(localsearch.LocalSearchIndex, "build_hnsw", lambda self, **kwargs: built.append(kwargs))
+    args = main.build_parser().parse_args(["query", "--local", "--local-fake-embedding", "--no-exhaustive", "--hnsw-m", "8",
+                                           "--hnsw-ef-construction", "200", "--hnsw-ef-search", "100"])
+    main.build_search_client(args, main.build_embedder(args))
+    assert built == [{"m": 8, "ef_construction": 200, "ef_search": 100}]
+
+class FakeConnection:
+    def close(self):
+        pass
+
+def test_typeahead_table_uses_the_sql_flags(monkeypatch):
+    connections = []
+    monkeypatch.setattr(azuresql, "connect", lambda *args: connections.append(args) or FakeConnection())
+    monkeypatch.setattr(typeahead.PrefixIndex, "from_sql", classmethod(lambda cls, co, table_name: cls({("Albert Einstein", "db_table_winner"): 1})))
+    args = main.build_parser().parse_args(["suggest", "--typeahead-table", "winners", "--sql-server", "server", "--database-name", "db",
+                                           "--sql-username", "user", "--sql-password", "secret", "--sql-driver", "driver", "einst"])
+    suggester = main.build_typeahead(args)
+    assert connections == [("server", "db", "user", "secret", "driver")]
+    assert suggester.suggest("einst")[0][0]["text"] == "Albert Einstein"
+
+@pytest.mark.parametrize("argv", [["enroll"], ["query"], ["console"], ["serve"], ["suggest", "einst"]])
+def test_defaults_come_from_the_parser(argv):
+    args = main.build_parser().parse_args(argv)
+    assert args.embedding_length == main.embedding_length
+    assert args.embedding_model == "text-embedding-ada-002"
+    if argv[0] == "enroll":
+        assert (args.hnsw_m, args.hnsw_ef_construction, args.hnsw_ef_search) == (4, 400, 500)
+        assert args.bulk_load and not args.dry_run and not args.incremental
+    if argv[0] in ("query", "console"):
+        assert args.exhaustive and not args.local and args.filter_mode == "pre"
+
+heavy_modules = {"pandas", "pyodbc", "openai", "numpy", "aiohttp"}
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+main_csv_file_path = os.path.join(repo_path, "data", "nobel-prize-winners.csv")
+
+#modules loaded by a fresh interpreter running the code in cwd (debug.log is written there)
+def loaded_modules(code, cwd):
+    script = f"import sys\nsys.path.insert(0, {repo_path!r})\n{code}\nprint(' '.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return set(result.stdout.splitlines()[-1].split())
+
+def test_import_main_loads_no_heavy_modules(tmp_path):
+    assert loaded_modules("import main", tmp_path) & heavy_modules == set()
+
+def test_dry_run_loads_no_heavy_modules(tmp_path):
+    code = f"import main\nmain.csv_file_path = {main_csv_file_path!r}\nmain.main(['enroll', '--dry-run', '--no-stderr-logs'])"
+    assert loaded_modules(code, tmp_path) & heavy_modules == set()
+
+def test_typeahead_does_not_load_the_index_definitions(tmp_path):
+    modules = loaded_modules("import typeahead", tmp_path)
+    assert "index" not in modules and "azure.search.documents.indexes" not in modules
+    assert modules & heavy_modules == set()
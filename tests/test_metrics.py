@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import metrics
+
+def test_histogram_percentiles():
+    histogram = metrics.Histogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    assert (histogram.count, histogram.total, histogram.min, histogram.max) == (1000, 500500, 1, 1000)
+    assert histogram.percentile(50) == pytest.approx(500, rel=0.01)
+    assert histogram.percentile(99) == pytest.approx(990, rel=0.01)
+    assert histogram.percentile(100) == 1000
+    assert histogram.count_at_most(255) == 255
+    assert histogram.count_at_most(0) == 0
+    assert metrics.Histogram().summary() == {"count": 0}
+
+@pytest.fixture
+def query_metrics():
+    query_metrics = metrics.QueryMetrics(slow_query_ms=100)
+    for seconds in (0.004, 0.02, 0.02, 0.2):
+        query_metrics.record("hybrid", "einstein", seconds, seconds / 2, server_seconds=seconds / 4, results=5, response_bytes=2000)
+    query_metrics.record("vector", "curie", 0.003, 0.003)
+    query_metrics.observe("embedding_seconds", None, 30000)
+    return query_metrics
+
+def test_prometheus_exposition(query_metrics):
+    lines = query_metrics.to_prometheus().splitlines()
+    assert "# HELP search_latency_seconds Client-side latency of search requests until the last result was read" in lines
+    assert "# TYPE search_latency_seconds histogram" in lines
+    #cumulative bucket counts per mode
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="0.005"} 1' in lines
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="0.01"} 1' in lines
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="0.025"} 3' in lines
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="0.1"} 3' in lines
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="0.25"} 4' in lines
+    assert 'search_latency_seconds_bucket{mode="hybrid",le="+Inf"} 4' in lines
+    assert 'search_latency_seconds_sum{mode="hybrid"} 0.244' in lines
+    assert 'search_latency_seconds_count{mode="hybrid"} 4' in lines
+    assert 'search_latency_seconds_count{mode="vector"} 1' in lines
+    assert 'search_results_bucket{mode="hybrid",le="5"} 4' in lines
+    assert 'search_response_bytes_bucket{mode="hybrid",le="1024"} 0' in lines
+    assert 'search_response_bytes_sum{mode="hybrid"} 8000' in lines
+    #metrics without mode have no labels
+    assert 'search_embedding_seconds_bucket{le="0.05"} 1' in lines
+    assert "search_embedding_seconds_count 1" in lines
+    assert "# TYPE search_server_elapsed_seconds histogram" in lines
+    #the vector query had no server time, its mode has no series of that metric
+    assert not any(line.startswith('search_server_elapsed_seconds_count{mode="vector"}') for line in lines)
+    assert lines[-3:] == ["# HELP search_slow_queries_total Search requests above the slow query threshold",
+                          "# TYPE search_slow_queries_total counter", "search_slow_queries_total 1"]
+    #every HELP line is followed by the TYPE line of its metric, and every metric appears once
+    helps = [(i, line.split()[2]) for i, line in enumerate(lines) if line.startswith("# HELP")]
+    assert all(lines[i + 1].startswith(f"# TYPE {metric} ") for i, metric in helps)
+    assert len(helps) == len({metric for _, metric in helps}) == 7
+
+def test_json_output(query_metrics, tmp_path):
+    output = json.loads(query_metrics.to_json())
+    assert output["slow_queries"] == 1
+    hybrid = output["metrics"]["latency_seconds"]["hybrid"]
+    assert hybrid["count"] == 4 and hybrid["sum"] == pytest.approx(0.244)
+    assert (hybrid["min"], hybrid["max"]) == (0.004, 0.2)
+    assert hybrid["p50"] == pytest.approx(0.02, rel=0.01)
+    assert output["metrics"]["embedding_seconds"]["all"]["count"] == 1
+    assert output["metrics"]["results"]["hybrid"]["p99"] == 5
+
+    query_metrics.write(str(tmp_path / "metrics.json"))
+    query_metrics.write(str(tmp_path / "metrics.prom"))
+    assert json.loads((tmp_path / "metrics.json").read_text()) == output
+    assert (tmp_path / "metrics.prom").read_text() == query_metrics.to_prometheus()
+
+def test_slow_queries_are_logged(tmp_path):
+    log = tmp_path / "slow.jsonl"
+    query_metrics = metrics.QueryMetrics(slow_query_ms=100, slow_query_log=str(log))
+    query_metrics.record("semantic", "peace", 0.15, 0.1, server_seconds=0.12, results=3, response_bytes=100)
+    query_metrics.record("semantic", "peace", 0.05, 0.04)
+    entries = [json.loads(line) for line in log.read_text().splitlines()]
+    assert len(entries) == 1 and query_metrics.slow_queries == 1
+    assert entries[0]["search_input"] == "peace" and entries[0]["latency_ms"] == pytest.approx(150)
@@ -0,0 +1,82 @@
+import pytest
+import index
+import indexer
+import azuresql
+import skillset
+import querycache
+import orchestrator
+from fakes import FakeIndexClient, FakeIndexerClient
+
+@pytest.fixture(autouse=True)
+def no_cache_invalidation(monkeypatch):
+    monkeypatch.setattr(querycache, "invalidate", lambda *args, **kwargs: None)
+
+class Enrollment:
+    def __init__(self, tmp_path):
+        self.state_file = str(tmp_path / "enroll-state.json")
+        self.source_file = tmp_path / "data.csv"
+        self.source_file.write_text("year,discipline,winner,desc\n1921,physics,Albert Einstein,photoelectric effect\n")
+        self.index_c = FakeIndexClient()
+        self.indexer_c = FakeIndexerClient(10, batch_overhead_ms=1.0, item_ms=0.01)
+        self.loads = 0
+
+    def load_table(self):
+        self.loads += 1
+
+    def run(self, hnsw_m=4):
+        steps = orchestrator.enrollment_steps(
+            self.index_c, self.indexer_c,
+            index.build_index("test", 1536, "key", "https://openai", "deployment", hnsw_m=hnsw_m),
+            azuresql.build_data_source_connection("server", "database", "user", "password", "nobelprizewinners"),
+            skillset.build_skillset("https://openai", "deployment", "key", "test"),
+            indexer.build_indexer("test"),
+            load_table=self.load_table, count_rows=lambda: 1, source_file=str(self.source_file))
+        return {result["step"]: result["status"] for result in orchestrator.run_steps(steps, self.state_file)}
+
+def test_unchanged_steps_are_skipped(tmp_path):
+    enrollment = Enrollment(tmp_path)
+    assert set(enrollment.run().values()) == {"applied"}
+    assert set(enrollment.run().values()) == {"unchanged"}
+    assert enrollment.loads == 1
+
+    #a changed definition hash applies the step again
+    statuses = enrollment.run(hnsw_m=8)
+    assert statuses["index"] == "applied"
+    assert statuses["load_table"] == "unchanged"
+    assert statuses["data_source"] == "unchanged"
+
+def test_changed_live_resource_is_applied_again(tmp_path):
+    enrollment = Enrollment(tmp_path)
+    enrollment.run()
+    #the skillset was changed on the service, its ETag differs from the state
+    enrollment.indexer_c.create_or_update_skillset(skillset.build_skillset("https://openai", "deployment", "key", "test"))
+    assert enrollment.run()["skillset"] == "applied"
+
+def test_failed_step_blocks_its_dependents(tmp_path):
+    enrollment = Enrollment(tmp_path)
+
+    def fail(definition):
+        raise RuntimeError("index quota exceeded")
+    enrollment.index_c.create_or_update_index = fail
+    statuses = enrollment.run()
+    assert statuses["index"] == "failed"
+    assert statuses["skillset"] == "blocked"
+    assert statuses["indexer"] == "blocked"
+    assert statuses["load_table"] == "applied"
+    assert statuses["data_source"] == "applied"
+
+def test_changed_upstream_step_reruns_the_indexer(tmp_path):
+    enrollment = Enrollment(tmp_path)
+    enrollment.run()
+    enrollment.source_file.write_text("year,discipline,winner,desc\n1921,physics,Albert Einstein,relativity\n")
+    statuses = enrollment.run()
+    assert statuses["load_table"] == "applied"
+    #the data source definition did not change, but the indexer has to index the reloaded table
+    assert statuses["data_source"] == "unchanged"
+    assert statuses["index"] == "unchanged"
+    assert statuses["indexer"] == "applied"
+    assert enrollment.loads == 2
+
+def test_dependency_on_unknown_step_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        orchestrator.run_steps([orchestrator.Step("indexer", lambda: None, ("index",))], str(tmp_path / "state.json"))
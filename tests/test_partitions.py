@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import pytest
+import chunking
+import partitions
+
+def config(partitions_count, **settings):
+    return partitions.validate_table_config(dict(partitions.default_table_config, partitions=partitions_count, **settings))
+
+def partition_of(plan, key):
+    return [partition["number"] for partition in plan
+            if (partition["lower"] is None or key >= partition["lower"]) and (partition["upper"] is None or key < partition["upper"])]
+
+def test_even_boundaries():
+    assert partitions.even_boundaries(1, 100, 4) == [26, 51, 76]
+    assert partitions.even_boundaries(1, 10, 1) == []
+
+def test_every_key_is_in_exactly_one_partition():
+    table_config = config(4)
+    plan = partitions.plan_partitions(table_config, partitions.even_boundaries(1, 1000, 4))
+    assert [partition["name"] for partition in plan] == [f"nobelprizewinners_p{i}" for i in range(4)]
+    assert plan[0]["lower"] is None and plan[-1]["upper"] is None
+    #keys outside of the planned range, e.g. rows added later, are still covered
+    for key in [-5, 1, 250, 251, 999, 1000, 5000]:
+        assert len(partition_of(plan, key)) == 1
+    sizes = [sum(1 for key in range(1, 1001) if partition_of(plan, key) == [partition["number"]]) for partition in plan]
+    assert sizes == [250, 250, 250, 250]
+
+def test_duplicate_boundaries_are_merged():
+    plan = partitions.plan_partitions(config(3), [10, 10])
+    assert [(partition["lower"], partition["upper"]) for partition in plan] == [(None, 10), (10, None)]
+
+def test_plan_from_csv_before_the_table_is_loaded(tmp_path):
+    csv_file_path = tmp_path / "data.csv"
+    csv_file_path.write_text("year,discipline,winner,desc\n" + "".join(f"1901,physics,winner {i},text\n" for i in range(10)))
+    plan = partitions.plan_table(None, config(2, csv_file_path=str(csv_file_path)))
+    assert [(partition["lower"], partition["upper"]) for partition in plan] == [(None, 6), (6, None)]
+
+def test_boundaries_of_unevenly_spread_keys():
+    co = sqlite3.connect(":memory:")
+    co.execute("CREATE TABLE nobelprizewinners (ID INTEGER PRIMARY KEY)")
+    co.executemany("INSERT INTO nobelprizewinners VALUES (?)", [(key,) for key in list(range(1, 11)) + list(range(1000, 1010))])
+    assert partitions.query_boundaries(co, config(4), 4) == [6, 1000, 1005]
+
+def test_views_data_sources_and_indexers():
+    table_config = config(2, table="Prizes", columns=dict(chunking.table_columns, db_table_id="PrizeId"), csv_file_path=None)
+    plan = partitions.plan_partitions(table_config, ["O'Neill"])
+    resources = partitions.build_partition_resources(table_config, plan, "prizes", "server", "database", "user", "password", incremental=True,
+                                                     batch_size=500)
+    assert resources[0]["view"].endswith("FROM Prizes WHERE PrizeId < 'O''Neill'")
+    assert resources[1]["view"].endswith("FROM Prizes WHERE PrizeId >= 'O''Neill'")
+    assert "RowVer, IsDeleted FROM" in resources[0]["view"]
+    assert [resource["data_source"].name for resource in resources] == ["prizes-p0-azuresqlcon", "prizes-p1-azuresqlcon"]
+    assert [resource["data_source"].container.name for resource in resources] == ["Prizes_p0", "Prizes_p1"]
+    assert [resource["indexer"].name for resource in resources] == ["prizes-indexer-p0", "prizes-indexer-p1"]
+    assert all(resource["indexer"].data_source_name == resource["data_source"].name for resource in resources)
+    assert all(resource["indexer"].target_index_name == "prizes" and resource["indexer"].parameters.batch_size == 500 for resource in resources)
+    assert resources[0]["data_source"].data_change_detection_policy is not None
+
+def test_invalid_table_configs_are_rejected(tmp_path):
+    path = tmp_path / "table.json"
+    path.write_text(json.dumps({"table": "prizes", "columns": {"db_table_id": "ID"}}))
+    with pytest.raises(ValueError, match="maps no column"):
+        partitions.read_table_config(str(path))
+    with pytest.raises(ValueError, match="boundaries"):
+        config(3, boundaries=[5])
+    path.write_text(json.dumps({"table": "prizes"}))
+    assert partitions.read_table_config(str(path), partitions=4)["csv_file_path"] is None
+
+def test_aggregated_progress():
+    running = {"status": "inProgress", "items": 100, "failed": 1, "seconds": 10.0, "docs_per_second": 10.0, "expected_items": 300, "eta_seconds": 20.0}
+    done = {"status": "success", "items": 300, "failed": 0, "seconds": 30.0, "docs_per_second": 10.0, "expected_items": 300, "eta_seconds": None}
+    progress = partitions.aggregate_progress([running, done, None])
+    assert (progress["status"], progress["running"], progress["queued"], progress["items"], progress["failed"]) == ("inProgress", 1, 1, 400, 1)
+    assert progress["expected_items"] is None
+    assert partitions.aggregate_progress([done, done])["status"] == "success"
+    assert partitions.aggregate_progress([done, dict(done, status="transientFailure")])["status"] == "transientFailure"
@@ -0,0 +1,56 @@
+import re
+import types
+import chunking
+import embeddings
+import pushpipeline
+
+#index stand-in for the upload client and the cleanup client: uploads merge by key, search supports the search.in filter
+#of pushpipeline.StaleChunkCleaner
+class FakeIndex:
+    def __init__(self):
+        self.documents = {}
+
+    def upload_documents(self, documents):
+        for document in documents:
+            self.documents[document["Id"]] = document
+        return [types.SimpleNamespace(key=document["Id"], succeeded=True, error_message=None) for document in documents]
+
+    def search(self, search_text, filter, select):
+        row_ids = re.fullmatch(r"search\.in\(db_table_id, '([^']*)', ','\)", filter).group(1).split(",")
+        return [{"Id": key} for key, document in self.documents.items() if document["db_table_id"] in row_ids]
+
+    def delete_documents(self, documents):
+        for document in documents:
+            self.documents.pop(document["Id"], None)
+
+def push(index, rows, deleted_rows=(), cleanup=True):
+    return pushpipeline.push_rows(iter(rows), embeddings.FakeEmbeddingClient(dimensions=8), index, embed_batch_size=2, embed_concurrency=2,
+                                  upload_batch_size=3, upload_concurrency=2, cleanup_client=index if cleanup else None,
+                                  deleted_rows=deleted_rows)
+
+def keys(rows):
+    return {document["Id"] for row in rows for document in chunking.project_row(*row)}
+
+long_description = " ".join(f"word{i}" for i in range(2000))
+
+def test_incremental_push_removes_deleted_rows_and_leftover_chunks():
+    rows = [(1, 1921, "Physics", "Albert Einstein", long_description), (2, 1903, "Physics", "Marie Curie", "radioactivity"),
+            (3, 1964, "Peace", "Martin Luther King Jr.", "civil rights")]
+    index = FakeIndex()
+    push(index, rows)
+    assert set(index.documents) == keys(rows)
+    assert len(keys(rows[:1])) > 1
+
+    changed = [(1, 1921, "Physics", "Albert Einstein", "photoelectric effect"), rows[1]]
+    stats = push(index, changed, deleted_rows=[rows[2]])
+    assert set(index.documents) == keys(changed)
+    assert stats["deleted"] == len(keys(rows)) - len(keys(changed))
+    assert index.documents["1_pages_0"]["chunk"] == "photoelectric effect"
+
+def test_push_without_cleanup_keeps_the_index():
+    rows = [(1, 1921, "Physics", "Albert Einstein", long_description)]
+    index = FakeIndex()
+    push(index, rows)
+    stats = push(index, [(1, 1921, "Physics", "Albert Einstein", "photoelectric effect")], cleanup=False)
+    assert stats["deleted"] == 0
+    assert set(index.documents) == keys(rows)
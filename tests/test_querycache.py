@@ -0,0 +1,39 @@
+import os
+
+import querycache
+
+search_kwargs = {"top": 2, "select": ["chunk"], "filter": None}
+
+def test_key_depends_on_index_and_scope(tmp_path):
+    cache = querycache.QueryCache(cache_dir=str(tmp_path), scope={"backend": "https://a.search.windows.net", "dimensions": 1536})
+    other_backend = querycache.QueryCache(cache_dir=str(tmp_path), scope={"backend": "local", "dimensions": 1536})
+    other_dimensions = querycache.QueryCache(cache_dir=str(tmp_path), scope={"backend": "https://a.search.windows.net", "dimensions": 256})
+
+    key = cache.key("hybrid", "Einstein", search_kwargs, index_name="index-a")
+    assert key == cache.key("hybrid", "  einstein ", search_kwargs, index_name="index-a")
+    assert key != cache.key("hybrid", "Einstein", search_kwargs, index_name="index-b")
+    assert key != other_backend.key("hybrid", "Einstein", search_kwargs, index_name="index-a")
+    assert key != other_dimensions.key("hybrid", "Einstein", search_kwargs, index_name="index-a")
+
+def test_disk_tier_is_not_shared_across_scopes(tmp_path):
+    service = querycache.QueryCache(cache_dir=str(tmp_path), disk=True, scope={"backend": "https://a.search.windows.net"})
+    local = querycache.QueryCache(cache_dir=str(tmp_path), disk=True, scope={"backend": "local"})
+    try:
+        service.put(service.key("vector", "peace", search_kwargs, index_name="index-a"), "vector", {"answers": [], "results": [{"chunk": "a"}]})
+        assert local.get(local.key("vector", "peace", search_kwargs, index_name="index-a"), "vector") is None
+        assert service.get(service.key("vector", "peace", search_kwargs, index_name="index-a"), "vector")["results"] == [{"chunk": "a"}]
+    finally:
+        service.close()
+        local.close()
+
+def test_invalidate_drops_cached_results(tmp_path):
+    cache = querycache.QueryCache(cache_dir=str(tmp_path))
+    key = cache.key("semantic", "peace", search_kwargs, index_name="index-a")
+    cache.put(key, "semantic", {"answers": [], "results": []})
+    querycache.invalidate(str(tmp_path))
+    cache._generation_checked = 0.0
+    assert cache.get(key, "semantic") is None
+
+def test_default_cache_dir_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert querycache.generation_file() == os.path.join(os.path.dirname(os.path.abspath(querycache.__file__)), ".querycache", "generation")
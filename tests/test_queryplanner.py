@@ -0,0 +1,91 @@
+import pytest
+
+import queryplanner
+
+winner_names = queryplanner.WinnerNames(["Albert Einstein", "Marie Curie", "Pierre Curie", "Eugene O'Neill", "Red Cross", "Not awarded"])
+
+@pytest.mark.parametrize("query, years", [
+    ("physics 1921", [(1921, 1921)]),
+    ("physics 1920s", [(1920, 1929)]),
+    ("the 20s", [(1920, 1929)]),
+    ("'30s", [(1930, 1939)]),
+    ("20th century literature", [(1901, 2000)]),
+    ("between 1901 and 1910", [(1901, 1910)]),
+    ("1950-1960", [(1950, 1960)]),
+    ("peace before 1950", [(None, 1949)]),
+    ("after 1990", [(1991, None)]),
+    ("since 2000", [(2000, None)])
+])
+def test_extract_years(query, years):
+    assert queryplanner.extract(query).years == years
+
+@pytest.mark.parametrize("query, number", [("1000 physicists", "1000"), ("physics 2999", "2999"), ("the 1500 most cited chemists", "1500")])
+def test_numbers_outside_the_prize_years_are_no_years(query, number):
+    plan = queryplanner.extract(query)
+    assert plan.years == []
+    assert "db_table_year" not in (queryplanner.compile_filter(plan) or "")
+    assert number in plan.text
+    #with a year cue the number is still a bound
+    assert queryplanner.extract(f"physics before {number}").years == [(None, int(number) - 1)]
+
+def test_extract_disciplines_and_remaining_text():
+    plan = queryplanner.extract("Physicists and chemists of 1911 who discovered radium")
+    assert plan.years == [(1911, 1911)]
+    assert plan.disciplines == ["physics", "chemistry"]
+    assert "1911" not in plan.text and "radium" in plan.text
+
+def test_filler_words_only_search_the_original_text():
+    plan = queryplanner.extract("nobel prize winners in physics 1921")
+    assert plan.disciplines == ["physics"]
+    assert plan.text == "nobel prize winners in physics 1921"
+
+def test_extract_winners():
+    assert queryplanner.extract("physics 1920s Einstein", winner_names).winners == ["Albert Einstein"]
+    #the full name selects only that winner, the surname alone both
+    assert queryplanner.extract("marie curie", winner_names).winners == ["Marie Curie"]
+    assert queryplanner.extract("Curie", winner_names).winners == ["Marie Curie", "Pierre Curie"]
+    #surnames only match capitalized
+    assert queryplanner.extract("a cross of iron", winner_names).winners == []
+    assert "Not awarded" not in queryplanner.extract("not awarded", winner_names).winners
+
+def test_compile_filter():
+    plan = queryplanner.extract("physics 1920s Einstein", winner_names)
+    assert queryplanner.compile_filter(plan) == ("db_table_year ge '1920' and db_table_year le '1929' and "
+                                                 "search.in(db_table_discipline, 'physics', ',') and "
+                                                 "search.in(db_table_winner, 'Albert Einstein', '|')")
+    assert queryplanner.compile_filter(plan, int_year=True).startswith("db_table_year ge 1920 and db_table_year le 1929 and ")
+    assert queryplanner.compile_filter(queryplanner.QueryPlan("einstein")) is None
+
+    plan = queryplanner.QueryPlan("prizes", years=[(1921, 1921), (None, 1905)])
+    assert queryplanner.compile_filter(plan) == "((db_table_year eq '1921') or (db_table_year le '1905'))"
+
+def test_filter_escapes_quotes():
+    plan = queryplanner.extract("O'Neill", winner_names)
+    assert plan.winners == ["Eugene O'Neill"]
+    search_filter = queryplanner.compile_filter(plan)
+    assert search_filter == "search.in(db_table_winner, 'Eugene O''Neill', '|')"
+    predicate = queryplanner.compile_predicate(search_filter)
+    assert predicate({"db_table_winner": "Eugene O'Neill"})
+    assert not predicate({"db_table_winner": "Eugene O"})
+
+def test_planner_adds_explicit_constraints():
+    planner = queryplanner.QueryPlanner(winner_names, filter_mode="post", years=["1920-1929"], disciplines=["Physicist"])
+    text, query_options = planner.apply("Einstein", {"top": 3})
+    assert text == "Einstein"
+    assert query_options["top"] == 3
+    assert query_options["filter_mode"] == "post"
+    assert query_options["filter"] == ("db_table_year ge '1920' and db_table_year le '1929' and "
+                                       "search.in(db_table_discipline, 'physics', ',') and "
+                                       "search.in(db_table_winner, 'Albert Einstein', '|')")
+
+    assert queryplanner.QueryPlanner(extract_constraints=False).apply("physics 1921") == ("physics 1921", {})
+    with pytest.raises(ValueError, match="Unknown filter mode"):
+        queryplanner.QueryPlanner(filter_mode="sideways")
+
+def test_predicate_matches_compiled_filter():
+    predicate = queryplanner.compile_predicate(queryplanner.compile_filter(queryplanner.extract("physics 1920s")))
+    assert predicate({"db_table_year": "1921", "db_table_discipline": "physics"})
+    assert not predicate({"db_table_year": "1931", "db_table_discipline": "physics"})
+    assert not predicate({"db_table_year": "1921", "db_table_discipline": "chemistry"})
+    with pytest.raises(ValueError):
+        queryplanner.compile_predicate("db_table_year like '19%'")
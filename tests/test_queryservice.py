@@ -0,0 +1,90 @@
+import json
+import socket
+import asyncio
+import functools
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import mockserver
+import queryservice
+import searchengine
+from fakes import sample_csv_file_path
+
+documents = mockserver.load_documents(sample_csv_file_path)
+
+#runs the test coroutine with a client of the query service, whose engine searches the mock server (or endpoint)
+def run_service(test, mock=None, endpoint=None, service_options=None, **engine_options):
+    async def run():
+        runner = await mockserver.start(mock or mockserver.MockSearchService(documents), port=0)
+        try:
+            url = endpoint or f"http://127.0.0.1:{runner.addresses[0][1]}"
+            engine_factory = functools.partial(searchengine.SearchEngine, url, "test", "key", **engine_options)
+            service = queryservice.QueryService(engine_factory, **(service_options or {}))
+            async with TestClient(TestServer(service.app())) as client:
+                return await test(client, service)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(run())
+
+def test_search_and_stream():
+    async def test(client, service):
+        response = await client.get("/search/semantic", params={"q": "einstein", "k": "3"})
+        assert response.status == 200
+        body = await response.json()
+        assert body["mode"] == "semantic" and len(body["results"]) == 3 and len(body["answers"]) == 1
+
+        response = await client.post("/search/hybrid", json={"search": "einstein", "k": 2, "stream": True})
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in (await response.text()).splitlines()]
+        assert lines[0]["answers"] == [] and len(lines) == 3
+
+        assert (await client.get("/search/fuzzy", params={"q": "einstein"})).status == 400
+        assert (await client.get("/search/hybrid", params={"q": "einstein", "k": "0"})).status == 400
+    run_service(test)
+
+def test_readyz_and_load_shedding():
+    async def test(client, service):
+        response = await client.get("/readyz")
+        assert response.status == 200 and (await response.json())["status"] == "ready"
+        slow = asyncio.ensure_future(client.get("/search/semantic", params={"q": "einstein"}))
+        while service.pending < 1:
+            await asyncio.sleep(0.01)
+        #the worker is saturated: not ready, and new requests are shed right away
+        assert (await client.get("/readyz")).status == 503
+        response = await client.get("/search/hybrid", params={"q": "curie"})
+        assert response.status == 503 and response.headers["Retry-After"] == "1"
+        assert (await slow).status == 200
+        assert (await client.get("/readyz")).status == 200
+        stats = await (await client.get("/stats")).json()
+        assert (stats["service"]["requests"], stats["service"]["shed"]) == (2, 1)
+        service.ready = False
+        assert (await client.get("/readyz")).status == 503
+        assert (await client.get("/search/hybrid", params={"q": "curie"})).status == 503
+    run_service(test, mockserver.MockSearchService(documents, mode_latency_ms={"semantic": 200}), service_options={"max_pending": 1})
+
+def test_deadline():
+    async def test(client, service):
+        response = await client.get("/search/hybrid", params={"q": "einstein"}, headers={queryservice.deadline_header: "50"})
+        assert response.status == 504
+        assert (await client.get("/search/vector", params={"q": "einstein", "timeout_ms": "5000"})).status == 200
+        return service.stats
+    stats = run_service(test, mockserver.MockSearchService(documents, mode_latency_ms={"hybrid": 1000}))
+    assert stats["deadline_exceeded"] == 1
+
+def test_throttling():
+    async def test(client, service):
+        response = await client.get("/search/hybrid", params={"q": "einstein"})
+        assert response.status == 503 and response.headers["Retry-After"] == "1"
+        return service.stats
+    stats = run_service(test, mockserver.MockSearchService(documents, throttle_rate=1.0), max_retries=1, backoff_base=0.001)
+    assert stats["errors"] == 1
+
+def test_unreachable_search_service():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    async def test(client, service):
+        response = await client.get("/search/hybrid", params={"q": "einstein"})
+        assert response.status == 502
+        return service.stats
+    assert run_service(test, endpoint=f"http://127.0.0.1:{port}")["errors"] == 1
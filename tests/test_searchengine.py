@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+import mockserver
+import searchengine
+from fakes import sample_csv_file_path
+
+documents = mockserver.load_documents(sample_csv_file_path)
+
+#runs the test coroutine with an engine in front of a mock server on a free port
+def run_with_mock(test, service, **engine_options):
+    async def run():
+        runner = await mockserver.start(service, port=0)
+        port = runner.addresses[0][1]
+        try:
+            async with searchengine.SearchEngine(f"http://127.0.0.1:{port}", "test", "key", **engine_options) as engine:
+                return await test(engine)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(run())
+
+def test_limiter_halves_on_throttling_and_grows_after_a_window():
+    async def run():
+        limiter = searchengine.AdaptiveLimiter(8, min_concurrency=2)
+        await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 4
+        for _ in range(2):
+            await limiter.acquire()
+            await limiter.release(throttled=True)
+        assert limiter.limit == 2
+        #one more after a full window of successes
+        for _ in range(2):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 3
+        for _ in range(100):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 8
+    asyncio.run(run())
+
+def test_limiter_bounds_the_requests_in_flight():
+    async def run():
+        limiter = searchengine.AdaptiveLimiter(2)
+        await limiter.acquire()
+        await limiter.acquire()
+        blocked = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await limiter.release()
+        await asyncio.wait_for(blocked, 1)
+    asyncio.run(run())
+
+def test_search_returns_the_results():
+    async def test(engine):
+        response = await engine.search("einstein", "semantic", k=3)
+        assert len(response["results"]) == 3
+        assert len(response["answers"]) == 1
+        return engine.stats
+    assert run_with_mock(test, mockserver.MockSearchService(documents))["queries"] == 1
+
+def test_throttled_retries_stop_at_max_retries():
+    service = mockserver.MockSearchService(documents, throttle_rate=1.0)
+    async def test(engine):
+        with pytest.raises(HttpResponseError) as error:
+            await engine.search("einstein")
+        assert error.value.status_code == 429
+        return engine.stats, engine.concurrency_limit
+    stats, limit = run_with_mock(test, service, max_concurrency=8, max_retries=3, backoff_base=0.001)
+    assert service.requests == 4
+    assert (stats["throttled"], stats["errors"]) == (3, 1)
+    assert limit == 1
+
+def test_every_attempt_has_a_deadline():
+    async def test(engine):
+        with pytest.raises(asyncio.TimeoutError):
+            await engine.search("einstein", timeout=0.05)
+        return engine.stats
+    stats = run_with_mock(test, mockserver.MockSearchService(documents, latency_ms=2000))
+    assert (stats["timeouts"], stats["errors"]) == (1, 0)
+
+def test_search_many_yields_finished_queries_with_a_bounded_window():
+    service = mockserver.MockSearchService(documents, latency_ms=5, mode_latency_ms={"semantic": 300})
+    consumed = []
+    ahead = []
+    async def test(engine):
+        def queries():
+            yield ("semantic", "slow")
+            for i in range(40):
+                consumed.append(i)
+                yield ("vector", f"query {i}")
+        entries = []
+        async for entry in engine.search_many(queries()):
+            ahead.append(len(consumed) - len(entries))
+            entries.append(entry)
+        return entries
+    entries = run_with_mock(test, service, max_concurrency=4)
+    #every query is answered once, the slow one last because entries are yielded as they finish
+    assert sorted(entry["query"] for entry in entries) == sorted(["slow"] + [f"query {i}" for i in range(40)])
+    assert entries[-1]["query"] == "slow"
+    assert all("error" not in entry for entry in entries)
+    #at most 2 * max_concurrency queries are taken from the iterator before their entries are yielded
+    assert max(ahead) <= 8
+    assert service.max_in_flight <= 4
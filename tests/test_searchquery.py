@@ -0,0 +1,95 @@
+import pytest
+from azure.search.documents.models import QueryType, VectorizableTextQuery, VectorizedQuery, VectorFilterMode
+
+import searchquery
+
+#five chunks of every row, ranked by row
+chunks = [{"Id": f"{row}_{chunk}", "db_table_id": str(row)} for row in range(10) for chunk in range(5)]
+
+class SearchResults(list):
+    def get_answers(self):
+        return []
+
+#pages of the results with the continuation token of the next page, like the paged results of the SDK
+class Pages:
+    def __init__(self, documents, page_size, start):
+        self.documents = documents
+        self.page_size = page_size
+        self.continuation_token = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = self.continuation_token or 0
+        if start >= len(self.documents):
+            raise StopIteration
+        self.continuation_token = start + self.page_size
+        return iter(self.documents[start:start + self.page_size])
+
+class PagedResults(SearchResults):
+    def by_page(self, continuation_token=None):
+        return Pages(self, 4, continuation_token)
+
+#search client returning the first top chunks, records the requests
+class FakeSearchClient:
+    def __init__(self, documents=chunks):
+        self.documents = documents
+        self.requests = []
+
+    def search(self, **search_kwargs):
+        self.requests.append(search_kwargs)
+        top = search_kwargs["top"]
+        return PagedResults(self.documents if top is None else self.documents[:top])
+
+def test_search_kwargs_per_mode():
+    vector = searchquery.build_search_kwargs("vector", "einstein", "test", k=5, exhaustive=False)
+    assert vector["search_text"] is None and vector["top"] == 5
+    assert isinstance(vector["vector_queries"][0], VectorizableTextQuery) and vector["vector_queries"][0].exhaustive is False
+    assert "query_type" not in vector and "filter" not in vector
+
+    semantic = searchquery.build_search_kwargs("semantic", "einstein", "test", vector=[1.0, 0.0], profile="ids", filter="db_table_year ge 1950",
+                                               filter_mode="post")
+    assert semantic["search_text"] == "einstein" and isinstance(semantic["vector_queries"][0], VectorizedQuery)
+    assert semantic["select"] == ["Id", "db_table_id"]
+    assert (semantic["query_type"], semantic["semantic_configuration_name"]) == (QueryType.SEMANTIC, "test-semantic")
+    assert semantic["vector_filter_mode"] == VectorFilterMode.POST_FILTER
+
+    with pytest.raises(ValueError, match="Unknown search mode"):
+        searchquery.build_search_kwargs("fuzzy", "einstein", "test")
+    with pytest.raises(ValueError, match="Unknown projection profile"):
+        searchquery.build_search_kwargs("vector", "einstein", "test", profile="all")
+
+def test_collapse_fetches_more_chunks_until_k_rows_are_found():
+    search_client = FakeSearchClient()
+    response = searchquery.search(search_client, "hybrid", "einstein", "test", k=3, collapse=True)
+    assert [result["Id"] for result in response["results"]] == ["0_0", "1_0", "2_0"]
+    #9 chunks are the first two rows, 18 chunks the first four
+    assert [request["top"] for request in search_client.requests] == [9, 18]
+
+    #the index has fewer rows than requested
+    search_client = FakeSearchClient(chunks[:10])
+    response = searchquery.search(search_client, "hybrid", "einstein", "test", k=3, collapse=True)
+    assert [result["db_table_id"] for result in response["results"]] == ["0", "1"]
+    assert [request["top"] for request in search_client.requests] == [9, 18]
+
+    assert len(searchquery.search(FakeSearchClient(), "hybrid", "einstein", "test", k=3)["results"]) == 3
+
+def test_overfetch_size():
+    assert searchquery.overfetch_size(2) == 6
+    assert searchquery.overfetch_size(500) == searchquery.max_overfetch
+    assert searchquery.overfetch_size(2, 6, 6, 1) == 12
+    assert searchquery.overfetch_size(2, 6, 6, 2) is None
+    assert searchquery.overfetch_size(2, 6, 5, 1) is None
+    assert searchquery.overfetch_size(2, searchquery.max_overfetch, searchquery.max_overfetch, 1) is None
+
+def test_result_stream_pages_and_resumes():
+    stream = searchquery.ResultStream(FakeSearchClient(), "vector", "einstein", "test", limit=6)
+    assert [result["Id"] for result in stream] == [chunk["Id"] for chunk in chunks[:6]]
+    #the search is sent without top, the service pages the results
+    assert stream.search_kwargs["top"] is None and stream.search_kwargs["vector_queries"][0].k_nearest_neighbors == 6
+    resumed = searchquery.ResultStream(FakeSearchClient(), "vector", "einstein", "test", limit=3, continuation=stream.continuation)
+    assert [result["Id"] for result in resumed] == [chunk["Id"] for chunk in chunks[6:9]]
+
+    collapsed = searchquery.ResultStream(FakeSearchClient(), "vector", "einstein", "test", limit=None, collapse=True)
+    assert [result["db_table_id"] for result in collapsed] == [str(row) for row in range(10)]
@@ -0,0 +1,48 @@
+import pytest
+
+import index
+import skillset
+import embeddingmodels
+
+def build(dimensions=None, model=None, deployment="deployment"):
+    return skillset.build_skillset("https://openai", deployment, "key", "test", dimensions=dimensions, model=model)
+
+def embedding_skill(built_skillset):
+    return built_skillset._to_generated().serialize(keep_readonly=True)["skills"][1]
+
+def test_requested_dimensions():
+    assert embeddingmodels.requested_dimensions(None, 256) is None
+    assert embeddingmodels.requested_dimensions("text-embedding-3-small", 1536) is None
+    assert embeddingmodels.requested_dimensions("text-embedding-3-large", 256) == 256
+    with pytest.raises(ValueError, match="use text-embedding-3-small, text-embedding-3-large for shortened embeddings"):
+        embeddingmodels.requested_dimensions("text-embedding-ada-002", 256)
+    with pytest.raises(ValueError, match="can not return 4096"):
+        embeddingmodels.requested_dimensions("text-embedding-3-large", 4096)
+    with pytest.raises(ValueError, match="Unknown embedding model"):
+        embeddingmodels.requested_dimensions("text-embedding-4", 256)
+
+def test_shortened_dimensions_are_sent_to_the_skill_and_the_vectorizer():
+    skill = embedding_skill(build(256, "text-embedding-3-small"))
+    assert (skill["dimensions"], skill["modelName"]) == (256, "text-embedding-3-small")
+    vectorizer = index.build_index("test", 256, "key", "https://openai", "deployment", embedding_model="text-embedding-3-small").vector_search.vectorizers[0]
+    assert vectorizer.azure_open_ai_parameters.model_name == "text-embedding-3-small"
+
+    #native dimensions keep the request body of the pinned SDK
+    assert "dimensions" not in embedding_skill(build(1536, "text-embedding-3-small"))
+    assert not isinstance(build(1536, "text-embedding-3-small").skills[1], skillset.ShortenedEmbeddingSkill)
+
+def test_matching_dimensions_pass_the_check():
+    skillset.check_dimensions(index.build_index("test", 256, "key", "https://openai", "deployment", embedding_model="text-embedding-3-small"),
+                              build(256, "text-embedding-3-small"), "text-embedding-3-small")
+    skillset.check_dimensions(index.build_index("test", 1536, "key", "https://openai", "deployment"), build(), "text-embedding-ada-002")
+
+def test_mismatches_are_reported_before_enrollment():
+    search_index = index.build_index("test", 1536, "key", "https://openai", "other-deployment")
+    with pytest.raises(ValueError) as error:
+        skillset.check_dimensions(search_index, build(256, "text-embedding-3-small"), "text-embedding-3-small")
+    message = str(error.value)
+    assert "the embedding skill returns 256 dimensions, vector field vector has 1536" in message
+    assert "vectorizer openai-ada embeds the queries with deployment other-deployment, the embedding skill the chunks with deployment" in message
+
+    with pytest.raises(ValueError, match="vector field vector: Embedding model text-embedding-ada-002 returns 1536 dimensions and can not return 256"):
+        skillset.check_dimensions(index.build_index("test", 256, "key", "https://openai", "deployment"), build(), "text-embedding-ada-002")
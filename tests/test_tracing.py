@@ -0,0 +1,102 @@
+import json
+import threading
+
+import pytest
+
+import azuresql
+import tracing
+from fakes import connect_sqlite, write_csv, create_sqlite_table
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start("test")
+    yield tracer
+    tracing.stop()
+
+def names(entry):
+    return [child["name"] for child in entry.get("children", [])]
+
+def test_disabled_tracing_is_a_noop():
+    assert not tracing.enabled()
+    client = object()
+    assert tracing.instrument(client) is client
+    with tracing.span("load", rows=1) as span:
+        span.add(rows=1)
+    assert span is tracing.noop_span and tracing.current() is tracing.noop_span
+    assert tracing.traced("double")(lambda x: 2 * x)(3) == 6
+
+def test_nested_spans_and_totals(tracer):
+    @tracing.traced("batch")
+    def batch(rows):
+        tracing.add(rows=rows)
+
+    with tracing.span("load", table="nobelprizewinners"):
+        for rows in (10, 20):
+            batch(rows)
+        parent = tracing.current()
+        #spans of another thread are children of the passed parent
+        def writer():
+            with tracing.span("writer", parent=parent):
+                pass
+        thread = threading.Thread(target=writer)
+        thread.start()
+        thread.join()
+    with pytest.raises(ValueError):
+        with tracing.span("failing"):
+            raise ValueError()
+
+    report = tracer.report()
+    assert names(report["spans"]) == ["load", "failing"]
+    load = report["spans"]["children"][0]
+    assert names(load) == ["batch", "batch", "writer"] and load["attributes"] == {"table": "nobelprizewinners"}
+    assert report["totals"]["batch"]["count"] == 2 and report["totals"]["batch"]["rows"] == 30
+    assert report["spans"]["children"][1]["attributes"] == {"error": "ValueError"}
+
+def test_children_beyond_the_maximum_are_only_counted(tracer, monkeypatch):
+    monkeypatch.setattr(tracing, "max_children", 3)
+    with tracing.span("load"):
+        for _ in range(5):
+            with tracing.span("batch"):
+                pass
+    load = tracer.report()["spans"]["children"][0]
+    assert len(load["children"]) == 3 and load["dropped_children"] == 2
+    assert tracer.totals["batch"]["count"] == 5
+
+def test_instrumented_client(tracer):
+    class Client:
+        def get_index(self, name):
+            return name
+
+    client = tracing.instrument(Client(), "index")
+    assert client.get_index("test") == "test"
+    assert names(tracer.report()["spans"]) == ["sdk index.get_index"]
+
+def test_parallel_bulk_load_is_traced_below_the_load(tracer, tmp_path):
+    csv_file_path = str(tmp_path / "data.csv")
+    db_path = str(tmp_path / "test.db")
+    write_csv(csv_file_path, 500)
+    create_sqlite_table(db_path, "nobelprizewinners")
+    azuresql.load_csv_bulk(lambda: connect_sqlite(db_path, 0), csv_file_path, "nobelprizewinners", batch_size=100, parallel_connections=2)
+    report = tracer.report()
+    assert names(report["spans"]) == ["azuresql.load_csv_bulk"]
+    load = report["spans"]["children"][0]
+    assert names(load).count("azuresql.writer") == 2
+    executemany = report["totals"]["azuresql.executemany"]
+    assert (executemany["count"], executemany["rows"]) == (5, 500)
+    assert report["totals"]["azuresql.read_csv_batch"]["rows"] == 500
+
+def test_compare_reports(tmp_path):
+    baseline = {"seconds": 2.0, "totals": {"load": {"seconds": 1.0}, "index": {"seconds": 0.01}, "removed": {"seconds": 0.5}}}
+    current = {"seconds": 2.5, "totals": {"load": {"seconds": 1.5}, "index": {"seconds": 0.03}, "added": {"seconds": 0.1}}}
+    rows = {row["name"]: row for row in tracing.compare(baseline, current)}
+    assert rows["load"]["regression"] and rows["load"]["ratio"] == pytest.approx(1.5)
+    #slower by 200%, but only by 20 ms
+    assert not rows["index"]["regression"]
+    assert not rows["removed"]["regression"] and not rows["added"]["regression"]
+
+    for name, report in (("baseline", baseline), ("current", current)):
+        (tmp_path / f"{name}.json").write_text(json.dumps(report))
+    with pytest.raises(SystemExit) as exit:
+        tracing.main([str(tmp_path / "baseline.json"), str(tmp_path / "current.json")])
+    assert exit.value.code == 1
+    tracing.main([str(tmp_path / "baseline.json"), str(tmp_path / "current.json"), "--max-regression", "0.6"])
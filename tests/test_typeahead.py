@@ -0,0 +1,97 @@
+import os
+import csv
+import html
+
+import pytest
+
+import index
+import schema
+import typeahead
+
+csv_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "nobel-prize-winners.csv")
+
+@pytest.fixture(scope="module")
+def prefix_index():
+    return typeahead.PrefixIndex.from_csv(csv_file_path)
+
+#suggestions of a prefix by scanning the keys of every suggestion in rank order
+def scan(keys, prefix_index, prefix, top):
+    prefix = " ".join(typeahead.tokenize(prefix))
+    if not prefix:
+        return []
+    ranks = [rank for rank, value_keys in enumerate(keys) if any(key.startswith(prefix) for key in value_keys)]
+    return [prefix_index.suggestion(rank) for rank in ranks[:top]]
+
+#every prefix of the first characters of every suggestion and of every token of it, with and without a typo
+def typed_prefixes(prefix_index, length=4):
+    prefixes = set()
+    for (value, _), _ in prefix_index.suggestions:
+        for key in typeahead.suffix_keys(value):
+            for i in range(1, min(len(key), length) + 1):
+                prefixes.add(key[:i])
+                prefixes.add(key[:i - 1] + "q")
+    return sorted(prefixes)
+
+def test_counts_match_the_csv(prefix_index):
+    with open(csv_file_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    winners = {}
+    for row in rows:
+        winner = html.unescape(row["winner"]).strip()
+        winners[winner] = winners.get(winner, 0) + 1
+    counts = {value: count for (value, field), count in prefix_index.suggestions if field == "db_table_winner"}
+    assert counts == winners
+    assert dict(prefix_index.lookup("phys", 1)[0]) == {"text": "physics", "field": "db_table_discipline",
+                                                       "count": sum(1 for row in rows if row["discipline"] == "physics")}
+
+@pytest.mark.parametrize("top", [1, 5, 20])
+def test_lookup_matches_a_scan(prefix_index, top):
+    keys = [typeahead.suffix_keys(value) for (value, _), _ in prefix_index.suggestions]
+    mismatches = [prefix for prefix in typed_prefixes(prefix_index) if prefix_index.lookup(prefix, top) != scan(keys, prefix_index, prefix, top)]
+    assert mismatches == []
+
+def test_lookup_normalizes_prefixes(prefix_index):
+    assert [suggestion["text"] for suggestion in prefix_index.lookup("einst")] == ["Albert Einstein"]
+    assert prefix_index.lookup("ALBERT  Ein") == prefix_index.lookup("einst")
+    #accents are removed and HTML entities of the CSV decoded
+    assert [suggestion["text"] for suggestion in prefix_index.lookup("rontg")] == ["Wilhelm Conrad Röntgen"]
+    assert prefix_index.lookup("marie c")[0] == {"text": "Marie Curie", "field": "db_table_winner", "count": 2}
+    assert prefix_index.lookup("  ") == [] and prefix_index.lookup("einst", top=0) == []
+
+class FakeSuggestClient:
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+
+    def suggest(self, search_text, suggester_name, top=5, use_fuzzy_matching=False, select=None):
+        self.requests.append((search_text, suggester_name, top, use_fuzzy_matching))
+        return self.results
+
+def test_fallback_to_the_service_and_cache(prefix_index):
+    #one document per chunk, the values repeat
+    client = FakeSuggestClient([{"@search.text": "Albert Einstein", "db_table_winner": "Albert Einstein"},
+                                {"@search.text": "Albert Einstein", "db_table_winner": "Albert Einstein"},
+                                {"@search.text": "physics", "db_table_discipline": "physics"}])
+    suggester = typeahead.Typeahead(prefix_index, client)
+
+    assert suggester.suggest("einst", 5)[1] == "local"
+    suggestions, source = suggester.suggest("einstien", 5)
+    assert source == "service"
+    assert suggestions == [{"text": "Albert Einstein", "field": "db_table_winner", "count": None},
+                           {"text": "physics", "field": "db_table_discipline", "count": None}]
+    assert client.requests == [("einstien", schema.suggester_name, 20, True)]
+    assert suggester.suggest(" Einstien ", 5) == (suggestions, "cache")
+    assert len(client.requests) == 1
+    assert (suggester.stats["local"], suggester.stats["service"], suggester.stats["cached"]) == (1, 1, 1)
+
+def test_without_service_only_local(prefix_index):
+    assert typeahead.Typeahead(prefix_index).suggest("einstien") == ([], "local")
+
+def test_suggester_fields_must_be_searchable_strings(monkeypatch):
+    search_index = index.build_index("test", 1536, "key", "https://openai", "deployment", suggester=True)
+    assert [suggester.source_fields for suggester in search_index.suggesters] == [list(schema.suggester_fields)]
+    assert index.validate_index(search_index) is search_index
+
+    monkeypatch.setattr(schema, "suggester_fields", schema.suggester_fields + ("db_table_year",))
+    with pytest.raises(ValueError, match="db_table_year must be a searchable string"):
+        index.build_index("test", 1536, "key", "https://openai", "deployment", compact=True, suggester=True)
@@ -0,0 +1,319 @@
+#Description: Optional tracing of the enrollment with a JSON report of the span tree.
+#usage: python tracing.py baseline.json current.json --max-regression 0.2
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import functools
+import threading
+
+#children of a span beyond this number are only counted in the totals
+max_children = 1000
+
+#tracer of the running enrollment, None while tracing is disabled
+active = None
+
+class NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+noop_span = NoopSpan()
+
+#one timed stage. Counts added with add() are summed, also in the totals of the report.
+class Span:
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.children = []
+        self.dropped = 0
+        self.start = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._exit(self)
+        return False
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    #start in seconds since the start of the run, spans still running are reported up to now
+    def to_dict(self, origin):
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.start
+        entry = {"name": self.name, "start": round(self.start - origin, 6), "seconds": round(seconds, 6)}
+        if self.attributes:
+            entry["attributes"] = self.attributes
+        if self.children:
+            entry["children"] = [child.to_dict(origin) for child in self.children]
+        if self.dropped:
+            entry["dropped_children"] = self.dropped
+        return entry
+
+#cProfile of the calling thread while the block runs. The profiles of a name are added up in the report.
+class Profile:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.profiler.disable()
+        with self.tracer._lock:
+            self.tracer.profiles.setdefault(self.name, []).append(self.profiler)
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+#spans are nested per thread. Spans of threads without an open span of their own (e.g. the steps of the orchestrator)
+#are children of the root span unless a parent is passed.
+class Tracer:
+    def __init__(self, name, profile=False, profile_top=25):
+        self.name = name
+        self.profiling = profile
+        self.profile_top = profile_top
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.totals = {}
+        self.profiles = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.root = Span(self, name, None, {})
+        self.root.start = time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else self.root
+
+    def span(self, name, parent=None, **attributes):
+        return Span(self, name, parent if isinstance(parent, Span) else self.current(), attributes)
+
+    def profile(self, name):
+        return Profile(self, name)
+
+    def _enter(self, span):
+        with self._lock:
+            if len(span.parent.children) < max_children:
+                span.parent.children.append(span)
+            else:
+                span.parent.dropped += 1
+        self._stack().append(span)
+
+    def _exit(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        with self._lock:
+            total = self.totals.setdefault(span.name, {"count": 0, "seconds": 0.0})
+            total["count"] += 1
+            total["seconds"] += span.seconds
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+
+    def finish(self):
+        if self.root.seconds is None:
+            self.root.seconds = time.perf_counter() - self.root.start
+
+    #pstats.Stats of all profiles of a name
+    def profile_stats(self, name):
+        import pstats
+        profilers = self.profiles[name]
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    #functions with the highest own time (without the functions they call) of the profiles of every name
+    def profile_report(self):
+        report = {}
+        for name in self.profiles:
+            stats = self.profile_stats(name)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.profile_top]
+            report[name] = {
+                "seconds": round(stats.total_tt, 6),
+                "calls": stats.total_calls,
+                "functions": [{"function": f"{function} ({os.path.basename(file)}:{line})", "calls": calls, "seconds": round(own, 6),
+                               "cumulative_seconds": round(cumulative, 6)}
+                              for (file, line, function), (_, calls, own, cumulative, _) in functions]
+            }
+        return report
+
+    def report(self):
+        with self._lock:
+            totals = {name: dict(total, seconds=round(total["seconds"], 6)) for name, total in sorted(self.totals.items())}
+            spans = self.root.to_dict(self.root.start)
+        return {"run": self.name, "started": self.started.isoformat(), "seconds": spans["seconds"], "totals": totals, "spans": spans,
+                "profiles": self.profile_report()}
+
+    #writes the JSON report and, with profiles, a <path>.<name>.prof file per profile for pstats or snakeviz
+    def write(self, path):
+        self.finish()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        for name in self.profiles:
+            self.profile_stats(name).dump_stats(f"{path}.{name}.prof")
+        logging.info(f"Trace of {self.name} written to {path}")
+
+def start(name, profile=False):
+    global active
+    active = Tracer(name, profile)
+    return active
+
+def stop():
+    global active
+    tracer, active = active, None
+    if tracer is not None:
+        tracer.finish()
+    return tracer
+
+def enabled():
+    return active is not None
+
+#new span, a child of the open span of the calling thread or of parent (see current)
+def span(name, parent=None, **attributes):
+    tracer = active
+    if tracer is None:
+        return noop_span
+    return tracer.span(name, parent, **attributes)
+
+#open span of the calling thread, passed as parent to the spans of threads started in it
+def current():
+    tracer = active
+    if tracer is None:
+        return noop_span
+    return tracer.current()
+
+#adds counts to the open span of the calling thread
+def add(**counts):
+    tracer = active
+    if tracer is not None:
+        tracer.current().add(**counts)
+
+#cProfile of the block if the tracer was started with profile=True. Profiles must not be nested in one thread.
+def profile(name):
+    tracer = active
+    if tracer is None or not tracer.profiling:
+        return noop_span
+    return tracer.profile(name)
+
+#decorator that runs every call of the function in a span
+def traced(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = active
+            if tracer is None:
+                return function(*args, **kwargs)
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+#client whose public methods record every call as span "sdk <name>.<method>". Iterators returned by list methods are
+#read after the span ended, only the first request is timed for them.
+class TracedClient:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, attribute):
+        value = getattr(self._client, attribute)
+        if attribute.startswith("_") or not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            with span(f"sdk {self._name}.{attribute}"):
+                return value(*args, **kwargs)
+        return call
+
+#wraps client while tracing is enabled, otherwise the client itself is returned
+def instrument(client, name=None):
+    if active is None:
+        return client
+    return TracedClient(client, name or type(client).__name__)
+
+#changes of the totals between two reports: per span name the seconds of both and their ratio. A span is a regression if
+#it got slower by more than max_regression (0.2 = 20%) and by more than min_seconds.
+def compare(baseline, current, max_regression=0.2, min_seconds=0.05):
+    rows = []
+    for name in sorted(set(baseline["totals"]) | set(current["totals"])):
+        old = baseline["totals"].get(name, {}).get("seconds")
+        new = current["totals"].get(name, {}).get("seconds")
+        ratio = new / old if old and new is not None else None
+        regression = (old is not None and new is not None and new - old > min_seconds and new > old * (1 + max_regression))
+        rows.append({"name": name, "baseline": old, "current": new, "ratio": ratio, "regression": regression})
+    return rows
+
+def format_comparison(rows, baseline, current):
+    width = max([len(row["name"]) for row in rows] + [4])
+    lines = [f"{'span':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}"]
+    for row in rows:
+        old = f"{row['baseline']:.3f} s" if row["baseline"] is not None else "-"
+        new = f"{row['current']:.3f} s" if row["current"] is not None else "-"
+        change = f"{row['ratio'] - 1:+.0%}" if row["ratio"] is not None else "-"
+        lines.append(f"{row['name']:<{width}}  {old:>10}  {new:>10}  {change:>8}{'  REGRESSION' if row['regression'] else ''}")
+    lines.append(f"{'total':<{width}}  {baseline['seconds']:>8.3f} s  {current['seconds']:>8.3f} s")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares the span totals of two enrollment trace reports")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="relative slowdown of a span that counts as regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="smaller absolute slowdowns are ignored")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.max_regression, args.min_seconds)
+    print(format_comparison(rows, baseline, current))
+    regressions = [row["name"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#Description: Local typeahead for winners and disciplines with the suggester of the index as fallback.
+#usage: python typeahead.py einst phys "marie c"
+import re
+import html
+import time
+import bisect
+import logging
+import argparse
+import threading
+import unicodedata
+from collections import OrderedDict
+import chunking
+import schema
+
+#the service accepts suggest requests with 1 to 100 characters
+max_prefix_length = 100
+
+token_pattern = re.compile(r"\w+")
+
+#lower case without accents, "Röntgen" is found with "rontgen"
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+def tokenize(text):
+    return token_pattern.findall(normalize(text))
+
+#keys of a value: the value from every token on, so a prefix of the first name and of the last name find it
+def suffix_keys(value):
+    tokens = tokenize(value)
+    return [" ".join(tokens[i:]) for i in range(len(tokens))]
+
+#prefix index of the values of fields. Every suggestion is a distinct (value, field) with the number of rows it occurs
+#in, more rows rank first. The top hot_top suggestions of all prefixes up to hot_prefix_length characters are precomputed.
+class PrefixIndex:
+    def __init__(self, counts, hot_prefix_length=3, hot_top=10):
+        self.suggestions = sorted(counts.items(), key=lambda item: (-item[1], item[0][0], item[0][1]))
+        self.hot_prefix_length = hot_prefix_length
+        self.hot_top = hot_top
+        #suggestions are numbered by rank, so the smaller number is the better suggestion
+        pairs = sorted((key, rank) for rank, ((value, _), _) in enumerate(self.suggestions) for key in dict.fromkeys(suffix_keys(value)))
+        self.keys = [key for key, _ in pairs]
+        self.ranks = [rank for _, rank in pairs]
+        hot = {}
+        for key, rank in pairs:
+            for length in range(1, min(len(key), hot_prefix_length) + 1):
+                hot.setdefault(key[:length], set()).add(rank)
+        self.hot = {prefix: sorted(ranks)[:hot_top] for prefix, ranks in hot.items()}
+
+    #rows are tuples in the order of chunking.table_columns, as read by chunking.read_csv_rows and chunking.read_sql_rows.
+    #Some names of the CSV contain HTML entities (R&ouml;ntgen), they are decoded.
+    @classmethod
+    def from_rows(cls, rows, fields=schema.suggester_fields, **kwargs):
+        positions = [(field, list(chunking.table_columns).index(field)) for field in fields]
+        counts = {}
+        for row in rows:
+            for field, position in positions:
+                value = html.unescape(str(row[position])).strip() if row[position] is not None else ""
+                if value:
+                    counts[(value, field)] = counts.get((value, field), 0) + 1
+        return cls(counts, **kwargs)
+
+    @classmethod
+    def from_csv(cls, csv_file_path="./data/nobel-prize-winners.csv", **kwargs):
+        return cls.from_rows(chunking.read_csv_rows(csv_file_path), **kwargs)
+
+    @classmethod
+    def from_sql(cls, co, table_name="nobelprizewinners", columns=None, **kwargs):
+        return cls.from_rows(chunking.read_sql_rows(co, table_name, columns=columns), **kwargs)
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def lookup(self, prefix, top=5):
+        prefix = " ".join(tokenize(prefix))
+        if not prefix or top <= 0:
+            return []
+        if len(prefix) <= self.hot_prefix_length and top <= self.hot_top:
+            ranks = self.hot.get(prefix, [])[:top]
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+            ranks = sorted(set(self.ranks[start:end]))[:top]
+        return [self.suggestion(rank) for rank in ranks]
+
+    def suggestion(self, rank):
+        (value, field), count = self.suggestions[rank]
+        return {"text": value, "field": field, "count": count}
+
+#suggestions from the prefix index, prefixes with too few local suggestions are sent to the suggester of search_client
+class Typeahead:
+    def __init__(self, prefix_index, search_client=None, suggester_name=schema.suggester_name, fields=schema.suggester_fields, min_local_results=1,
+                 fuzzy=True, cache_size=1024):
+        self.prefix_index = prefix_index
+        self.search_client = search_client
+        self.suggester_name = suggester_name
+        self.fields = fields
+        self.min_local_results = min_local_results
+        self.fuzzy = fuzzy
+        self.cache_size = cache_size
+        self.stats = {"local": 0, "service": 0, "cached": 0, "local_seconds": 0.0, "service_seconds": 0.0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    #suggestions (text, field, count) and where they came from: local, cache or service
+    def suggest(self, prefix, top=5):
+        start = time.perf_counter()
+        suggestions = self.prefix_index.lookup(prefix, top)
+        if len(suggestions) >= min(top, self.min_local_results) or self.search_client is None or not prefix.strip():
+            with self._lock:
+                self.stats["local"] += 1
+                self.stats["local_seconds"] += time.perf_counter() - start
+            return suggestions, "local"
+        key = (normalize(prefix.strip()), top)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cached"] += 1
+                return self._cache[key], "cache"
+        suggestions = self.suggest_service(prefix.strip()[:max_prefix_length], top)
+        with self._lock:
+            self.stats["service"] += 1
+            self.stats["service_seconds"] += time.perf_counter() - start
+            self._cache[key] = suggestions
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return suggestions, "service"
+
+    #suggest request of the service. It returns one document per chunk, the values are deduplicated.
+    def suggest_service(self, prefix, top):
+        results = self.search_client.suggest(prefix, self.suggester_name, top=min(top * 4, 100), use_fuzzy_matching=self.fuzzy, select=list(self.fields))
+        suggestions = {}
+        for result in results:
+            text = result["@search.text"]
+            field = next((field for field in self.fields if result.get(field) == text), None)
+            if (text, field) not in suggestions:
+                suggestions[(text, field)] = {"text": text, "field": field, "count": None}
+        return list(suggestions.values())[:top]
+
+    def report(self):
+        local, service = self.stats["local"], self.stats["service"]
+        lookups = local + service + self.stats["cached"]
+        local_us = f"{self.stats['local_seconds'] / local * 1e6:.1f} us" if local else "-"
+        service_ms = f"{self.stats['service_seconds'] / service * 1000:.1f} ms" if service else "-"
+        share = f"{local / lookups:.0%}" if lookups else "-"
+        return (f"Typeahead: {lookups} prefixes, {share} answered locally (mean {local_us}), {self.stats['cached']} from the cache, "
+                f"{service} by the service (mean {service_ms})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suggests winners and disciplines for prefixes from the local prefix index")
+    parser.add_argument("prefixes", nargs="+")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--csv", default="./data/nobel-prize-winners.csv")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    start = time.perf_counter()
+    prefix_index = PrefixIndex.from_csv(args.csv)
+    logging.info(f"Prefix index with {len(prefix_index)} suggestions and {len(prefix_index.keys)} keys built in {time.perf_counter() - start:.3f} s")
+    for prefix in args.prefixes:
+        suggestions = prefix_index.lookup(prefix, args.top)
+        text = ", ".join(f"{suggestion['text']} ({suggestion['field']}, {suggestion['count']})" for suggestion in suggestions)
+        print(f"{prefix}: {text or 'no suggestions'}")
+
+if __name__ == "__main__":
+    main()